@@ -0,0 +1,227 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+End-to-end provisioning benchmark: runs the dashboard.py bootstrap against an in-process fake Greengrass IPC
+and a local fake Grafana server, and reports time-to-ready, connections and requests as JSON.
+
+    python3 benchmark/benchmarkProvisioning.py --sizes 1,10,100 --output results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from unittest import mock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, os.pardir, "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import dashboard  # noqa: E402
+import ipcConnection  # noqa: E402
+from fakeGrafana import FakeGrafanaServer, create_self_signed_cert  # noqa: E402
+from fakeGreengrassIPC import FakeGreengrassIPC  # noqa: E402
+
+RESULTS_FORMAT_VERSION = 1
+SIZES = "1,10,100"
+REPEAT = 3
+TOKEN_REQUEST_TOPIC = "greengrass/influxdb/token/request"
+TOKEN_RESPONSE_TOPIC = "greengrass/influxdb/token/response"
+DASHBOARDS_DIR = "grafana_dashboards"
+
+
+def write_dashboards(dashboards_path, count) -> None:
+    """
+    Write dashboard JSON files, each with one panel bound to the InfluxDB datasource placeholder.
+
+    :param dashboards_path: The directory to write the dashboards to.
+    :param count: The number of dashboards.
+    :return: None
+    """
+    os.makedirs(dashboards_path, exist_ok=True)
+    for i in range(count):
+        dashboard_json = {
+            "title": "Benchmark {}".format(i),
+            "tags": ["benchmark"],
+            "panels": [{
+                "id": 1,
+                "type": "timeseries",
+                "title": "Panel {}".format(i),
+                "datasource": "${DS_INFLUXDB}",
+                "targets": [{"refId": "A", "query": "from(bucket: \"greengrass-telemetry\") |> range(start: -1h)"}]
+            }]
+        }
+        with open(os.path.join(dashboards_path, "dashboard{:04d}.json".format(i)), "w") as f:
+            json.dump(dashboard_json, f)
+
+
+def datasource_specs(count) -> list:
+    # The default InfluxDB datasource is always provisioned, so count - 1 additional ones make count in total
+    return [{"name": "InfluxDB-{}".format(i), "bucket": "bucket-{}".format(i)} for i in range(1, count)]
+
+
+def bootstrap_arguments(mount_path, grafana_port, protocol, count, bootstrap_mode) -> argparse.Namespace:
+    argv = [
+        "dashboard.py",
+        "--subscribe_topic", TOKEN_RESPONSE_TOPIC,
+        "--publish_topic", TOKEN_REQUEST_TOPIC,
+        "--mount_path", mount_path,
+        "--grafana_secret_arn", "arn:aws:secretsmanager:region:account:secret:benchmark",
+        "--grafana_port", str(grafana_port),
+        "--grafana_server_protocol", protocol,
+        "--skip_tls_verify", "true",
+        "--bootstrap_mode", bootstrap_mode,
+        "--reconcile_datasource", "true",
+        "--dashboards_dir", DASHBOARDS_DIR,
+        "--datasources", json.dumps(datasource_specs(count))
+    ]
+    with mock.patch.object(sys, "argv", argv):
+        return dashboard.parse_arguments()
+
+
+def run_bootstrap(args, ipc, grafana) -> dict:
+    """
+    Run one bootstrap and measure it.
+
+    :param args: The dashboard.py arguments.
+    :param ipc: The FakeGreengrassIPC to connect to.
+    :param grafana: The FakeGrafanaServer the arguments point to.
+    :return: The time to ready in seconds, the phase timings, and the connection and request counts.
+    """
+    grafana.reset_counters()
+    ipc_requests = ipc.request_count
+    ipc_connections = ipcConnection.get_ipc_connection_stats()["connect_count"]
+    with mock.patch("awsiot.greengrasscoreipc.connect", return_value=ipc):
+        start = time.monotonic()
+        try:
+            phase_timings = dashboard.bootstrap(args)
+            time_to_ready = time.monotonic() - start
+        finally:
+            ipc_stats = ipcConnection.get_ipc_connection_stats()
+            ipcConnection.close_ipc_client()
+    return {
+        "time_to_ready": time_to_ready,
+        "phase_timings": phase_timings,
+        "grafana_connections": grafana.connection_count,
+        "grafana_requests": grafana.request_count(),
+        "grafana_requests_by_endpoint": dict(grafana.requests),
+        "ipc_connections": ipc_stats["connect_count"] - ipc_connections,
+        "ipc_requests": ipc.request_count - ipc_requests
+    }
+
+
+def run_scenario(count, options, cert) -> list:
+    """
+    Provision count datasources and count dashboards into a fresh fake Grafana, then provision them again
+    into the now populated Grafana.
+
+    :param count: The number of datasources and dashboards.
+    :param options: The parsed benchmark options.
+    :param cert: The (cert path, key path) tuple for HTTPS, or None for HTTP.
+    :return: The "cold" and "warm" run results.
+    """
+    mount_path = tempfile.mkdtemp(prefix="benchmark")
+    try:
+        write_dashboards(os.path.join(mount_path, DASHBOARDS_DIR), count)
+        ipc = FakeGreengrassIPC(secret_delay=options.ipc_delay, token_delay=options.ipc_delay)
+        with FakeGrafanaServer(delay=options.grafana_delay, cert=cert) as grafana:
+            args = bootstrap_arguments(mount_path, grafana.port, "https" if cert else "http", count,
+                                       options.bootstrap_mode)
+            cold = run_bootstrap(args, ipc, grafana)
+            if len(grafana.datasources) != count or len(grafana.dashboards) != count:
+                raise RuntimeError("Expected {0} datasources and {0} dashboards, Grafana has {1} and {2}".format(
+                    count, len(grafana.datasources), len(grafana.dashboards)))
+            warm = run_bootstrap(args, ipc, grafana)
+    finally:
+        shutil.rmtree(mount_path, ignore_errors=True)
+    return [dict(cold, size=count, run="cold"), dict(warm, size=count, run="warm")]
+
+
+def summarize(results) -> list:
+    summary = []
+    for key in sorted({(r["size"], r["run"]) for r in results}):
+        runs = [r for r in results if (r["size"], r["run"]) == key]
+        summary.append({
+            "size": key[0],
+            "run": key[1],
+            "repeat": len(runs),
+            "time_to_ready_median": statistics.median(r["time_to_ready"] for r in runs),
+            "time_to_ready_min": min(r["time_to_ready"] for r in runs),
+            "time_to_ready_max": max(r["time_to_ready"] for r in runs),
+            "grafana_connections_max": max(r["grafana_connections"] for r in runs),
+            "grafana_requests_max": max(r["grafana_requests"] for r in runs),
+            "ipc_connections_max": max(r["ipc_connections"] for r in runs)
+        })
+    return summary
+
+
+def run_benchmark(options) -> dict:
+    """
+    Run every scenario the requested number of times.
+
+    :param options: The parsed benchmark options.
+    :return: The JSON-serializable benchmark report.
+    """
+    sizes = [int(size) for size in options.sizes.split(",")]
+    cert_dir = tempfile.mkdtemp(prefix="benchmarkcert") if options.https else None
+    try:
+        cert = create_self_signed_cert(cert_dir) if options.https else None
+        results = []
+        for _ in range(options.repeat):
+            for size in sizes:
+                results.extend(run_scenario(size, options, cert))
+    finally:
+        if cert_dir:
+            shutil.rmtree(cert_dir, ignore_errors=True)
+
+    return {
+        "version": RESULTS_FORMAT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(options),
+        "summary": summarize(results),
+        "results": results
+    }
+
+
+def parse_arguments(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark provisioning Grafana against local stand-ins.")
+    parser.add_argument("--sizes", type=str, default=SIZES,
+                        help="comma-separated numbers of datasources and dashboards to provision")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--bootstrap_mode", type=str, default=dashboard.CONCURRENT_BOOTSTRAP,
+                        choices=[dashboard.CONCURRENT_BOOTSTRAP, dashboard.SEQUENTIAL_BOOTSTRAP])
+    parser.add_argument("--ipc_delay", type=float, default=0.05,
+                        help="seconds the fake nucleus takes to answer secret and token requests")
+    parser.add_argument("--grafana_delay", type=float, default=0.0,
+                        help="seconds the fake Grafana adds to every response")
+    parser.add_argument("--https", action="store_true", help="serve the fake Grafana over HTTPS (needs openssl)")
+    parser.add_argument("--output", type=str, default="", help="write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep the component's INFO logs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> dict:
+    options = parse_arguments(argv)
+    if not options.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmark(options)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
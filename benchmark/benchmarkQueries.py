@@ -0,0 +1,391 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Dashboard query benchmark: writes synthetic Greengrass system telemetry into a local InfluxDB stand-in that
+evaluates Flux, rolls it up as the downsampling tiers do, and replays the panel queries of the dashboards
+against the raw and the rollup buckets with the window period of every datasource profile. Reports the
+p50/p95 query latency and the bytes returned as JSON.
+
+    python3 benchmark/benchmarkQueries.py --devices 10 --history 24h --output results.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, os.pardir, "src"))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import requests  # noqa: E402
+
+import datasourceProfiles  # noqa: E402
+import downsamplingTiers  # noqa: E402
+import fluxEngine  # noqa: E402
+import fluxLinter  # noqa: E402
+import provisionDashboards  # noqa: E402
+import selfTelemetry  # noqa: E402
+from fakeInfluxDB import BUCKET, ORG, TOKEN, FakeInfluxDBServer  # noqa: E402
+
+RESULTS_FORMAT_VERSION = 1
+# (namespace, metric name, unit, aggregation) of the Greengrass nucleus system telemetry metrics. Points are
+# written with the metric name (N) as measurement, the namespace (NS), unit (U) and aggregation (A) as tags
+# and the value in the V field, plus a device tag that sets the cardinality.
+TELEMETRY_METRICS = [
+    ("SystemMetrics", "CpuUsage", "Percent", "Average"),
+    ("SystemMetrics", "SystemMemUsage", "Megabytes", "Average"),
+    ("SystemMetrics", "TotalNumberOfFDs", "Count", "Average"),
+    ("GreengrassComponents", "NumberOfComponentsRunning", "Count", "Average"),
+    ("GreengrassComponents", "NumberOfComponentsErrored", "Count", "Average"),
+    ("GreengrassComponents", "NumberOfComponentsBroken", "Count", "Average")
+]
+DATASOURCE_NAME = "InfluxDB"
+DEVICES = 5
+INTERVAL = "10s"
+HISTORY = "6h"
+TIME_RANGE = "6h"
+PROFILES = ",".join([datasourceProfiles.NO_PROFILE, datasourceProfiles.EDGE_SMALL_PROFILE,
+                     datasourceProfiles.EDGE_LARGE_PROFILE])
+TIERS = '[{"every": "1m", "retention": "30d"}]'
+REPEAT = 5
+# Grafana asks for about one point per pixel of the panel width
+MAX_DATA_POINTS = 1000
+BATCH_SIZE = 5000
+# Grafana rounds the window period up to one of these, in seconds
+ROUND_INTERVALS = [1, 2, 5, 10, 15, 20, 30, 60, 120, 300, 600, 900, 1200, 1800, 3600, 7200, 10800, 21600, 43200,
+                   86400, 604800]
+STAGE_SEPARATOR = fluxLinter.STAGE_SEPARATOR
+ANNOTATIONS = ["datatype", "group", "default"]
+VARIABLE_PATTERN = re.compile(r"\bv\.(timeRangeStart|timeRangeStop|windowPeriod|defaultBucket)\b")
+
+
+def telemetry_dashboard() -> dict:
+    """
+    A dashboard of the system telemetry with the panel queries dashboards typically have, including a panel
+    that returns raw points, which FluxLint would flag.
+
+    :return: The dashboard JSON.
+    """
+
+    def query(measurement, *stages):
+        return STAGE_SEPARATOR.join(['from(bucket: v.defaultBucket)',
+                                     'range(start: v.timeRangeStart, stop: v.timeRangeStop)',
+                                     'filter(fn: (r) => r._measurement == "{}" and r._field == "V")'.format(measurement)]
+                                    + list(stages))
+
+    panels = [
+        ("CPU usage", query("CpuUsage", "aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)")),
+        ("Memory usage", query("SystemMemUsage", "aggregateWindow(every: v.windowPeriod, fn: max, createEmpty: false)")),
+        ("Components running", query("NumberOfComponentsRunning", "last()")),
+        ("Open file descriptors (raw)", query("TotalNumberOfFDs"))
+    ]
+    return {
+        "title": "Greengrass system telemetry",
+        "tags": ["benchmark"],
+        "panels": [{"id": i + 1, "type": "timeseries", "title": title, "datasource": "${DS_INFLUXDB}",
+                    "targets": [{"refId": "A", "query": flux}]} for i, (title, flux) in enumerate(panels)]
+    }
+
+
+def generate_telemetry(devices, interval, start_ns, end_ns, seed=0):
+    """
+    Generate system telemetry points as line protocol: every metric of every device, once per interval.
+
+    :param devices: The number of devices; each adds one series per metric.
+    :param interval: The seconds between two points of a series.
+    :param start_ns: The time of the first points, in nanoseconds since the epoch.
+    :param end_ns: The time the points end before, in nanoseconds since the epoch.
+    :param seed: The seed of the random values, so that runs are comparable.
+    :return: A generator of line protocol lines.
+    """
+    rng = random.Random(seed)
+    state = {(device, metric[1]): rng.uniform(10, 50) for device in range(devices) for metric in TELEMETRY_METRICS}
+    for timestamp in range(start_ns, end_ns, int(interval * fluxEngine.NS)):
+        for device in range(devices):
+            for namespace, name, unit, aggregation in TELEMETRY_METRICS:
+                # A bounded random walk, with counts as integers
+                value = min(max(state[(device, name)] + rng.uniform(-2, 2), 0), 100)
+                state[(device, name)] = value
+                tags = {"NS": namespace, "U": unit, "A": aggregation, "device": "device-{:03d}".format(device)}
+                yield selfTelemetry.to_line_protocol(name, tags, {"V": int(value) if unit == "Count" else value},
+                                                     timestamp)
+
+
+def ingest(session, influxdb, lines, batch_size) -> dict:
+    """
+    Write line protocol to the InfluxDB stand-in in batches.
+
+    :param session: The requests session authenticated with the InfluxDB token.
+    :param influxdb: The FakeInfluxDBServer.
+    :param lines: The line protocol lines.
+    :param batch_size: The maximum number of lines per write request.
+    :return: The number of points and write requests, and the write throughput.
+    """
+    points = 0
+    requests_sent = 0
+    start = time.monotonic()
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            _write(session, influxdb, batch)
+            points += len(batch)
+            requests_sent += 1
+            batch = []
+    if batch:
+        _write(session, influxdb, batch)
+        points += len(batch)
+        requests_sent += 1
+    seconds = time.monotonic() - start
+    return {"points": points, "write_requests": requests_sent, "seconds": seconds,
+            "points_per_second": points / seconds if seconds else float("inf")}
+
+
+def _write(session, influxdb, batch) -> None:
+    response = session.post(influxdb.url + selfTelemetry.WRITE_PATH, data="\n".join(batch).encode("utf-8"),
+                            params={"org": ORG, "bucket": BUCKET, "precision": "ns"})
+    if response.status_code != 204:
+        raise RuntimeError("Write failed with status code {}: {}".format(response.status_code, response.text))
+
+
+def roll_up(influxdb, tiers) -> dict:
+    """
+    Fill the rollup bucket of every tier with what its downsampling task writes: the aggregate of every
+    series of the raw bucket per window.
+
+    :param influxdb: The FakeInfluxDBServer holding the raw points.
+    :param tiers: The downsampling tiers, as returned by downsamplingTiers.parse_tiers.
+    :return: The number of points of every rollup bucket.
+    """
+    points = {}
+    for tier in tiers:
+        bucket = downsamplingTiers.tier_bucket(tier, BUCKET)
+        tables = fluxEngine.evaluate(influxdb.store, STAGE_SEPARATOR.join([
+            'from(bucket: "{}")'.format(BUCKET), 'range(start: 0)',
+            'aggregateWindow(every: {}, fn: {}, createEmpty: false)'.format(
+                tier["every"], tier.get("fn", downsamplingTiers.DEFAULT_FUNCTION))]))
+        with influxdb.lock:
+            points[bucket] = influxdb.store.write_tables(bucket, tables)
+    return points
+
+
+def window_period(time_range, max_data_points, options) -> int:
+    """
+    Compute the window period Grafana binds v.windowPeriod to: the time range divided by the number of data
+    points the panel asks for, rounded up to a round interval and at least the datasource's minimum interval.
+
+    :param time_range: The dashboard time range in seconds.
+    :param max_data_points: The number of data points the panel asks for.
+    :param options: The datasource jsonData options of the profile.
+    :return: The window period in seconds.
+    """
+    interval = time_range / max_data_points
+    rounded = next((r for r in ROUND_INTERVALS if r >= interval), ROUND_INTERVALS[-1])
+    minimum = downsamplingTiers.duration_seconds(options["timeInterval"]) if options.get("timeInterval") else 0
+    return max(rounded, minimum)
+
+
+def bind_query(flux, bucket, start_ns, stop_ns, period) -> str:
+    """
+    Bind the dashboard variables of a Flux query as Grafana does before sending it.
+
+    :param flux: The panel query.
+    :param bucket: The default bucket of the datasource.
+    :param start_ns: The start of the dashboard time range, in nanoseconds since the epoch.
+    :param stop_ns: The end of the dashboard time range, in nanoseconds since the epoch.
+    :param period: The window period in seconds.
+    :return: The bound query.
+    """
+    values = {"timeRangeStart": fluxEngine.format_time(start_ns), "timeRangeStop": fluxEngine.format_time(stop_ns),
+              "windowPeriod": "{}s".format(period), "defaultBucket": json.dumps(bucket)}
+    return VARIABLE_PATTERN.sub(lambda match: values[match.group(1)], flux)
+
+
+def percentile(values, percent) -> float:
+    """
+    :param values: The measurements.
+    :param percent: The percentile, between 0 and 100.
+    :return: The nearest-rank percentile of the measurements.
+    """
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(percent / 100.0 * len(ordered))) - 1, 0)]
+
+
+def run_query(session, influxdb, flux, repeat) -> dict:
+    """
+    Send a query the given number of times, as Grafana's Flux datasource does.
+
+    :param session: The requests session authenticated with the InfluxDB token.
+    :param influxdb: The FakeInfluxDBServer.
+    :param flux: The bound query.
+    :param repeat: The number of times to send it.
+    :return: The latency of every run, the bytes, rows and series of the response, and the error, if any.
+    """
+    body = json.dumps({"query": flux, "type": "flux", "dialect": {"annotations": ANNOTATIONS}})
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = session.post(influxdb.url + "/api/v2/query", params={"org": ORG}, data=body)
+        latencies.append(time.perf_counter() - start)
+    rows = [line for line in response.text.split("\r\n") if line.startswith(",_result,")]
+    return {
+        "latencies": latencies,
+        "bytes": len(response.content),
+        "rows": len(rows),
+        "series": len({row.split(",", 3)[2] for row in rows}),
+        "error": response.json().get("message") if response.status_code != 200 else None
+    }
+
+
+def load_queries(dashboards_dir) -> list:
+    """
+    :param dashboards_dir: The directory of the dashboard JSON files, or an empty string for the built-in one.
+    :return: (dashboard file, panel title, refId, query) tuples of every Flux query of the dashboards.
+    """
+    dashboards = provisionDashboards.load_dashboards(dashboards_dir) if dashboards_dir \
+        else [("telemetry.json", telemetry_dashboard())]
+    return [(file_name, panel.get("title"), target.get("refId"), target["query"])
+            for file_name, dashboard in dashboards for panel in fluxLinter.iter_panels(dashboard)
+            for target in panel["targets"] if isinstance(target, dict) and isinstance(target.get("query"), str)]
+
+
+def replay(session, influxdb, queries, datasource, options, profile, time_range_ns, stop_ns) -> list:
+    """
+    Replay every query against one datasource with the settings of one profile.
+
+    :return: One result per query.
+    """
+    profile_options = datasourceProfiles.profile_options(profile)
+    period = window_period(time_range_ns / fluxEngine.NS, options.max_data_points, profile_options)
+    results = []
+    for file_name, title, ref_id, flux in queries:
+        bound = bind_query(flux, datasource["bucket"], stop_ns - time_range_ns, stop_ns, period)
+        result = run_query(session, influxdb, bound, options.repeat)
+        latencies = result.pop("latencies")
+        results.append(dict(result, profile=profile, datasource=datasource["name"], bucket=datasource["bucket"],
+                            window_period=period, max_series=profile_options.get("maxSeries"), dashboard=file_name,
+                            panel=title, refId=ref_id, latencies=latencies,
+                            latency_p50=percentile(latencies, 50), latency_p95=percentile(latencies, 95)))
+    return results
+
+
+def summarize(results) -> list:
+    summary = []
+    keys = []
+    for result in results:
+        if (result["profile"], result["datasource"]) not in keys:
+            keys.append((result["profile"], result["datasource"]))
+    for profile, datasource in keys:
+        runs = [r for r in results if (r["profile"], r["datasource"]) == (profile, datasource)]
+        latencies = [latency for r in runs for latency in r["latencies"]]
+        max_series = runs[0]["max_series"]
+        summary.append({
+            "profile": profile,
+            "datasource": datasource,
+            "bucket": runs[0]["bucket"],
+            "window_period": runs[0]["window_period"],
+            "queries": len(runs),
+            "errors": sum(r["error"] is not None for r in runs),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            # What one refresh of all dashboards transfers
+            "bytes_per_refresh": sum(r["bytes"] for r in runs),
+            "rows_per_refresh": sum(r["rows"] for r in runs),
+            "series_max": max(r["series"] for r in runs),
+            # Grafana drops the series beyond maxSeries, after InfluxDB has already returned them
+            "queries_over_max_series": sum(max_series is not None and r["series"] > max_series for r in runs)
+        })
+    return summary
+
+
+def run_benchmark(options) -> dict:
+    """
+    Load the telemetry, roll it up, and replay the queries for every profile and datasource.
+
+    :param options: The parsed benchmark options.
+    :return: The JSON-serializable benchmark report.
+    """
+    profiles = options.profiles.split(",")
+    for profile in profiles:
+        datasourceProfiles.validate_profile(profile)
+    tiers = downsamplingTiers.parse_tiers(options.tiers)
+    interval = downsamplingTiers.duration_seconds(options.interval)
+    time_range_ns = downsamplingTiers.duration_seconds(options.time_range) * fluxEngine.NS
+    queries = load_queries(options.dashboards_dir)
+    # Whole intervals, so that runs with the same options write the same points
+    end_ns = int(time.time()) // interval * interval * fluxEngine.NS
+    start_ns = end_ns - downsamplingTiers.duration_seconds(options.history) * fluxEngine.NS
+
+    datasources = [{"name": DATASOURCE_NAME, "bucket": BUCKET}] + downsamplingTiers.tier_datasource_specs(tiers, BUCKET)
+    with FakeInfluxDBServer(evaluate_queries=True) as influxdb, requests.Session() as session:
+        session.headers.update({"Authorization": "Token {}".format(TOKEN), "Content-Type": "application/json",
+                                "Accept": "application/csv"})
+        ingested = ingest(session, influxdb, generate_telemetry(options.devices, interval, start_ns, end_ns,
+                                                                options.seed), options.batch_size)
+        rollups = roll_up(influxdb, tiers)
+        results = []
+        for profile in profiles:
+            for datasource in datasources:
+                results.extend(replay(session, influxdb, queries, datasource, options, profile, time_range_ns,
+                                      end_ns))
+
+    return {
+        "version": RESULTS_FORMAT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": vars(options),
+        "ingest": dict(ingested, series=options.devices * len(TELEMETRY_METRICS)),
+        "rollups": rollups,
+        "summary": summarize(results),
+        "results": results
+    }
+
+
+def parse_arguments(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard queries against synthetic telemetry.")
+    parser.add_argument("--devices", type=int, default=DEVICES,
+                        help="devices to generate telemetry for; each adds {} series".format(len(TELEMETRY_METRICS)))
+    parser.add_argument("--interval", type=str, default=INTERVAL, help="time between two points of a series")
+    parser.add_argument("--history", type=str, default=HISTORY, help="how much telemetry to generate")
+    parser.add_argument("--time_range", type=str, default=TIME_RANGE, help="the dashboard time range")
+    parser.add_argument("--profiles", type=str, default=PROFILES,
+                        help="comma-separated datasource profiles to compare")
+    parser.add_argument("--tiers", type=str, default=TIERS,
+                        help="downsampling tiers to compare the raw bucket with, as a JSON list")
+    parser.add_argument("--dashboards_dir", type=str, default="",
+                        help="replay the dashboards of this directory instead of the built-in one")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="times every query is sent")
+    parser.add_argument("--max_data_points", type=int, default=MAX_DATA_POINTS,
+                        help="data points a panel asks for, about its width in pixels")
+    parser.add_argument("--batch_size", type=int, default=BATCH_SIZE, help="points per write request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="", help="write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="keep the INFO logs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> dict:
+    options = parse_arguments(argv)
+    if not options.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    report = run_benchmark(options)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
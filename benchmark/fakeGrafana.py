@@ -0,0 +1,188 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import json
+import os
+import re
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+def create_self_signed_cert(directory) -> tuple:
+    """
+    Create a self-signed certificate for localhost with openssl.
+
+    :param directory: The directory to write the certificate and key to.
+    :return: The (cert path, key path) tuple.
+    """
+    cert = os.path.join(directory, "grafana.crt")
+    key = os.path.join(directory, "grafana.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-keyout", key, "-out", cert], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return cert, key
+
+
+class FakeGrafanaServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the parts of the Grafana HTTP API used to provision datasources and dashboards. It keeps
+    the provisioned state in memory and counts the connections and requests it receives.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, cert=None):
+        """
+        :param delay: Seconds added to every response, to model a loaded Grafana.
+        :param cert: The (cert path, key path) tuple to serve HTTPS with, or None for HTTP.
+        """
+        super().__init__(("127.0.0.1", 0), FakeGrafanaHandler)
+        if cert is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*cert)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.delay = delay
+        self.datasources = {}
+        self.dashboards = {}
+        self.connection_count = 0
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeGrafanaServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.connection_count = 0
+            self.requests.clear()
+
+    def request_count(self) -> int:
+        with self.lock:
+            return sum(self.requests.values())
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# Request paths are grouped by endpoint in the request counters
+ROUTES = [
+    ("GET", re.compile(r"^/api/health$"), "health"),
+    ("GET", re.compile(r"^/api/datasources$"), "list_datasources"),
+    ("GET", re.compile(r"^/api/datasources/name/(?P<name>[^/?]+)$"), "get_datasource"),
+    ("POST", re.compile(r"^/api/datasources$"), "create_datasource"),
+    ("PUT", re.compile(r"^/api/datasources/(?P<id>\d+)$"), "update_datasource"),
+    ("GET", re.compile(r"^/api/search(\?.*)?$"), "search_dashboards"),
+    ("POST", re.compile(r"^/api/dashboards/db$"), "push_dashboard"),
+]
+
+
+class FakeGrafanaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length).decode("utf-8")) if length else None
+        for method, pattern, endpoint in ROUTES:
+            match = pattern.match(self.path)
+            if method == self.command and match:
+                break
+        else:
+            endpoint, match = None, None
+        with self.server.lock:
+            self.server.requests[endpoint or "unknown"] += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if endpoint is None:
+            self._send(404, {"message": "Not found"})
+            return
+        status, response = getattr(self, endpoint)(body, **match.groupdict())
+        self._send(status, response)
+
+    do_GET = do_POST = do_PUT = _handle
+
+    def health(self, body):
+        return 200, {"database": "ok"}
+
+    def list_datasources(self, body):
+        with self.server.lock:
+            return 200, list(self.server.datasources.values())
+
+    def get_datasource(self, body, name):
+        with self.server.lock:
+            datasource = self.server.datasources.get(name)
+        if datasource is None:
+            return 404, {"message": "Data source not found"}
+        return 200, datasource
+
+    def create_datasource(self, body):
+        with self.server.lock:
+            if body["name"] in self.server.datasources:
+                return 409, {"message": "data source with the same name already exists"}
+            datasource_id = len(self.server.datasources) + 1
+            # Like Grafana, keep the uid the client chose and generate one otherwise
+            uid = body.get("uid") or "ds{}".format(datasource_id)
+            datasource = self._store_datasource(dict(body, id=datasource_id, uid=uid))
+        return 200, {"datasource": datasource, "id": datasource_id, "message": "Datasource added"}
+
+    def update_datasource(self, body, id):
+        with self.server.lock:
+            existing = [d for d in self.server.datasources.values() if d["id"] == int(id)]
+            if not existing:
+                return 404, {"message": "Data source not found"}
+            secure_fields = dict(existing[0].get("secureJsonFields", {}))
+            self.server.datasources.pop(existing[0]["name"])
+            datasource = self._store_datasource(dict(body, id=int(id), uid=existing[0]["uid"]), secure_fields)
+        return 200, {"datasource": datasource, "message": "Datasource updated"}
+
+    def _store_datasource(self, datasource, secure_fields=None):
+        # Like Grafana, only report which secure fields are set, never their values
+        secure_fields = dict(secure_fields or {})
+        secure_fields.update({k: True for k in datasource.pop("secureJsonData", {})})
+        datasource["secureJsonFields"] = secure_fields
+        self.server.datasources[datasource["name"]] = datasource
+        return datasource
+
+    def search_dashboards(self, body):
+        with self.server.lock:
+            return 200, [{"uid": uid, "tags": dashboard.get("tags", []), "type": "dash-db"}
+                         for uid, dashboard in self.server.dashboards.items()]
+
+    def push_dashboard(self, body):
+        dashboard = body["dashboard"]
+        with self.server.lock:
+            self.server.dashboards[dashboard["uid"]] = dashboard
+        return 200, {"uid": dashboard["uid"], "status": "success"}
@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import concurrent.futures
+import json
+import threading
+
+from awsiot.greengrasscoreipc.model import (
+    GetSecretValueResponse,
+    JsonMessage,
+    PublishToTopicResponse,
+    SecretValue,
+    SubscribeToTopicResponse,
+    SubscriptionResponseMessage
+)
+
+GRAFANA_USERNAME = "admin"
+GRAFANA_PASSWORD = "benchmark"
+INFLUXDB_PARAMETERS = {
+    "InfluxDBContainerName": "greengrass_InfluxDB",
+    "InfluxDBOrg": "greengrass",
+    "InfluxDBBucket": "greengrass-telemetry",
+    "InfluxDBPort": "8086",
+    "InfluxDBInterface": "127.0.0.1",
+    "InfluxDBToken": "benchmarkToken",
+    "InfluxDBServerProtocol": "http",
+    "InfluxDBSkipTLSVerify": "true",
+    "InfluxDBTokenAccessType": "RO"
+}
+
+
+def completed_future(result=None) -> concurrent.futures.Future:
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+def delayed_future(delay, result) -> concurrent.futures.Future:
+    if delay <= 0:
+        return completed_future(result)
+    future = concurrent.futures.Future()
+    threading.Timer(delay, future.set_result, [result]).start()
+    return future
+
+
+class FakeOperation:
+    """
+    Stands in for an IPC stream operation: activate() sends the request and get_response() waits for the reply.
+    """
+
+    def __init__(self, on_activate, response):
+        self.on_activate = on_activate
+        self.response = response
+
+    def activate(self, request) -> concurrent.futures.Future:
+        self.on_activate(request)
+        return completed_future()
+
+    def get_response(self) -> concurrent.futures.Future:
+        return self.response
+
+    def close(self) -> concurrent.futures.Future:
+        return completed_future()
+
+
+class FakeGreengrassIPC:
+    """
+    In-process stand-in for the Greengrass IPC client, playing the part of the secret manager and of the
+    InfluxDB component answering token requests. Replies are delayed to model the nucleus round trip.
+    """
+
+    def __init__(self, secret_delay=0.0, token_delay=0.0, influxdb_parameters=None):
+        """
+        :param secret_delay: Seconds before a secret request is answered.
+        :param token_delay: Seconds before a published token request is answered on the response topic.
+        :param influxdb_parameters: The InfluxDB parameters sent in token responses.
+        """
+        self.secret_delay = secret_delay
+        self.token_delay = token_delay
+        self.influxdb_parameters = dict(influxdb_parameters or INFLUXDB_PARAMETERS)
+        self.secret_string = json.dumps({"grafana_username": GRAFANA_USERNAME, "grafana_password": GRAFANA_PASSWORD})
+        self.handlers = []
+        self.request_count = 0
+        self.close_count = 0
+        self._lock = threading.Lock()
+
+    def _count(self) -> None:
+        with self._lock:
+            self.request_count += 1
+
+    def new_get_secret_value(self) -> FakeOperation:
+        response = GetSecretValueResponse(secret_value=SecretValue(secret_string=self.secret_string))
+        return FakeOperation(lambda request: self._count(), delayed_future(self.secret_delay, response))
+
+    def new_subscribe_to_topic(self, handler) -> FakeOperation:
+        def subscribe(request):
+            self._count()
+            with self._lock:
+                self.handlers.append(handler)
+        return FakeOperation(subscribe, completed_future(SubscribeToTopicResponse()))
+
+    def new_publish_to_topic(self) -> FakeOperation:
+        def publish(request):
+            self._count()
+            message = SubscriptionResponseMessage(json_message=JsonMessage(message=dict(self.influxdb_parameters)))
+            with self._lock:
+                handlers = list(self.handlers)
+            for handler in handlers:
+                threading.Timer(self.token_delay, handler.on_stream_event, [message]).start()
+        return FakeOperation(publish, completed_future(PublishToTopicResponse()))
+
+    def close(self) -> None:
+        self.close_count += 1
@@ -0,0 +1,223 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+import fluxEngine
+
+ORG = "greengrass"
+ORG_ID = "0000000000000001"
+BUCKET = "greengrass-telemetry"
+TOKEN = "admintoken"
+
+
+class FakeInfluxDBServer(ThreadingMixIn, HTTPServer):
+    """
+    Local stand-in for the parts of the InfluxDB v2 HTTP API used by this component: line protocol writes,
+    bucket and task management, and Flux queries, which are answered with a CSV echoing the query unless the
+    written points are kept to evaluate the queries against. It keeps its state in memory, checks the token of
+    every request and counts the requests it receives by endpoint.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, token=TOKEN, org=ORG, bucket=BUCKET, evaluate_queries=False):
+        """
+        :param token: The only token accepted.
+        :param org: The name of the one org.
+        :param bucket: The name of a bucket that exists from the start.
+        :param evaluate_queries: Keep the written points in a fluxEngine.PointStore and answer queries with
+            their results.
+        """
+        super().__init__(("127.0.0.1", 0), FakeInfluxDBHandler)
+        self.token = token
+        self.orgs = {org: ORG_ID}
+        self.buckets = {}
+        self.tasks = {}
+        self.writes = []
+        # The next this many writes fail with 503
+        self.fail_writes = 0
+        self.queries = []
+        # Seconds every query takes, to let identical queries overlap
+        self.query_delay = 0
+        self.store = fluxEngine.PointStore() if evaluate_queries else None
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+        self._next_id = 1
+        self._thread = None
+        self.add_bucket(ORG_ID, bucket, [])
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self.port)
+
+    def new_id(self) -> str:
+        self._next_id += 1
+        return "{:016x}".format(self._next_id)
+
+    def add_bucket(self, org_id, name, retention_rules) -> dict:
+        bucket = {"id": self.new_id(), "orgID": org_id, "name": name, "retentionRules": retention_rules}
+        self.buckets[bucket["id"]] = bucket
+        return bucket
+
+    def lines(self) -> list:
+        with self.lock:
+            return [line for write in self.writes for line in write["body"].split("\n")]
+
+    def start(self) -> "FakeInfluxDBServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+ROUTES = [
+    ("GET", re.compile(r"^/health$"), "health"),
+    ("POST", re.compile(r"^/api/v2/write$"), "write"),
+    ("POST", re.compile(r"^/api/v2/query$"), "query"),
+    ("GET", re.compile(r"^/api/v2/orgs$"), "list_orgs"),
+    ("GET", re.compile(r"^/api/v2/buckets$"), "list_buckets"),
+    ("POST", re.compile(r"^/api/v2/buckets$"), "create_bucket"),
+    ("PATCH", re.compile(r"^/api/v2/buckets/(?P<id>[0-9a-f]+)$"), "update_bucket"),
+    ("GET", re.compile(r"^/api/v2/tasks$"), "list_tasks"),
+    ("POST", re.compile(r"^/api/v2/tasks$"), "create_task"),
+    ("PATCH", re.compile(r"^/api/v2/tasks/(?P<id>[0-9a-f]+)$"), "update_task"),
+]
+TASK_NAME_PATTERN = re.compile(r'option task = \{[^}]*name: "(?P<name>[^"]+)"')
+
+
+class FakeInfluxDBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would delay on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None):
+        if isinstance(body, str):
+            payload, content_type = body.encode("utf-8"), "text/csv; charset=utf-8"
+        else:
+            payload = json.dumps(body).encode("utf-8") if body is not None else b""
+            content_type = "application/json"
+        self.send_response(status)
+        if payload:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        for method, pattern, endpoint in ROUTES:
+            match = pattern.match(url.path)
+            if method == self.command and match:
+                break
+        else:
+            endpoint, match = None, None
+        if endpoint == "query" and self.server.query_delay:
+            time.sleep(self.server.query_delay)
+        with self.server.lock:
+            self.server.requests[endpoint or "unknown"] += 1
+            if endpoint is None:
+                self._send(404, {"code": "not found", "message": "path not found"})
+            elif endpoint != "health" and self.headers.get("Authorization") != "Token {}".format(self.server.token):
+                self._send(401, {"code": "unauthorized", "message": "unauthorized access"})
+            else:
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                self._send(*getattr(self, endpoint)(query, body, **match.groupdict()))
+
+    do_GET = do_POST = do_PATCH = _handle
+
+    def write(self, query, body):
+        if self.server.fail_writes:
+            self.server.fail_writes -= 1
+            return 503, {"code": "unavailable", "message": "service unavailable"}
+        # Evaluated writes are only kept as points, so that large loads don't also keep every request body
+        if self.server.store is not None:
+            try:
+                self.server.store.write(query.get("bucket"), body, query.get("precision", "ns"))
+            except ValueError as e:
+                return 400, {"code": "invalid", "message": str(e)}
+        else:
+            self.server.writes.append({"params": query, "body": body})
+        return (204,)
+
+    def query(self, query, body):
+        request = json.loads(body) if body.startswith("{") else {"query": body}
+        flux = request["query"]
+        self.server.queries.append(flux)
+        if self.server.store is None:
+            return 200, ",result,table,_value\r\n,_result,0,{}\r\n".format(len(self.server.queries))
+        try:
+            tables = fluxEngine.evaluate(self.server.store, flux)
+        except ValueError as e:
+            return 400, {"code": "invalid", "message": str(e)}
+        return 200, fluxEngine.render_csv(tables, (request.get("dialect") or {}).get("annotations", ()))
+
+    def health(self, query, body):
+        return 200, {"name": "influxdb", "status": "pass"}
+
+    def list_orgs(self, query, body):
+        return 200, {"orgs": [{"id": org_id, "name": name} for name, org_id in self.server.orgs.items()
+                              if query.get("org") in (None, name)]}
+
+    def list_buckets(self, query, body):
+        return 200, {"buckets": [bucket for bucket in self.server.buckets.values()
+                                 if query.get("orgID") in (None, bucket["orgID"])
+                                 and query.get("name") in (None, bucket["name"])]}
+
+    def create_bucket(self, query, body):
+        request = json.loads(body)
+        if any(b["name"] == request["name"] for b in self.server.buckets.values()):
+            return 422, {"code": "conflict", "message": "bucket with name {} already exists".format(request["name"])}
+        return 201, self.server.add_bucket(request["orgID"], request["name"], request.get("retentionRules", []))
+
+    def update_bucket(self, query, body, id):
+        if id not in self.server.buckets:
+            return 404, {"code": "not found", "message": "bucket not found"}
+        self.server.buckets[id].update(json.loads(body))
+        return 200, self.server.buckets[id]
+
+    def list_tasks(self, query, body):
+        return 200, {"tasks": [task for task in self.server.tasks.values()
+                               if query.get("orgID") in (None, task["orgID"])
+                               and query.get("name") in (None, task["name"])]}
+
+    def create_task(self, query, body):
+        request = json.loads(body)
+        name = TASK_NAME_PATTERN.search(request["flux"])
+        if name is None:
+            return 400, {"code": "invalid", "message": "task options are missing"}
+        # Like InfluxDB, accept tasks with duplicate names
+        task = {"id": self.server.new_id(), "orgID": request["orgID"], "name": name.group("name"),
+                "flux": request["flux"], "status": request.get("status", "active")}
+        self.server.tasks[task["id"]] = task
+        return 201, task
+
+    def update_task(self, query, body, id):
+        if id not in self.server.tasks:
+            return 404, {"code": "not found", "message": "task not found"}
+        self.server.tasks[id].update(json.loads(body))
+        return 200, self.server.tasks[id]
@@ -0,0 +1,584 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+A small in-memory stand-in for the InfluxDB storage and query engine: points written as line protocol are kept
+by bucket and series, and single-pipeline Flux queries of the form dashboards send are evaluated against them
+and answered with annotated CSV. It supports from(), range(), filter() on comparisons of columns with literals,
+aggregateWindow(), the mean/median/sum/count/min/max/first/last reducers, limit() and yield(); anything else
+is rejected like an invalid query.
+"""
+
+import bisect
+import calendar
+import collections
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+import fluxLinter  # noqa: E402
+
+NS = 1000000000
+PRECISIONS = {"ns": 1, "us": 1000, "ms": 1000000, "s": NS}
+DURATION_UNITS = {"ns": 1, "us": 1000, "ms": 1000000, "s": NS, "m": 60 * NS, "h": 3600 * NS, "d": 86400 * NS,
+                  "w": 604800 * NS, "mo": 2592000 * NS, "y": 31536000 * NS}
+DURATION_PATTERN = re.compile(r"^(-?)((?:\d+(?:ns|us|ms|mo|s|m|h|d|w|y))+)$")
+DURATION_PART_PATTERN = re.compile(r"(\d+)(ns|us|ms|mo|s|m|h|d|w|y)")
+TIMESTAMP_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d{1,9}))?Z$")
+TOKEN_PATTERN = re.compile(r'\s*(?:(?P<string>"(?:[^"\\]|\\.)*")|(?P<column>r\.\w+|r\["[^"]+"\])|'
+                           r'(?P<number>-?\d+(?:\.\d+)?)|(?P<op>==|!=|>=|<=|>|<|\(|\))|'
+                           r'(?P<word>and|or|not|true|false)\b)')
+FILTER_FN_PATTERN = re.compile(r"^\(\s*r\s*\)\s*=>\s*(.+)$", re.DOTALL)
+COMPARISONS = {"==": lambda a, b: a == b, "!=": lambda a, b: a != b, ">": lambda a, b: a > b,
+               "<": lambda a, b: a < b, ">=": lambda a, b: a >= b, "<=": lambda a, b: a <= b}
+AGGREGATES = {
+    "mean": lambda values: sum(values) / len(values),
+    "median": lambda values: sorted(values)[(len(values) - 1) // 2],
+    "sum": sum,
+    "count": len,
+    "min": min,
+    "max": max,
+    "first": lambda values: values[0],
+    "last": lambda values: values[-1]
+}
+# Selectors keep the time of the point they select, the other aggregates don't have one
+SELECTORS = ("min", "max", "first", "last")
+ROW_COLUMNS = ("_time", "_value")
+CSV_COLUMNS = ["", "result", "table", "_start", "_stop", "_time", "_value", "_field", "_measurement"]
+
+
+def parse_duration(duration) -> int:
+    """
+    :param duration: A Flux duration literal, e.g. 1h30m or -5m.
+    :return: The duration in nanoseconds.
+    """
+    match = DURATION_PATTERN.match(duration.strip())
+    if not match:
+        raise ValueError("Invalid duration {}".format(duration))
+    total = sum(int(count) * DURATION_UNITS[unit] for count, unit in DURATION_PART_PATTERN.findall(match.group(2)))
+    return -total if match.group(1) else total
+
+
+def parse_time(value, now_ns) -> int:
+    """
+    :param value: A Flux time: an RFC3339 timestamp, a duration relative to now, now() or an integer.
+    :param now_ns: The current time in nanoseconds since the epoch.
+    :return: The time in nanoseconds since the epoch.
+    """
+    value = value.strip()
+    if value == "now()":
+        return now_ns
+    if re.match(r"^-?\d+$", value):
+        return int(value)
+    match = TIMESTAMP_PATTERN.match(value)
+    if match:
+        seconds = calendar.timegm(time.strptime(match.group(1), "%Y-%m-%dT%H:%M:%S"))
+        return seconds * NS + int((match.group(2) or "0").ljust(9, "0"))
+    return now_ns + parse_duration(value)
+
+
+def format_time(timestamp_ns) -> str:
+    seconds, fraction = divmod(timestamp_ns, NS)
+    text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+    return text + ("." + "{:09d}".format(fraction).rstrip("0") if fraction else "") + "Z"
+
+
+def _split_unescaped(text, separators, limit=None) -> list:
+    """
+    Split a line protocol section on unescaped separators outside double-quoted strings.
+    """
+    parts = []
+    current = []
+    quoted = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and i + 1 < len(text):
+            current.append(text[i:i + 2])
+            i += 2
+            continue
+        if char == '"':
+            quoted = not quoted
+        if char in separators and not quoted and (limit is None or len(parts) < limit):
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    parts.append("".join(current))
+    return parts
+
+
+def _unescape(text) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def _field_value(text):
+    if text.startswith('"'):
+        return _unescape(text[1:-1])
+    if text in ("t", "T", "true", "True", "TRUE"):
+        return True
+    if text in ("f", "F", "false", "False", "FALSE"):
+        return False
+    if text[-1] in "iu":
+        return int(text[:-1])
+    return float(text)
+
+
+def parse_line(line, precision=1) -> tuple:
+    """
+    Parse one line of line protocol.
+
+    :param line: The line.
+    :param precision: The number of nanoseconds in a unit of the timestamp.
+    :return: The (measurement, tags, fields, timestamp) tuple, with the tags as a sorted tuple of pairs and the
+        timestamp in nanoseconds, or None if the line has no timestamp.
+    """
+    sections = _split_unescaped(line, " ", limit=2)
+    if len(sections) < 2:
+        raise ValueError("Invalid line protocol: {}".format(line))
+    key = _split_unescaped(sections[0], ",")
+    tags = tuple(sorted(tuple(_unescape(part) for part in _split_unescaped(tag, "=", limit=1)) for tag in key[1:]))
+    fields = {}
+    for field in _split_unescaped(sections[1], ","):
+        name, value = _split_unescaped(field, "=", limit=1)
+        fields[_unescape(name)] = _field_value(value)
+    timestamp = int(sections[2]) * precision if len(sections) > 2 and sections[2].strip() else None
+    return _unescape(key[0]), tags, fields, timestamp
+
+
+class Series:
+    """
+    The points of one series, sorted by time when read.
+    """
+
+    __slots__ = ("times", "values", "_sorted")
+
+    def __init__(self):
+        self.times = []
+        self.values = []
+        self._sorted = True
+
+    def add(self, timestamp, value) -> None:
+        if self.times and timestamp < self.times[-1]:
+            self._sorted = False
+        self.times.append(timestamp)
+        self.values.append(value)
+
+    def sort(self) -> None:
+        if not self._sorted:
+            points = sorted(zip(self.times, self.values), key=lambda point: point[0])
+            self.times = [point[0] for point in points]
+            self.values = [point[1] for point in points]
+            self._sorted = True
+
+
+class PointStore:
+    """
+    Points by bucket name and series key, the series key being the (measurement, tags, field) tuple. Not
+    thread-safe on its own; FakeInfluxDBServer serializes the requests that use it.
+    """
+
+    def __init__(self, clock=time.time):
+        """
+        :param clock: The wall clock, for points without a timestamp and for queries relative to now.
+        """
+        self.buckets = collections.defaultdict(dict)
+        self._clock = clock
+
+    def now(self) -> int:
+        return int(self._clock() * NS)
+
+    def add(self, bucket, measurement, tags, field, timestamp, value) -> None:
+        key = (measurement, tags, field)
+        series = self.buckets[bucket].get(key)
+        if series is None:
+            series = self.buckets[bucket][key] = Series()
+        series.add(timestamp, value)
+
+    def write(self, bucket, body, precision="ns") -> int:
+        """
+        Store a line protocol write.
+
+        :param bucket: The bucket name.
+        :param body: The line protocol lines.
+        :param precision: The precision of the timestamps: ns, us, ms or s.
+        :return: The number of points stored, one per field of every line.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError("Invalid precision {}".format(precision))
+        count = 0
+        for line in body.split("\n"):
+            if not line.strip() or line.startswith("#"):
+                continue
+            measurement, tags, fields, timestamp = parse_line(line.strip(), PRECISIONS[precision])
+            for field, value in fields.items():
+                self.add(bucket, measurement, tags, field, timestamp if timestamp is not None else self.now(), value)
+                count += 1
+        return count
+
+    def write_tables(self, bucket, tables) -> int:
+        """
+        Store the rows of query results, as the to() function does.
+
+        :param bucket: The bucket name.
+        :param tables: The Tables, as returned by evaluate.
+        :return: The number of points stored.
+        """
+        count = 0
+        for table in tables:
+            for timestamp, value in zip(table.times, table.values):
+                if value is not None:
+                    self.add(bucket, table.measurement, table.tags, table.field, timestamp, value)
+                    count += 1
+        return count
+
+    def point_count(self, bucket) -> int:
+        return sum(len(series.times) for series in self.buckets.get(bucket, {}).values())
+
+    def series(self, bucket) -> list:
+        series = self.buckets.get(bucket)
+        if series is None:
+            raise ValueError('could not find bucket "{}"'.format(bucket))
+        for points in series.values():
+            points.sort()
+        return sorted(series.items())
+
+
+class Table:
+    """
+    One table of a query result: the points of one series within the queried range.
+    """
+
+    __slots__ = ("measurement", "tags", "field", "start", "stop", "times", "values")
+
+    def __init__(self, measurement, tags, field, start, stop, times, values):
+        self.measurement = measurement
+        self.tags = tags
+        self.field = field
+        self.start = start
+        self.stop = stop
+        self.times = times
+        self.values = values
+
+    def key(self) -> dict:
+        """
+        :return: The group key columns of the table.
+        """
+        columns = dict(self.tags)
+        columns.update({"_measurement": self.measurement, "_field": self.field, "_start": self.start,
+                        "_stop": self.stop})
+        return columns
+
+    def replace(self, times, values) -> "Table":
+        return Table(self.measurement, self.tags, self.field, self.start, self.stop, times, values)
+
+
+def _arguments(stage) -> dict:
+    """
+    Get the named arguments of a pipeline stage, e.g. {"every": "v.windowPeriod", "fn": "mean"}.
+    """
+    body = stage[stage.index("(") + 1:stage.rindex(")")]
+    arguments = {}
+    for argument in _split_top_level(body):
+        if argument.strip():
+            name, _, value = argument.partition(":")
+            arguments[name.strip()] = value.strip()
+    return arguments
+
+
+def _split_top_level(text) -> list:
+    parts = []
+    depth = 0
+    quoted = False
+    start = 0
+    for i, char in enumerate(text):
+        if char == '"' and (i == 0 or text[i - 1] != "\\"):
+            quoted = not quoted
+        elif not quoted and char in "([{":
+            depth += 1
+        elif not quoted and char in ")]}":
+            depth -= 1
+        elif not quoted and not depth and char == ",":
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _string(value) -> str:
+    if not (value.startswith('"') and value.endswith('"')):
+        raise ValueError("Expected a string literal, got {}".format(value))
+    return _unescape(value[1:-1])
+
+
+class _Parser:
+    """
+    Compiles the body of a filter function to a predicate over rows.
+    """
+
+    def __init__(self, expression):
+        self.tokens = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = TOKEN_PATTERN.match(expression, position)
+            if not match or match.end() == position:
+                raise ValueError("Unsupported filter expression: {}".format(expression))
+            kind = match.lastgroup
+            self.tokens.append((kind, match.group(kind)))
+            position = match.end()
+            while position < len(expression) and expression[position].isspace():
+                position += 1
+        self.position = 0
+        self.columns = set()
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError("Unexpected {} in filter expression".format(self.peek()[1]))
+        return predicate
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() == ("word", "or"):
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else lambda row: any(operand(row) for operand in operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.peek() == ("word", "and"):
+            self.take()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else lambda row: all(operand(row) for operand in operands)
+
+    def parse_not(self):
+        if self.peek() == ("word", "not"):
+            self.take()
+            operand = self.parse_not()
+            return lambda row: not operand(row)
+        if self.peek() == ("op", "("):
+            self.take()
+            predicate = self.parse_or()
+            if self.take() != ("op", ")"):
+                raise ValueError("Unbalanced parentheses in filter expression")
+            return predicate
+        left = self.parse_operand()
+        kind, op = self.take()
+        if kind != "op" or op not in COMPARISONS:
+            raise ValueError("Expected a comparison in filter expression")
+        right = self.parse_operand()
+        compare = COMPARISONS[op]
+
+        def predicate(row):
+            a, b = left(row), right(row)
+            if a is None or b is None:
+                return False
+            try:
+                return compare(a, b)
+            except TypeError:
+                return False
+        return predicate
+
+    def parse_operand(self):
+        kind, text = self.take()
+        if kind == "string":
+            value = _string(text)
+            return lambda row: value
+        if kind == "number":
+            value = float(text)
+            return lambda row: value
+        if kind == "word" and text in ("true", "false"):
+            value = text == "true"
+            return lambda row: value
+        if kind == "column":
+            column = text[2:] if text.startswith("r.") else text[3:-2]
+            self.columns.add(column)
+            return lambda row: row.get(column)
+        raise ValueError("Unexpected {} in filter expression".format(text))
+
+
+def compile_filter(stage) -> tuple:
+    """
+    :param stage: The filter() stage.
+    :return: The (predicate, columns) tuple: the predicate over a row dict, and the columns it reads.
+    """
+    match = FILTER_FN_PATTERN.match(_arguments(stage).get("fn", ""))
+    if not match:
+        raise ValueError("Unsupported filter function: {}".format(stage))
+    parser = _Parser(match.group(1))
+    return parser.parse(), parser.columns
+
+
+def _range(store, bucket, stage, now_ns) -> list:
+    arguments = _arguments(stage)
+    if "start" not in arguments:
+        raise ValueError("range() needs a start")
+    start = parse_time(arguments["start"], now_ns)
+    stop = parse_time(arguments.get("stop", "now()"), now_ns)
+    tables = []
+    for (measurement, tags, field), series in store.series(bucket):
+        first = bisect.bisect_left(series.times, start)
+        last = bisect.bisect_left(series.times, stop)
+        if first < last:
+            tables.append(Table(measurement, tags, field, start, stop, series.times[first:last],
+                                series.values[first:last]))
+    return tables
+
+
+def _filter(tables, stage) -> list:
+    predicate, columns = compile_filter(stage)
+    if not columns & set(ROW_COLUMNS):
+        # Filters on group key columns keep or drop whole tables
+        return [table for table in tables if predicate(table.key())]
+    filtered = []
+    for table in tables:
+        key = table.key()
+        times, values = [], []
+        for timestamp, value in zip(table.times, table.values):
+            key["_time"], key["_value"] = timestamp, value
+            if predicate(key):
+                times.append(timestamp)
+                values.append(value)
+        if times:
+            filtered.append(table.replace(times, values))
+    return filtered
+
+
+def _aggregate_window(tables, stage) -> list:
+    arguments = _arguments(stage)
+    every = parse_duration(arguments.get("every", ""))
+    function = arguments.get("fn", "")
+    if function not in AGGREGATES or every <= 0:
+        raise ValueError("Unsupported aggregateWindow: {}".format(stage))
+    create_empty = arguments.get("createEmpty", "true") == "true"
+    aggregate = AGGREGATES[function]
+    windowed = []
+    for table in tables:
+        times, values = [], []
+        # Windows are aligned to the epoch; without empty windows, skip straight to the next point
+        window_start = table.start - table.start % every
+        i = 0
+        while window_start < table.stop and (create_empty or i < len(table.times)):
+            if not create_empty:
+                window_start = table.times[i] - table.times[i] % every
+            window_stop = window_start + every
+            j = bisect.bisect_left(table.times, window_stop, i)
+            window = [value for value in table.values[i:j] if value is not None]
+            if window or create_empty:
+                times.append(min(window_stop, table.stop))
+                values.append(aggregate(window) if window else (0 if function == "count" else None))
+            i = j
+            window_start = window_stop
+        windowed.append(table.replace(times, values))
+    return windowed
+
+
+def _reduce(tables, function) -> list:
+    reduced = []
+    aggregate = AGGREGATES[function]
+    for table in tables:
+        points = [(t, v) for t, v in zip(table.times, table.values) if v is not None]
+        if not points:
+            continue
+        value = aggregate([v for _, v in points])
+        timestamp = next(t for t, v in points if v == value) if function in SELECTORS else None
+        reduced.append(table.replace([timestamp], [value]))
+    return reduced
+
+
+def _limit(tables, stage) -> list:
+    arguments = _arguments(stage)
+    n = int(arguments.get("n", "0"))
+    offset = int(arguments.get("offset", "0"))
+    return [table.replace(table.times[offset:offset + n], table.values[offset:offset + n]) for table in tables]
+
+
+def evaluate(store, flux, now_ns=None) -> list:
+    """
+    Evaluate a Flux query that is a single from() |> range() pipeline.
+
+    :param store: The PointStore to read from.
+    :param flux: The Flux query.
+    :param now_ns: The current time in nanoseconds since the epoch; defaults to the store's clock.
+    :return: The result Tables.
+    """
+    now_ns = store.now() if now_ns is None else now_ns
+    statements = [statement for statement in fluxLinter.split_statements(flux) if statement.strip()]
+    if len(statements) != 1:
+        raise ValueError("Only single-pipeline queries are supported, got {} statements".format(len(statements)))
+    _, stages = fluxLinter.split_pipeline(statements[0])
+    if fluxLinter.stage_function(stages[0]) != "from":
+        raise ValueError("Queries must start with from()")
+    bucket = _string(_arguments(stages[0]).get("bucket", ""))
+    if len(stages) < 2 or fluxLinter.stage_function(stages[1]) != "range":
+        raise ValueError("cannot submit unbounded read to \"{}\"; try bounding 'from' with a call to 'range'"
+                         .format(bucket))
+    tables = _range(store, bucket, stages[1], now_ns)
+    for stage in stages[2:]:
+        function = fluxLinter.stage_function(stage)
+        if function == "filter":
+            tables = _filter(tables, stage)
+        elif function == "aggregateWindow":
+            tables = _aggregate_window(tables, stage)
+        elif function in AGGREGATES:
+            tables = _reduce(tables, function)
+        elif function == "limit":
+            tables = _limit(tables, stage)
+        elif function != "yield":
+            raise ValueError("Unsupported Flux function {}()".format(function))
+    return tables
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_csv(tables, annotations=()) -> str:
+    """
+    Render query results as InfluxDB annotated CSV: consecutive tables with the same columns share a header.
+
+    :param tables: The result Tables.
+    :param annotations: The annotation rows the query asked for: datatype, group and default.
+    :return: The CSV.
+    """
+    lines = []
+    columns = None
+    for index, table in enumerate(tables):
+        tag_keys = [key for key, _ in table.tags]
+        if tag_keys != columns:
+            if columns is not None:
+                lines.append("")
+            columns = tag_keys
+            if "datatype" in annotations:
+                lines.append(",".join(["#datatype", "string", "long", "dateTime:RFC3339", "dateTime:RFC3339",
+                                       "dateTime:RFC3339", "double", "string", "string"] + ["string"] * len(tag_keys)))
+            if "group" in annotations:
+                lines.append(",".join(["#group", "false", "false", "true", "true", "false", "false", "true", "true"]
+                                      + ["true"] * len(tag_keys)))
+            if "default" in annotations:
+                lines.append(",".join(["#default", "_result"] + [""] * (len(CSV_COLUMNS) - 2 + len(tag_keys))))
+            lines.append(",".join(CSV_COLUMNS + tag_keys))
+        start, stop = format_time(table.start), format_time(table.stop)
+        suffix = ",".join([table.field, table.measurement] + [value for _, value in table.tags])
+        for timestamp, value in zip(table.times, table.values):
+            lines.append(",_result,{},{},{},{},{},{}".format(index, start, stop,
+                                                             format_time(timestamp) if timestamp is not None else "",
+                                                             _format_value(value), suffix))
+    return "\r\n".join(lines) + "\r\n" if lines else "\r\n"
@@ -1,17 +1,19 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import concurrent.futures
+import hashlib
 import json
 import logging
 import os
-import requests
+import time
+
+import datasourceProfiles
+import grafanaClient
+import instrumentation
 
-TIMEOUT = 10
 logging.basicConfig(level=logging.INFO)
 
-headers = {
-    'Content-Type': 'application/json',
-}
 HTTP_SERVER_PROTOCOL = "http"
 HTTPS_SERVER_PROTOCOL = "https"
 DATA_SOURCE_NAME = "InfluxDB"
@@ -23,33 +25,48 @@ DATA_SOURCE_JSONDATA_VERSION = "Flux"
 INFLUXDB_CONTAINER_PORT = 8086
 INFLUXDB_CERT_RELATIVE_PATH = "influxdb2_certs/influxdb.crt"
 INFLUXDB_KEY_RELATIVE_PATH = "influxdb2_certs/influxdb.key"
+# jsonData key under which we store the hash of the datasource config we provisioned
+DATA_SOURCE_CONFIG_HASH_KEY = "greengrassConfigHash"
+RECONCILE_CREATED = "created"
+RECONCILE_UPDATED = "updated"
+RECONCILE_UNCHANGED = "unchanged"
+RECONCILE_FAILED = "failed"
+MAX_WORKERS = 4
 
 
-def create_influxdb_datasource_config(influxdb_parameters, cert, key) -> dict:
+def create_influxdb_datasource_config(influxdb_parameters, cert, key, name=DATA_SOURCE_NAME, org=None,
+                                      bucket=None, options=None, url=None) -> dict:
     """
 
     :param influxdb_parameters: The retrieved InfluxDB parameter JSON
     :param cert: The InfluxDB cert for HTTPS.
     :param key: The InfluxDB key for HTTPS.
+    :param name: The datasource name.
+    :param org: The InfluxDB org to query, instead of the retrieved InfluxDBOrg.
+    :param bucket: The default InfluxDB bucket to query, instead of the retrieved InfluxDBBucket.
+    :param options: Additional jsonData options, such as those of a datasource performance profile.
+    :param url: The URL Grafana sends queries to, such as that of the query proxy, instead of InfluxDB's.
     :return: data: The datasource JSON to add.
     """
 
     data = {}
+    org = org or influxdb_parameters['InfluxDBOrg']
+    bucket = bucket or influxdb_parameters['InfluxDBBucket']
 
     # InfluxDB port inside the container is always 8086 unless overridden inside the InfluxDB config
     # We reference the InfluxDB container name in the provided URL instead of using localhost/127.0.0.1
     # since this will be interpreted from inside the Grafana container
     if influxdb_parameters['InfluxDBServerProtocol'] == HTTP_SERVER_PROTOCOL:
         data = {
-            "name": DATA_SOURCE_NAME,
+            "name": name,
             "type": DATA_SOURCE_TYPE,
             "access": DATA_SOURCE_DIRECT_ACCESS,
             "editable": False,
-            "url": "http://{}:{}".format(influxdb_parameters['InfluxDBContainerName'], INFLUXDB_CONTAINER_PORT),
+            "url": url or "http://{}:{}".format(influxdb_parameters['InfluxDBContainerName'], INFLUXDB_CONTAINER_PORT),
             "jsonData": {
                 "version": DATA_SOURCE_JSONDATA_VERSION,
-                "organization": influxdb_parameters['InfluxDBOrg'],
-                "defaultBucket": influxdb_parameters['InfluxDBBucket'],
+                "organization": org,
+                "defaultBucket": bucket,
             },
             "secureJsonData": {
                 "token": influxdb_parameters['InfluxDBToken']
@@ -57,15 +74,15 @@ def create_influxdb_datasource_config(influxdb_parameters, cert, key) -> dict:
         }
     elif influxdb_parameters['InfluxDBServerProtocol'] == HTTPS_SERVER_PROTOCOL:
         data = {
-            "name": DATA_SOURCE_NAME,
+            "name": name,
             "type": DATA_SOURCE_TYPE,
             "access": DATA_SOURCE_PROXY_ACCESS,
             "editable": False,
-            "url": "https://{}:{}".format(influxdb_parameters['InfluxDBContainerName'], INFLUXDB_CONTAINER_PORT),
+            "url": url or "https://{}:{}".format(influxdb_parameters['InfluxDBContainerName'], INFLUXDB_CONTAINER_PORT),
             "jsonData": {
                 "version": DATA_SOURCE_JSONDATA_VERSION,
-                "organization": influxdb_parameters['InfluxDBOrg'],
-                "defaultBucket": influxdb_parameters['InfluxDBBucket'],
+                "organization": org,
+                "defaultBucket": bucket,
                 "tlsSkipVerify": (influxdb_parameters['InfluxDBSkipTLSVerify'] == 'true'),
                 "tlsAuth": True,
                 "serverName": "https://{}:{}".format(influxdb_parameters['InfluxDBContainerName'],
@@ -80,43 +97,359 @@ def create_influxdb_datasource_config(influxdb_parameters, cert, key) -> dict:
     else:
         logging.error("Received invalid InfluxDBServerProtocol! Should be http or https, but was: {}"
                       .format(influxdb_parameters['InfluxDBServerProtocol']))
+    if data and options:
+        data["jsonData"].update(options)
 
     logging.info("Generated InfluxDB datasource config")
     return data
 
 
-def create_and_add_datasource_to_grafana(url, data, tls_verify):
+@instrumentation.traced("create_and_add_datasource_to_grafana")
+def create_and_add_datasource_to_grafana(grafana_client, data):
     """
 
-    :param url: The Grafana URL to send requests to.
+    :param grafana_client: The GrafanaClient to send requests with.
     :param data: The datasource JSON to add.
-    :param tls_verify: Use TLS verify or not.
     :return:
+    :raises GrafanaRequestError: if Grafana did not add the datasource.
     """
 
     logging.info("Adding generated datasource to Grafana")
-    response = requests.post(url=url, headers=headers, data=json.dumps(data), verify=tls_verify)
+    response = grafana_client.post('/api/datasources', data)
+    instrumentation.annotate(status_code=response.status_code)
     if response.status_code != 200:
         logging.error("Request to add datasource request to Grafana failed with status code {}! "
                       "Check the aws.greengrass.labs.dashboard.Grafana log to investigate."
                       .format(response.status_code))
-        exit(1)
+        raise grafanaClient.GrafanaRequestError("POST", '/api/datasources', response.status_code)
 
 
-def influxdb_datasource_exists(grafana_server_protocol, username, password, grafana_port,
-                               tls_verify):
+@instrumentation.traced("update_datasource_in_grafana")
+def update_datasource_in_grafana(grafana_client, datasource_id, data):
     """
 
-    :param grafana_server_protocol: HTTP or HTTPS
-    :param username: The retrieved Grafana username
-    :param password: The retrieved Grafana password
-    :param grafana_port: The Grafana port
-    :param tls_verify: Use TLS verify or not.
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param datasource_id: The Grafana ID of the datasource to update.
+    :param data: The datasource JSON to replace the existing datasource with.
     :return:
+    :raises GrafanaRequestError: if Grafana did not update the datasource.
+    """
+
+    logging.info("Updating datasource {} in Grafana".format(datasource_id))
+    path = '/api/datasources/{}'.format(datasource_id)
+    response = grafana_client.put(path, data)
+    instrumentation.annotate(status_code=response.status_code)
+    if response.status_code != 200:
+        logging.error("Request to update datasource in Grafana failed with status code {}! "
+                      "Check the aws.greengrass.labs.dashboard.Grafana log to investigate."
+                      .format(response.status_code))
+        raise grafanaClient.GrafanaRequestError("PUT", path, response.status_code)
+
+
+@instrumentation.traced("get_influxdb_datasource")
+def get_influxdb_datasource(grafana_client, name=DATA_SOURCE_NAME):
     """
-    url = '{}://{}:{}@localhost:{}/api/datasources/name/{}' \
-        .format(grafana_server_protocol, username, password, grafana_port, DATA_SOURCE_NAME)
-    response = requests.get(url=url, headers=headers, verify=tls_verify)
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param name: The name of the datasource to look up.
+    :return: The existing datasource JSON, or None if it doesn't exist or couldn't be retrieved.
+    """
+    response = grafana_client.get('/api/datasources/name/{}'.format(name))
+    instrumentation.annotate(status_code=response.status_code)
+    logging.info("Grafana response status code: {}".format(response.status_code))
+    if response.status_code == 200:
+        return response.json()
+    elif response.status_code != 404:
+        logging.warning("Grafana has returned the response code {}. InfluxDB may not have been set up"
+                        " or configured correctly.".format(response.status_code))
+    return None
+
+
+def compute_datasource_config_hash(data) -> str:
+    """
+    Compute a stable hash of a datasource config, ignoring any previously stamped hash.
+
+    :param data: The datasource JSON.
+    :return: The hex SHA-256 digest of the canonical JSON encoding of the config.
+    """
+
+    json_data = {k: v for k, v in data.get("jsonData", {}).items() if k != DATA_SOURCE_CONFIG_HASH_KEY}
+    canonical = json.dumps(dict(data, jsonData=json_data), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def stamp_datasource_config_hash(data) -> dict:
+    """
+    Store the hash of a datasource config in its jsonData, so that later runs can detect changes without
+    reading back the secure fields Grafana never returns.
+
+    :param data: The datasource JSON.
+    :return: The datasource JSON with the hash stored in its jsonData.
+    """
+
+    json_data = dict(data.get("jsonData", {}))
+    json_data[DATA_SOURCE_CONFIG_HASH_KEY] = compute_datasource_config_hash(data)
+    return dict(data, jsonData=json_data)
+
+
+@instrumentation.traced("reconcile_datasource")
+def reconcile_datasource(grafana_client, data) -> str:
+    """
+    Create the datasource if it doesn't exist, or update it only if the desired config has changed.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param data: The desired datasource JSON.
+    :return: The action taken: created, updated or unchanged.
+    """
+
+    desired = stamp_datasource_config_hash(data)
+    existing = get_influxdb_datasource(grafana_client, data["name"])
+    if existing is None:
+        create_and_add_datasource_to_grafana(grafana_client, desired)
+        instrumentation.annotate(datasource=data["name"], action=RECONCILE_CREATED)
+        return RECONCILE_CREATED
+
+    existing_hash = existing.get("jsonData", {}).get(DATA_SOURCE_CONFIG_HASH_KEY)
+    if existing_hash == desired["jsonData"][DATA_SOURCE_CONFIG_HASH_KEY]:
+        logging.info("Datasource {} is up to date".format(data["name"]))
+        instrumentation.annotate(datasource=data["name"], action=RECONCILE_UNCHANGED)
+        return RECONCILE_UNCHANGED
+
+    desired["id"] = existing["id"]
+    if "uid" in existing:
+        desired["uid"] = existing["uid"]
+    update_datasource_in_grafana(grafana_client, existing["id"], desired)
+    instrumentation.annotate(datasource=data["name"], action=RECONCILE_UPDATED)
+    return RECONCILE_UPDATED
+
+
+def update_datasource_secure_fields(grafana_client, data, secure_fields) -> str:
+    """
+    Push only the given secureJsonData fields of a datasource, keeping everything else Grafana already has.
+    Grafana keeps the stored value of any secure field that is left out of an update.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param data: The desired datasource JSON.
+    :param secure_fields: The names of the secureJsonData fields that changed.
+    :return: The action taken: created or updated.
+    """
+
+    desired = stamp_datasource_config_hash(data)
+    existing = get_influxdb_datasource(grafana_client, data["name"])
+    if existing is None:
+        create_and_add_datasource_to_grafana(grafana_client, desired)
+        return RECONCILE_CREATED
+
+    update = {k: v for k, v in existing.items() if k != "secureJsonFields"}
+    update["jsonData"] = desired["jsonData"]
+    update["secureJsonData"] = {k: desired["secureJsonData"][k] for k in secure_fields}
+    update_datasource_in_grafana(grafana_client, existing["id"], update)
+    logging.info("Pushed secure fields {} of datasource {}".format(sorted(secure_fields), data["name"]))
+    return RECONCILE_UPDATED
+
+
+def apply_influxdb_parameters_change(grafana_client, mount_path, previous_parameters, influxdb_parameters,
+                                     options=None, url=None) -> str:
+    """
+    Bring the InfluxDB datasource in line with newly received InfluxDB parameters. If only the token changed,
+    just the token is pushed, otherwise the whole datasource is reconciled.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param mount_path: The InfluxDB mount path.
+    :param previous_parameters: The InfluxDB parameter JSON the datasource was last provisioned with.
+    :param influxdb_parameters: The newly retrieved InfluxDB parameter JSON
+    :param options: The datasource performance profile options.
+    :param url: The URL Grafana sends queries to, if not InfluxDB's.
+    :return: The action taken: created, updated or unchanged.
+    """
+
+    cert, key = load_influxdb_certs(mount_path, influxdb_parameters)
+    config = create_influxdb_datasource_config(influxdb_parameters, cert, key, options=options, url=url)
+    if not config:
+        raise ValueError("Could not generate an InfluxDB datasource config!")
+
+    changed = {k for k in set(previous_parameters) | set(influxdb_parameters)
+               if previous_parameters.get(k) != influxdb_parameters.get(k)}
+    if not changed:
+        return RECONCILE_UNCHANGED
+    if changed == {"InfluxDBToken"}:
+        return update_datasource_secure_fields(grafana_client, config, ["token"])
+    return reconcile_datasource(grafana_client, config)
+
+
+def apply_influxdb_certs_change(grafana_client, influxdb_parameters, cert, key, secure_fields,
+                                datasource_specs=None, options=None, url=None) -> list:
+    """
+    Push rotated InfluxDB TLS material to the InfluxDB datasource and the additional datasources.
+    Only the changed TLS fields are sent; the token and other fields stay as Grafana has them.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param influxdb_parameters: The InfluxDB parameter JSON the datasources were provisioned with.
+    :param cert: The new InfluxDB cert.
+    :param key: The new InfluxDB key.
+    :param secure_fields: The names of the TLS secureJsonData fields that changed.
+    :param datasource_specs: The additional datasource specs, as returned by parse_datasource_specs.
+    :param options: The datasource performance profile options of datasources without a profile of their own.
+    :param url: The URL Grafana sends queries to, if not InfluxDB's.
+    :return: One {"name", "action"} result per datasource.
+    """
+
+    results = []
+    for spec in [{"name": DATA_SOURCE_NAME}] + list(datasource_specs or []):
+        try:
+            config = create_influxdb_datasource_config(influxdb_parameters, cert, key, name=spec["name"],
+                                                       org=spec.get("org"), bucket=spec.get("bucket"),
+                                                       options=datasource_spec_options(spec, options), url=url)
+            action = update_datasource_secure_fields(grafana_client, config, secure_fields)
+        except Exception:
+            logging.error("Failed to push InfluxDB cert material to datasource {}".format(spec["name"]),
+                          exc_info=True)
+            action = RECONCILE_FAILED
+        results.append({"name": spec["name"], "action": action})
+    if any(result["action"] == RECONCILE_FAILED for result in results):
+        raise ValueError("Failed to push InfluxDB cert material to some datasources: {}".format(results))
+    return results
+
+
+def load_influxdb_certs(mount_path, influxdb_parameters):
+    """
+
+    :param mount_path: The InfluxDB mount path.
+    :param influxdb_parameters: The retrieved InfluxDB parameter JSON
+    :return: cert, key: The InfluxDB cert and key for HTTPS, or empty strings when using HTTP.
+    """
+
+    cert = key = ""
+    # If using HTTPS, load in the cert and key
+    if influxdb_parameters['InfluxDBServerProtocol'] == HTTPS_SERVER_PROTOCOL:
+        logging.info("Retrieving InfluxDB cert and key from mount path...")
+        with open(os.path.join(mount_path, INFLUXDB_CERT_RELATIVE_PATH)) as f:
+            cert = f.read()
+        with open(os.path.join(mount_path, INFLUXDB_KEY_RELATIVE_PATH)) as f:
+            key = f.read()
+        if len(cert) == 0 or len(key) == 0:
+            raise ValueError("Retrieved Grafana certs are empty!")
+    return cert, key
+
+
+def parse_datasource_specs(datasource_specs) -> list:
+    """
+    Parse and validate a JSON list of additional datasource specs, e.g.
+    [{"name": "InfluxDB-downsampled", "bucket": "downsampled", "org": "greengrass", "profile": "edge-large"}].
+    The org and bucket are optional and default to the retrieved InfluxDB parameters. The performance profile
+    is optional and defaults to the one configured for all datasources.
+
+    :param datasource_specs: The JSON string of datasource specs.
+    :return: The list of datasource spec dicts.
+    """
+
+    if not datasource_specs:
+        return []
+    specs = json.loads(datasource_specs)
+    if not isinstance(specs, list):
+        raise ValueError("Datasource specs must be a JSON list!")
+    names = set()
+    for spec in specs:
+        if not isinstance(spec, dict) or not spec.get("name"):
+            raise ValueError("Every datasource spec needs a name, but got: {}".format(spec))
+        unknown = set(spec) - {"name", "org", "bucket", "profile"}
+        if unknown:
+            raise ValueError("Unknown datasource spec fields {} in {}".format(sorted(unknown), spec))
+        if "profile" in spec:
+            datasourceProfiles.validate_profile(spec["profile"])
+        if spec["name"] in names:
+            raise ValueError("Duplicate datasource name {}".format(spec["name"]))
+        names.add(spec["name"])
+    return specs
+
+
+def datasource_spec_options(spec, options) -> dict:
+    """
+    Get the performance profile options of an additional datasource.
+
+    :param spec: The datasource spec.
+    :param options: The profile options of datasources without a profile of their own.
+    :return: The jsonData options of the spec's own profile if it has one, the given options otherwise.
+    """
+
+    if spec.get("profile"):
+        return datasourceProfiles.profile_options(spec["profile"])
+    return options
+
+
+def create_influxdb_datasource_configs(influxdb_parameters, cert, key, datasource_specs=None, options=None,
+                                       url=None) -> list:
+    """
+    Generate the configs of the InfluxDB datasource and of the additional datasources.
+
+    :param influxdb_parameters: The retrieved InfluxDB parameter JSON
+    :param cert: The InfluxDB cert for HTTPS.
+    :param key: The InfluxDB key for HTTPS.
+    :param datasource_specs: The additional datasource specs, as returned by parse_datasource_specs.
+    :param options: The datasource performance profile options of datasources without a profile of their own.
+    :param url: The URL Grafana sends queries to, if not InfluxDB's.
+    :return: The datasource JSONs, the InfluxDB datasource first.
+    """
+
+    configs = [create_influxdb_datasource_config(influxdb_parameters, cert, key, options=options, url=url)]
+    if not configs[0]:
+        raise ValueError("Could not generate an InfluxDB datasource config!")
+    for spec in datasource_specs or []:
+        configs.append(create_influxdb_datasource_config(influxdb_parameters, cert, key, name=spec["name"],
+                                                         org=spec.get("org"), bucket=spec.get("bucket"),
+                                                         options=datasource_spec_options(spec, options), url=url))
+    return configs
+
+
+def add_influxdb_datasources_to_grafana(grafana_client, mount_path, influxdb_parameters, datasource_specs,
+                                        max_workers=MAX_WORKERS, options=None, url=None) -> list:
+    """
+    Reconcile one named InfluxDB datasource per spec, in parallel on a bounded worker pool.
+    A failing datasource doesn't prevent the others from being provisioned.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param mount_path: The InfluxDB mount path.
+    :param influxdb_parameters: The retrieved InfluxDB parameter JSON
+    :param datasource_specs: The list of datasource specs, as returned by parse_datasource_specs.
+    :param max_workers: The maximum number of datasources provisioned at the same time.
+    :param options: The datasource performance profile options of datasources without a profile of their own.
+    :param url: The URL Grafana sends queries to, if not InfluxDB's.
+    :return: One {"name", "action", "latency"} result per spec, in spec order.
+    """
+
+    if not datasource_specs:
+        return []
+    cert, key = load_influxdb_certs(mount_path, influxdb_parameters)
+
+    def provision(spec):
+        start = time.monotonic()
+        try:
+            config = create_influxdb_datasource_config(influxdb_parameters, cert, key, name=spec["name"],
+                                                       org=spec.get("org"), bucket=spec.get("bucket"),
+                                                       options=datasource_spec_options(spec, options), url=url)
+            action = reconcile_datasource(grafana_client, config)
+        except Exception:
+            logging.error("Failed to provision datasource {}".format(spec["name"]), exc_info=True)
+            action = RECONCILE_FAILED
+        return {"name": spec["name"], "action": action, "latency": time.monotonic() - start}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(provision, datasource_specs))
+
+    for result in results:
+        logging.info("Datasource {name}: {action} in {latency:.3f} seconds".format(**result))
+    return results
+
+
+@instrumentation.traced("influxdb_datasource_exists")
+def influxdb_datasource_exists(grafana_client):
+    """
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :return:
+    """
+    response = grafana_client.get('/api/datasources/name/{}'.format(DATA_SOURCE_NAME))
+    instrumentation.annotate(status_code=response.status_code)
     logging.info("Grafana response status code: {}".format(response.status_code))
     if response.status_code == 200:
         return True
@@ -130,7 +463,8 @@ def influxdb_datasource_exists(grafana_server_protocol, username, password, graf
 
 
 def add_influxdb_datasource_to_grafana(mount_path, grafana_secrets, influxdb_parameters, grafana_port,
-                                       grafana_server_protocol, tls_verify):
+                                       grafana_server_protocol, tls_verify, grafana_client=None, reconcile=False,
+                                       options=None, url=None):
     """
 
     :param mount_path: The InfluxDB mount path.
@@ -139,42 +473,42 @@ def add_influxdb_datasource_to_grafana(mount_path, grafana_secrets, influxdb_par
     :param grafana_port: The Grafana port
     :param grafana_server_protocol:  HTTP or HTTPS
     :param tls_verify: Use TLS verify or not.
-    :return:
+    :param grafana_client: An existing GrafanaClient to reuse. If not given, one is created and closed here.
+    :param reconcile: Update an existing datasource whose config has changed instead of leaving it as it is.
+    :param options: The datasource performance profile options.
+    :param url: The URL Grafana sends queries to, if not InfluxDB's.
+    :return: The action taken: created, updated (in reconcile mode only) or unchanged.
     """
 
-    if not tls_verify:
-        import urllib3
-        # Necessary to suppress warning for self-signed certs
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-    username = grafana_secrets["grafana_username"]
-    password = grafana_secrets["grafana_password"]
+    owns_client = grafana_client is None
+    if owns_client:
+        grafana_client = grafanaClient.GrafanaClient(grafana_server_protocol, grafana_port, tls_verify)
+    grafana_client.set_credentials(grafana_secrets["grafana_username"], grafana_secrets["grafana_password"])
 
     try:
 
+        if reconcile:
+            cert, key = load_influxdb_certs(mount_path, influxdb_parameters)
+            config = create_influxdb_datasource_config(influxdb_parameters, cert, key, options=options, url=url)
+            if not config:
+                raise ValueError("Could not generate an InfluxDB datasource config!")
+            action = reconcile_datasource(grafana_client, config)
+            logging.info("InfluxDB datasource reconciled with Grafana: {}".format(action))
+            return action
+
         # Check if the InfluxDB data source is already present
-        if not influxdb_datasource_exists(grafana_server_protocol, username, password, grafana_port, tls_verify):
+        if not influxdb_datasource_exists(grafana_client):
             logging.info("No InfluxDB data source found, creating a new one...")
-            cert = key = ""
-
-            # If using HTTPS, load in the cert and key
-            if influxdb_parameters['InfluxDBServerProtocol'] == HTTPS_SERVER_PROTOCOL:
-                logging.info("Retrieving InfluxDB cert and key from mount path...")
-                with open(os.path.join(mount_path, INFLUXDB_CERT_RELATIVE_PATH)) as f:
-                    cert = f.read()
-                with open(os.path.join(mount_path, INFLUXDB_KEY_RELATIVE_PATH)) as f:
-                    key = f.read()
-                if len(cert) == 0 or len(key) == 0:
-                    raise ValueError("Retrieved Grafana certs are empty!")
-
-            config = create_influxdb_datasource_config(influxdb_parameters, cert, key)
-            url = '{}://{}:{}@localhost:{}/api/datasources' \
-                .format(grafana_server_protocol, username, password, grafana_port)
-            create_and_add_datasource_to_grafana(url, config, tls_verify)
+            cert, key = load_influxdb_certs(mount_path, influxdb_parameters)
+            config = create_influxdb_datasource_config(influxdb_parameters, cert, key, options=options, url=url)
+            create_and_add_datasource_to_grafana(grafana_client, stamp_datasource_config_hash(config))
             logging.info("InfluxDB datasource successfully added to Grafana!")
-        else:
-            logging.info("InfluxDB data source is already present, exiting...")
-            exit(0)
+            return RECONCILE_CREATED
+        logging.info("InfluxDB data source is already present, leaving it as it is")
+        return RECONCILE_UNCHANGED
     except Exception as e:
         logging.error('Exception occurred when adding InfluxDB datasource to Grafana.', exc_info=True)
         raise e
+    finally:
+        if owns_client:
+            grafana_client.close()
@@ -0,0 +1,210 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import logging
+import os
+import select
+
+logging.basicConfig(level=logging.INFO)
+POLL_INTERVAL = 5
+# The InfluxDB component rewrites the cert and the key one after the other, so wait for both before pushing
+DEBOUNCE = 1
+CERT_FIELD = "tlsClientCert"
+KEY_FIELD = "tlsClientKey"
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+READ_SIZE = 4096
+
+
+class CertFile:
+    """
+    A PEM file whose content is cached, and only re-read when its inode, mtime or size change and only
+    re-parsed when the content hash changes.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The PEM file path.
+        """
+        self.path = path
+        self.content = None
+        self.digest = None
+        self.read_count = 0
+        self._signature = None
+
+    def refresh(self) -> bool:
+        """
+        Pick up a change of the file.
+
+        :return: True if the file now holds different PEM material than before.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # Keep the last known material while the file is being replaced
+            return False
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == self._signature:
+            return False
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.read_count += 1
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == self.digest:
+            self._signature = signature
+            return False
+        content = data.decode("ascii", errors="replace")
+        if "-----BEGIN " not in content or "-----END " not in content:
+            # Most likely caught halfway through a write; leave the signature unset to read it again next time
+            logging.info("Ignoring incomplete PEM file {}".format(self.path))
+            return False
+        self._signature = signature
+        self.content, self.digest = content, digest
+        return True
+
+
+class Inotify:
+    """
+    Minimal ctypes binding to the Linux inotify API, watching directories for file changes.
+    """
+
+    def __init__(self, directories, mask=WATCH_MASK):
+        """
+        :param directories: The directories to watch.
+        :param mask: The inotify event mask.
+        """
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            for directory in directories:
+                if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, "Could not watch {}: {}".format(directory, os.strerror(errno)))
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def wait(self, timeout) -> bool:
+        """
+        Wait for file events and consume them.
+
+        :param timeout: The maximum number of seconds to wait.
+        :return: True if any events arrived.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            while os.read(self.fd, READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class CertWatcher:
+    """
+    Watches the InfluxDB client cert and key, with inotify where available and by polling otherwise, and
+    calls back with the fields whose PEM material changed.
+    """
+
+    def __init__(self, cert_path, key_path, on_change, poll_interval=POLL_INTERVAL, debounce=DEBOUNCE,
+                 use_inotify=True):
+        """
+        :param cert_path: The InfluxDB cert path.
+        :param key_path: The InfluxDB key path.
+        :param on_change: Called with (changed fields, material) when the cert or key change. Both are dicts
+            of datasource secureJsonData field name to PEM content; material holds the cert and the key.
+        :param poll_interval: Seconds between two checks when polling, or between checks of the stop event
+            while waiting for inotify events.
+        :param debounce: Seconds to let a burst of file events settle before reading the files.
+        :param use_inotify: Use inotify if available instead of polling.
+        """
+        self.files = {CERT_FIELD: CertFile(cert_path), KEY_FIELD: CertFile(key_path)}
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        self.change_count = 0
+
+    def material(self) -> dict:
+        return {field: cert_file.content for field, cert_file in self.files.items()}
+
+    def check(self) -> set:
+        """
+        Refresh the cached cert and key.
+
+        :return: The fields whose material changed.
+        """
+        return {field for field, cert_file in self.files.items() if cert_file.refresh()}
+
+    def _open_inotify(self):
+        directories = sorted({os.path.dirname(os.path.abspath(f.path)) for f in self.files.values()})
+        try:
+            return Inotify(directories)
+        except (OSError, AttributeError, TypeError):
+            logging.info("inotify is not available, polling the InfluxDB cert and key every {} seconds"
+                         .format(self.poll_interval), exc_info=True)
+            return None
+
+    def _wait(self, inotify, stop_event) -> bool:
+        if inotify is None:
+            stop_event.wait(self.poll_interval)
+            return True
+        if not inotify.wait(self.poll_interval):
+            return False
+        stop_event.wait(self.debounce)
+        inotify.wait(0)
+        return True
+
+    def run(self, stop_event) -> None:
+        """
+        Watch the cert and key until the stop event is set. The material present when the watch starts is
+        taken as the one already provisioned.
+
+        :param stop_event: A threading.Event that ends the watch when set.
+        :return: None
+        """
+        self.check()
+        inotify = self._open_inotify() if self.use_inotify else None
+        pending = set()
+        try:
+            while not stop_event.is_set():
+                # A failed push is retried on the next wakeup, even without a new file event
+                if not self._wait(inotify, stop_event) and not pending:
+                    continue
+                pending |= self.check()
+                if not pending or stop_event.is_set():
+                    continue
+                material = self.material()
+                if not all(material.values()):
+                    continue
+                try:
+                    self.on_change({field: material[field] for field in pending}, material)
+                    self.change_count += 1
+                    pending = set()
+                    logging.info("Applied rotated InfluxDB cert material")
+                except Exception:
+                    logging.error("Failed to apply rotated InfluxDB cert material!", exc_info=True)
+        finally:
+            if inotify is not None:
+                inotify.close()
@@ -3,13 +3,30 @@
 
 import logging
 import argparse
+import concurrent.futures
+import os
+import signal
+import socket
+import threading
+import time
 
+import grafanaClient
+import instrumentation
+import ipcConnection
 import retrieveInfluxDBParams
 import retrieveGrafanaSecrets
 import addGrafanaDataSources
+import datasourceProfiles
+import fluxLinter
+import provisionDashboards
+import retryPolicy
+
+# The modules of optional features are imported in the code paths that use them, so that a plain provisioning
+# run doesn't pay for them: the query proxy and the metrics server alone pull in http.server.
 
 logging.basicConfig(level=logging.INFO)
-TIMEOUT = 10
+CONCURRENT_BOOTSTRAP = "concurrent"
+SEQUENTIAL_BOOTSTRAP = "sequential"
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -25,6 +42,7 @@ def parse_arguments() -> argparse.Namespace:
         args(Namespace): Parsed arguments
     """
 
+    # Defaults of optional features are spelled out, rather than read from their modules, to keep those unloaded
     parser = argparse.ArgumentParser()
     parser.add_argument("--subscribe_topic", type=str, required=True)
     parser.add_argument("--publish_topic", type=str, required=True)
@@ -33,24 +51,889 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument('--skip_tls_verify', type=str, required=True)
     parser.add_argument('--grafana_port', type=str, required=True)
     parser.add_argument('--grafana_server_protocol', type=str, required=True)
+    # The token request and Grafana readiness settings default to their retry policies
+    parser.add_argument('--token_request_initial_backoff', type=float, default=None)
+    parser.add_argument('--token_request_max_backoff', type=float, default=None)
+    parser.add_argument('--token_request_deadline', type=float, default=None)
+    parser.add_argument('--bootstrap_mode', type=str, default=CONCURRENT_BOOTSTRAP,
+                        choices=[CONCURRENT_BOOTSTRAP, SEQUENTIAL_BOOTSTRAP])
+    parser.add_argument('--grafana_ready_deadline', type=float, default=None)
+    parser.add_argument('--retry_policies', type=str, default='')
+    parser.add_argument('--startup_deadline', type=float, default=0)
+    parser.add_argument('--reconcile_datasource', type=str, default='false')
+    parser.add_argument('--daemon', type=str, default='false')
+    parser.add_argument('--token_rotation_debounce', type=float, default=2)
+    parser.add_argument('--cert_poll_interval', type=float, default=5)
+    parser.add_argument('--dashboards_dir', type=str, default='')
+    parser.add_argument('--dashboard_workers', type=int, default=provisionDashboards.MAX_WORKERS)
+    parser.add_argument('--provisioning_mode', type=str, default='api', choices=['api', 'file'])
+    parser.add_argument('--provisioning_dir', type=str, default='')
+    parser.add_argument('--grafana_provisioning_path', type=str, default='/etc/grafana/provisioning')
+    parser.add_argument('--plan', type=str, default='false')
+    parser.add_argument('--apply', type=str, default='false')
+    parser.add_argument('--flux_lint', type=str, default=fluxLinter.LINT_OFF, choices=fluxLinter.LINT_MODES)
+    parser.add_argument('--datasources', type=str, default='')
+    parser.add_argument('--datasource_workers', type=int, default=addGrafanaDataSources.MAX_WORKERS)
+    parser.add_argument('--downsampling_tiers', type=str, default='')
+    parser.add_argument('--downsampling_access_level', type=str, default='Admin')
+    parser.add_argument('--datasource_profile', type=str, default=datasourceProfiles.NO_PROFILE,
+                        choices=datasourceProfiles.PROFILE_NAMES)
+    parser.add_argument('--params_cache', type=str, default='false')
+    parser.add_argument('--params_cache_ttl', type=float, default=86400)
+    parser.add_argument('--params_cache_encrypt', type=str, default='false')
+    parser.add_argument('--profile_startup', '--profile-startup', type=str, default='false')
+    parser.add_argument('--provisioning_report', type=str, default='false')
+    parser.add_argument('--provisioning_report_path', type=str, default='')
+    parser.add_argument('--telemetry', type=str, default='false')
+    parser.add_argument('--telemetry_bucket', type=str, default='')
+    parser.add_argument('--telemetry_access_level', type=str, default='RW')
+    parser.add_argument('--telemetry_flush_interval', type=float, default=5)
+    parser.add_argument('--query_proxy', type=str, default='false')
+    parser.add_argument('--query_proxy_port', type=int, default=8087)
+    parser.add_argument('--query_proxy_bind', type=str, default='172.17.0.1')
+    parser.add_argument('--query_proxy_url', type=str, default='http://172.17.0.1:8087')
+    parser.add_argument('--query_proxy_ttl', type=float, default=30)
+    parser.add_argument('--query_proxy_alignment', type=int, default=10)
+    parser.add_argument('--query_proxy_max_bytes', type=int, default=32 * 1024 * 1024)
+    parser.add_argument('--metrics', type=str, default='false')
+    parser.add_argument('--metrics_port', type=int, default=9108)
+    parser.add_argument('--metrics_bind', type=str, default='127.0.0.1')
     return parser.parse_args()
 
 
+def parse_downsampling_tiers(args) -> list:
+    """
+    Parse and validate the downsampling tiers, if any are configured.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+
+    Returns
+    -------
+        tiers(list): the tiers, as returned by downsamplingTiers.parse_tiers
+    """
+
+    if args.downsampling_tiers.strip() in ('', '[]'):
+        return []
+    import downsamplingTiers
+    return downsamplingTiers.parse_tiers(args.downsampling_tiers)
+
+
+def configure_retries(args) -> dict:
+    """
+    Set the retry policies of all IPC and HTTP calls, and start the deadline the whole startup shares.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+
+    Returns
+    -------
+        policies(dict): the retry policies by phase
+    """
+
+    policies = retryPolicy.configure(retryPolicy.parse_policies(args.retry_policies), args.startup_deadline or None)
+    logging.info("Retry policies: {}{}".format(
+        {phase: policy.to_dict() for phase, policy in sorted(policies.items())},
+        ", startup deadline {:g} seconds".format(args.startup_deadline) if args.startup_deadline else ""))
+    return policies
+
+
+def run_phase(phase_timings, name, function, *args, **kwargs):
+    """
+    Run a single bootstrap phase and record how long it took.
+
+    Parameters
+    ----------
+        phase_timings(dict): the phase name to duration (seconds) mapping to record into
+        name(str): the name of the phase
+        function(callable): the phase to run
+        *args, **kwargs: the arguments passed to the phase
+
+    Returns
+    -------
+        result: the return value of the phase
+    """
+
+    start = time.monotonic()
+    try:
+        with instrumentation.span(name):
+            return function(*args, **kwargs)
+    finally:
+        phase_timings[name] = time.monotonic() - start
+        logging.info("Bootstrap phase {} finished in {:.3f} seconds".format(name, phase_timings[name]))
+
+
+def run_independent_phases(phases, phase_timings, bootstrap_mode) -> dict:
+    """
+    Run bootstrap phases that don't depend on each other, either overlapping or one after another.
+
+    Parameters
+    ----------
+        phases(list): (name, function, args, kwargs) tuples describing each phase
+        phase_timings(dict): the phase name to duration (seconds) mapping to record into
+        bootstrap_mode(str): concurrent or sequential
+
+    Returns
+    -------
+        results(dict): the phase name to return value mapping
+    """
+
+    if bootstrap_mode == SEQUENTIAL_BOOTSTRAP:
+        return {name: run_phase(phase_timings, name, function, *args, **kwargs)
+                for name, function, args, kwargs in phases}
+
+    futures = [(name, start_phase(phase_timings, name, function, *args, **kwargs))
+               for name, function, args, kwargs in phases]
+    return {name: future.result() for name, future in futures}
+
+
+def start_phase(phase_timings, name, function, *args, **kwargs) -> concurrent.futures.Future:
+    """
+    Start a bootstrap phase in the background. The phase runs on a daemon thread rather than in an executor,
+    whose worker threads are joined at interpreter exit: when another phase fails, the process exits right
+    away instead of waiting for this one to run out its deadline.
+
+    Parameters
+    ----------
+        phase_timings(dict): the phase name to duration (seconds) mapping to record into
+        name(str): the name of the phase
+        function(callable): the phase to run
+        *args, **kwargs: the arguments passed to the phase
+
+    Returns
+    -------
+        future(Future): resolves to the return value of the phase
+    """
+
+    future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(run_phase(phase_timings, name, function, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+def provision_dashboards(args, grafana_client) -> dict:
+    """
+    Push the dashboards found in the configured directory under the mount path to Grafana.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the authenticated Grafana client
+
+    Returns
+    -------
+        report(dict): the uids of the pushed, skipped and failed dashboards
+    """
+
+    dashboards_path = os.path.join(args.mount_path, args.dashboards_dir)
+    if not os.path.isdir(dashboards_path):
+        logging.info("No dashboard directory found at {}, skipping dashboard provisioning".format(dashboards_path))
+        return {"pushed": [], "skipped": [], "failed": []}
+    datasource = addGrafanaDataSources.get_influxdb_datasource(grafana_client)
+    return provisionDashboards.provision_dashboards(grafana_client, dashboards_path,
+                                                    addGrafanaDataSources.DATA_SOURCE_NAME,
+                                                    datasource.get("uid") if datasource else None,
+                                                    max_workers=args.dashboard_workers,
+                                                    flux_lint=args.flux_lint)
+
+
+def datasource_settings(args) -> dict:
+    """
+    Get the settings shared by all InfluxDB datasources: the options of the datasource performance profile,
+    and the URL of the query proxy when Grafana queries InfluxDB through it.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+
+    Returns
+    -------
+        settings(dict): the options and url keyword arguments of the addGrafanaDataSources functions
+    """
+
+    return {"options": datasourceProfiles.profile_options(args.datasource_profile),
+            "url": args.query_proxy_url if args.query_proxy == 'true' else None}
+
+
+def apply_influxdb_parameters_change(args, grafana_client, previous_parameters, influxdb_parameters,
+                                     datasource_specs) -> None:
+    """
+    Bring the InfluxDB datasources provisioned with one set of InfluxDB parameters in line with another.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the authenticated Grafana client
+        previous_parameters(dict): the InfluxDB parameters the datasources were provisioned with
+        influxdb_parameters(dict): the InfluxDB parameters to provision the datasources with
+        datasource_specs(list): the additional datasources to keep up to date as well
+
+    Returns
+    -------
+        None
+    """
+
+    settings = datasource_settings(args)
+    action = addGrafanaDataSources.apply_influxdb_parameters_change(grafana_client, args.mount_path,
+                                                                    previous_parameters, influxdb_parameters,
+                                                                    **settings)
+    logging.info("InfluxDB datasource reconciled with new InfluxDB parameters: {}".format(action))
+    addGrafanaDataSources.add_influxdb_datasources_to_grafana(grafana_client, args.mount_path, influxdb_parameters,
+                                                              datasource_specs, max_workers=args.datasource_workers,
+                                                              **settings)
+
+
+def stop_on_sigterm(stop_event=None) -> threading.Event:
+    """
+    Get the event that ends a long-running mode, setting it when the process receives SIGTERM.
+
+    Parameters
+    ----------
+        stop_event(threading.Event): the event to use; if given, the caller is in charge of setting it
+
+    Returns
+    -------
+        stop_event(threading.Event): the given event, or a new one set on SIGTERM
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    return stop_event
+
+
+def watch_token_rotation(args, grafana_client, handler, influxdb_parameters, datasource_specs=None,
+                         stop_event=None) -> None:
+    """
+    Keep the token response subscription open and update the InfluxDB datasource whenever new read-only
+    InfluxDB parameters arrive, until the stop event is set or the process receives SIGTERM. With HTTPS,
+    the InfluxDB cert and key are watched as well and pushed to Grafana when they are regenerated.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the authenticated Grafana client
+        handler(InfluxDBDataStreamHandler): the handler of the open token response subscription
+        influxdb_parameters(dict): the InfluxDB parameters the datasource was provisioned with
+        datasource_specs(list): the additional datasources to keep up to date as well
+        stop_event(threading.Event): ends the watch when set
+
+    Returns
+    -------
+        None
+    """
+
+    import certWatcher
+    import tokenRotationWatcher
+
+    stop_event = stop_on_sigterm(stop_event)
+    # Token and cert updates of the same datasources must not interleave
+    update_lock = threading.Lock()
+
+    def on_rotation(previous_parameters, rotated_parameters):
+        with update_lock:
+            apply_influxdb_parameters_change(args, grafana_client, previous_parameters, rotated_parameters,
+                                             datasource_specs)
+
+    watcher = tokenRotationWatcher.TokenRotationWatcher(handler, on_rotation, influxdb_parameters,
+                                                        debounce=args.token_rotation_debounce)
+
+    def on_certs_change(changed, material):
+        with update_lock:
+            addGrafanaDataSources.apply_influxdb_certs_change(grafana_client, watcher.influxdb_parameters,
+                                                              material[certWatcher.CERT_FIELD],
+                                                              material[certWatcher.KEY_FIELD], list(changed),
+                                                              datasource_specs, **datasource_settings(args))
+
+    cert_thread = None
+    if influxdb_parameters.get('InfluxDBServerProtocol') == addGrafanaDataSources.HTTPS_SERVER_PROTOCOL:
+        cert_watcher = certWatcher.CertWatcher(
+            os.path.join(args.mount_path, addGrafanaDataSources.INFLUXDB_CERT_RELATIVE_PATH),
+            os.path.join(args.mount_path, addGrafanaDataSources.INFLUXDB_KEY_RELATIVE_PATH),
+            on_certs_change, poll_interval=args.cert_poll_interval)
+        cert_thread = threading.Thread(target=cert_watcher.run, args=(stop_event,), name="certWatcher", daemon=True)
+        cert_thread.start()
+
+    logging.info("Running in daemon mode, watching for InfluxDB token rotation...")
+    try:
+        watcher.run(stop_event)
+    finally:
+        stop_event.set()
+        if cert_thread is not None:
+            cert_thread.join()
+
+
+def start_self_telemetry(args, telemetry) -> threading.Thread:
+    """
+    Retrieve an InfluxDB token with write access in the background, and point the telemetry writer at
+    InfluxDB once it arrives. Points recorded in the meantime are buffered.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        telemetry(TelemetryWriter): the writer to configure
+
+    Returns
+    -------
+        thread(threading.Thread): the thread retrieving the token
+    """
+
+    import influxdbClient
+    import selfTelemetry
+
+    def configure():
+        try:
+            influxdb_parameters = retrieveInfluxDBParams.retrieve_influxdb_params(
+                args.publish_topic, args.subscribe_topic,
+                initial_backoff=args.token_request_initial_backoff,
+                max_backoff=args.token_request_max_backoff,
+                deadline=selfTelemetry.TOKEN_DEADLINE,
+                access_level=args.telemetry_access_level)
+            telemetry.configure(influxdbClient.influxdb_url(influxdb_parameters),
+                                influxdb_parameters['InfluxDBToken'],
+                                influxdb_parameters['InfluxDBOrg'],
+                                args.telemetry_bucket or influxdb_parameters['InfluxDBBucket'],
+                                tls_verify=not (influxdb_parameters['InfluxDBSkipTLSVerify'] == 'true'))
+        except Exception:
+            # Telemetry must never take provisioning down with it
+            logging.error("Failed to set up self-telemetry, its points will be dropped", exc_info=True)
+
+    thread = threading.Thread(target=configure, name="selfTelemetrySetup", daemon=True)
+    thread.start()
+    return thread
+
+
+def provision_downsampling(args, influxdb_parameters, tiers) -> list:
+    """
+    Retrieve an InfluxDB token that can manage buckets and tasks, and reconcile the rollup bucket and the
+    downsampling task of every tier. Failures are logged but don't fail provisioning, since Grafana is
+    still usable without the rollups.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        influxdb_parameters(dict): the InfluxDB parameters of the bucket to roll up
+        tiers(list): the downsampling tiers, as returned by downsamplingTiers.parse_tiers
+
+    Returns
+    -------
+        results(list): the per-tier results of downsamplingTiers.provision_tiers, or an empty list on failure
+    """
+
+    import downsamplingTiers
+    import influxdbClient
+
+    try:
+        admin_parameters = retrieveInfluxDBParams.retrieve_influxdb_params(
+            args.publish_topic, args.subscribe_topic,
+            initial_backoff=args.token_request_initial_backoff,
+            max_backoff=args.token_request_max_backoff,
+            deadline=args.token_request_deadline,
+            access_level=args.downsampling_access_level)
+        with influxdbClient.InfluxDBClient(influxdbClient.influxdb_url(influxdb_parameters),
+                                           admin_parameters['InfluxDBToken'],
+                                           not (influxdb_parameters['InfluxDBSkipTLSVerify'] == 'true')) as client:
+            return downsamplingTiers.provision_tiers(client, influxdb_parameters['InfluxDBOrg'],
+                                                     influxdb_parameters['InfluxDBBucket'], tiers)
+    except Exception:
+        logging.error("Failed to provision the downsampling tiers", exc_info=True)
+        return []
+
+
+def plan_grafana(args, grafana_client, influxdb_parameters, datasource_specs) -> list:
+    """
+    Fetch the datasources and dashboards in Grafana in bulk, and compute the changes that bring them to the
+    configured ones. The plan is logged, one line per datasource and dashboard.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the authenticated Grafana client
+        influxdb_parameters(dict): the InfluxDB parameters to provision the datasources with
+        datasource_specs(list): the additional datasources to provision
+
+    Returns
+    -------
+        changes(list): the grafanaPlan.Changes of the plan
+    """
+
+    import grafanaPlan
+
+    cert, key = addGrafanaDataSources.load_influxdb_certs(args.mount_path, influxdb_parameters)
+    configs = addGrafanaDataSources.create_influxdb_datasource_configs(influxdb_parameters, cert, key,
+                                                                       datasource_specs, **datasource_settings(args))
+    state = grafanaPlan.fetch_state(grafana_client)
+    dashboards_path = os.path.join(args.mount_path, args.dashboards_dir) if args.dashboards_dir else None
+    changes = grafanaPlan.plan_provisioning(state, configs, dashboards_path, flux_lint=args.flux_lint)
+    logging.info("Grafana provisioning plan:\n{}".format(grafanaPlan.format_plan(changes)))
+    return changes
+
+
+def provision_grafana_with_plan(args, grafana_client, phase_timings, grafana_secrets, influxdb_parameters,
+                                datasource_specs, tiers=None) -> list:
+    """
+    Provision Grafana from a plan: its state is read once in bulk, and only the datasources and dashboards
+    that differ from it are written, in apply mode. In plan mode nothing is written.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the Grafana client
+        phase_timings(dict): the phase name to duration (seconds) mapping to record into
+        grafana_secrets(dict): the retrieved Grafana secret JSON containing the username/password
+        influxdb_parameters(dict): the InfluxDB parameters to provision the datasources with
+        datasource_specs(list): the additional datasources to provision
+        tiers(list): the downsampling tiers to provision
+
+    Returns
+    -------
+        datasource_specs(list): the additional datasources, including those of the downsampling tiers
+    """
+
+    import downsamplingTiers
+    import grafanaPlan
+
+    apply = args.apply == 'true'
+    grafana_client.set_credentials(grafana_secrets["grafana_username"], grafana_secrets["grafana_password"])
+    if tiers:
+        if apply:
+            run_phase(phase_timings, "provision_downsampling", provision_downsampling, args, influxdb_parameters,
+                      tiers)
+        datasource_specs = datasource_specs + downsamplingTiers.tier_datasource_specs(
+            tiers, influxdb_parameters['InfluxDBBucket'])
+
+    changes = run_phase(phase_timings, "plan_grafana", plan_grafana, args, grafana_client, influxdb_parameters,
+                        datasource_specs)
+    if apply:
+        run_phase(phase_timings, "apply_grafana_plan", grafanaPlan.apply_plan, grafana_client, changes,
+                  max_workers=max(args.datasource_workers, args.dashboard_workers),
+                  required=[addGrafanaDataSources.DATA_SOURCE_NAME])
+    return datasource_specs
+
+
+def provision_grafana(args, grafana_client, phase_timings, grafana_secrets, influxdb_parameters, datasource_specs,
+                      reconcile, tiers=None) -> list:
+    """
+    Add the InfluxDB datasource, the downsampling tiers with their datasources, the additional datasources and
+    the dashboards to Grafana.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the Grafana client
+        phase_timings(dict): the phase name to duration (seconds) mapping to record into
+        grafana_secrets(dict): the retrieved Grafana secret JSON containing the username/password
+        influxdb_parameters(dict): the InfluxDB parameters to provision the datasources with
+        datasource_specs(list): the additional datasources to provision
+        reconcile(bool): update an existing InfluxDB datasource whose config has changed
+        tiers(list): the downsampling tiers to provision
+
+    Returns
+    -------
+        datasource_specs(list): the additional datasources, including those of the downsampling tiers
+    """
+
+    if args.plan == 'true' or args.apply == 'true':
+        return provision_grafana_with_plan(args, grafana_client, phase_timings, grafana_secrets,
+                                           influxdb_parameters, datasource_specs, tiers)
+    settings = datasource_settings(args)
+    run_phase(phase_timings, "add_influxdb_datasource", addGrafanaDataSources.add_influxdb_datasource_to_grafana,
+              args.mount_path,
+              grafana_secrets,
+              influxdb_parameters,
+              args.grafana_port,
+              args.grafana_server_protocol,
+              not (args.skip_tls_verify == 'true'),
+              grafana_client=grafana_client,
+              reconcile=reconcile,
+              **settings)
+
+    if tiers:
+        import downsamplingTiers
+        run_phase(phase_timings, "provision_downsampling", provision_downsampling, args, influxdb_parameters, tiers)
+        datasource_specs = datasource_specs + downsamplingTiers.tier_datasource_specs(
+            tiers, influxdb_parameters['InfluxDBBucket'])
+
+    if datasource_specs:
+        run_phase(phase_timings, "add_additional_datasources",
+                  addGrafanaDataSources.add_influxdb_datasources_to_grafana,
+                  grafana_client,
+                  args.mount_path,
+                  influxdb_parameters,
+                  datasource_specs,
+                  max_workers=args.datasource_workers,
+                  **settings)
+
+    if args.dashboards_dir:
+        run_phase(phase_timings, "provision_dashboards", provision_dashboards, args, grafana_client)
+    return datasource_specs
+
+
+def start_query_proxy(args, influxdb_parameters):
+    """
+    Start the query proxy that caches the results of Grafana's queries to InfluxDB.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        influxdb_parameters(dict): the InfluxDB parameters of the InfluxDB to forward queries to
+
+    Returns
+    -------
+        proxy(QueryProxy): the running proxy
+    """
+
+    import influxdbClient
+    import queryProxy
+
+    cache = queryProxy.QueryCache(max_bytes=args.query_proxy_max_bytes, ttl=args.query_proxy_ttl)
+    proxy = queryProxy.QueryProxy(influxdbClient.influxdb_url(influxdb_parameters),
+                                  not (influxdb_parameters['InfluxDBSkipTLSVerify'] == 'true'),
+                                  port=args.query_proxy_port, bind_address=args.query_proxy_bind,
+                                  alignment=args.query_proxy_alignment, cache=cache)
+    return proxy.start()
+
+
+def serve(args, grafana_client, handler, influxdb_parameters, datasource_specs, stop_event=None) -> None:
+    """
+    Run what outlives provisioning: the query proxy if enabled, and the token rotation watch in daemon mode.
+    With the query proxy but without daemon mode, just serve queries until the stop event is set or the
+    process receives SIGTERM.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the authenticated Grafana client
+        handler(InfluxDBDataStreamHandler): the handler of the open token response subscription in daemon mode
+        influxdb_parameters(dict): the InfluxDB parameters the datasources were provisioned with
+        datasource_specs(list): the additional datasources
+        stop_event(threading.Event): ends serving when set
+
+    Returns
+    -------
+        None
+    """
+
+    daemon = args.daemon == 'true'
+    if args.query_proxy != 'true':
+        if daemon:
+            watch_token_rotation(args, grafana_client, handler, influxdb_parameters, datasource_specs, stop_event)
+        return
+
+    stop_event = stop_on_sigterm(stop_event)
+    proxy = start_query_proxy(args, influxdb_parameters)
+    try:
+        if daemon:
+            watch_token_rotation(args, grafana_client, handler, influxdb_parameters, datasource_specs, stop_event)
+        else:
+            logging.info("Serving the query proxy until stopped...")
+            stop_event.wait()
+    finally:
+        proxy.stop()
+
+
+def report_bootstrap(args, phase_timings, profiler=None, telemetry=None) -> None:
+    """
+    Log the bootstrap phase timings, report the startup profile, and record the timings as self-telemetry.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        phase_timings(dict): the duration of each phase and of the whole bootstrap, in seconds
+        profiler(StartupProfiler): the running startup profiler to stop and report, if any
+        telemetry(TelemetryWriter): the writer to record the phase timings with and to start, if any
+    """
+
+    logging.info("Bootstrap phase timings ({}): {}".format(
+        args.bootstrap_mode, ", ".join("{}={:.3f}s".format(k, v) for k, v in phase_timings.items())))
+    if profiler is not None:
+        profiler.stop()
+        profiler.report()
+    if telemetry is not None:
+        import selfTelemetry
+        telemetry.record(selfTelemetry.MEASUREMENT, dict(phase_timings),
+                         {"event": "bootstrap", "bootstrap_mode": args.bootstrap_mode})
+        start_self_telemetry(args, telemetry)
+
+
+def write_provisioning_files(args, influxdb_parameters, datasource_specs) -> dict:
+    """
+    Render the InfluxDB datasources and the dashboards into Grafana provisioning files in the provisioning
+    directory shared with Grafana.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        influxdb_parameters(dict): the InfluxDB parameters to provision the datasources with
+        datasource_specs(list): the additional datasources to provision
+
+    Returns
+    -------
+        report(dict): the action taken for each file, by path relative to the provisioning directory
+    """
+
+    import grafanaProvisioning
+
+    settings = datasource_settings(args)
+    cert, key = addGrafanaDataSources.load_influxdb_certs(args.mount_path, influxdb_parameters)
+    configs = addGrafanaDataSources.create_influxdb_datasource_configs(influxdb_parameters, cert, key,
+                                                                       datasource_specs, **settings)
+    dashboards = None
+    if args.dashboards_dir:
+        dashboards = grafanaProvisioning.render_dashboards(os.path.join(args.mount_path, args.dashboards_dir),
+                                                           addGrafanaDataSources.DATA_SOURCE_NAME, args.flux_lint)
+    return grafanaProvisioning.write_provisioning_files(os.path.join(args.mount_path, args.provisioning_dir),
+                                                        configs, dashboards, args.grafana_provisioning_path)
+
+
+def bootstrap_files(args, stop_event=None, profiler=None, telemetry=None) -> dict:
+    """
+    Retrieve the InfluxDB parameters and write the datasources and dashboards as Grafana provisioning files,
+    without waiting for Grafana or calling its API. Grafana loads the files when it starts.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        stop_event(threading.Event): ends serving the query proxy when set
+        profiler(StartupProfiler): the running startup profiler to report once the files are written, if any
+        telemetry(TelemetryWriter): the writer to record the phase timings with and to start, if any
+
+    Returns
+    -------
+        phase_timings(dict): the duration of each phase and of the whole bootstrap, in seconds
+    """
+
+    if args.daemon == 'true':
+        # Grafana only reads provisioning files at startup, so rotated tokens would never reach it
+        raise ValueError("Daemon mode needs the Grafana API, it can't be combined with file provisioning!")
+    configure_retries(args)
+    datasource_specs = addGrafanaDataSources.parse_datasource_specs(args.datasources)
+    tiers = parse_downsampling_tiers(args)
+    phase_timings = {}
+    start = time.monotonic()
+
+    influxdb_parameters = run_phase(phase_timings, "retrieve_influxdb_params",
+                                    retrieveInfluxDBParams.retrieve_influxdb_params,
+                                    args.publish_topic, args.subscribe_topic,
+                                    initial_backoff=args.token_request_initial_backoff,
+                                    max_backoff=args.token_request_max_backoff,
+                                    deadline=args.token_request_deadline)
+    if tiers:
+        import downsamplingTiers
+        run_phase(phase_timings, "provision_downsampling", provision_downsampling, args, influxdb_parameters, tiers)
+        datasource_specs = datasource_specs + downsamplingTiers.tier_datasource_specs(
+            tiers, influxdb_parameters['InfluxDBBucket'])
+    run_phase(phase_timings, "write_provisioning_files", write_provisioning_files, args, influxdb_parameters,
+              datasource_specs)
+
+    phase_timings["total"] = time.monotonic() - start
+    retryPolicy.end_startup()
+    report_bootstrap(args, phase_timings, profiler, telemetry)
+    serve(args, None, None, influxdb_parameters, datasource_specs, stop_event)
+    return phase_timings
+
+
+def store_params_cache(cache, influxdb_parameters, grafana_secrets) -> None:
+    """
+    Store the InfluxDB parameters in the cache. Grafana is provisioned by then, so a failure only slows down the
+    next start and is logged rather than raised.
+
+    Parameters
+    ----------
+        cache(ParamsCache): the parameter cache
+        influxdb_parameters(dict): the InfluxDB parameters to cache
+        grafana_secrets(dict): the retrieved Grafana secret JSON, to encrypt the cache with
+    """
+
+    try:
+        cache.store(influxdb_parameters, grafana_secrets)
+    except Exception:
+        logging.warning("Failed to store the InfluxDB parameter cache", exc_info=True)
+
+
+def apply_refreshed_params(args, grafana_client, phase_timings, refresh, cached_parameters,
+                           datasource_specs) -> dict:
+    """
+    Wait for the token exchange that refreshes the cached InfluxDB parameters, and reconcile Grafana with the
+    refreshed parameters if they changed. Grafana is provisioned from the cached parameters by then, so a failed
+    refresh keeps them and is logged rather than raised.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        grafana_client(GrafanaClient): the authenticated Grafana client
+        phase_timings(dict): the phase name to duration (seconds) mapping to record into
+        refresh(Future): the background token exchange
+        cached_parameters(dict): the cached InfluxDB parameters Grafana was provisioned with
+        datasource_specs(list): the additional datasources
+
+    Returns
+    -------
+        influxdb_parameters(dict): the refreshed InfluxDB parameters, or the cached ones if the refresh failed
+    """
+
+    try:
+        influxdb_parameters = refresh.result()
+    except Exception:
+        logging.warning("Failed to refresh the cached InfluxDB parameters, keeping the cached ones", exc_info=True)
+        return cached_parameters
+    if influxdb_parameters != cached_parameters:
+        logging.info("Cached InfluxDB parameters are outdated, reconciling with the refreshed ones")
+        run_phase(phase_timings, "reconcile_refreshed_params", apply_influxdb_parameters_change, args,
+                  grafana_client, cached_parameters, influxdb_parameters, datasource_specs)
+    return influxdb_parameters
+
+
+def bootstrap(args, stop_event=None, profiler=None, telemetry=None) -> dict:
+    """
+    Retrieve the Grafana secret and the InfluxDB parameters and wait for Grafana to be ready, then add the
+    InfluxDB datasource to Grafana. In concurrent mode the independent phases overlap and are only joined
+    before the datasource is added, which needs all of their results. With the parameter cache enabled,
+    cached InfluxDB parameters are provisioned right away and the token exchange runs in the background
+    to refresh them. In daemon mode, keep watching for token rotation afterwards, and with the query proxy
+    enabled, keep serving queries. In plan mode, only log the changes Grafana needs and stop there; in apply
+    mode, make those changes from a single bulk read of Grafana's state.
+
+    Parameters
+    ----------
+        args(Namespace): Parsed arguments
+        stop_event(threading.Event): ends daemon mode when set
+        profiler(StartupProfiler): the running startup profiler to report once Grafana is provisioned, if any
+        telemetry(TelemetryWriter): the writer to record the phase timings with and to start, if any
+
+    Returns
+    -------
+        phase_timings(dict): the duration of each phase and of the whole bootstrap, in seconds
+    """
+
+    tls_verify = not (args.skip_tls_verify == 'true')
+    daemon = args.daemon == 'true'
+    dry_run = args.plan == 'true'
+    if dry_run and (daemon or args.apply == 'true'):
+        raise ValueError("Plan mode only shows the changes, it can't be combined with apply or daemon mode!")
+    reconcile = daemon or args.reconcile_datasource == 'true'
+    configure_retries(args)
+    # Validate the additional datasources before spending time on the token exchange
+    datasource_specs = addGrafanaDataSources.parse_datasource_specs(args.datasources)
+    tiers = parse_downsampling_tiers(args)
+    # In daemon mode the subscription stays open, so the handler outlives the token exchange
+    handler = None
+    if daemon:
+        # Imported here since the stream handler pulls in the IPC client library
+        import streamHandlers
+        handler = streamHandlers.InfluxDBDataStreamHandler()
+    cache = None
+    # A plan shows the changes for the current parameters, never for possibly outdated cached ones
+    if args.params_cache == 'true' and not dry_run:
+        import paramsCache
+        cache = paramsCache.ParamsCache(os.path.join(args.mount_path, paramsCache.CACHE_RELATIVE_PATH),
+                                        ttl=args.params_cache_ttl, encrypt=(args.params_cache_encrypt == 'true'))
+    phase_timings = {}
+    start = time.monotonic()
+
+    # Size the connection pool so that concurrent dashboard pushes don't wait for a connection
+    pool_size = max(grafanaClient.POOL_SIZE, args.dashboard_workers, args.datasource_workers)
+    with grafanaClient.GrafanaClient(args.grafana_server_protocol, args.grafana_port, tls_verify,
+                                     pool_size=pool_size) as grafana_client:
+        retrieve_params = ("retrieve_influxdb_params", retrieveInfluxDBParams.retrieve_influxdb_params,
+                           (args.publish_topic, args.subscribe_topic), {
+                               "initial_backoff": args.token_request_initial_backoff,
+                               "max_backoff": args.token_request_max_backoff,
+                               "deadline": args.token_request_deadline,
+                               "handler": handler,
+                               "keep_subscription": daemon
+                           })
+        phases = [
+            ("retrieve_secret", retrieveGrafanaSecrets.retrieve_secret, (args.grafana_secret_arn,), {}),
+            ("wait_for_grafana", grafana_client.wait_until_ready, (), {"deadline": args.grafana_ready_deadline})
+        ]
+        if cache is None:
+            phases.insert(1, retrieve_params)
+            results = run_independent_phases(phases, phase_timings, args.bootstrap_mode)
+            cached_parameters = None
+            influxdb_parameters = results["retrieve_influxdb_params"]
+        else:
+            # The token exchange always runs in the background here, refreshing whatever the cache holds
+            name, function, function_args, function_kwargs = retrieve_params
+            refresh = start_phase(phase_timings, name, function, *function_args, **function_kwargs)
+            results = run_independent_phases(phases, phase_timings, args.bootstrap_mode)
+            cached_parameters = cache.load(results["retrieve_secret"])
+            influxdb_parameters = cached_parameters or refresh.result()
+
+        datasource_specs = provision_grafana(args, grafana_client, phase_timings, results["retrieve_secret"],
+                                             influxdb_parameters, datasource_specs, reconcile, tiers)
+
+        if cache is not None:
+            # Grafana is usable from here on, even if the refreshed parameters still have to be applied
+            phase_timings["ready"] = time.monotonic() - start
+            if cached_parameters:
+                influxdb_parameters = apply_refreshed_params(args, grafana_client, phase_timings, refresh,
+                                                             cached_parameters, datasource_specs)
+            # Parameters that failed to refresh are kept as cached, rather than stored again with a new TTL
+            if influxdb_parameters is not cached_parameters:
+                store_params_cache(cache, influxdb_parameters, results["retrieve_secret"])
+
+        phase_timings["total"] = time.monotonic() - start
+        retryPolicy.end_startup()
+        report_bootstrap(args, phase_timings, profiler, telemetry)
+
+        if not dry_run:
+            serve(args, grafana_client, handler, influxdb_parameters, datasource_specs, stop_event)
+
+    return phase_timings
+
+
 if __name__ == "__main__":
 
+    report_path = None
+    telemetry = None
+    metrics = None
     try:
         args = parse_arguments()
-        tls_verify = not (args.skip_tls_verify == 'true')
-
-        grafana_secrets = retrieveGrafanaSecrets.retrieve_secret(args.grafana_secret_arn)
-        influxdb_parameters = retrieveInfluxDBParams.retrieve_influxdb_params(args.publish_topic, args.subscribe_topic)
-        addGrafanaDataSources.add_influxdb_datasource_to_grafana(
-            args.mount_path,
-            grafana_secrets,
-            influxdb_parameters,
-            args.grafana_port,
-            args.grafana_server_protocol,
-            tls_verify)
+        if args.provisioning_report == 'true':
+            instrumentation.enable()
+            report_path = args.provisioning_report_path
+        profiler = None
+        if args.profile_startup == 'true':
+            # Heavy modules are imported on first use, so most of them load during the bootstrap
+            import startupProfile
+            profiler = startupProfile.StartupProfiler()
+            profiler.start()
+        if args.telemetry == 'true':
+            import selfTelemetry
+            telemetry = selfTelemetry.TelemetryWriter(flush_interval=args.telemetry_flush_interval,
+                                                      default_tags={"host": socket.gethostname()})
+            instrumentation.add_listener(telemetry.record_span)
+        if args.metrics == 'true':
+            import metricsServer
+            metrics = metricsServer.MetricsServer(port=args.metrics_port, bind_address=args.metrics_bind).start()
+            instrumentation.add_listener(metrics.registry.record_span)
+        if args.provisioning_mode == 'file':
+            bootstrap_files(args, profiler=profiler, telemetry=telemetry)
+        else:
+            bootstrap(args, profiler=profiler, telemetry=telemetry)
+    except retryPolicy.RetryError as e:
+        logging.error('Gave up setting up dashboard: {}'.format(e), exc_info=True)
+        exit(1)
     except Exception:
         logging.error('Exception occurred when setting up dashboard.', exc_info=True)
         exit(1)
+    finally:
+        if metrics is not None:
+            metrics.stop()
+        if telemetry is not None:
+            # Before closing IPC, which the write token may still be retrieved over
+            telemetry.close()
+        ipcConnection.close_ipc_client()
+        logging.info("Greengrass IPC connection stats: {}".format(ipcConnection.get_ipc_connection_stats()))
+        instrumentation.report(report_path)
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+
+logging.basicConfig(level=logging.INFO)
+NO_PROFILE = "none"
+AUTO_PROFILE = "auto"
+EDGE_SMALL_PROFILE = "edge-small"
+EDGE_LARGE_PROFILE = "edge-large"
+# Grafana InfluxDB datasource jsonData options bounding the work a single query can cause on InfluxDB:
+# timeInterval is the minimum GROUP BY / aggregateWindow interval, maxSeries caps the series a Flux query
+# returns, timeout is the query timeout in seconds and httpMode sends queries in POST bodies instead of URLs
+PROFILES = {
+    EDGE_SMALL_PROFILE: {"timeInterval": "30s", "maxSeries": 100, "timeout": 30, "httpMode": "POST"},
+    EDGE_LARGE_PROFILE: {"timeInterval": "10s", "maxSeries": 1000, "timeout": 60, "httpMode": "POST"}
+}
+PROFILE_NAMES = [NO_PROFILE, AUTO_PROFILE] + sorted(PROFILES)
+# Devices below either threshold get the edge-small profile in auto mode
+SMALL_DEVICE_CPUS = 2
+SMALL_DEVICE_MEMORY_MB = 2048
+
+
+def device_capacity() -> tuple:
+    """
+    Get the CPU count and the physical memory of the device, which InfluxDB and Grafana share.
+
+    Returns
+    -------
+        (cpus, memory_mb)(tuple): the CPU count and memory in MiB; either is None if it can't be determined
+    """
+
+    try:
+        memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        memory_mb = None
+    return os.cpu_count(), memory_mb
+
+
+def select_profile(cpus, memory_mb) -> str:
+    """
+    Derive a profile from the device capacity. A device whose capacity can't be determined is treated as small.
+
+    Parameters
+    ----------
+        cpus(int): the CPU count
+        memory_mb(int): the physical memory in MiB
+
+    Returns
+    -------
+        profile(str): the name of the profile
+    """
+
+    if not cpus or not memory_mb or cpus <= SMALL_DEVICE_CPUS or memory_mb < SMALL_DEVICE_MEMORY_MB:
+        return EDGE_SMALL_PROFILE
+    return EDGE_LARGE_PROFILE
+
+
+def validate_profile(profile) -> None:
+    if profile not in PROFILE_NAMES:
+        raise ValueError("Unknown datasource profile {}, must be one of {}".format(profile, PROFILE_NAMES))
+
+
+def profile_options(profile) -> dict:
+    """
+    Get the datasource jsonData options of a performance profile.
+
+    Parameters
+    ----------
+        profile(str): none, auto, edge-small or edge-large
+
+    Returns
+    -------
+        options(dict): the jsonData options to add to the datasource; empty for none, leaving Grafana's defaults
+    """
+
+    validate_profile(profile)
+    if profile == NO_PROFILE:
+        return {}
+    if profile == AUTO_PROFILE:
+        cpus, memory_mb = device_capacity()
+        profile = select_profile(cpus, memory_mb)
+        logging.info("Selected datasource profile {} for {} CPUs and {} MiB of memory".format(profile, cpus,
+                                                                                              memory_mb))
+    return dict(PROFILES[profile])
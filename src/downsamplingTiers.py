@@ -0,0 +1,202 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import re
+
+import instrumentation
+
+logging.basicConfig(level=logging.INFO)
+# Creating buckets and tasks needs more than the read-only token given to Grafana
+ADMIN_ACCESS = "Admin"
+AGGREGATE_FUNCTIONS = ("mean", "median", "max", "min", "sum", "last")
+DEFAULT_FUNCTION = "mean"
+DATASOURCE_NAME_FORMAT = "InfluxDB-{}"
+BUCKET_NAME_FORMAT = "{}-{}"
+TASK_NAME_FORMAT = "greengrass-downsample-{}"
+TIER_ACTION_CREATED = "created"
+TIER_ACTION_UPDATED = "updated"
+TIER_ACTION_UNCHANGED = "unchanged"
+TIER_ACTION_FAILED = "failed"
+DURATION_PATTERN = re.compile(r"^([1-9][0-9]*)([smhdw])$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+# Only numeric fields can be aggregated, so other fields are left out of the rollups
+TASK_FLUX = """import "types"
+
+option task = {{name: "{name}", every: {every}}}
+
+from(bucket: "{source}")
+    |> range(start: -task.every)
+    |> filter(fn: (r) => types.isType(v: r._value, type: "float") or types.isType(v: r._value, type: "int")
+        or types.isType(v: r._value, type: "uint"))
+    |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)
+    |> to(bucket: "{bucket}", org: "{org}")
+"""
+
+
+def duration_seconds(duration) -> int:
+    """
+    Convert a Flux duration literal with a single unit, e.g. 30d, to seconds.
+
+    :param duration: The duration literal.
+    :return: The number of seconds.
+    """
+
+    match = DURATION_PATTERN.match(str(duration))
+    if not match:
+        raise ValueError("Invalid duration {}, expected a number followed by s, m, h, d or w".format(duration))
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_tiers(tiers) -> list:
+    """
+    Parse and validate a JSON list of downsampling tiers, e.g.
+    [{"every": "1m", "retention": "30d"}, {"every": "1h", "retention": "365d", "fn": "max"}].
+    Each tier rolls the InfluxDB bucket up into windows of the given length, kept for the given retention
+    ("0s" keeps them forever). The aggregate function defaults to mean, and the rollup bucket and its Grafana
+    datasource are named after the window unless a bucket name is given.
+
+    :param tiers: The JSON string of tiers.
+    :return: The list of tier dicts.
+    """
+
+    if not tiers:
+        return []
+    parsed = json.loads(tiers)
+    if not isinstance(parsed, list):
+        raise ValueError("Downsampling tiers must be a JSON list!")
+    windows = set()
+    for tier in parsed:
+        if not isinstance(tier, dict) or "every" not in tier or "retention" not in tier:
+            raise ValueError("Every downsampling tier needs every and retention, but got: {}".format(tier))
+        unknown = set(tier) - {"every", "retention", "fn", "bucket"}
+        if unknown:
+            raise ValueError("Unknown downsampling tier fields {} in {}".format(sorted(unknown), tier))
+        duration_seconds(tier["every"])
+        if tier["retention"] != "0s":
+            duration_seconds(tier["retention"])
+        if tier.get("fn", DEFAULT_FUNCTION) not in AGGREGATE_FUNCTIONS:
+            raise ValueError("Unsupported aggregate function {}, must be one of {}".format(
+                tier["fn"], AGGREGATE_FUNCTIONS))
+        if tier["every"] in windows:
+            raise ValueError("Duplicate downsampling window {}".format(tier["every"]))
+        windows.add(tier["every"])
+    return parsed
+
+
+def tier_bucket(tier, source_bucket) -> str:
+    return tier.get("bucket") or BUCKET_NAME_FORMAT.format(source_bucket, tier["every"])
+
+
+def tier_datasource_specs(tiers, source_bucket) -> list:
+    """
+    Get the additional Grafana datasource specs querying the rollup buckets, one per tier.
+
+    :param tiers: The tiers, as returned by parse_tiers.
+    :param source_bucket: The InfluxDB bucket the tiers roll up.
+    :return: The datasource specs, as accepted by addGrafanaDataSources.add_influxdb_datasources_to_grafana.
+    """
+
+    return [{"name": DATASOURCE_NAME_FORMAT.format(tier["every"]), "bucket": tier_bucket(tier, source_bucket)}
+            for tier in tiers]
+
+
+def create_task_flux(tier, org, source_bucket) -> str:
+    """
+    Generate the Flux script of the task that rolls up one tier.
+
+    :param tier: The tier.
+    :param org: The InfluxDB org.
+    :param source_bucket: The InfluxDB bucket the tier rolls up.
+    :return: The Flux script.
+    """
+
+    bucket = tier_bucket(tier, source_bucket)
+    return TASK_FLUX.format(name=TASK_NAME_FORMAT.format(bucket), every=tier["every"], source=source_bucket,
+                            fn=tier.get("fn", DEFAULT_FUNCTION), bucket=bucket, org=org)
+
+
+def get_org_id(client, org) -> str:
+    orgs = client.call("GET", "/api/v2/orgs", params={"org": org}).get("orgs", [])
+    if not orgs:
+        raise ValueError("InfluxDB org {} does not exist".format(org))
+    return orgs[0]["id"]
+
+
+def reconcile_bucket(client, org_id, name, retention) -> str:
+    """
+    Create the bucket if it doesn't exist, or update its retention if it differs.
+
+    :param client: The InfluxDBClient to send requests with.
+    :param org_id: The InfluxDB org ID.
+    :param name: The bucket name.
+    :param retention: The retention duration literal, or 0s to keep the data forever.
+    :return: The action taken: created, updated or unchanged.
+    """
+
+    retention_rules = [{"type": "expire", "everySeconds": duration_seconds(retention)}] if retention != "0s" else []
+    buckets = client.call("GET", "/api/v2/buckets", params={"orgID": org_id, "name": name}).get("buckets", [])
+    if not buckets:
+        client.call("POST", "/api/v2/buckets", {"orgID": org_id, "name": name, "retentionRules": retention_rules},
+                    expected=(201,))
+        return TIER_ACTION_CREATED
+    existing_rules = [{"type": rule.get("type"), "everySeconds": rule.get("everySeconds")}
+                      for rule in buckets[0].get("retentionRules", [])]
+    if existing_rules == retention_rules:
+        return TIER_ACTION_UNCHANGED
+    client.call("PATCH", "/api/v2/buckets/{}".format(buckets[0]["id"]), {"retentionRules": retention_rules})
+    return TIER_ACTION_UPDATED
+
+
+def reconcile_task(client, org_id, name, flux) -> str:
+    """
+    Create the task if it doesn't exist, or update its Flux script if it differs.
+
+    :param client: The InfluxDBClient to send requests with.
+    :param org_id: The InfluxDB org ID.
+    :param name: The task name, which the Flux script sets as well.
+    :param flux: The Flux script.
+    :return: The action taken: created, updated or unchanged.
+    """
+
+    tasks = client.call("GET", "/api/v2/tasks", params={"orgID": org_id, "name": name}).get("tasks", [])
+    if not tasks:
+        client.call("POST", "/api/v2/tasks", {"orgID": org_id, "flux": flux, "status": "active"}, expected=(201,))
+        return TIER_ACTION_CREATED
+    if tasks[0].get("flux") == flux and tasks[0].get("status") == "active":
+        return TIER_ACTION_UNCHANGED
+    client.call("PATCH", "/api/v2/tasks/{}".format(tasks[0]["id"]), {"flux": flux, "status": "active"})
+    return TIER_ACTION_UPDATED
+
+
+@instrumentation.traced("provision_downsampling_tiers")
+def provision_tiers(client, org, source_bucket, tiers) -> list:
+    """
+    Reconcile the rollup bucket and the downsampling task of every tier. A failing tier doesn't prevent the
+    others from being provisioned.
+
+    :param client: The InfluxDBClient to send requests with, authenticated with a token that can manage
+        buckets and tasks.
+    :param org: The InfluxDB org.
+    :param source_bucket: The InfluxDB bucket the tiers roll up.
+    :param tiers: The tiers, as returned by parse_tiers.
+    :return: One {"every", "bucket", "bucket_action", "task_action"} result per tier, in tier order.
+    """
+
+    org_id = get_org_id(client, org)
+    results = []
+    for tier in tiers:
+        bucket = tier_bucket(tier, source_bucket)
+        result = {"every": tier["every"], "bucket": bucket, "bucket_action": TIER_ACTION_FAILED,
+                  "task_action": TIER_ACTION_FAILED}
+        try:
+            result["bucket_action"] = reconcile_bucket(client, org_id, bucket, tier["retention"])
+            result["task_action"] = reconcile_task(client, org_id, TASK_NAME_FORMAT.format(bucket),
+                                                   create_task_flux(tier, org, source_bucket))
+        except Exception:
+            logging.error("Failed to provision the {} downsampling tier".format(tier["every"]), exc_info=True)
+        logging.info("Downsampling tier {every}: bucket {bucket} {bucket_action}, task {task_action}".format(**result))
+        results.append(result)
+    return results
@@ -0,0 +1,419 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import argparse
+import copy
+import json
+import logging
+import os
+import re
+import sys
+
+logging.basicConfig(level=logging.INFO)
+
+LINT_OFF = "off"
+LINT_REPORT = "report"
+LINT_FIX = "fix"
+LINT_MODES = [LINT_OFF, LINT_REPORT, LINT_FIX]
+
+RULE_UNBOUNDED_RANGE = "unbounded-range"
+RULE_FIXED_RANGE = "fixed-range"
+RULE_MISSING_WINDOW_PERIOD = "missing-window-period"
+RULE_PIVOT_BEFORE_FILTER = "pivot-before-filter"
+# How much each rule adds to the estimated cost of a query
+RULE_WEIGHTS = {
+    RULE_UNBOUNDED_RANGE: 2,
+    RULE_FIXED_RANGE: 1,
+    RULE_MISSING_WINDOW_PERIOD: 1,
+    RULE_PIVOT_BEFORE_FILTER: 1
+}
+COST_LOW = "low"
+COST_MEDIUM = "medium"
+COST_HIGH = "high"
+COST_CLASSES = [COST_LOW, COST_MEDIUM, COST_HIGH]
+
+WINDOW_RANGE = "range(start: v.timeRangeStart, stop: v.timeRangeStop)"
+# Grafana's own Flux query template aggregates with mean
+WINDOW_AGGREGATE = "aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)"
+STAGE_SEPARATOR = "\n  |> "
+PIVOT_FUNCTIONS = ("pivot", "schema.fieldsAsCols")
+# Functions that already bound the number of points a pipeline returns
+REDUCING_FUNCTIONS = ("aggregateWindow", "window", "count", "distinct", "first", "histogram", "integral", "last",
+                      "limit", "max", "mean", "median", "min", "mode", "quantile", "reduce", "sample", "spread",
+                      "stddev", "sum", "tail", "top", "bottom", "unique")
+# Columns a pivot leaves as they are, so filters on them can run before it
+PIVOT_STABLE_COLUMNS = ("_measurement", "_time", "_start", "_stop")
+UNBOUNDED_STARTS = ("0", "time(v: 0)", "1970-01-01T00:00:00Z")
+CALL_PATTERN = re.compile(r"^\s*([A-Za-z_][\w.]*)\s*\(")
+ASSIGNMENT_PATTERN = re.compile(r"^(\s*[A-Za-z_]\w*\s*=(?!=)\s*)")
+COLUMN_PATTERN = re.compile(r"\br\.(\w+)|\br\[\"(\w+)\"\]")
+ARGUMENT_PATTERN = r"\b{}\s*:\s*"
+# A statement whose line ends in an operator continues on the next line
+CONTINUATION_PATTERN = re.compile(r"(\|>|[=,+\-*/]|\band|\bor)$")
+CLOSING = {")": "(", "]": "[", "}": "{"}
+
+
+def _scan(flux):
+    """
+    Yield the position and character of every character of a Flux script outside strings and comments,
+    together with the bracket depth it is at.
+    """
+
+    depth = 0
+    i = 0
+    while i < len(flux):
+        char = flux[i]
+        if char == '"':
+            i += 1
+            while i < len(flux) and flux[i] != '"':
+                i += 2 if flux[i] == "\\" else 1
+        elif flux.startswith("//", i):
+            i = flux.find("\n", i)
+            if i < 0:
+                return
+            continue
+        else:
+            if char in CLOSING:
+                depth = max(depth - 1, 0)
+            yield i, char, depth
+            if char in "([{":
+                depth += 1
+        i += 1
+
+
+def split_statements(flux) -> list:
+    """
+    Split a Flux script into its top-level statements, keeping pipelines that continue on the next line
+    with |> together.
+
+    Parameters
+    ----------
+        flux(str): the Flux script
+
+    Returns
+    -------
+        statements(list): the text of each statement, including its surrounding whitespace
+    """
+
+    boundaries = []
+    for i, char, depth in _scan(flux):
+        if char != "\n" or depth:
+            continue
+        before = flux[:i].rstrip()
+        after = flux[i + 1:].lstrip()
+        if after and not CONTINUATION_PATTERN.search(before) and not after.startswith("|>"):
+            boundaries.append(i + 1)
+    return [flux[start:end] for start, end in zip([0] + boundaries, boundaries + [len(flux)])]
+
+
+def split_pipeline(statement) -> tuple:
+    """
+    Split a statement into its assignment and the stages of its pipeline.
+
+    Parameters
+    ----------
+        statement(str): the statement
+
+    Returns
+    -------
+        (assignment, stages)(tuple): the assignment prefix, e.g. "data = ", or an empty string, and the
+            stripped text of each stage
+    """
+
+    code = statement.strip()
+    match = ASSIGNMENT_PATTERN.match(code)
+    assignment = match.group(1) if match else ""
+    code = code[len(assignment):]
+    separators = [i for i, char, depth in _scan(code) if depth == 0 and code.startswith("|>", i)]
+    bounds = zip([0] + [i + 2 for i in separators], separators + [len(code)])
+    return assignment.strip() + " " if assignment else "", [code[start:end].strip() for start, end in bounds]
+
+
+def stage_function(stage) -> str:
+    match = CALL_PATTERN.match(stage)
+    return match.group(1) if match else ""
+
+
+def _argument(stage, name):
+    """
+    Get the text of a named argument of a call, e.g. the start of range(start: -1h).
+    """
+
+    match = re.search(ARGUMENT_PATTERN.format(name), stage)
+    if not match:
+        return None
+    value = stage[match.end():]
+    end = len(value)
+    for i, char, depth in _scan(value):
+        if depth == 0 and char in ",)":
+            end = i
+            break
+    return value[:end].strip()
+
+
+def _lint_range(stages, fix, findings) -> list:
+    range_index = next((i for i, stage in enumerate(stages) if stage_function(stage) == "range"), None)
+    if range_index is None:
+        findings.append({"rule": RULE_UNBOUNDED_RANGE, "fixed": fix,
+                         "message": "from() is not followed by a range(), so every point in the bucket is read"})
+        return stages[:1] + [WINDOW_RANGE] + stages[1:] if fix else stages
+
+    start = _argument(stages[range_index], "start")
+    if start == "v.timeRangeStart":
+        return stages
+    if start in UNBOUNDED_STARTS:
+        rule, message = RULE_UNBOUNDED_RANGE, "range() starts at the epoch, so every point in the bucket is read"
+    else:
+        rule, message = RULE_FIXED_RANGE, "range(start: {}) ignores the dashboard time range".format(start)
+    findings.append({"rule": rule, "fixed": fix, "message": message})
+    if fix:
+        stages = stages[:range_index] + [WINDOW_RANGE] + stages[range_index + 1:]
+    return stages
+
+
+def _lint_window(stages, fix, findings, aggregated) -> list:
+    functions = [stage_function(stage) for stage in stages]
+    if "aggregateWindow" in functions:
+        index = functions.index("aggregateWindow")
+        every = _argument(stages[index], "every")
+        if every == "v.windowPeriod":
+            return stages
+        findings.append({"rule": RULE_MISSING_WINDOW_PERIOD, "fixed": fix,
+                         "message": "aggregateWindow(every: {}) ignores the panel width".format(every)})
+        if fix:
+            stages = list(stages)
+            stages[index] = re.sub(ARGUMENT_PATTERN.format("every") + re.escape(every),
+                                   "every: v.windowPeriod", stages[index], count=1)
+        return stages
+    if aggregated or any(function in REDUCING_FUNCTIONS for function in functions):
+        return stages
+
+    findings.append({"rule": RULE_MISSING_WINDOW_PERIOD, "fixed": fix,
+                     "message": "Raw points are returned without aggregateWindow(every: v.windowPeriod)"})
+    if not fix:
+        return stages
+    # Aggregate right after the leading range and filters, before anything that reshapes the tables
+    index = 1
+    while index < len(stages) and functions[index] in ("range", "filter"):
+        index += 1
+    return stages[:index] + [WINDOW_AGGREGATE] + stages[index:]
+
+
+def _pivot_stable(stage) -> bool:
+    columns = {a or b for a, b in COLUMN_PATTERN.findall(stage)}
+    return bool(columns) and columns <= set(PIVOT_STABLE_COLUMNS)
+
+
+def _lint_pivot(stages, fix, findings) -> list:
+    functions = [stage_function(stage) for stage in stages]
+    pivot_index = next((i for i, function in enumerate(functions) if function in PIVOT_FUNCTIONS), None)
+    if pivot_index is None:
+        return stages
+    late_filters = [i for i in range(pivot_index + 1, len(stages)) if functions[i] == "filter"]
+    if not late_filters:
+        return stages
+
+    movable = [i for i in late_filters if _pivot_stable(stages[i])] if fix else []
+    findings.append({"rule": RULE_PIVOT_BEFORE_FILTER, "fixed": len(movable) == len(late_filters),
+                     "message": "{} filter() calls run after {}(), on every row it builds".format(
+                         len(late_filters), functions[pivot_index])})
+    if not movable:
+        return stages
+    moved = [stages[i] for i in movable]
+    kept = [stage for i, stage in enumerate(stages) if i not in movable]
+    return kept[:pivot_index] + moved + kept[pivot_index:]
+
+
+def lint_flux(flux, fix=False) -> tuple:
+    """
+    Check a Flux query for patterns that make InfluxDB do far more work than a panel needs: a from() whose
+    range() isn't tied to the dashboard time range, raw points returned without
+    aggregateWindow(every: v.windowPeriod), and filter() calls after a pivot(). The query is split into
+    statements and pipeline stages rather than fully parsed, so pipelines are checked one by one.
+
+    Parameters
+    ----------
+        flux(str): the Flux query
+        fix(bool): rewrite the query to the window-aware form where that is safe
+
+    Returns
+    -------
+        (flux, findings)(tuple): the rewritten query, unchanged if there was nothing to fix, and one
+            {"rule", "message", "fixed"} finding per pattern found
+    """
+
+    statements = split_statements(flux)
+    pipelines = [split_pipeline(statement) for statement in statements]
+    # Pipelines that carry on from a variable aggregate the source pipeline assigned to it
+    aggregated = {stages[0] for _, stages in pipelines
+                  if any(stage_function(stage) in REDUCING_FUNCTIONS for stage in stages[1:])}
+
+    findings = []
+    rewritten = []
+    for statement, (assignment, stages) in zip(statements, pipelines):
+        fixed = stages
+        if stage_function(stages[0]) == "from":
+            fixed = _lint_range(fixed, fix, findings)
+            fixed = _lint_window(fixed, fix, findings, assignment.split("=")[0].strip() in aggregated)
+        fixed = _lint_pivot(fixed, fix, findings)
+        if fixed == stages:
+            rewritten.append(statement)
+        else:
+            leading = statement[:len(statement) - len(statement.lstrip())]
+            trailing = statement[len(statement.rstrip()):]
+            rewritten.append(leading + assignment + STAGE_SEPARATOR.join(fixed) + trailing)
+    return "".join(rewritten), findings
+
+
+def cost_class(findings) -> str:
+    """
+    Estimate how expensive a query is from its findings.
+
+    Parameters
+    ----------
+        findings(list): the findings of lint_flux
+
+    Returns
+    -------
+        cost(str): low without findings, medium for a single minor one, high otherwise
+    """
+
+    score = sum(RULE_WEIGHTS[finding["rule"]] for finding in findings)
+    return COST_CLASSES[min(score, len(COST_CLASSES) - 1)]
+
+
+def dashboard_cost(panels) -> str:
+    """
+    Estimate how expensive a dashboard is to refresh: as expensive as its most expensive panel.
+
+    Parameters
+    ----------
+        panels(list): the panel report of lint_dashboard
+
+    Returns
+    -------
+        cost(str): low, medium or high
+    """
+
+    return max([panel["cost"] for panel in panels] + [COST_LOW], key=COST_CLASSES.index)
+
+
+def iter_panels(node):
+    """
+    Yield every panel with targets of a dashboard, including those of panels nested in rows.
+    """
+
+    if isinstance(node, dict):
+        if isinstance(node.get("targets"), list):
+            yield node
+        for key in ("panels", "rows"):
+            for child in node.get(key, []) if isinstance(node.get(key), list) else []:
+                yield from iter_panels(child)
+
+
+def lint_dashboard(dashboard, fix=False) -> tuple:
+    """
+    Lint the Flux query of every panel target of a dashboard, including those of panels nested in rows.
+
+    Parameters
+    ----------
+        dashboard(dict): the dashboard JSON
+        fix(bool): rewrite the queries to the window-aware form where that is safe
+
+    Returns
+    -------
+        (dashboard, report)(tuple): the dashboard with its queries rewritten, or the given dashboard if there
+            was nothing to rewrite, and one {"id", "title", "cost", "findings"} entry per panel with queries
+    """
+
+    linted = copy.deepcopy(dashboard) if fix else dashboard
+    report = []
+    for panel in iter_panels(linted):
+        findings = []
+        costs = []
+        for target in panel["targets"]:
+            if not isinstance(target, dict) or not isinstance(target.get("query"), str):
+                continue
+            query, target_findings = lint_flux(target["query"], fix)
+            if fix:
+                target["query"] = query
+            findings.extend(dict(finding, refId=target.get("refId")) for finding in target_findings)
+            costs.append(cost_class([f for f in target_findings if not f["fixed"]]))
+        if costs:
+            report.append({"id": panel.get("id"), "title": panel.get("title"),
+                           "cost": max(costs, key=COST_CLASSES.index), "findings": findings})
+    if fix and not any(finding["fixed"] for panel in report for finding in panel["findings"]):
+        linted = dashboard
+    return linted, report
+
+
+def log_report(file_name, report) -> None:
+    for panel in report:
+        for finding in panel["findings"]:
+            logging.log(logging.INFO if finding["fixed"] else logging.WARNING,
+                        "Dashboard {} panel {!r} query {}: {}{}".format(
+                            file_name, panel["title"], finding["refId"], finding["message"],
+                            " (rewritten)" if finding["fixed"] else ""))
+
+
+def lint_directory(dashboards_path, fix=False, output_path=None) -> list:
+    """
+    Lint every dashboard JSON file of a directory, optionally writing the rewritten dashboards.
+
+    Parameters
+    ----------
+        dashboards_path(str): the directory containing the dashboard JSON files
+        fix(bool): rewrite the queries to the window-aware form where that is safe
+        output_path(str): the directory to write rewritten dashboards to; defaults to rewriting them in place
+
+    Returns
+    -------
+        report(list): one {"file", "uid", "title", "cost", "panels"} entry per dashboard
+    """
+
+    report = []
+    for file_name in sorted(os.listdir(dashboards_path)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(dashboards_path, file_name)) as f:
+            document = json.load(f)
+        # Accept both raw dashboards and the {"dashboard": ...} wrapper used by the Grafana API
+        wrapped = isinstance(document.get("dashboard"), dict)
+        dashboard = document["dashboard"] if wrapped else document
+        linted, panels = lint_dashboard(dashboard, fix)
+        report.append({"file": file_name, "uid": dashboard.get("uid"), "title": dashboard.get("title"),
+                       "cost": dashboard_cost(panels), "panels": panels})
+        if fix and linted is not dashboard:
+            output = dict(document, dashboard=linted) if wrapped else linted
+            with open(os.path.join(output_path or dashboards_path, file_name), "w") as f:
+                json.dump(output, f, indent=2)
+                f.write("\n")
+    return report
+
+
+def parse_arguments(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Lint the Flux queries of a directory of Grafana dashboards.")
+    parser.add_argument("dashboards_dir", type=str)
+    parser.add_argument("--fix", action="store_true", help="rewrite queries to the window-aware form")
+    parser.add_argument("--output", type=str, default="",
+                        help="write rewritten dashboards to this directory instead of in place")
+    parser.add_argument("--fail_on", type=str, default=COST_HIGH, choices=COST_CLASSES + ["never"],
+                        help="exit with status 1 if a dashboard is estimated at this cost or above after fixing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    options = parse_arguments(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    if options.output:
+        os.makedirs(options.output, exist_ok=True)
+    report = lint_directory(options.dashboards_dir, options.fix, options.output or None)
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if options.fail_on == "never":
+        return 0
+    threshold = COST_CLASSES.index(options.fail_on)
+    return int(any(COST_CLASSES.index(dashboard["cost"]) >= threshold for dashboard in report))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import time
+
+import instrumentation
+import retryPolicy
+
+POOL_SIZE = 4
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+# POSTs aren't retried: a datasource created before its response was lost would answer the retry with 409
+RETRY_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE"])
+HEALTH_PATH = "/api/health"
+logging.basicConfig(level=logging.INFO)
+
+headers = {
+    'Content-Type': 'application/json',
+}
+
+
+class GrafanaRequestError(Exception):
+    """
+    A Grafana API call answered with an unexpected status code.
+    """
+
+    def __init__(self, method, path, status_code):
+        super().__init__("{} {} failed with status code {}".format(method, path, status_code))
+        self.method = method
+        self.path = path
+        self.status_code = status_code
+        # The retrying adapter has already retried these, but a caller may still try again later
+        self.retryable = status_code in RETRY_STATUS_CODES
+
+
+def create_ssl_context(tls_verify):
+    """
+    Create the SSL context shared by all connections to Grafana.
+
+    Parameters
+    ----------
+        tls_verify(bool): Use TLS verify or not.
+
+    Returns
+    -------
+        ssl_context(ssl.SSLContext): the SSL context
+    """
+
+    import ssl
+
+    ssl_context = ssl.create_default_context()
+    if not tls_verify:
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+class GrafanaClient:
+    """
+    Client for the Grafana HTTP API, backed by a pooled keep-alive session with per-call timeouts
+    and retries with backoff on connection errors and 5xx responses.
+    """
+
+    def __init__(self, grafana_server_protocol, grafana_port, tls_verify, username=None, password=None,
+                 host="localhost", pool_size=POOL_SIZE, timeout=None, max_retries=None, backoff_factor=None):
+        """
+        :param grafana_server_protocol: HTTP or HTTPS
+        :param grafana_port: The Grafana port
+        :param tls_verify: Use TLS verify or not.
+        :param username: The retrieved Grafana username
+        :param password: The retrieved Grafana password
+        :param host: The Grafana host
+        :param pool_size: The maximum number of connections kept open to Grafana
+        :param timeout: The timeout in seconds applied to every call, instead of the grafana retry policy's
+        :param max_retries: The number of retries on connection errors and 5xx responses, instead of the policy's
+        :param backoff_factor: The backoff factor between retries in seconds, instead of the policy's
+        """
+
+        # requests and urllib3 are only imported once a client is needed, to keep the import of this module cheap
+        import requests
+        from urllib3.util.retry import Retry
+        from tlsContextAdapter import TLSContextAdapter
+
+        policy = retryPolicy.get(retryPolicy.GRAFANA)
+        self.base_url = "{}://{}:{}".format(grafana_server_protocol, host, grafana_port)
+        self.timeout = timeout if timeout is not None else policy.timeout
+        self.tls_verify = tls_verify
+        if not tls_verify:
+            import urllib3
+            # Necessary to suppress warning for self-signed certs
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        if max_retries is None:
+            # The transport retries can't be bounded by a deadline, so a policy without an attempt limit gets none
+            max_retries = (policy.max_attempts or 1) - 1
+        retry = Retry(total=max_retries,
+                      backoff_factor=backoff_factor if backoff_factor is not None else policy.initial_backoff,
+                      status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=RETRY_METHODS, raise_on_status=False)
+        adapter = TLSContextAdapter(create_ssl_context(tls_verify), pool_connections=1, pool_maxsize=pool_size,
+                                    max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Readiness polling does its own backoff, so health checks bypass the retrying adapter
+        self.session.mount(self.base_url + HEALTH_PATH,
+                           TLSContextAdapter(adapter.ssl_context, pool_connections=1, pool_maxsize=1, max_retries=0))
+        if username is not None:
+            self.set_credentials(username, password)
+
+    def set_credentials(self, username, password) -> None:
+        """
+        Set the basic auth credentials sent with every call.
+
+        :param username: The retrieved Grafana username
+        :param password: The retrieved Grafana password
+        :return:
+        """
+        self.session.auth = (username, password)
+
+    def request(self, method, path, data=None, **kwargs):
+        """
+        Send a request to the Grafana API.
+
+        :param method: The HTTP method.
+        :param path: The API path, e.g. /api/datasources
+        :param data: The JSON body to send, if any.
+        :return: The Grafana response.
+        """
+        # Calls made during the startup don't outlast its deadline
+        kwargs.setdefault("timeout", retryPolicy.budget().cap(self.timeout))
+        # Passed per call, since a session-level verify is overridden by REQUESTS_CA_BUNDLE
+        kwargs.setdefault("verify", self.tls_verify)
+        if data is not None:
+            kwargs["data"] = json.dumps(data)
+        with instrumentation.span("grafana_request", method=method, endpoint=path.split("?")[0]) as span:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+            span.set(status_code=response.status_code)
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, data, **kwargs):
+        return self.request("POST", path, data=data, **kwargs)
+
+    def put(self, path, data, **kwargs):
+        return self.request("PUT", path, data=data, **kwargs)
+
+    def is_ready(self, **kwargs) -> bool:
+        """
+        Check whether Grafana is up and its database is usable.
+
+        :return: True if Grafana is ready to serve API calls.
+        """
+        response = self.get(HEALTH_PATH, **kwargs)
+        if response.status_code != 200:
+            logging.info("Grafana health check returned status code {}".format(response.status_code))
+            return False
+        try:
+            database = response.json().get("database")
+        except ValueError:
+            database = None
+        if database != "ok":
+            logging.info("Grafana is up but its database is not ready yet: {}".format(database))
+            return False
+        return True
+
+    @instrumentation.traced("wait_until_ready")
+    def wait_until_ready(self, deadline=None, initial_backoff=None, max_backoff=None) -> float:
+        """
+        Poll the Grafana health endpoint until Grafana is ready or the deadline expires. The backoff adapts to
+        what the probe sees: while Grafana is unreachable it grows exponentially, and once Grafana answers but
+        is still starting up (e.g. migrating its database) it drops back to the initial interval. Unless given,
+        the deadline and backoffs are those of the grafana_ready retry policy, and the startup deadline applies.
+
+        :param deadline: The maximum number of seconds to wait.
+        :param initial_backoff: The initial wait between two probes, in seconds.
+        :param max_backoff: The upper bound on the wait between two probes, in seconds.
+        :return: The number of seconds it took for Grafana to become ready.
+        """
+        import requests
+
+        policy = retryPolicy.get(retryPolicy.GRAFANA_READY).replace(
+            deadline=deadline, initial_backoff=initial_backoff, max_backoff=max_backoff)
+        start = time.monotonic()
+        end_time = policy.end_time(start)
+        attempts = 0
+        unreachable = 0
+        while True:
+            attempts += 1
+            try:
+                # Don't let a single hung probe overrun the deadline
+                if self.is_ready(timeout=max(min(self.timeout, end_time - time.monotonic()), retryPolicy.MIN_TIMEOUT)):
+                    elapsed = time.monotonic() - start
+                    instrumentation.annotate(retries=attempts - 1)
+                    logging.info("Grafana is ready after {} health checks and {:.3f} seconds".format(attempts, elapsed))
+                    return elapsed
+                unreachable = 0
+            except requests.exceptions.RequestException as e:
+                logging.info("Grafana is not reachable yet: {}".format(e))
+                unreachable += 1
+            if policy.max_attempts is not None and attempts >= policy.max_attempts:
+                raise retryPolicy.RetriesExhaustedError("wait_until_ready", attempts)
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                raise retryPolicy.DeadlineExceededError("wait_until_ready", attempts, end_time - start)
+            time.sleep(min(policy.backoff(unreachable + 1), remaining))
+
+    def close(self) -> None:
+        """
+        Close all pooled connections.
+        :return:
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,258 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import os
+
+import addGrafanaDataSources
+import fluxLinter
+import instrumentation
+import provisionDashboards
+
+logging.basicConfig(level=logging.INFO)
+DATASOURCE = "datasource"
+DASHBOARD = "dashboard"
+CREATE = "create"
+UPDATE = "update"
+UNCHANGED = "unchanged"
+ACTIONS = (CREATE, UPDATE, UNCHANGED)
+# Datasources created from a plan get a uid derived from their name, so that dashboards can be bound to
+# them before they exist
+DATASOURCE_UID_PREFIX = "gg-ds-"
+MAX_WORKERS = 4
+
+# payload is the JSON to write, and for datasource updates carries the id of the existing datasource
+Change = collections.namedtuple("Change", ["kind", "name", "action", "payload"])
+
+
+class GrafanaState:
+    """
+    The datasources and dashboards in Grafana, indexed by datasource name and dashboard uid.
+    """
+
+    def __init__(self, datasources=(), dashboards=()):
+        """
+        :param datasources: The datasource JSONs, as listed by GET /api/datasources.
+        :param dashboards: The dashboard search results, as returned by GET /api/search.
+        """
+        self.datasources = {datasource["name"]: datasource for datasource in datasources}
+        self.dashboards = {dashboard["uid"]: dashboard for dashboard in dashboards if dashboard.get("uid")}
+
+    def datasource_hash(self, name):
+        """
+        :param name: The datasource name.
+        :return: The config hash stamped on the datasource, or None if it doesn't exist or has no hash.
+        """
+        datasource = self.datasources.get(name)
+        if datasource is None:
+            return None
+        return (datasource.get("jsonData") or {}).get(addGrafanaDataSources.DATA_SOURCE_CONFIG_HASH_KEY)
+
+    def dashboard_hash(self, uid):
+        """
+        :param uid: The dashboard uid.
+        :return: The content hash tagged on the dashboard, or None if it doesn't exist or has no hash.
+        """
+        dashboard = self.dashboards.get(uid)
+        if dashboard is None:
+            return None
+        for tag in dashboard.get("tags") or []:
+            if tag.startswith(provisionDashboards.DASHBOARD_HASH_TAG_PREFIX):
+                return tag[len(provisionDashboards.DASHBOARD_HASH_TAG_PREFIX):]
+        return None
+
+
+@instrumentation.traced("fetch_grafana_state")
+def fetch_state(grafana_client) -> GrafanaState:
+    """
+    Fetch all datasources and dashboards from Grafana with one request each, however many there are.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :return: The GrafanaState.
+    """
+
+    response = grafana_client.get('/api/datasources')
+    if response.status_code != 200:
+        raise ValueError("Failed to list Grafana datasources, status code {}".format(response.status_code))
+    datasources = response.json()
+    response = grafana_client.get('/api/search', params={"type": "dash-db",
+                                                         "limit": provisionDashboards.SEARCH_LIMIT})
+    if response.status_code != 200:
+        raise ValueError("Failed to list Grafana dashboards, status code {}".format(response.status_code))
+    dashboards = response.json()
+    instrumentation.annotate(datasources=len(datasources), dashboards=len(dashboards))
+    return GrafanaState(datasources, dashboards)
+
+
+def datasource_uid(name) -> str:
+    """
+    :param name: The datasource name.
+    :return: The uid a datasource of this name is created with.
+    """
+    return DATASOURCE_UID_PREFIX + hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+
+
+def plan_datasources(state, configs) -> list:
+    """
+    Compare the desired datasources with those in Grafana by their stamped config hash.
+
+    :param state: The GrafanaState.
+    :param configs: The desired datasource JSONs, as generated by create_influxdb_datasource_configs.
+    :return: One Change per datasource, in config order.
+    """
+
+    changes = []
+    for config in configs:
+        desired = addGrafanaDataSources.stamp_datasource_config_hash(config)
+        existing = state.datasources.get(config["name"])
+        if existing is None:
+            # The uid isn't part of the config hash, so it is only added after stamping
+            desired["uid"] = datasource_uid(config["name"])
+            changes.append(Change(DATASOURCE, config["name"], CREATE, desired))
+        elif state.datasource_hash(config["name"]) == \
+                desired["jsonData"][addGrafanaDataSources.DATA_SOURCE_CONFIG_HASH_KEY]:
+            changes.append(Change(DATASOURCE, config["name"], UNCHANGED, dict(desired, uid=existing.get("uid"))))
+        else:
+            desired["id"] = existing["id"]
+            if "uid" in existing:
+                desired["uid"] = existing["uid"]
+            changes.append(Change(DATASOURCE, config["name"], UPDATE, desired))
+    return changes
+
+
+def plan_dashboards(state, dashboards) -> list:
+    """
+    Compare the desired dashboards with those in Grafana by their content hash.
+
+    :param state: The GrafanaState.
+    :param dashboards: The stamped dashboards, as returned by provisionDashboards.prepare_dashboards.
+    :return: One Change per dashboard, in the given order.
+    """
+
+    changes = []
+    for dashboard in dashboards:
+        if dashboard["uid"] not in state.dashboards:
+            action = CREATE
+        elif state.dashboard_hash(dashboard["uid"]) == provisionDashboards.compute_dashboard_hash(dashboard):
+            action = UNCHANGED
+        else:
+            action = UPDATE
+        changes.append(Change(DASHBOARD, dashboard["uid"], action, dashboard))
+    return changes
+
+
+@instrumentation.traced("plan_grafana")
+def plan_provisioning(state, configs, dashboards_path=None, flux_lint=fluxLinter.LINT_OFF) -> list:
+    """
+    Compute the changes that bring Grafana to the desired datasources and dashboards. The dashboards are
+    bound to the uid the InfluxDB datasource has or will be created with.
+
+    :param state: The GrafanaState, as returned by fetch_state.
+    :param configs: The desired datasource JSONs, the InfluxDB datasource first.
+    :param dashboards_path: The directory containing the dashboard JSON files, if any.
+    :param flux_lint: off, report to log the findings of fluxLinter, or fix to rewrite the queries as well.
+    :return: The datasource changes, followed by the dashboard changes.
+    """
+
+    changes = plan_datasources(state, configs)
+    if dashboards_path:
+        if os.path.isdir(dashboards_path):
+            dashboards, _ = provisionDashboards.prepare_dashboards(
+                dashboards_path, configs[0]["name"], changes[0].payload.get("uid"), flux_lint)
+            changes += plan_dashboards(state, dashboards)
+        else:
+            logging.info("No dashboard directory found at {}, skipping dashboard provisioning"
+                         .format(dashboards_path))
+    instrumentation.annotate(**summarize(changes))
+    return changes
+
+
+def summarize(changes) -> dict:
+    """
+    :param changes: The Changes of a plan.
+    :return: The number of changes by action.
+    """
+    summary = dict.fromkeys(ACTIONS, 0)
+    for change in changes:
+        summary[change.action] += 1
+    return summary
+
+
+def format_plan(changes) -> str:
+    """
+    :param changes: The Changes of a plan.
+    :return: The plan, one line per change followed by a summary line.
+    """
+    lines = ["  {:<9} {:<10} {}".format(change.action, change.kind, change.name) for change in changes]
+    summary = summarize(changes)
+    lines.append("Plan: {} to create, {} to update, {} unchanged".format(summary[CREATE], summary[UPDATE],
+                                                                         summary[UNCHANGED]))
+    return "\n".join(lines)
+
+
+def apply_change(grafana_client, change) -> None:
+    """
+    Write one change to Grafana.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param change: The Change to apply.
+    :return: None
+    """
+    if change.kind == DASHBOARD:
+        provisionDashboards.push_dashboard(grafana_client, change.payload)
+    elif change.action == CREATE:
+        addGrafanaDataSources.create_and_add_datasource_to_grafana(grafana_client, change.payload)
+    else:
+        addGrafanaDataSources.update_datasource_in_grafana(grafana_client, change.payload["id"], change.payload)
+
+
+def _apply_changes(grafana_client, changes, max_workers) -> dict:
+    # Changes hold their JSON payload, so results are keyed by kind and name
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(apply_change, grafana_client, change): change for change in changes}
+        for future in concurrent.futures.as_completed(futures):
+            change = futures[future]
+            try:
+                future.result()
+                results[(change.kind, change.name)] = change.action
+            except Exception:
+                logging.error("Failed to {} {} {}".format(change.action, change.kind, change.name), exc_info=True)
+                results[(change.kind, change.name)] = addGrafanaDataSources.RECONCILE_FAILED
+    return results
+
+
+@instrumentation.traced("apply_grafana_plan")
+def apply_plan(grafana_client, changes, max_workers=MAX_WORKERS, required=()) -> list:
+    """
+    Write the changes of a plan to Grafana, skipping the unchanged ones: the datasources first, so that the
+    dashboards never refer to a missing datasource, then the dashboards, each on a bounded worker pool.
+    A failing change doesn't prevent the others from being applied.
+
+    :param grafana_client: The GrafanaClient to send requests with.
+    :param changes: The Changes of the plan, as returned by plan_provisioning.
+    :param max_workers: The maximum number of changes applied at the same time.
+    :param required: The names of the datasources whose failure aborts the plan before the dashboards.
+    :return: One {"kind", "name", "action"} result per change, in plan order, where the action is the
+        planned one or failed.
+    """
+
+    pending = [change for change in changes if change.action != UNCHANGED]
+    results = _apply_changes(grafana_client, [change for change in pending if change.kind == DATASOURCE],
+                             max_workers)
+    failed = [name for (_, name), action in results.items()
+              if action == addGrafanaDataSources.RECONCILE_FAILED and name in required]
+    if failed:
+        raise ValueError("Failed to provision the datasources {}".format(failed))
+    results.update(_apply_changes(grafana_client, [change for change in pending if change.kind == DASHBOARD],
+                                  max_workers))
+
+    report = [{"kind": change.kind, "name": change.name,
+               "action": results.get((change.kind, change.name), change.action)} for change in changes]
+    failed = sum(result["action"] == addGrafanaDataSources.RECONCILE_FAILED for result in report)
+    instrumentation.annotate(writes=len(pending), failed=failed)
+    logging.info("Applied Grafana provisioning plan: {} writes, {} failed".format(len(pending), failed))
+    return report
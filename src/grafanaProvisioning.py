@@ -0,0 +1,164 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import os
+
+import fluxLinter
+import instrumentation
+import provisionDashboards
+
+logging.basicConfig(level=logging.INFO)
+API_MODE = "api"
+FILE_MODE = "file"
+PROVISIONING_MODES = [API_MODE, FILE_MODE]
+# Where the Grafana container reads its provisioning files from
+GRAFANA_PROVISIONING_PATH = "/etc/grafana/provisioning"
+DATASOURCES_RELATIVE_PATH = "datasources/greengrass.yaml"
+DASHBOARD_PROVIDER_RELATIVE_PATH = "dashboards/greengrass.yaml"
+DASHBOARDS_RELATIVE_DIR = "dashboards/greengrass"
+DASHBOARD_PROVIDER_NAME = "greengrass"
+# The Grafana container runs as another user, so the files are group-readable; they hold the InfluxDB token
+PROVISIONING_FILE_MODE = 0o640
+WRITE_CREATED = "created"
+WRITE_UPDATED = "updated"
+WRITE_UNCHANGED = "unchanged"
+WRITE_REMOVED = "removed"
+
+
+def render_yaml(document) -> str:
+    """
+    Render a provisioning document. JSON is valid YAML, so Grafana reads it as is and no YAML library is needed,
+    and the sorted keys keep the output stable so that unchanged documents render byte for byte the same.
+
+    :param document: The provisioning document.
+    :return: The rendered document.
+    """
+
+    return json.dumps(document, indent=2, sort_keys=True) + "\n"
+
+
+def render_datasources(datasource_configs) -> str:
+    """
+
+    :param datasource_configs: The datasource JSONs, as generated by create_influxdb_datasource_config.
+    :return: The rendered datasource provisioning file.
+    """
+
+    return render_yaml({"apiVersion": 1, "datasources": list(datasource_configs)})
+
+
+def render_dashboard_provider(dashboards_path) -> str:
+    """
+
+    :param dashboards_path: The directory Grafana loads the dashboard JSON files from, as seen by Grafana.
+    :return: The rendered dashboard provider provisioning file.
+    """
+
+    return render_yaml({"apiVersion": 1, "providers": [{
+        "name": DASHBOARD_PROVIDER_NAME,
+        "type": "file",
+        "disableDeletion": False,
+        "allowUiUpdates": False,
+        "options": {"path": dashboards_path}
+    }]})
+
+
+def write_if_changed(path, content) -> str:
+    """
+    Atomically replace a file with new content, unless it already has that content. The content is written
+    to a temporary file next to it and renamed over it, so Grafana never reads a partially written file.
+
+    :param path: The file path.
+    :param content: The file content.
+    :return: The action taken: created, updated or unchanged.
+    """
+
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return WRITE_UNCHANGED
+        action = WRITE_UPDATED
+    except FileNotFoundError:
+        action = WRITE_CREATED
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, PROVISIONING_FILE_MODE)
+    try:
+        with os.fdopen(fd, "w") as f:
+            # Regardless of the umask, Grafana's group must be able to read the file
+            os.fchmod(f.fileno(), PROVISIONING_FILE_MODE)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return action
+
+
+def render_dashboards(dashboards_path, datasource_name, flux_lint=fluxLinter.LINT_OFF) -> dict:
+    """
+    Render every dashboard JSON of a directory bound to the InfluxDB datasource, as provisionDashboards
+    would push it.
+
+    :param dashboards_path: The directory containing the dashboard JSON files.
+    :param datasource_name: The name of the InfluxDB datasource.
+    :param flux_lint: off, report to log the findings of fluxLinter, or fix to rewrite the queries as well.
+    :return: The rendered dashboard by file name.
+    """
+
+    rendered = {}
+    if not os.path.isdir(dashboards_path):
+        logging.info("No dashboard directory found at {}, skipping dashboard provisioning".format(dashboards_path))
+        return rendered
+    for file_name, dashboard in provisionDashboards.load_dashboards(dashboards_path):
+        if flux_lint != fluxLinter.LINT_OFF:
+            dashboard, panels = fluxLinter.lint_dashboard(dashboard, fix=(flux_lint == fluxLinter.LINT_FIX))
+            fluxLinter.log_report(file_name, panels)
+        rendered[file_name] = render_yaml(provisionDashboards.bind_dashboard(file_name, dashboard, datasource_name))
+    return rendered
+
+
+@instrumentation.traced("write_provisioning_files")
+def write_provisioning_files(provisioning_path, datasource_configs, dashboards=None,
+                             grafana_provisioning_path=GRAFANA_PROVISIONING_PATH) -> dict:
+    """
+    Write the datasources and dashboards as Grafana provisioning files into the provisioning directory
+    shared with Grafana, which loads them at startup without any API calls. Files are only rewritten when
+    their content changed, and dashboard files this component wrote earlier but no longer renders are removed.
+
+    :param provisioning_path: The provisioning directory shared with Grafana, as seen by this component.
+    :param datasource_configs: The datasource JSONs, as generated by create_influxdb_datasource_config.
+    :param dashboards: The rendered dashboards by file name, as returned by render_dashboards, if any.
+    :param grafana_provisioning_path: The same directory as seen by Grafana.
+    :return: The action taken for each file, by path relative to the provisioning directory.
+    """
+
+    files = {DATASOURCES_RELATIVE_PATH: render_datasources(datasource_configs)}
+    if dashboards is not None:
+        files[DASHBOARD_PROVIDER_RELATIVE_PATH] = render_dashboard_provider(
+            "{}/{}".format(grafana_provisioning_path.rstrip("/"), DASHBOARDS_RELATIVE_DIR))
+        for file_name, content in dashboards.items():
+            files["{}/{}".format(DASHBOARDS_RELATIVE_DIR, file_name)] = content
+
+    report = {relative_path: write_if_changed(os.path.join(provisioning_path, relative_path), content)
+              for relative_path, content in files.items()}
+
+    dashboards_dir = os.path.join(provisioning_path, DASHBOARDS_RELATIVE_DIR)
+    if os.path.isdir(dashboards_dir):
+        for file_name in sorted(os.listdir(dashboards_dir)):
+            relative_path = "{}/{}".format(DASHBOARDS_RELATIVE_DIR, file_name)
+            if file_name.endswith(".json") and relative_path not in files:
+                os.remove(os.path.join(dashboards_dir, file_name))
+                report[relative_path] = WRITE_REMOVED
+
+    instrumentation.annotate(files=len(report),
+                             changed=sum(action != WRITE_UNCHANGED for action in report.values()))
+    logging.info("Wrote Grafana provisioning files to {}: {}".format(provisioning_path, ", ".join(
+        "{} {}".format(path, action) for path, action in sorted(report.items()))))
+    return report
@@ -0,0 +1,115 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+
+import instrumentation
+import retryPolicy
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+# InfluxDB accepts tasks with duplicate names, so creating POSTs are never retried
+RETRY_METHODS = frozenset(["GET", "PATCH"])
+logging.basicConfig(level=logging.INFO)
+
+
+def influxdb_url(influxdb_parameters) -> str:
+    """
+    Get the URL this component can reach InfluxDB on from the host.
+
+    Parameters
+    ----------
+        influxdb_parameters(dict): the retrieved InfluxDB parameters
+
+    Returns
+    -------
+        url(str): the InfluxDB base URL
+    """
+
+    return "{}://{}:{}".format(influxdb_parameters['InfluxDBServerProtocol'],
+                               influxdb_parameters['InfluxDBInterface'], influxdb_parameters['InfluxDBPort'])
+
+
+class InfluxDBClient:
+    """
+    Client for the InfluxDB v2 HTTP API, authenticated with an InfluxDB token.
+    """
+
+    def __init__(self, url, token, tls_verify, timeout=None, max_retries=None, backoff_factor=None):
+        """
+        :param url: The InfluxDB base URL, e.g. from influxdb_url()
+        :param token: The InfluxDB token, with enough access for the calls made with this client
+        :param tls_verify: Use TLS verify or not.
+        :param timeout: The timeout in seconds applied to every call, instead of the influxdb retry policy's
+        :param max_retries: The number of retries of GET and PATCH calls on connection errors and 5xx responses,
+            instead of the policy's
+        :param backoff_factor: The backoff factor between retries in seconds, instead of the policy's
+        """
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        policy = retryPolicy.get(retryPolicy.INFLUXDB)
+        self.base_url = url
+        self.timeout = timeout if timeout is not None else policy.timeout
+        self.tls_verify = tls_verify
+        if not tls_verify:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        if max_retries is None:
+            # The transport retries can't be bounded by a deadline, so a policy without an attempt limit gets none
+            max_retries = (policy.max_attempts or 1) - 1
+        retry = Retry(total=max_retries,
+                      backoff_factor=backoff_factor if backoff_factor is not None else policy.initial_backoff,
+                      status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=RETRY_METHODS, raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": "Token {}".format(token), "Content-Type": "application/json"})
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, data=None, **kwargs):
+        """
+        Send a request to the InfluxDB API.
+
+        :param method: The HTTP method.
+        :param path: The API path, e.g. /api/v2/buckets
+        :param data: The JSON body to send, if any.
+        :return: The InfluxDB response.
+        """
+        kwargs.setdefault("timeout", retryPolicy.budget().cap(self.timeout))
+        kwargs.setdefault("verify", self.tls_verify)
+        if data is not None:
+            kwargs["data"] = json.dumps(data)
+        with instrumentation.span("influxdb_request", method=method, endpoint=path) as span:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+            span.set(status_code=response.status_code)
+            return response
+
+    def call(self, method, path, data=None, expected=(200,), **kwargs) -> dict:
+        """
+        Send a request to the InfluxDB API and decode its JSON response.
+
+        :param method: The HTTP method.
+        :param path: The API path.
+        :param data: The JSON body to send, if any.
+        :param expected: The status codes that mean success.
+        :return: The decoded response body.
+        """
+        response = self.request(method, path, data=data, **kwargs)
+        if response.status_code not in expected:
+            raise ValueError("InfluxDB {} {} failed with status code {}: {}".format(
+                method, path, response.status_code, response.text[:200]))
+        return response.json() if response.content else {}
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,277 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import functools
+import json
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_EXIT = "exit"
+REPORT_FORMAT_VERSION = 1
+# Individual spans kept for the report; the per-name totals cover all spans
+MAX_SPANS = 10000
+
+
+class Span:
+    """
+    One timed operation. Spans nest per thread: a span opened while another is open on the same thread
+    becomes its child.
+    """
+
+    __slots__ = ("name", "parent", "start", "duration", "outcome", "error", "attributes")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.start = time.monotonic()
+        self.duration = None
+        self.outcome = None
+        self.error = None
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self, origin) -> dict:
+        span = {"name": self.name, "parent": self.parent, "start": round(self.start - origin, 6),
+                "duration": round(self.duration, 6), "outcome": self.outcome}
+        if self.error:
+            span["error"] = self.error
+        if self.attributes:
+            span["attributes"] = self.attributes
+        return span
+
+
+class NoopSpan:
+    """
+    Stands in for a span while instrumentation is disabled, so instrumented code doesn't need to check.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class SpanRecorder:
+    """
+    Collects finished spans from all threads, and hands each of them to the registered listeners.
+    """
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self.origin = time.monotonic()
+        self.spans = collections.deque(maxlen=max_spans)
+        self.totals = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else NOOP_SPAN
+
+    def open(self, name, attributes) -> Span:
+        stack = self._stack()
+        span = Span(name, stack[-1].name if stack else None, attributes)
+        stack.append(span)
+        return span
+
+    def close(self, span, exc_type) -> None:
+        span.duration = time.monotonic() - span.start
+        if exc_type is None:
+            span.outcome = OUTCOME_OK
+        else:
+            span.outcome = OUTCOME_EXIT if issubclass(exc_type, SystemExit) else OUTCOME_ERROR
+            span.error = exc_type.__name__
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        with self._lock:
+            self.spans.append(span)
+            total = self.totals.setdefault(span.name, {"count": 0, "total": 0.0, "max": 0.0, "errors": 0})
+            total["count"] += 1
+            total["total"] += span.duration
+            total["max"] = max(total["max"], span.duration)
+            total["errors"] += span.outcome != OUTCOME_OK
+            for key, value in span.attributes.items():
+                if key != "status_code" and isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[key] = total.get(key, 0) + value
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(span)
+            except Exception:
+                logging.warning("Span listener failed", exc_info=True)
+
+    def summary(self) -> dict:
+        """
+        Summarize the finished spans.
+
+        :return: The per-name count, total and max duration, error count and summed numeric attributes (such
+            as retries), and the latest individual spans in start order, with start offsets relative to enable().
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            totals = {name: dict(total) for name, total in self.totals.items()}
+        for total in totals.values():
+            total["total"] = round(total["total"], 6)
+            total["max"] = round(total["max"], 6)
+        return {
+            "version": REPORT_FORMAT_VERSION,
+            "elapsed": round(time.monotonic() - self.origin, 6),
+            "totals": totals,
+            "spans": [span.to_dict(self.origin) for span in spans]
+        }
+
+
+class _SpanContext:
+    __slots__ = ("recorder", "name", "attributes", "span")
+
+    def __init__(self, recorder, name, attributes):
+        self.recorder = recorder
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self) -> Span:
+        self.span = self.recorder.open(self.name, self.attributes)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.recorder.close(self.span, exc_type)
+        return False
+
+
+_recorder = None
+
+
+def enable() -> SpanRecorder:
+    """
+    Start recording spans, discarding any recorded so far.
+
+    :return: The recorder the spans are collected in.
+    """
+    global _recorder
+    _recorder = SpanRecorder()
+    return _recorder
+
+
+def disable() -> None:
+    """
+    Stop recording spans.
+
+    :return: None
+    """
+    global _recorder
+    _recorder = None
+
+
+def is_enabled() -> bool:
+    return _recorder is not None
+
+
+def add_listener(listener) -> None:
+    """
+    Hand every span finished from now on to a listener, enabling instrumentation if it isn't yet.
+
+    :param listener: Called with each finished Span, on the thread that finished it. It must not block.
+    :return: None
+    """
+    recorder = _recorder or enable()
+    with recorder._lock:
+        recorder.listeners.append(listener)
+
+
+def span(name, **attributes):
+    """
+    Time a block of code:
+
+        with instrumentation.span("grafana_lookup", datasource="InfluxDB") as s:
+            ...
+            s.set(status_code=200)
+
+    :param name: The span name.
+    :param attributes: Attributes recorded with the span.
+    :return: A context manager yielding the span, or a no-op stand-in while instrumentation is disabled.
+    """
+    recorder = _recorder
+    if recorder is None:
+        return NOOP_SPAN
+    return _SpanContext(recorder, name, attributes)
+
+
+def annotate(**attributes) -> None:
+    """
+    Set attributes on the innermost open span of the calling thread, if any.
+
+    :param attributes: The attributes to set, e.g. retries=2
+    :return: None
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.current().set(**attributes)
+
+
+def traced(name):
+    """
+    Decorator recording every call of a function as a span.
+
+    :param name: The span name.
+    :return: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return function(*args, **kwargs)
+            with _SpanContext(recorder, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+    Summarize the spans recorded since instrumentation was enabled.
+
+    :return: The summary dict (see SpanRecorder.summary), or None while instrumentation is disabled.
+    """
+    recorder = _recorder
+    return recorder.summary() if recorder is not None else None
+
+
+def report(path=None):
+    """
+    Emit the summary of the recorded spans as a single JSON log line, and optionally write it to a file.
+
+    :param path: The file to write the JSON summary to, if any.
+    :return: The summary dict, or None while instrumentation is disabled.
+    """
+    provisioning_report = summary()
+    if provisioning_report is None:
+        return None
+    logging.info("Provisioning report: {}".format(json.dumps(provisioning_report, sort_keys=True)))
+    if path:
+        with open(path, "w") as f:
+            json.dump(provisioning_report, f, indent=2, sort_keys=True)
+    return provisioning_report
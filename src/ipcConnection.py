@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import threading
+import time
+
+import instrumentation
+import retryPolicy
+
+logging.basicConfig(level=logging.INFO)
+
+
+class IPCConnectionManager:
+    """
+    Lazily creates a single Greengrass IPC client and shares it between all callers,
+    so that the event-stream handshake is only paid once per run.
+    """
+
+    def __init__(self, timeout=None):
+        # Defaults to the timeout of the ipc retry policy
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._client = None
+        self.connect_count = 0
+        self.connect_latencies = []
+
+    def get_client(self):
+        """
+        Get the shared IPC client, connecting to the Greengrass nucleus on first use.
+
+        Parameters
+        ----------
+            None
+
+        Returns
+        -------
+            ipc_client(awsiot.greengrasscoreipc.client.GreengrassCoreIPCClient): the shared IPC client
+        """
+        with self._lock:
+            if self._client is None:
+                # awsiot loads the awscrt native library, so it is only imported when connecting
+                import awsiot.greengrasscoreipc
+                start = time.monotonic()
+                with instrumentation.span("ipc_connect"):
+                    timeout = self.timeout if self.timeout is not None else retryPolicy.get(retryPolicy.IPC).attempt_timeout()
+                    self._client = awsiot.greengrasscoreipc.connect(timeout=timeout)
+                self.connect_latencies.append(time.monotonic() - start)
+                self.connect_count += 1
+                logging.info("Connected to Greengrass IPC in {:.3f} seconds".format(self.connect_latencies[-1]))
+            return self._client
+
+    def close(self) -> None:
+        """
+        Close the shared IPC client, if one has been created. A later call to get_client reconnects.
+
+        Parameters
+        ----------
+            None
+
+        Returns
+        -------
+            None
+        """
+        with self._lock:
+            if self._client is not None:
+                try:
+                    self._client.close()
+                    logging.info("Closed Greengrass IPC connection")
+                finally:
+                    self._client = None
+
+    def stats(self) -> dict:
+        """
+        Get the connection statistics of this manager.
+
+        Parameters
+        ----------
+            None
+
+        Returns
+        -------
+            stats(dict): the number of connections opened and their latencies in seconds
+        """
+        with self._lock:
+            return {
+                "connect_count": self.connect_count,
+                "connect_latency_total": sum(self.connect_latencies),
+                "connect_latency_max": max(self.connect_latencies, default=0.0)
+            }
+
+    def __enter__(self):
+        return self.get_client()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_manager = IPCConnectionManager()
+
+
+def get_ipc_client():
+    """
+    Get the process-wide shared IPC client.
+    :return: the shared IPC client
+    """
+    return _manager.get_client()
+
+
+def close_ipc_client() -> None:
+    """
+    Close the process-wide shared IPC client.
+    :return: None
+    """
+    _manager.close()
+
+
+def get_ipc_connection_stats() -> dict:
+    """
+    Get the connection statistics of the process-wide shared IPC client.
+    :return: the connection statistics
+    """
+    return _manager.stats()
@@ -0,0 +1,258 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import instrumentation
+
+logging.basicConfig(level=logging.INFO)
+PORT = 9108
+# Metrics include datasource names, so they are only served locally by default
+BIND_ADDRESS = "127.0.0.1"
+PREFIX = "greengrass_dashboard_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+IPC_SPANS = ("ipc_connect", "get_secret_over_ipc", "publish_token_request", "retrieve_influxdb_params")
+GRAFANA_SPAN = "grafana_request"
+RECONCILE_SPAN = "reconcile_datasource"
+# Spans whose success means Grafana holds the datasources as this component last provisioned them
+SYNC_SPANS = ("add_influxdb_datasource", "reconcile_datasource", "create_and_add_datasource_to_grafana",
+              "update_datasource_in_grafana", "write_provisioning_files", "apply_grafana_plan")
+HEALTH_OK = "ok"
+HEALTH_STARTING = "starting"
+HEALTH_FAILING = "failing"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + "}"
+
+
+def _format_value(value) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A counter, gauge or histogram with its samples by label values, rendered in the Prometheus text format.
+    Updates are not thread-safe on their own; MetricsRegistry serializes them.
+    """
+
+    def __init__(self, name, metric_type, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.type = metric_type
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self.samples = {}
+
+    def _key(self, labels) -> tuple:
+        return tuple((name, labels.get(name, "")) for name in self.label_names)
+
+    def inc(self, value=1, **labels) -> None:
+        key = self._key(labels)
+        self.samples[key] = self.samples.get(key, 0) + value
+
+    def set(self, value, **labels) -> None:
+        self.samples[self._key(labels)] = value
+
+    def observe(self, value, **labels) -> None:
+        # Cumulative bucket counts, sum and count
+        state = self.samples.setdefault(self._key(labels), [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][i] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list:
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.type)]
+        for key, value in sorted(self.samples.items(), key=lambda item: str(item[0])):
+            if self.type != "histogram":
+                lines.append("{}{} {}".format(self.name, _format_labels(key), _format_value(value)))
+                continue
+            counts, total, count = value
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append("{}_bucket{} {}".format(self.name, _format_labels(key + (("le", repr(bound)),)),
+                                                     bucket_count))
+            lines.append("{}_bucket{} {}".format(self.name, _format_labels(key + (("le", "+Inf"),)), count))
+            lines.append("{}_sum{} {}".format(self.name, _format_labels(key), _format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, _format_labels(key), count))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Derives the component's metrics from the instrumentation spans: IPC and Grafana call latency, retries,
+    datasource reconciles, failed operations and the time of the last successful datasource sync. Handling a
+    span only updates a few in-memory samples, so it adds nothing noticeable to the provisioning path.
+    """
+
+    def __init__(self, clock=time.time):
+        """
+        :param clock: The wall clock to timestamp syncs with.
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.start_time = clock()
+        self.last_sync = None
+        self.sync_failing = False
+        self.ipc_latency = Metric("ipc_request_duration_seconds", "histogram",
+                                  "Latency of Greengrass IPC operations.", ["operation"])
+        self.grafana_latency = Metric("grafana_request_duration_seconds", "histogram",
+                                      "Latency of Grafana API calls.", ["method"])
+        self.grafana_requests = Metric("grafana_requests_total", "counter",
+                                       "Grafana API calls by status code.", ["method", "code"])
+        self.grafana_failures = Metric("grafana_request_failures_total", "counter",
+                                       "Grafana API calls that failed or returned an error status.", ["method"])
+        self.retries = Metric("retries_total", "counter", "Retries of IPC calls, token requests and readiness checks.",
+                              ["operation"])
+        self.reconciles = Metric("datasource_reconciles_total", "counter", "Datasource reconciles by action.",
+                                 ["datasource", "action"])
+        self.errors = Metric("operation_errors_total", "counter", "Instrumented operations that failed.",
+                             ["operation"])
+        self.metrics = [self.ipc_latency, self.grafana_latency, self.grafana_requests, self.grafana_failures,
+                        self.retries, self.reconciles, self.errors]
+
+    def record_span(self, span) -> None:
+        """
+        Update the metrics with a finished instrumentation span.
+
+        :param span: The finished instrumentation.Span.
+        :return: None
+        """
+        attributes = span.attributes
+        failed = span.outcome != instrumentation.OUTCOME_OK
+        with self._lock:
+            if span.name in IPC_SPANS:
+                self.ipc_latency.observe(span.duration, operation=span.name)
+            elif span.name == GRAFANA_SPAN:
+                code = attributes.get("status_code", "error")
+                self.grafana_latency.observe(span.duration, method=attributes.get("method"))
+                self.grafana_requests.inc(method=attributes.get("method"), code=code)
+                if failed or code == "error" or code >= 400:
+                    self.grafana_failures.inc(method=attributes.get("method"))
+            if attributes.get("retries"):
+                self.retries.inc(attributes["retries"], operation=span.name)
+            if span.name == RECONCILE_SPAN and "action" in attributes:
+                self.reconciles.inc(datasource=attributes.get("datasource"), action=attributes["action"])
+            if failed:
+                self.errors.inc(operation=span.name)
+            if span.name in SYNC_SPANS:
+                self.sync_failing = failed
+                if not failed:
+                    self.last_sync = self._clock()
+
+    def sync_age(self) -> float:
+        """
+        :return: The seconds since the last successful datasource sync, or NaN if there was none yet.
+        """
+        last_sync = self.last_sync
+        return self._clock() - last_sync if last_sync is not None else float("nan")
+
+    def health(self) -> dict:
+        """
+        :return: The status, starting until the datasources were first synced, failing if the last sync
+            failed, ok otherwise, and the age of the last successful sync.
+        """
+        with self._lock:
+            if self.last_sync is None:
+                status = HEALTH_STARTING
+            else:
+                status = HEALTH_FAILING if self.sync_failing else HEALTH_OK
+            age = self.sync_age()
+        return {"status": status, "last_sync_age_seconds": None if math.isnan(age) else round(age, 3)}
+
+    def render(self) -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            last_sync = Metric("last_successful_sync_timestamp_seconds", "gauge",
+                               "Time of the last successful datasource sync.")
+            last_sync.set(self.last_sync if self.last_sync is not None else float("nan"))
+            sync_age = Metric("last_successful_sync_age_seconds", "gauge",
+                              "Seconds since the last successful datasource sync.")
+            sync_age.set(self.sync_age())
+            start_time = Metric("start_time_seconds", "gauge", "Time the component started.")
+            start_time.set(self.start_time)
+            lines = [line for metric in self.metrics + [last_sync, sync_age, start_time] for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves GET /metrics in the Prometheus text format and GET /healthz, from a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, registry=None, port=PORT, bind_address=BIND_ADDRESS):
+        """
+        :param registry: The MetricsRegistry to serve; a new one is created if not given.
+        :param port: The port to listen on; 0 picks a free port.
+        :param bind_address: The address to listen on.
+        """
+        super().__init__((bind_address, port), MetricsHandler)
+        self.registry = registry if registry is not None else MetricsRegistry()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="metricsServer", daemon=True)
+        self._thread.start()
+        logging.info("Serving metrics on {}:{}".format(self.server_address[0], self.port))
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, content_type, body):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, CONTENT_TYPE, self.server.registry.render())
+        elif path == "/healthz":
+            health = self.server.registry.health()
+            self._send(503 if health["status"] != HEALTH_OK else 200, "application/json", json.dumps(health))
+        else:
+            self._send(404, "text/plain", "not found\n")
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+CACHE_RELATIVE_PATH = "influxdb_grafana/influxdb_parameters_cache.json"
+CACHE_FORMAT_VERSION = 1
+TTL = 86400
+KEY_DERIVATION_ITERATIONS = 50000
+SALT_LENGTH = 16
+
+
+def derive_key(grafana_secrets, salt) -> bytes:
+    """
+    Derive the cache encryption key from the Grafana secret.
+
+    Parameters
+    ----------
+        grafana_secrets(dict): the retrieved Grafana secret JSON containing the username/password
+        salt(bytes): the random salt stored alongside the cache
+
+    Returns
+    -------
+        key(bytes): a urlsafe base64-encoded 32-byte key
+    """
+
+    secret = "{}:{}".format(grafana_secrets["grafana_username"], grafana_secrets["grafana_password"])
+    key = hashlib.pbkdf2_hmac("sha256", secret.encode("utf-8"), salt, KEY_DERIVATION_ITERATIONS)
+    return base64.urlsafe_b64encode(key)
+
+
+def check_encryption() -> None:
+    """
+    Check that the cryptography package needed to encrypt the cache can be imported.
+
+    :raises ValueError: if it can't.
+    """
+
+    try:
+        import cryptography.fernet  # noqa: F401
+    except ImportError:
+        raise ValueError("Encrypting the InfluxDB parameter cache requires the cryptography package! Install it with "
+                         "python3 -m pip install cryptography, or set ParamsCacheEncrypt to false.")
+
+
+class ParamsCache:
+    """
+    On-disk cache of the InfluxDB parameters resolved over IPC, so that a restart can provision Grafana
+    without waiting for the token exchange. The file is only readable by its owner and is optionally
+    encrypted with a key derived from the Grafana secret.
+    """
+
+    def __init__(self, path, ttl=TTL, encrypt=True):
+        """
+        :param path: The cache file path.
+        :param ttl: The number of seconds a cached entry stays valid.
+        :param encrypt: Encrypt the cached parameters. Requires the cryptography package.
+        :raises ValueError: if encrypting and the cryptography package is missing.
+        """
+        if encrypt:
+            # Checked up front, so that a missing package fails the startup before Grafana is provisioned
+            check_encryption()
+        self.path = path
+        self.ttl = ttl
+        self.encrypt = encrypt
+
+    def _fernet(self, grafana_secrets, salt):
+        # Only needed when encrypting, so that the cryptography package stays optional
+        from cryptography.fernet import Fernet
+        return Fernet(derive_key(grafana_secrets, salt))
+
+    def load(self, grafana_secrets=None):
+        """
+        Load the cached InfluxDB parameters.
+
+        :param grafana_secrets: The Grafana secret JSON, needed to decrypt an encrypted cache.
+        :return: The cached InfluxDB parameter JSON, or None if there is no valid, unexpired entry.
+        """
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+            if entry.get("version") != CACHE_FORMAT_VERSION:
+                logging.info("Ignoring InfluxDB parameter cache with an unknown format")
+                return None
+            age = time.time() - entry["created"]
+            if age < 0 or age > self.ttl:
+                logging.info("InfluxDB parameter cache expired {:.0f} seconds ago".format(age - self.ttl))
+                return None
+            if entry["encrypted"] != self.encrypt:
+                logging.info("Ignoring InfluxDB parameter cache with a different encryption setting")
+                return None
+            if self.encrypt:
+                salt = base64.b64decode(entry["salt"])
+                payload = self._fernet(grafana_secrets, salt).decrypt(entry["payload"].encode("ascii"))
+                influxdb_parameters = json.loads(payload.decode("utf-8"))
+            else:
+                influxdb_parameters = entry["payload"]
+        except FileNotFoundError:
+            logging.info("No InfluxDB parameter cache found at {}".format(self.path))
+            return None
+        except Exception:
+            logging.warning("Ignoring unreadable InfluxDB parameter cache at {}".format(self.path), exc_info=True)
+            return None
+
+        logging.info("Loaded InfluxDB parameters from cache, {:.0f} seconds old".format(age))
+        return influxdb_parameters
+
+    def store(self, influxdb_parameters, grafana_secrets=None) -> None:
+        """
+        Atomically write the InfluxDB parameters to the cache file with 0600 permissions.
+
+        :param influxdb_parameters: The InfluxDB parameter JSON to cache.
+        :param grafana_secrets: The Grafana secret JSON, needed to encrypt the cache.
+        :return: None
+        """
+        entry = {"version": CACHE_FORMAT_VERSION, "created": time.time(), "encrypted": self.encrypt}
+        if self.encrypt:
+            salt = os.urandom(SALT_LENGTH)
+            payload = json.dumps(influxdb_parameters).encode("utf-8")
+            entry["salt"] = base64.b64encode(salt).decode("ascii")
+            entry["payload"] = self._fernet(grafana_secrets, salt).encrypt(payload).decode("ascii")
+        else:
+            entry["payload"] = influxdb_parameters
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logging.info("Stored InfluxDB parameters in cache at {}".format(self.path))
+
+    def invalidate(self) -> None:
+        """
+        Remove the cache file, if any.
+
+        :return: None
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,263 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import concurrent.futures
+import copy
+import hashlib
+import json
+import logging
+import os
+
+import fluxLinter
+
+logging.basicConfig(level=logging.INFO)
+
+MAX_WORKERS = 4
+SEARCH_LIMIT = 5000
+# Dashboards carry the hash of their provisioned content in a tag with this prefix
+DASHBOARD_HASH_TAG_PREFIX = "greengrass-hash:"
+DASHBOARD_UID_PREFIX = "gg-"
+DATASOURCE_TYPE = "influxdb"
+# Keys of exported dashboards that only matter to the Grafana import UI
+EXPORT_ONLY_KEYS = ("__inputs", "__requires", "__elements")
+
+
+def load_dashboards(dashboards_path) -> list:
+    """
+    Load every dashboard JSON file from a directory.
+
+    Parameters
+    ----------
+        dashboards_path(str): the directory containing the dashboard JSON files
+
+    Returns
+    -------
+        dashboards(list): (file name, dashboard JSON) tuples, sorted by file name
+    """
+
+    dashboards = []
+    for file_name in sorted(os.listdir(dashboards_path)):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(dashboards_path, file_name)) as f:
+                dashboard = json.load(f)
+        except ValueError:
+            logging.error("Skipping invalid dashboard JSON file {}".format(file_name), exc_info=True)
+            continue
+        # Accept both raw dashboards and the {"dashboard": ...} wrapper used by the Grafana API
+        if "dashboard" in dashboard and isinstance(dashboard["dashboard"], dict):
+            dashboard = dashboard["dashboard"]
+        dashboards.append((file_name, dashboard))
+    return dashboards
+
+
+def _bind_datasource_references(node, datasource_name, datasource_uid) -> None:
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "datasource":
+                if isinstance(value, str) and value.startswith("${"):
+                    node[key] = datasource_name
+                elif isinstance(value, dict) and value.get("type") == DATASOURCE_TYPE:
+                    node[key] = {"type": DATASOURCE_TYPE, "uid": datasource_uid} if datasource_uid \
+                        else datasource_name
+                    continue
+            _bind_datasource_references(value, datasource_name, datasource_uid)
+    elif isinstance(node, list):
+        for value in node:
+            _bind_datasource_references(value, datasource_name, datasource_uid)
+
+
+def bind_dashboard(file_name, dashboard, datasource_name, datasource_uid=None) -> dict:
+    """
+    Prepare a dashboard for provisioning: bind its InfluxDB datasource references and import placeholders to
+    the provisioned datasource, and give it a stable uid so that later runs can find it again.
+
+    Parameters
+    ----------
+        file_name(str): the name of the file the dashboard was loaded from
+        dashboard(dict): the dashboard JSON
+        datasource_name(str): the name of the InfluxDB datasource
+        datasource_uid(str): the uid of the InfluxDB datasource, if known
+
+    Returns
+    -------
+        dashboard(dict): the bound dashboard JSON
+    """
+
+    bound = copy.deepcopy(dashboard)
+    for key in EXPORT_ONLY_KEYS:
+        bound.pop(key, None)
+    bound["id"] = None
+    if not bound.get("uid"):
+        bound["uid"] = DASHBOARD_UID_PREFIX + hashlib.sha1(file_name.encode("utf-8")).hexdigest()[:16]
+    _bind_datasource_references(bound, datasource_name, datasource_uid)
+    return bound
+
+
+def compute_dashboard_hash(dashboard) -> str:
+    """
+    Compute a stable hash of a dashboard's content, ignoring fields Grafana manages itself.
+
+    Parameters
+    ----------
+        dashboard(dict): the dashboard JSON
+
+    Returns
+    -------
+        hash(str): the hex SHA-256 digest of the canonical JSON encoding of the dashboard
+    """
+
+    content = {k: v for k, v in dashboard.items() if k not in ("id", "version")}
+    content["tags"] = [t for t in dashboard.get("tags", []) if not t.startswith(DASHBOARD_HASH_TAG_PREFIX)]
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def stamp_dashboard_hash(dashboard) -> dict:
+    """
+    Store the content hash of a dashboard in its tags.
+
+    Parameters
+    ----------
+        dashboard(dict): the dashboard JSON
+
+    Returns
+    -------
+        dashboard(dict): the dashboard JSON with its hash tag set
+    """
+
+    tags = [t for t in dashboard.get("tags", []) if not t.startswith(DASHBOARD_HASH_TAG_PREFIX)]
+    tags.append(DASHBOARD_HASH_TAG_PREFIX + compute_dashboard_hash(dashboard))
+    return dict(dashboard, tags=tags)
+
+
+def list_dashboard_hashes(grafana_client) -> dict:
+    """
+    Fetch the content hashes of all dashboards in Grafana with a single search call.
+
+    Parameters
+    ----------
+        grafana_client(GrafanaClient): the Grafana client to send requests with
+
+    Returns
+    -------
+        hashes(dict): dashboard uid to provisioned content hash (None for dashboards without a hash tag)
+    """
+
+    response = grafana_client.get('/api/search', params={"type": "dash-db", "limit": SEARCH_LIMIT})
+    if response.status_code != 200:
+        raise ValueError("Failed to list Grafana dashboards, status code {}".format(response.status_code))
+    hashes = {}
+    for result in response.json():
+        hash_tags = [t[len(DASHBOARD_HASH_TAG_PREFIX):] for t in result.get("tags", [])
+                     if t.startswith(DASHBOARD_HASH_TAG_PREFIX)]
+        hashes[result.get("uid")] = hash_tags[0] if hash_tags else None
+    return hashes
+
+
+def push_dashboard(grafana_client, dashboard) -> None:
+    """
+    Create or overwrite a dashboard in Grafana.
+
+    Parameters
+    ----------
+        grafana_client(GrafanaClient): the Grafana client to send requests with
+        dashboard(dict): the dashboard JSON
+
+    Returns
+    -------
+        None
+    """
+
+    response = grafana_client.post('/api/dashboards/db', {"dashboard": dashboard, "overwrite": True})
+    if response.status_code != 200:
+        raise ValueError("Request to push dashboard {} to Grafana failed with status code {}"
+                         .format(dashboard.get("uid"), response.status_code))
+
+
+def prepare_dashboards(dashboards_path, datasource_name, datasource_uid=None, flux_lint=fluxLinter.LINT_OFF) -> tuple:
+    """
+    Load every dashboard JSON in a directory, lint its Flux queries if asked to, bind it to the InfluxDB
+    datasource and stamp it with its content hash, ready to be compared with Grafana's and pushed.
+
+    Parameters
+    ----------
+        dashboards_path(str): the directory containing the dashboard JSON files
+        datasource_name(str): the name of the InfluxDB datasource
+        datasource_uid(str): the uid of the InfluxDB datasource, if known
+        flux_lint(str): off, report to log the findings of fluxLinter, or fix to rewrite the queries as well
+
+    Returns
+    -------
+        (dashboards, cost)(tuple): the stamped dashboards, and when linting, the estimated cost of every
+            dashboard by uid
+    """
+
+    dashboards = []
+    cost = {}
+    for file_name, dashboard in load_dashboards(dashboards_path):
+        if flux_lint != fluxLinter.LINT_OFF:
+            dashboard, panels = fluxLinter.lint_dashboard(dashboard, fix=(flux_lint == fluxLinter.LINT_FIX))
+            fluxLinter.log_report(file_name, panels)
+        bound = stamp_dashboard_hash(bind_dashboard(file_name, dashboard, datasource_name, datasource_uid))
+        if flux_lint != fluxLinter.LINT_OFF:
+            cost[bound["uid"]] = fluxLinter.dashboard_cost(panels)
+        dashboards.append(bound)
+    return dashboards, cost
+
+
+def provision_dashboards(grafana_client, dashboards_path, datasource_name, datasource_uid=None,
+                         max_workers=MAX_WORKERS, flux_lint=fluxLinter.LINT_OFF) -> dict:
+    """
+    Push every dashboard JSON in a directory to Grafana, bound to the InfluxDB datasource. Dashboards whose
+    content hash matches the one already in Grafana are skipped, and the rest are pushed concurrently.
+    The Flux queries of the panels can be linted first, and rewritten to window-aware forms before pushing.
+
+    Parameters
+    ----------
+        grafana_client(GrafanaClient): the Grafana client to send requests with
+        dashboards_path(str): the directory containing the dashboard JSON files
+        datasource_name(str): the name of the InfluxDB datasource
+        datasource_uid(str): the uid of the InfluxDB datasource, if known
+        max_workers(int): the maximum number of dashboards pushed at the same time
+        flux_lint(str): off, report to log the findings of fluxLinter, or fix to rewrite the queries as well
+
+    Returns
+    -------
+        report(dict): the uids of the pushed, skipped and failed dashboards, and when linting, the estimated
+            cost of every dashboard by uid
+    """
+
+    report = {"pushed": [], "skipped": [], "failed": []}
+    if flux_lint != fluxLinter.LINT_OFF:
+        report["cost"] = {}
+    if not os.path.isdir(dashboards_path):
+        logging.info("No dashboard directory found at {}, skipping dashboard provisioning".format(dashboards_path))
+        return report
+
+    existing_hashes = list_dashboard_hashes(grafana_client)
+    dashboards, cost = prepare_dashboards(dashboards_path, datasource_name, datasource_uid, flux_lint)
+    if flux_lint != fluxLinter.LINT_OFF:
+        report["cost"] = cost
+    pending = []
+    for bound in dashboards:
+        if existing_hashes.get(bound["uid"]) == compute_dashboard_hash(bound):
+            report["skipped"].append(bound["uid"])
+        else:
+            pending.append(bound)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(push_dashboard, grafana_client, dashboard): dashboard["uid"]
+                   for dashboard in pending}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+                report["pushed"].append(futures[future])
+            except Exception:
+                logging.error("Failed to push dashboard {}".format(futures[future]), exc_info=True)
+                report["failed"].append(futures[future])
+
+    logging.info("Provisioned dashboards: {} pushed, {} unchanged, {} failed".format(
+        len(report["pushed"]), len(report["skipped"]), len(report["failed"])))
+    return report
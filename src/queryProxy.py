@@ -0,0 +1,365 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+logging.basicConfig(level=logging.INFO)
+PORT = 8087
+# The default Docker bridge gateway, which Grafana reaches the proxy on from inside its container. The proxy
+# serves its metrics without authentication, so it doesn't listen on the host's other interfaces.
+BIND_ADDRESS = "172.17.0.1"
+DATASOURCE_URL = "http://{}:{}".format(BIND_ADDRESS, PORT)
+ALIGNMENT = 10
+TTL = 30
+MAX_BYTES = 32 * 1024 * 1024
+# A single response may take up at most this fraction of the cache, so that one wide query can't flush it
+MAX_ENTRY_FRACTION = 0.25
+# Bookkeeping bytes counted per entry on top of its key and body
+ENTRY_OVERHEAD = 256
+# Upstream queries are served long after startup, on behalf of Grafana, so they aren't bound by the retry
+# policies; this matches the longest query timeout a datasource profile gives Grafana
+TIMEOUT = 60
+QUERY_PATH = "/api/v2/query"
+METRICS_PATH = "/proxy/metrics"
+# The only other requests Grafana's InfluxDB datasource sends; writes and management calls are refused
+PASSTHROUGH_PATHS = ("/health", "/ping")
+PASSTHROUGH_METHODS = ("GET", "HEAD")
+FORWARDED_REQUEST_HEADERS = ("Authorization", "Content-Type", "Accept")
+# Absolute range bounds as interpolated by Grafana, e.g. range(start: 2021-01-01T00:00:00.123Z, stop: ...)
+RANGE_BOUND_PATTERN = re.compile(r"\b(start|stop)(\s*:\s*)(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z)")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+CachedResponse = collections.namedtuple("CachedResponse", ["status", "content_type", "body"])
+
+
+def _parse_timestamp(timestamp) -> float:
+    seconds, _, fraction = timestamp.rstrip("Z").partition(".")
+    parsed = datetime.datetime.strptime(seconds + "Z", TIMESTAMP_FORMAT).replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp() + (float("0." + fraction) if fraction else 0.0)
+
+
+def _format_timestamp(epoch) -> str:
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def normalize_flux(query, alignment=ALIGNMENT) -> str:
+    """
+    Align the absolute time range bounds of a Flux query, so that refreshes of the same panel within one
+    alignment interval produce the same query. Range starts are rounded down and range stops up, so the
+    aligned range always covers the requested one.
+
+    :param query: The Flux query.
+    :param alignment: The alignment interval in seconds.
+    :return: The normalized Flux query.
+    """
+
+    def align(match):
+        epoch = _parse_timestamp(match.group(3))
+        aligned = epoch - epoch % alignment
+        if match.group(1) == "stop" and aligned < epoch:
+            aligned += alignment
+        return "{}{}{}".format(match.group(1), match.group(2), _format_timestamp(aligned))
+
+    return RANGE_BOUND_PATTERN.sub(align, query)
+
+
+def normalize_query_body(body, alignment=ALIGNMENT) -> bytes:
+    """
+    Normalize the body of a query request: either a JSON query object, as sent by Grafana, or plain Flux.
+
+    :param body: The request body.
+    :param alignment: The alignment interval in seconds.
+    :return: The normalized body.
+    """
+
+    try:
+        request = json.loads(body.decode("utf-8"))
+    except ValueError:
+        return normalize_flux(body.decode("utf-8", "replace"), alignment).encode("utf-8")
+    if isinstance(request, dict) and isinstance(request.get("query"), str):
+        request["query"] = normalize_flux(request["query"], alignment)
+    return json.dumps(request, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def cache_key(path, body, authorization) -> str:
+    """
+    Key a query by everything that determines its result, including the token, since different tokens may
+    see different buckets.
+
+    :param path: The request path, including the org in its query string.
+    :param body: The normalized request body.
+    :param authorization: The Authorization header.
+    :return: The hex digest key.
+    """
+
+    digest = hashlib.sha256()
+    for part in (path.encode("utf-8"), body, (authorization or "").encode("utf-8")):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class QueryCache:
+    """
+    LRU cache of query responses with a per-entry time to live and a bound on the total memory used.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, ttl=TTL, clock=time.monotonic):
+        """
+        :param max_bytes: The maximum number of bytes the cached responses may take up.
+        :param ttl: The number of seconds a response is served from the cache.
+        :param clock: The monotonic clock to expire entries with.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(key, response) -> int:
+        return len(key) + len(response.body) + len(response.content_type or "") + ENTRY_OVERHEAD
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remove(self, key) -> None:
+        response, _ = self._entries.pop(key)
+        self.bytes -= self.entry_size(key, response)
+
+    def get(self, key):
+        """
+        :param key: The cache key.
+        :return: The cached response, or None if there is none or it has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, response) -> bool:
+        """
+        Cache a response, evicting the least recently used responses until it fits.
+
+        :param key: The cache key.
+        :param response: The CachedResponse.
+        :return: True if the response was cached, False if it is too large to be cached.
+        """
+        size = self.entry_size(key, response)
+        if size > self.max_bytes * MAX_ENTRY_FRACTION:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self.bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = (response, self._clock() + self.ttl)
+            self.bytes += size
+        return True
+
+
+class QueryProxy(ThreadingMixIn, HTTPServer):
+    """
+    Caching HTTP proxy between Grafana and InfluxDB. Flux queries are normalized to aligned time ranges and
+    served from a QueryCache; identical queries arriving while one is in flight wait for its response instead
+    of querying InfluxDB again. Health checks and pings are passed through, and any other request is answered
+    with 405. GET /proxy/metrics returns the cache metrics as JSON.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, upstream_url, tls_verify, port=PORT, bind_address=BIND_ADDRESS, alignment=ALIGNMENT,
+                 cache=None, timeout=TIMEOUT):
+        """
+        :param upstream_url: The InfluxDB base URL.
+        :param tls_verify: Use TLS verify or not towards InfluxDB.
+        :param port: The port to listen on; 0 picks a free port.
+        :param bind_address: The address to listen on.
+        :param alignment: The interval in seconds that query time ranges are aligned to.
+        :param cache: The QueryCache to use; a default one is created if not given.
+        :param timeout: The timeout in seconds of upstream requests.
+        """
+        import requests
+
+        super().__init__((bind_address, port), QueryProxyHandler)
+        self.upstream_url = upstream_url.rstrip("/")
+        self.tls_verify = tls_verify
+        self.alignment = alignment
+        self.cache = cache if cache is not None else QueryCache()
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.passthrough = 0
+        self.upstream_errors = 0
+        if not tls_verify:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        self.session = requests.Session()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def forward(self, method, path, headers, body) -> CachedResponse:
+        """
+        Send a request to InfluxDB.
+
+        :return: The InfluxDB response, or a 502 response if InfluxDB couldn't be reached.
+        """
+        import requests
+
+        try:
+            response = self.session.request(method, self.upstream_url + path, headers=headers, data=body,
+                                            verify=self.tls_verify, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            with self._lock:
+                self.upstream_errors += 1
+            logging.warning("Query proxy could not reach InfluxDB: {}".format(e))
+            return CachedResponse(502, "application/json",
+                                  json.dumps({"code": "bad gateway", "message": str(e)}).encode("utf-8"))
+        return CachedResponse(response.status_code, response.headers.get("Content-Type"), response.content)
+
+    def query(self, path, headers, body) -> CachedResponse:
+        """
+        Answer a Flux query from the cache, from an identical query in flight, or from InfluxDB.
+
+        :param path: The request path.
+        :param headers: The forwarded request headers.
+        :param body: The request body.
+        :return: The response.
+        """
+        body = normalize_query_body(body, self.alignment)
+        key = cache_key(path, body, headers.get("Authorization"))
+        with self._lock:
+            response = self.cache.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = concurrent.futures.Future()
+                self.misses += 1
+            else:
+                self.collapsed += 1
+        if not leader:
+            try:
+                return future.result(self.timeout)
+            except concurrent.futures.TimeoutError:
+                return CachedResponse(504, "application/json", json.dumps(
+                    {"code": "gateway timeout", "message": "timed out waiting for an identical query"}).encode("utf-8"))
+
+        try:
+            response = self.forward("POST", path, headers, body)
+            # Errors are shared with the queries waiting on this one, but never cached
+            if response.status == 200:
+                self.cache.put(key, response)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def metrics(self) -> dict:
+        """
+        :return: The request counts by outcome, the hit rate of the Flux queries (collapsed queries count as
+            hits), and the number of entries and bytes in the cache.
+        """
+        with self._lock:
+            queries = self.hits + self.misses + self.collapsed
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "collapsed": self.collapsed,
+                "passthrough": self.passthrough,
+                "upstream_errors": self.upstream_errors,
+                "hit_rate": round((self.hits + self.collapsed) / queries, 4) if queries else 0.0,
+                "entries": len(self.cache),
+                "bytes": self.cache.bytes,
+                "max_bytes": self.cache.max_bytes,
+                "evictions": self.cache.evictions,
+                "expirations": self.cache.expirations
+            }
+
+    def start(self) -> "QueryProxy":
+        self._thread = threading.Thread(target=self.serve_forever, name="queryProxy", daemon=True)
+        self._thread.start()
+        logging.info("Query proxy listening on port {}, forwarding to {}".format(self.port, self.upstream_url))
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.session.close()
+        logging.info("Query proxy stopped: {}".format(self.metrics()))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class QueryProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, response, head=False):
+        self.send_response(response.status)
+        if response.content_type:
+            self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(response.body)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        if self.command == "GET" and self.path == METRICS_PATH:
+            self._send(CachedResponse(200, "application/json", json.dumps(self.server.metrics()).encode("utf-8")))
+            return
+        headers = {name: self.headers[name] for name in FORWARDED_REQUEST_HEADERS if self.headers.get(name)}
+        path = self.path.split("?")[0]
+        if self.command == "POST" and path == QUERY_PATH:
+            response = self.server.query(self.path, headers, body)
+        elif self.command in PASSTHROUGH_METHODS and path in PASSTHROUGH_PATHS:
+            with self.server._lock:
+                self.server.passthrough += 1
+            response = self.server.forward(self.command, self.path, headers, None)
+        else:
+            response = CachedResponse(405, "application/json", json.dumps(
+                {"code": "method not allowed", "message": "the query proxy only forwards queries"}).encode("utf-8"))
+        self._send(response, head=(self.command == "HEAD"))
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
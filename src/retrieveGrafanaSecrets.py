@@ -3,13 +3,15 @@
 
 import json
 import logging
-import awsiot.greengrasscoreipc
-from awsiot.greengrasscoreipc.model import GetSecretValueRequest, UnauthorizedError
 
-TIMEOUT = 10
+import instrumentation
+import ipcConnection
+import retryPolicy
+
 logging.basicConfig(level=logging.INFO)
 
 
+@instrumentation.traced("get_secret_over_ipc")
 def get_secret_over_ipc(secret_arn) -> str:
     """
     Parse arguments.
@@ -23,14 +25,17 @@ def get_secret_over_ipc(secret_arn) -> str:
         secret_string(str): Retrieved IPC secret.
     """
 
+    # The IPC model pulls in awscrt, so it is only imported once IPC is actually used
+    from awsiot.greengrasscoreipc.model import GetSecretValueRequest, UnauthorizedError
+
     try:
-        ipc_client = awsiot.greengrasscoreipc.connect()
+        ipc_client = ipcConnection.get_ipc_client()
         request = GetSecretValueRequest()
         request.secret_id = secret_arn
         operation = ipc_client.new_get_secret_value()
         operation.activate(request)
         futureResponse = operation.get_response()
-        response = futureResponse.result(TIMEOUT)
+        response = futureResponse.result(retryPolicy.get(retryPolicy.IPC).attempt_timeout())
         return response.secret_value.secret_string
     except TimeoutError as e:
         logging.error("Timeout occurred while getting secret: {}".format(secret_arn), exc_info=True)
@@ -45,13 +50,13 @@ def get_secret_over_ipc(secret_arn) -> str:
 
 def retrieve_secret(secret_arn):
     """
-    Get Secret Arn.
+    Get Secret Arn. Timeouts and connection errors are retried as the ipc retry policy allows.
     :param secret_arn: the AWS Secret Manager secret ARN
     :return: the secret JSON string
     """
 
     try:
-        response = get_secret_over_ipc(secret_arn)
+        response = retryPolicy.get(retryPolicy.IPC).run("get_secret_over_ipc", get_secret_over_ipc, secret_arn)
         responseString = json.loads(response)
         if len(responseString) == 0:
             raise ValueError("Retrieved Grafana secret was empty!")
@@ -5,21 +5,16 @@ import concurrent.futures
 import time
 import logging
 
-import awsiot.greengrasscoreipc
-from awsiot.greengrasscoreipc.model import (
-    PublishToTopicRequest,
-    PublishMessage,
-    SubscribeToTopicRequest,
-    UnauthorizedError, JsonMessage
-)
-import streamHandlers
+import instrumentation
+import ipcConnection
+import retryPolicy
 
 logging.basicConfig(level=logging.INFO)
-TIMEOUT = 15
 READ_ONLY_ACCESS = "RO"
 
 
-def publish_token_request(ipc_publisher_client, publish_topic) -> None:
+@instrumentation.traced("publish_token_request")
+def publish_token_request(ipc_publisher_client, publish_topic, access_level=READ_ONLY_ACCESS, request_id=None) -> None:
     """
     Publish a token request to the specified publish topic.
 
@@ -27,27 +22,35 @@ def publish_token_request(ipc_publisher_client, publish_topic) -> None:
     ----------
         ipc_publisher_client(awsiot.greengrasscoreipc.client): the Greengrass IPC client
         publish_topic(str): the topic to publish the request on
+        access_level(str): the access level of the requested token
+        request_id(str): the correlation ID responders echo back, so that the response can be told apart from
+            responses to other components' requests
 
     Returns
     -------
         None
     """
 
+    # The IPC model pulls in awscrt, so it is only imported once IPC is actually used
+    from awsiot.greengrasscoreipc.model import PublishToTopicRequest, PublishMessage, UnauthorizedError, JsonMessage
+    import tokenMultiplexer
+
     try:
         request = PublishToTopicRequest()
         request.topic = publish_topic
+        message = {
+            "action": "RetrieveToken",
+            "accessLevel": access_level
+        }
+        if request_id is not None:
+            message[tokenMultiplexer.REQUEST_ID_FIELD] = request_id
         publish_message = PublishMessage()
-        publish_message.json_message = JsonMessage(
-            message={
-                "action": "RetrieveToken",
-                "accessLevel": "RO"
-            }
-        )
+        publish_message.json_message = JsonMessage(message=message)
         request.publish_message = publish_message
         publish_operation = ipc_publisher_client.new_publish_to_topic()
         publish_operation.activate(request)
         futureResponse = publish_operation.get_response()
-        futureResponse.result(TIMEOUT)
+        futureResponse.result(retryPolicy.get(retryPolicy.TOKEN_REQUEST).attempt_timeout())
 
     except concurrent.futures.TimeoutError as e:
         logging.error('Timeout occurred while publishing to topic: {}'.format(publish_topic), exc_info=True)
@@ -60,34 +63,32 @@ def publish_token_request(ipc_publisher_client, publish_topic) -> None:
         raise e
 
 
-# Ignore flake8 complexity warning
-# flake8: noqa: C901
-def retrieve_influxdb_params(publish_topic, subscribe_topic) -> str:
+def subscribe(subscribe_topic, handler):
     """
-    Subscribe to a token response topic and send a request to the token request topic
-    in order to retrieve InfluxDB parameters.
+    Subscribe to a token response topic.
 
     Parameters
     ----------
-        publish_topic(str): the topic to publish the request on
         subscribe_topic(str): the topic to subscribe on to retrieve the response
+        handler(InfluxDBDataStreamHandler): the handler to subscribe with
 
     Returns
     -------
-        influxdb_parameters(str): the retrieved parameters needed to connect to InfluxDB
+        (ipc_client, subscriber_operation)(tuple): the shared IPC client and the open subscription
     """
 
-    subscriber_operation = None
+    from awsiot.greengrasscoreipc.model import SubscribeToTopicRequest, UnauthorizedError
+
     try:
-        # First, set up a subscription to the InfluxDB token response topic
-        ipc_subscriber_client = awsiot.greengrasscoreipc.connect()
+        # The subscription and the token requests share the process-wide IPC connection
+        ipc_client = ipcConnection.get_ipc_client()
         request = SubscribeToTopicRequest()
         request.topic = subscribe_topic
-        handler = streamHandlers.InfluxDBDataStreamHandler()
-        subscriber_operation = ipc_subscriber_client.new_subscribe_to_topic(handler)
+        subscriber_operation = ipc_client.new_subscribe_to_topic(handler)
         future = subscriber_operation.activate(request)
-        future.result(TIMEOUT)
+        future.result(retryPolicy.get(retryPolicy.TOKEN_REQUEST).attempt_timeout())
         logging.info('Successfully subscribed to topic: {}'.format(subscribe_topic))
+        return ipc_client, subscriber_operation
     except concurrent.futures.TimeoutError as e:
         logging.error('Timeout occurred while subscribing to topic: {}'.format(subscribe_topic), exc_info=True)
         raise e
@@ -98,34 +99,104 @@ def retrieve_influxdb_params(publish_topic, subscribe_topic) -> str:
         logging.error('Exception while subscribing to topic: {}'.format(subscribe_topic), exc_info=True)
         raise e
 
+
+def request_token(ipc_client, publish_topic, token_request, policy) -> dict:
+    """
+    Publish a token request and wait for its response, re-publishing it with exponential backoff until a
+    response arrives, the attempts are used up or the deadline expires.
+
+    Parameters
+    ----------
+        ipc_client(awsiot.greengrasscoreipc.client): the Greengrass IPC client
+        publish_topic(str): the topic to publish the request on
+        token_request(TokenRequest): the open request of the multiplexer that routes responses to it
+        policy(RetryPolicy): the token request retry policy
+
+    Returns
+    -------
+        influxdb_parameters(dict): the retrieved parameters needed to connect to InfluxDB
+    """
+
+    start = time.monotonic()
+    end_time = policy.end_time(start)
+    attempt = 0
+    while policy.max_attempts is None or attempt < policy.max_attempts:
+        remaining = end_time - time.monotonic()
+        if remaining <= 0:
+            raise retryPolicy.DeadlineExceededError("retrieve_influxdb_params", attempt, end_time - start)
+        attempt += 1
+        instrumentation.annotate(retries=attempt - 1)
+        logging.info("Publish attempt {}".format(attempt - 1))
+        try:
+            publish_token_request(ipc_client, publish_topic, token_request.access_level, token_request.request_id)
+            logging.info('Successfully published token request to topic: {}'.format(publish_topic))
+        except Exception as e:
+            if not retryPolicy.is_retryable(e):
+                raise
+        wait = min(policy.backoff(attempt), remaining)
+        logging.info('Waiting up to {:.1f} seconds for a response...'.format(wait))
+        with instrumentation.span("wait_for_token_response", timeout=wait):
+            # Responses to other components' requests are ignored without ending the wait
+            influxdb_parameters = token_request.wait(wait)
+        if influxdb_parameters:
+            return influxdb_parameters
+    raise retryPolicy.RetriesExhaustedError("retrieve_influxdb_params", attempt)
+
+
+@instrumentation.traced("retrieve_influxdb_params")
+def retrieve_influxdb_params(publish_topic, subscribe_topic, initial_backoff=None, max_backoff=None,
+                             backoff_multiplier=None, deadline=None, handler=None, keep_subscription=False,
+                             access_level=READ_ONLY_ACCESS) -> str:
+    """
+    Subscribe to a token response topic and send a request to the token request topic
+    in order to retrieve InfluxDB parameters. The subscription is retried as the ipc retry policy allows,
+    and the token request as the token_request retry policy allows, unless overridden.
+
+    Parameters
+    ----------
+        publish_topic(str): the topic to publish the request on
+        subscribe_topic(str): the topic to subscribe on to retrieve the response
+        initial_backoff(float): seconds to wait for a response to the first request before re-publishing
+        max_backoff(float): the upper bound on the wait between two requests
+        backoff_multiplier(float): the factor the wait grows by after each unanswered request
+        deadline(float): the overall number of seconds to spend retrieving the parameters
+        handler(InfluxDBDataStreamHandler): the handler to subscribe with; a new one is created if not given
+        keep_subscription(bool): leave the subscription open so that the handler keeps receiving responses
+        access_level(str): the access level of the requested token; responses with other tokens are ignored
+
+    Returns
+    -------
+        influxdb_parameters(str): the retrieved parameters needed to connect to InfluxDB
+
+    Raises
+    ------
+        RetriesExhaustedError: if no response arrived to any of the requests
+        DeadlineExceededError: if no response arrived before the deadline
+    """
+
+    import streamHandlers
+
+    policy = retryPolicy.get(retryPolicy.TOKEN_REQUEST).replace(
+        initial_backoff=initial_backoff, max_backoff=max_backoff, multiplier=backoff_multiplier, deadline=deadline)
+    # First, set up a subscription to the InfluxDB token response topic
+    if handler is None:
+        handler = streamHandlers.InfluxDBDataStreamHandler()
+    ipc_client, subscriber_operation = retryPolicy.get(retryPolicy.IPC).run(
+        "subscribe_to_token_responses", subscribe, subscribe_topic, handler)
+
     # Next, send a publish request to the InfluxDB token request topic
-    ipc_publisher_client = awsiot.greengrasscoreipc.connect()
-    retries = 0
+    # Every publish carries the same correlation ID, so that a late response to an earlier attempt still counts
+    token_request = handler.multiplexer.open(access_level)
     try:
-        # Retrieve the InfluxDB parameters to connect
-        # Retry 10 times or until we retrieve parameters with RO access
-        while not handler.influxdb_parameters and retries < 10:
-            logging.info("Publish attempt {}".format(retries))
-            publish_token_request(ipc_publisher_client, publish_topic)
-            logging.info('Successfully published token request to topic: {}'.format(publish_topic))
-            retries += 1
-            logging.info('Waiting for 15 seconds...')
-            time.sleep(TIMEOUT)
-            if handler.influxdb_parameters:
-                if handler.influxdb_parameters['InfluxDBTokenAccessType'] != READ_ONLY_ACCESS:
-                    logging.warning("Discarding retrieved token with incorrect access level {}"
-                                    .format(handler.influxdb_parameters['InfluxDBTokenAccessType']))
-                    handler.influxdb_parameters = {}
+        influxdb_parameters = request_token(ipc_client, publish_topic, token_request, policy)
+        logging.info("Successfully retrieved InfluxDB metadata and token!")
+        return influxdb_parameters
     except Exception:
-        logging.error("Received error while sending token publish request!", exc_info=True)
+        logging.error("Failed to retrieve InfluxDB parameters over IPC!", exc_info=True)
+        raise
     finally:
+        handler.multiplexer.close(token_request)
         # Close the operations for the clients
-        if subscriber_operation:
+        if not keep_subscription:
             subscriber_operation.close()
-        logging.info("Closed InfluxDB parameter response subscriber client")
-        if not handler.influxdb_parameters:
-            logging.error("Failed to retrieve InfluxDB parameters over IPC!")
-            exit(1)
-        logging.info("Successfully retrieved InfluxDB metadata and token!")
-
-    return handler.influxdb_parameters
+            logging.info("Closed InfluxDB parameter response subscriber client")
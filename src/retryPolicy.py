@@ -0,0 +1,301 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import concurrent.futures
+import json
+import logging
+import random
+import sys
+import threading
+import time
+
+import instrumentation
+
+logging.basicConfig(level=logging.INFO)
+# The phases that have a retry policy of their own
+IPC = "ipc"
+TOKEN_REQUEST = "token_request"
+GRAFANA = "grafana"
+GRAFANA_READY = "grafana_ready"
+INFLUXDB = "influxdb"
+# max_attempts and deadline are None where the phase isn't bounded by them
+DEFAULT_POLICIES = {
+    # Secret retrieval and subscriptions over Greengrass IPC
+    IPC: {"max_attempts": 3, "initial_backoff": 0.5, "max_backoff": 5, "timeout": 10},
+    # Token requests are re-published until a response arrives; the backoff is the wait for that response
+    TOKEN_REQUEST: {"max_attempts": 10, "initial_backoff": 1, "max_backoff": 15, "timeout": 15, "deadline": 150},
+    # Calls to the Grafana API, retried on connection errors and 5xx responses
+    GRAFANA: {"max_attempts": 4, "initial_backoff": 0.5, "timeout": 10},
+    # Health checks until Grafana is ready
+    GRAFANA_READY: {"max_attempts": None, "initial_backoff": 0.25, "max_backoff": 5, "timeout": 10, "deadline": 120},
+    # Calls to the InfluxDB API, retried on connection errors and 5xx responses
+    INFLUXDB: {"max_attempts": 4, "initial_backoff": 0.5, "timeout": 10}
+}
+POLICY_FIELDS = ("max_attempts", "initial_backoff", "max_backoff", "multiplier", "jitter", "timeout", "deadline")
+MULTIPLIER = 2
+# Attempts are never given less time than this, even right before the deadline
+MIN_TIMEOUT = 0.1
+# Each backoff is shortened by up to this fraction at random, so that retries of parallel calls spread out
+JITTER = 0.2
+
+
+class RetryError(Exception):
+    """
+    An operation that kept failing until its retry policy gave up on it.
+    """
+
+    def __init__(self, operation, attempts, message):
+        super().__init__(message)
+        self.operation = operation
+        self.attempts = attempts
+
+
+class RetriesExhaustedError(RetryError):
+    """
+    An operation that used up all attempts of its retry policy without succeeding.
+    """
+
+    def __init__(self, operation, attempts):
+        super().__init__(operation, attempts, "{} did not succeed after {} attempts".format(operation, attempts))
+
+
+class DeadlineExceededError(RetryError, TimeoutError):
+    """
+    An operation that did not succeed before its own deadline or the startup deadline expired.
+    """
+
+    def __init__(self, operation, attempts, deadline):
+        super().__init__(operation, attempts, "{} did not succeed within {:g} seconds ({} attempts)"
+                         .format(operation, deadline, attempts))
+        self.deadline = deadline
+
+
+def is_retryable(error) -> bool:
+    """
+    Classify an error as transient. Errors that know whether they are transient, such as Grafana responses
+    with a 5xx status code, say so in a retryable attribute; otherwise timeouts and connection errors are.
+
+    :param error: The exception raised by an attempt.
+    :return: True if the operation may succeed when attempted again.
+    """
+
+    retryable = getattr(error, "retryable", None)
+    if retryable is not None:
+        return bool(retryable)
+    if isinstance(error, RetryError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError, concurrent.futures.TimeoutError)):
+        return True
+    # requests is only imported by the HTTP clients, so only check its errors once it has been loaded
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(error, (requests.exceptions.ConnectionError,
+                                                       requests.exceptions.Timeout))
+
+
+class Budget:
+    """
+    A deadline shared by all phases of the startup, so that retries in one phase eat into the time left
+    for the others.
+    """
+
+    def __init__(self, seconds=None, clock=time.monotonic):
+        """
+        :param seconds: The number of seconds the startup may take, or None for no deadline.
+        :param clock: The monotonic clock to measure the deadline with.
+        """
+        self.seconds = seconds
+        self._clock = clock
+        self.end_time = clock() + seconds if seconds else None
+
+    def remaining(self) -> float:
+        """
+        :return: The seconds left until the deadline, infinite without a deadline.
+        """
+        if self.end_time is None:
+            return float("inf")
+        return max(self.end_time - self._clock(), 0.0)
+
+    def cap(self, timeout) -> float:
+        """
+        :param timeout: A timeout in seconds.
+        :return: The timeout, shortened so that it doesn't run past the deadline.
+        """
+        return max(min(timeout, self.remaining()), MIN_TIMEOUT)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with jitter, bounded by a number of attempts, by a deadline of its own and by the
+    startup budget.
+    """
+
+    def __init__(self, max_attempts=1, initial_backoff=1.0, max_backoff=15.0, multiplier=MULTIPLIER, jitter=JITTER,
+                 timeout=10.0, deadline=None):
+        """
+        :param max_attempts: The maximum number of attempts, or None for no limit.
+        :param initial_backoff: The wait after the first failed attempt, in seconds.
+        :param max_backoff: The upper bound on the wait between two attempts, in seconds.
+        :param multiplier: The factor the wait grows by after each failed attempt.
+        :param jitter: The fraction of each wait that is randomly cut off, between 0 and 1.
+        :param timeout: The timeout of a single attempt, in seconds.
+        :param deadline: The number of seconds all attempts together may take, or None for no deadline.
+        """
+        if max_attempts is not None and max_attempts < 1:
+            raise ValueError("A retry policy needs at least one attempt, but got {}".format(max_attempts))
+        if not 0 <= jitter <= 1:
+            raise ValueError("The retry jitter must be between 0 and 1, but got {}".format(jitter))
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.timeout = timeout
+        self.deadline = deadline
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in POLICY_FIELDS}
+
+    def replace(self, **overrides) -> "RetryPolicy":
+        """
+        :param overrides: Policy fields to change; those that are None are left as they are.
+        :return: A copy of the policy with the given fields changed.
+        """
+        settings = self.to_dict()
+        settings.update({field: value for field, value in overrides.items() if value is not None})
+        return RetryPolicy(**settings)
+
+    def backoff(self, attempt, rand=random.random) -> float:
+        """
+        :param attempt: The number of the attempt that just failed, starting at 1.
+        :param rand: The source of randomness for the jitter.
+        :return: The number of seconds to wait before the next attempt.
+        """
+        backoff = min(self.initial_backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        return backoff * (1 - self.jitter * rand())
+
+    def end_time(self, start) -> float:
+        """
+        :param start: The monotonic time the first attempt started at.
+        :return: The monotonic time the attempts must end by, given the policy's deadline and the startup budget.
+        """
+        end_time = start + self.deadline if self.deadline else float("inf")
+        budget_end_time = _budget.end_time
+        return min(end_time, budget_end_time) if budget_end_time is not None else end_time
+
+    def attempt_timeout(self) -> float:
+        """
+        :return: The timeout of a single attempt, shortened so that it doesn't run past the startup deadline.
+        """
+        return _budget.cap(self.timeout)
+
+    def run(self, operation, function, *args, **kwargs):
+        """
+        Call a function until it succeeds, retrying transient errors as is_retryable classifies them. Other
+        errors are raised as they are.
+
+        :param operation: The name of the operation, for logging.
+        :param function: The function to call.
+        :param args: The positional arguments of the function.
+        :param kwargs: The keyword arguments of the function.
+        :return: The return value of the first successful call.
+        :raises RetriesExhaustedError: if all attempts failed, chained to the last transient error.
+        :raises DeadlineExceededError: if the deadline expired before the next attempt, chained to the last
+            transient error.
+        """
+        start = time.monotonic()
+        end_time = self.end_time(start)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = function(*args, **kwargs)
+                if attempt > 1:
+                    instrumentation.annotate(retries=attempt - 1)
+                return result
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if self.max_attempts is not None and attempt >= self.max_attempts:
+                    logging.error("Giving up on {} after {} attempts".format(operation, attempt))
+                    raise RetriesExhaustedError(operation, attempt) from e
+                wait = self.backoff(attempt)
+                if time.monotonic() + wait >= end_time:
+                    raise DeadlineExceededError(operation, attempt, end_time - start) from e
+                logging.warning("Attempt {} of {} failed, retrying in {:.2f} seconds: {}"
+                                .format(attempt, operation, wait, e))
+            time.sleep(wait)
+
+
+def parse_policies(policies) -> dict:
+    """
+    Parse and validate a JSON object of retry policy overrides by phase, e.g.
+    {"token_request": {"max_attempts": 5, "deadline": 60}, "grafana": {"timeout": 5}}.
+
+    :param policies: The JSON string of policy overrides.
+    :return: The policy fields to override by phase.
+    """
+
+    if not policies:
+        return {}
+    overrides = json.loads(policies)
+    if not isinstance(overrides, dict):
+        raise ValueError("Retry policies must be a JSON object!")
+    for phase, settings in overrides.items():
+        if phase not in DEFAULT_POLICIES:
+            raise ValueError("Unknown retry policy phase {}, should be one of {}".format(
+                phase, sorted(DEFAULT_POLICIES)))
+        if not isinstance(settings, dict):
+            raise ValueError("The retry policy of {} must be a JSON object, but got: {}".format(phase, settings))
+        unknown = set(settings) - set(POLICY_FIELDS)
+        if unknown:
+            raise ValueError("Unknown retry policy fields {} in {}".format(sorted(unknown), phase))
+    return overrides
+
+
+_lock = threading.Lock()
+_policies = {phase: RetryPolicy(**settings) for phase, settings in DEFAULT_POLICIES.items()}
+_budget = Budget()
+
+
+def configure(overrides=None, startup_deadline=None) -> dict:
+    """
+    Set the process-wide retry policies, starting from the defaults, and start the startup budget.
+
+    :param overrides: The policy fields to override by phase, as returned by parse_policies.
+    :param startup_deadline: The number of seconds the whole startup may take, or None for no deadline.
+    :return: The policies by phase.
+    """
+    global _policies, _budget
+    policies = {}
+    for phase, settings in DEFAULT_POLICIES.items():
+        policies[phase] = RetryPolicy(**dict(settings, **(overrides or {}).get(phase, {})))
+    with _lock:
+        _policies = policies
+        _budget = Budget(startup_deadline)
+    return policies
+
+
+def end_startup() -> None:
+    """
+    Lift the startup budget once the startup is done, so that it doesn't cut short the calls made later on.
+
+    :return: None
+    """
+    global _budget
+    with _lock:
+        _budget = Budget()
+
+
+def get(phase) -> RetryPolicy:
+    """
+    :param phase: The phase, e.g. retryPolicy.GRAFANA
+    :return: The process-wide retry policy of the phase.
+    """
+    return _policies[phase]
+
+
+def budget() -> Budget:
+    """
+    :return: The startup budget.
+    """
+    return _budget
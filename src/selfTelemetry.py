@@ -0,0 +1,234 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import logging
+import threading
+import time
+
+import retryPolicy
+
+logging.basicConfig(level=logging.INFO)
+MEASUREMENT = "greengrass_dashboard"
+WRITE_PATH = "/api/v2/write"
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5
+MAX_BUFFER = 10000
+# Writing needs a token with write access; the read-only token given to Grafana can't be used
+WRITE_ACCESS = "RW"
+TOKEN_DEADLINE = 30
+
+
+def _escape(value, special) -> str:
+    value = str(value).replace("\\", "\\\\")
+    for character in special:
+        value = value.replace(character, "\\" + character)
+    return value
+
+
+def format_field_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return "{}i".format(value)
+    if isinstance(value, float):
+        return repr(value)
+    return '"{}"'.format(str(value).replace("\\", "\\\\").replace('"', '\\"'))
+
+
+def to_line_protocol(measurement, tags, fields, timestamp_ns) -> str:
+    """
+    Format one point as InfluxDB line protocol.
+
+    Parameters
+    ----------
+        measurement(str): the measurement name
+        tags(dict): the tag set; empty values are left out
+        fields(dict): the field set, at least one field
+        timestamp_ns(int): the timestamp in nanoseconds since the epoch
+
+    Returns
+    -------
+        line(str): the line protocol line, without a trailing newline
+    """
+
+    key = _escape(measurement, ", ")
+    for tag_key, tag_value in sorted(tags.items()):
+        if tag_value is not None and tag_value != "":
+            key += ",{}={}".format(_escape(tag_key, ",= "), _escape(tag_value, ",= "))
+    field_set = ",".join("{}={}".format(_escape(field_key, ",= "), format_field_value(field_value))
+                         for field_key, field_value in sorted(fields.items()))
+    return "{} {} {}".format(key, field_set, timestamp_ns)
+
+
+class TelemetryWriter:
+    """
+    Buffers metric points and writes them to InfluxDB in batches from a background thread, so that recording
+    a point never blocks the caller. Points can be recorded before the InfluxDB destination is known; they
+    are written once configure() is called. When the buffer is full the oldest points are dropped.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_buffer=MAX_BUFFER,
+                 default_tags=None, timeout=None):
+        """
+        :param batch_size: The maximum number of points per write request; a full batch is written right away.
+        :param flush_interval: Seconds between two writes of a partial batch.
+        :param max_buffer: The maximum number of points kept while InfluxDB is unknown or unreachable.
+        :param default_tags: Tags added to every point, e.g. the host name.
+        :param timeout: The timeout in seconds of a write request, instead of the influxdb retry policy's.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.default_tags = dict(default_tags or {})
+        self.timeout = timeout
+        self.written_count = 0
+        self.dropped_count = 0
+        self.failed_writes = 0
+        self._buffer = collections.deque(maxlen=max_buffer)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._session = None
+        self._write = None
+
+    def record(self, measurement, fields, tags=None, timestamp_ns=None) -> None:
+        """
+        Buffer a point. Formatting and writing happen on the background thread.
+
+        :param measurement: The measurement name.
+        :param fields: The field set.
+        :param tags: The tag set, added to the default tags.
+        :param timestamp_ns: The timestamp in nanoseconds since the epoch; now if not given.
+        :return: None
+        """
+        if timestamp_ns is None:
+            timestamp_ns = int(time.time() * 1e9)
+        with self._condition:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped_count += 1
+            self._buffer.append((measurement, tags, fields, timestamp_ns))
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify()
+
+    def record_span(self, span) -> None:
+        """
+        Buffer a finished instrumentation span as a point: its name, parent and outcome, and its string
+        attributes, become tags, and its duration and numeric attributes become fields.
+
+        :param span: The finished instrumentation.Span.
+        :return: None
+        """
+        tags = {"span": span.name, "parent": span.parent, "outcome": span.outcome}
+        fields = {"duration": span.duration}
+        for key, value in span.attributes.items():
+            if isinstance(value, (bool, int, float)):
+                fields[key] = value
+            elif value is not None:
+                tags[key] = value
+        self.record(MEASUREMENT, fields, tags)
+
+    def configure(self, url, token, org, bucket, tls_verify=True) -> None:
+        """
+        Set the InfluxDB destination and start writing buffered points.
+
+        :param url: The InfluxDB base URL.
+        :param token: An InfluxDB token with write access to the bucket.
+        :param org: The InfluxDB org.
+        :param bucket: The InfluxDB bucket to write to.
+        :param tls_verify: Use TLS verify or not.
+        :return: None
+        """
+        import requests
+        if not tls_verify:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        with self._condition:
+            if self._closed:
+                # The component is exiting already, and close() has accounted for the buffered points
+                return
+            if self.timeout is None:
+                # Resolved here rather than at construction, once the recipe's retry policies are configured
+                self.timeout = retryPolicy.get(retryPolicy.INFLUXDB).timeout
+            self._session = requests.Session()
+            self._session.headers.update({"Authorization": "Token {}".format(token),
+                                          "Content-Type": "text/plain; charset=utf-8"})
+            self._write = {"url": url + WRITE_PATH, "params": {"org": org, "bucket": bucket, "precision": "ns"},
+                           "verify": tls_verify}
+            self._thread = threading.Thread(target=self._run, name="selfTelemetry", daemon=True)
+            self._thread.start()
+        logging.info("Writing self-telemetry to InfluxDB bucket {}".format(bucket))
+
+    def _take_batch(self) -> list:
+        with self._condition:
+            return [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+    def _requeue(self, batch) -> None:
+        with self._condition:
+            room = self._buffer.maxlen - len(self._buffer)
+            self.dropped_count += max(len(batch) - room, 0)
+            # Keep the newest points of the batch, ahead of the points recorded since it was taken
+            self._buffer.extendleft(reversed(batch[-room:] if room else []))
+
+    def flush(self) -> bool:
+        """
+        Write all buffered points.
+
+        :return: True if the buffer was written out, False if a write failed and the rest was kept for later.
+        """
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return True
+            body = "\n".join(to_line_protocol(measurement, dict(self.default_tags, **(tags or {})), fields, timestamp)
+                             for measurement, tags, fields, timestamp in batch)
+            try:
+                response = self._session.post(self._write["url"], params=self._write["params"],
+                                              data=body.encode("utf-8"), verify=self._write["verify"],
+                                              timeout=self.timeout)
+                if response.status_code >= 300:
+                    raise ValueError("InfluxDB write failed with status code {}: {}".format(
+                        response.status_code, response.text[:200]))
+            except Exception:
+                self.failed_writes += 1
+                logging.warning("Failed to write {} self-telemetry points, will retry".format(len(batch)),
+                                exc_info=True)
+                self._requeue(batch)
+                return False
+            self.written_count += len(batch)
+
+    def _run(self) -> None:
+        healthy = True
+        try:
+            while True:
+                with self._condition:
+                    # After a failed write, wait for the full interval instead of retrying on every new batch
+                    self._condition.wait_for(lambda: self._closed or (healthy and len(self._buffer) >= self.batch_size),
+                                             self.flush_interval)
+                    closed = self._closed
+                healthy = self.flush()
+                if closed:
+                    return
+        finally:
+            # The session belongs to this thread, which may still be writing when close() gives up waiting
+            self._session.close()
+
+    def close(self, timeout=None) -> None:
+        """
+        Write the remaining points and stop the background thread.
+
+        :param timeout: The maximum number of seconds to wait for the remaining points to be written, by default
+            the timeout of a write request. A writer that was never configured has nowhere to write them, and
+            returns right away.
+        :return: None
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout if timeout is not None else self.timeout)
+        if self._buffer:
+            logging.warning("Dropping {} self-telemetry points that could not be written".format(len(self._buffer)))
+        logging.info("Self-telemetry: {} points written, {} dropped, {} failed writes".format(
+            self.written_count, self.dropped_count + len(self._buffer), self.failed_writes))
@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import builtins
+import logging
+import sys
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+TOP_MODULES = 15
+
+
+def peak_rss_kb() -> int:
+    """
+    Get the peak resident set size of this process.
+
+    Returns
+    -------
+        peak_rss(int): the peak RSS in KiB, or 0 where the resource module is unavailable
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+
+
+class StartupProfiler:
+    """
+    Records how long each module takes to import, the way -X importtime does, by wrapping the import
+    statement while it is running. Only first imports are recorded; modules already loaded cost nothing.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.start_time = None
+        self.start_rss = 0
+        self._original_import = None
+        self._local = threading.local()
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            if name not in self.timings:
+                self.timings[name] = (cumulative - children, cumulative)
+
+    def start(self) -> None:
+        """
+        Start recording imports.
+
+        :return: None
+        """
+        self.start_time = time.perf_counter()
+        self.start_rss = peak_rss_kb()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self) -> None:
+        """
+        Stop recording imports.
+
+        :return: None
+        """
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def summary(self, top=TOP_MODULES) -> dict:
+        """
+        Summarize the recorded imports.
+
+        :param top: The number of slowest imports to list.
+        :return: The elapsed time, import count and total import time in seconds, the peak RSS in KiB at start
+            and now, and the slowest imports by cumulative time as (module, self seconds, cumulative seconds).
+        """
+        # The self times of all imports add up to the total time spent importing
+        slowest = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "elapsed": time.perf_counter() - self.start_time,
+            "imports": len(self.timings),
+            "import_time": sum(self_time for self_time, _ in self.timings.values()),
+            "start_peak_rss_kb": self.start_rss,
+            "peak_rss_kb": peak_rss_kb(),
+            "slowest": [(name, self_time, cumulative) for name, (self_time, cumulative) in slowest[:top]]
+        }
+
+    def report(self, top=TOP_MODULES) -> dict:
+        """
+        Log the summary of the recorded imports.
+
+        :param top: The number of slowest imports to list.
+        :return: The summary, as returned by summary().
+        """
+        summary = self.summary(top)
+        logging.info("Startup profile: {} modules imported in {:.3f} of {:.3f} seconds, peak RSS {} KiB "
+                     "({} KiB at start)".format(summary["imports"], summary["import_time"], summary["elapsed"],
+                                                summary["peak_rss_kb"], summary["start_peak_rss_kb"]))
+        logging.info("Startup profile: {:>10} | {:>10} | module".format("self [us]", "cumul [us]"))
+        for name, self_time, cumulative in summary["slowest"]:
+            logging.info("Startup profile: {:>10} | {:>10} | {}".format(
+                int(self_time * 1e6), int(cumulative * 1e6), name))
+        return summary
@@ -2,21 +2,48 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import threading
 
 import awsiot.greengrasscoreipc.client as client
 from awsiot.greengrasscoreipc.model import (
     SubscriptionResponseMessage
 )
 
+import tokenMultiplexer
+
 
 class InfluxDBDataStreamHandler(client.SubscribeToTopicStreamHandler):
     def __init__(self):
         super().__init__()
         self.influxdb_parameters = {}
+        # Incremented on every received message, so that long-lived watchers can tell new messages apart
+        self.parameters_version = 0
+        self._parameters_condition = threading.Condition()
+        # Routes responses to the token requests sent over this subscription
+        self.multiplexer = tokenMultiplexer.TokenRequestMultiplexer()
+        # The access level of responses to other requests that are still published, see watch_broadcasts
+        self.broadcast_access_level = None
+
+    def watch_broadcasts(self, access_level) -> None:
+        """
+        Publish the responses to other components' requests that carry the given token access level, as well as
+        the responses to this component's requests. Rotated tokens are broadcast with the ID of whichever request
+        triggered them, so a rotation watcher needs them once this component no longer sends requests.
+
+        Parameters
+        ----------
+            access_level(str): The token access level to publish, or None to only publish this component's responses.
+
+        Returns
+        -------
+            None
+        """
+        self.broadcast_access_level = access_level
 
     def on_stream_event(self, event: SubscriptionResponseMessage) -> None:
         """
-        When we receive a message over IPC on the token response topic, load in the InfluxDB parameters
+        When we receive a message over IPC on the token response topic, load in the InfluxDB parameters.
+        Invalid messages are logged and dropped, leaving the token request they may answer to time out.
 
         Parameters
         ----------
@@ -27,12 +54,43 @@ class InfluxDBDataStreamHandler(client.SubscribeToTopicStreamHandler):
             None
         """
         try:
-            self.influxdb_parameters = event.json_message.message
-            if len(self.influxdb_parameters) == 0:
+            message = event.json_message.message
+            if len(message) == 0:
                 raise ValueError("Retrieved Influxdb parameters are empty!")
+            request_id, influxdb_parameters = tokenMultiplexer.split_response(message)
+            if not self.multiplexer.dispatch(message) and request_id is not None and not self._is_broadcast(
+                    influxdb_parameters):
+                # A response to another component's request: leave the last received parameters in place
+                return
+            with self._parameters_condition:
+                self.influxdb_parameters = influxdb_parameters
+                self.parameters_version += 1
+                self._parameters_condition.notify_all()
         except Exception:
+            # Raising here would only end the IPC callback thread, not the token request waiting for the response
             logging.error('Failed to load telemetry event JSON!', exc_info=True)
-            exit(1)
+
+    def _is_broadcast(self, influxdb_parameters) -> bool:
+        access_level = self.broadcast_access_level
+        return access_level is not None and \
+            influxdb_parameters.get(tokenMultiplexer.ACCESS_TYPE_FIELD) == access_level
+
+    def wait_for_update(self, version, timeout):
+        """
+        Block until a message newer than the given version has been received or the timeout expires.
+
+        Parameters
+        ----------
+            version(int): The last parameters_version seen by the caller.
+            timeout(float): The maximum number of seconds to wait.
+
+        Returns
+        -------
+            (version, influxdb_parameters)(tuple): The current version and parameters.
+        """
+        with self._parameters_condition:
+            self._parameters_condition.wait_for(lambda: self.parameters_version > version, timeout)
+            return self.parameters_version, self.influxdb_parameters
 
     def on_stream_error(self, error: Exception) -> bool:
         """
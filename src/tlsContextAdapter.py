@@ -0,0 +1,19 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from requests.adapters import HTTPAdapter
+
+
+class TLSContextAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that hands one pre-built SSL context to every pooled connection, instead of
+    building (and loading the CA bundle into) a new context per connection.
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
@@ -0,0 +1,128 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import uuid
+
+logging.basicConfig(level=logging.INFO)
+# Token requests carry a correlation ID in this field; responders that echo it get their responses routed exactly
+REQUEST_ID_FIELD = "requestId"
+ACCESS_TYPE_FIELD = "InfluxDBTokenAccessType"
+
+
+def split_response(message) -> tuple:
+    """
+    Separate the correlation ID of a token response from the InfluxDB parameters it carries.
+
+    Parameters
+    ----------
+        message(dict): the received token response
+
+    Returns
+    -------
+        (request_id, influxdb_parameters)(tuple): the correlation ID, or None if the response has none, and the
+        InfluxDB parameters without it
+    """
+
+    return message.get(REQUEST_ID_FIELD), {k: v for k, v in message.items() if k != REQUEST_ID_FIELD}
+
+
+class TokenRequest:
+    """
+    One outstanding token request. Its future is resolved with the InfluxDB parameters of the matching response.
+    """
+
+    def __init__(self, access_level):
+        self.request_id = uuid.uuid4().hex
+        self.access_level = access_level
+        self.future = concurrent.futures.Future()
+
+    def wait(self, timeout) -> dict:
+        """
+        Block until the matching response has been received or the timeout expires.
+
+        Parameters
+        ----------
+            timeout(float): The maximum number of seconds to wait.
+
+        Returns
+        -------
+            influxdb_parameters(dict): The received parameters, or an empty dict on timeout.
+        """
+        try:
+            return self.future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            return {}
+
+
+class TokenRequestMultiplexer:
+    """
+    Routes the responses arriving on the shared token response topic to the outstanding requests they answer.
+    A response carrying a correlation ID goes to the request with that ID. A response without one, from a
+    responder that doesn't echo IDs, goes to the oldest outstanding request for its token access level.
+    Responses matching no outstanding request, such as tokens meant for other components, are ignored.
+    """
+
+    def __init__(self):
+        self.routed_count = 0
+        self.ignored_count = 0
+        self._requests = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, access_level) -> TokenRequest:
+        """
+        Register a new outstanding request.
+
+        :param access_level: The access level of the requested token.
+        :return: The TokenRequest, whose request_id should be sent with every publish of the request.
+        """
+        request = TokenRequest(access_level)
+        with self._lock:
+            self._requests[request.request_id] = request
+        return request
+
+    def close(self, request) -> None:
+        """
+        Stop routing responses to a request, e.g. once its caller gave up waiting.
+
+        :param request: The TokenRequest returned by open().
+        :return: None
+        """
+        with self._lock:
+            outstanding = self._requests.pop(request.request_id, None)
+        # A request no longer outstanding has been routed a response, which resolves its future
+        if outstanding is not None:
+            request.future.cancel()
+
+    def outstanding_count(self) -> int:
+        with self._lock:
+            return len(self._requests)
+
+    def _match(self, request_id, access_level):
+        if request_id is not None:
+            request = self._requests.get(request_id)
+            return request if request is not None and request.access_level == access_level else None
+        return next((r for r in self._requests.values() if r.access_level == access_level), None)
+
+    def dispatch(self, message) -> bool:
+        """
+        Resolve the outstanding request a token response answers, if any.
+
+        :param message: The received token response.
+        :return: True if the response was routed to a request, False if it was ignored.
+        """
+        request_id, influxdb_parameters = split_response(message)
+        with self._lock:
+            request = self._match(request_id, influxdb_parameters.get(ACCESS_TYPE_FIELD))
+            if request is None:
+                self.ignored_count += 1
+                logging.debug("Ignoring token response with {} access that answers no outstanding request"
+                              .format(influxdb_parameters.get(ACCESS_TYPE_FIELD)))
+                return False
+            del self._requests[request.request_id]
+            self.routed_count += 1
+        request.future.set_result(influxdb_parameters)
+        return True
@@ -0,0 +1,88 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+READ_ONLY_ACCESS = "RO"
+# Responses arriving within this many seconds of each other are treated as one rotation
+DEBOUNCE = 2
+POLL_INTERVAL = 1
+
+
+class TokenRotationWatcher:
+    """
+    Watches an InfluxDBDataStreamHandler whose subscription is kept open and calls back once per burst of
+    token responses that carries new read-only InfluxDB parameters.
+    """
+
+    def __init__(self, handler, on_rotation, influxdb_parameters, debounce=DEBOUNCE, poll_interval=POLL_INTERVAL,
+                 access_level=READ_ONLY_ACCESS):
+        """
+        :param handler: The InfluxDBDataStreamHandler receiving token responses.
+        :param on_rotation: Called with (previous_parameters, influxdb_parameters) when new parameters arrive.
+        :param influxdb_parameters: The InfluxDB parameters currently provisioned.
+        :param debounce: Seconds without further responses before a burst is considered complete.
+        :param poll_interval: Seconds between checks of the stop event while idle.
+        :param access_level: The token access level to accept; responses meant for other components are ignored.
+        """
+        self.handler = handler
+        self.on_rotation = on_rotation
+        self.influxdb_parameters = influxdb_parameters
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.access_level = access_level
+        self.rotation_count = 0
+
+    def _wait_for_burst(self, version):
+        """
+        Absorb responses until the topic has been quiet for the debounce window.
+
+        :param version: The version of the first response of the burst.
+        :return: (version, parameters) with the latest accepted parameters of the burst, or None if there were none.
+        """
+        accepted = None
+        new_version, parameters = version, self.handler.influxdb_parameters
+        while True:
+            if parameters and parameters.get('InfluxDBTokenAccessType') == self.access_level:
+                accepted = parameters
+            version = new_version
+            new_version, parameters = self.handler.wait_for_update(version, self.debounce)
+            if new_version == version:
+                return version, accepted
+
+    def run(self, stop_event) -> None:
+        """
+        Watch for token responses until the stop event is set.
+
+        :param stop_event: A threading.Event that ends the watch when set.
+        :return: None
+        """
+        # Rotated tokens carry the ID of another component's request once this one stops sending requests
+        self.handler.watch_broadcasts(self.access_level)
+        try:
+            self._watch(stop_event)
+        finally:
+            self.handler.watch_broadcasts(None)
+
+    def _watch(self, stop_event) -> None:
+        version = self.handler.parameters_version
+        while not stop_event.is_set():
+            new_version, _ = self.handler.wait_for_update(version, self.poll_interval)
+            if new_version == version:
+                continue
+            version, accepted = self._wait_for_burst(new_version)
+            if not accepted:
+                logging.info("Ignoring token responses without {} access".format(self.access_level))
+                continue
+            if accepted == self.influxdb_parameters:
+                logging.info("Received InfluxDB parameters are unchanged")
+                continue
+            try:
+                self.on_rotation(self.influxdb_parameters, accepted)
+                self.influxdb_parameters = accepted
+                self.rotation_count += 1
+                logging.info("Applied rotated InfluxDB parameters")
+            except Exception:
+                # Keep watching; the next response will be applied against the last parameters that succeeded
+                logging.error("Failed to apply rotated InfluxDB parameters!", exc_info=True)
@@ -0,0 +1,19 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import pytest
+
+sys.path.append("src/")
+
+import ipcConnection  # noqa: E402
+import retryPolicy  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def reset_ipc_connection():
+    # The IPC client is shared process-wide, so drop it between tests to keep connect mocks isolated
+    yield
+    ipcConnection.close_ipc_client()
+    # Retry policies and the startup deadline are process-wide as well
+    retryPolicy.configure()
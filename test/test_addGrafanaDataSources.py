@@ -1,13 +1,21 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import copy
+import json
 import pytest
 import sys
+import threading
+import time
 import requests
 import src.addGrafanaDataSources as agds
+import src.grafanaClient as grafanaClient
 from unittest import mock
 
 sys.path.append("src")
+import retryPolicy  # noqa: E402
+sys.path.append("benchmark/")
+from fakeGrafana import FakeGrafanaHandler, FakeGrafanaServer  # noqa: E402
 
 testInfluxDBParams = {
     'InfluxDBContainerName': 'greengrass_InfluxDB',
@@ -67,6 +75,10 @@ testCert = "testCert"
 testKey = "testKey"
 
 
+def grafana_client():
+    return grafanaClient.GrafanaClient("https", 3000, False)
+
+
 def test_create_https_influxdb_datasource_data():
 
     output = agds.create_influxdb_datasource_config(testInfluxDBParams, testCert, testKey)
@@ -83,70 +95,70 @@ def test_create_http_influxdb_datasource_data():
 def test_add_valid_datasource_to_grafana(mocker):
     testResp = requests.Response()
     testResp.status_code = 200
-    mocker.patch('requests.post', return_value=testResp)
-    agds.create_and_add_datasource_to_grafana("https://test", "test", False)
+    mock_request = mocker.patch('requests.Session.request', return_value=testResp)
+    agds.create_and_add_datasource_to_grafana(grafana_client(), "test")
+    mock_request.assert_called_once_with("POST", "https://localhost:3000/api/datasources", data='"test"',
+                                         timeout=retryPolicy.get(retryPolicy.GRAFANA).timeout, verify=False)
 
 
 def test_add_invalid_datasource_to_grafana(mocker):
     testResp = requests.Response()
     testResp.status_code = 404
-    mocker.patch('requests.post', return_value=testResp)
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        agds.create_and_add_datasource_to_grafana("https://test", "test", False)
-    assert pytest_wrapped_e.type == SystemExit
-    assert pytest_wrapped_e.value.code == 1
+    mocker.patch('requests.Session.request', return_value=testResp)
+    with pytest.raises(Exception, match="POST /api/datasources failed with status code 404") as e:
+        agds.create_and_add_datasource_to_grafana(grafana_client(), "test")
+    assert e.value.status_code == 404 and not e.value.retryable
 
 
 def test_influxdb_datasource_exists(mocker):
     testResp = requests.Response()
     testResp.status_code = 200
-    mocker.patch('requests.get', return_value=testResp)
-    assert agds.influxdb_datasource_exists("https://test", "username", "password", "3000", False)
+    mock_request = mocker.patch('requests.Session.request', return_value=testResp)
+    assert agds.influxdb_datasource_exists(grafana_client())
+    mock_request.assert_called_once_with("GET", "https://localhost:3000/api/datasources/name/InfluxDB",
+                                         timeout=retryPolicy.get(retryPolicy.GRAFANA).timeout, verify=False)
 
 
 def test_influxdb_datasource_does_not_exist(mocker):
     testResp = requests.Response()
     testResp.status_code = 404
-    mocker.patch('requests.get', return_value=testResp)
-    assert not agds.influxdb_datasource_exists("https://test", "username", "password", "3000", False)
+    mocker.patch('requests.Session.request', return_value=testResp)
+    assert not agds.influxdb_datasource_exists(grafana_client())
 
 
 def test_influxdb_datasource_error(mocker):
     testResp = requests.Response()
     testResp.status_code = 400
-    mocker.patch('requests.get', return_value=testResp)
-    assert not agds.influxdb_datasource_exists("https://test", "username", "password", "3000", False)
+    mocker.patch('requests.Session.request', return_value=testResp)
+    assert not agds.influxdb_datasource_exists(grafana_client())
 
 
 def test_add_existing_influxdb_datasource_to_grafana(mocker):
     mocker.patch('src.addGrafanaDataSources.influxdb_datasource_exists', return_value=True)
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, {}, 3000,
-                                                "https", False)
-    assert pytest_wrapped_e.type == SystemExit
-    assert pytest_wrapped_e.value.code == 0
+    assert agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, {}, 3000,
+                                                   "https", False) == agds.RECONCILE_UNCHANGED
 
 
 def test_add_new_influxdb_datasource_to_grafana(mocker):
     testInfluxDBParams['InfluxDBServerProtocol'] = 'https'
     testResp = requests.Response()
     testResp.status_code = 200
-    mocker.patch('requests.post', return_value=testResp)
+    mocker.patch('requests.Session.request', return_value=testResp)
     mocker.patch('src.addGrafanaDataSources.influxdb_datasource_exists', return_value=False)
 
     my_text = "mock text"
     mocked_open_function = mock.mock_open(read_data=my_text)
 
     with mock.patch("builtins.open", mocked_open_function):
-        agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, testInfluxDBParams, 3000,
-                                                "https", False)
+        assert agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, testInfluxDBParams, 3000,
+                                                       "https", False) == agds.RECONCILE_CREATED
 
 
 def test_invalid_grafana_certs(mocker):
     testInfluxDBParams['InfluxDBServerProtocol'] = 'https'
     testResp = requests.Response()
     testResp.status_code = 200
-    mocker.patch('requests.post', return_value=testResp)
+    mocker.patch('requests.Session.request', return_value=testResp)
     datasource_exists_mocker = mocker.patch('src.addGrafanaDataSources.influxdb_datasource_exists', return_value=False)
 
     my_text = ""
@@ -164,3 +176,241 @@ def test_invalid_influxdb_server_protocol():
     testInfluxDBParams['InfluxDBServerProtocol'] = 'test'
     data = agds.create_influxdb_datasource_config(testInfluxDBParams, "testCert", "testKey")
     assert data == {}
+
+
+def grafana_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode() if body is not None else b''
+    return response
+
+
+def test_datasource_config_hash_is_stable():
+    reordered = json.loads(json.dumps(https_publish_json, sort_keys=True))
+    assert agds.compute_datasource_config_hash(https_publish_json) == agds.compute_datasource_config_hash(reordered)
+
+    stamped = agds.stamp_datasource_config_hash(https_publish_json)
+    assert agds.DATA_SOURCE_CONFIG_HASH_KEY not in https_publish_json["jsonData"]
+    assert agds.compute_datasource_config_hash(stamped) == agds.compute_datasource_config_hash(https_publish_json)
+
+    rotated = copy.deepcopy(https_publish_json)
+    rotated["secureJsonData"]["token"] = "rotatedToken"
+    assert agds.compute_datasource_config_hash(rotated) != agds.compute_datasource_config_hash(https_publish_json)
+
+
+def test_reconcile_creates_missing_datasource(mocker):
+    mock_request = mocker.patch('requests.Session.request', side_effect=[grafana_response(404),
+                                                                         grafana_response(200)])
+    assert agds.reconcile_datasource(grafana_client(), https_publish_json) == agds.RECONCILE_CREATED
+
+    method, url = mock_request.call_args[0]
+    assert (method, url) == ("POST", "https://localhost:3000/api/datasources")
+    posted = json.loads(mock_request.call_args[1]["data"])
+    assert posted == agds.stamp_datasource_config_hash(https_publish_json)
+
+
+def test_reconcile_unchanged_datasource(mocker):
+    existing = dict(agds.stamp_datasource_config_hash(https_publish_json), id=7, uid="abc")
+    del existing["secureJsonData"]
+    mock_request = mocker.patch('requests.Session.request', return_value=grafana_response(200, existing))
+    assert agds.reconcile_datasource(grafana_client(), https_publish_json) == agds.RECONCILE_UNCHANGED
+    assert mock_request.call_count == 1
+
+
+def test_reconcile_changed_datasource(mocker):
+    outdated = copy.deepcopy(https_publish_json)
+    outdated["secureJsonData"]["token"] = "oldToken"
+    existing = dict(agds.stamp_datasource_config_hash(outdated), id=7, uid="abc")
+    mock_request = mocker.patch('requests.Session.request', side_effect=[grafana_response(200, existing),
+                                                                         grafana_response(200)])
+    assert agds.reconcile_datasource(grafana_client(), https_publish_json) == agds.RECONCILE_UPDATED
+
+    method, url = mock_request.call_args[0]
+    assert (method, url) == ("PUT", "https://localhost:3000/api/datasources/7")
+    updated = json.loads(mock_request.call_args[1]["data"])
+    assert updated == dict(agds.stamp_datasource_config_hash(https_publish_json), id=7, uid="abc")
+
+
+def test_update_datasource_failure(mocker):
+    mocker.patch.object(FakeGrafanaHandler, "update_datasource", return_value=(500, {"message": "database is locked"}))
+    with FakeGrafanaServer() as server:
+        with grafanaClient.GrafanaClient("http", server.port, True, host="127.0.0.1", max_retries=2,
+                                         backoff_factor=0) as client:
+            with pytest.raises(Exception, match="PUT /api/datasources/7 failed with status code 500") as e:
+                agds.update_datasource_in_grafana(client, 7, https_publish_json)
+        # Grafana kept answering 500 through the retries of the client
+        assert server.requests["update_datasource"] == 3
+    assert e.value.retryable
+
+
+def test_get_influxdb_datasource_error(mocker):
+    mocker.patch('requests.Session.request', return_value=grafana_response(400))
+    assert agds.get_influxdb_datasource(grafana_client()) is None
+
+
+def test_reconcile_influxdb_datasource_to_grafana(mocker):
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='https')
+    mock_reconcile = mocker.patch('src.addGrafanaDataSources.reconcile_datasource',
+                                  return_value=agds.RECONCILE_UNCHANGED)
+
+    with mock.patch("builtins.open", mock.mock_open(read_data="mock text")):
+        action = agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, params, 3000, "https",
+                                                         False, reconcile=True)
+    assert action == agds.RECONCILE_UNCHANGED
+    assert mock_reconcile.call_count == 1
+
+
+def test_reconcile_invalid_influxdb_server_protocol(mocker):
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='test')
+    with pytest.raises(ValueError, match='Could not generate'):
+        agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, params, 3000, "https", False,
+                                                reconcile=True)
+
+
+def test_apply_token_only_change(mocker):
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='https')
+    rotated = dict(params, InfluxDBToken='rotatedToken')
+    existing = dict(agds.stamp_datasource_config_hash(https_publish_json), id=7, uid="abc",
+                    secureJsonFields={"token": True})
+    del existing["secureJsonData"]
+    mock_request = mocker.patch('requests.Session.request', side_effect=[grafana_response(200, existing),
+                                                                         grafana_response(200)])
+
+    with mock.patch("builtins.open", mock.mock_open(read_data="testCert")):
+        action = agds.apply_influxdb_parameters_change(grafana_client(), "testPath", params, rotated)
+
+    assert action == agds.RECONCILE_UPDATED
+    method, url = mock_request.call_args[0]
+    assert (method, url) == ("PUT", "https://localhost:3000/api/datasources/7")
+    updated = json.loads(mock_request.call_args[1]["data"])
+    assert updated["secureJsonData"] == {"token": "rotatedToken"}
+    assert "secureJsonFields" not in updated
+    assert updated["jsonData"][agds.DATA_SOURCE_CONFIG_HASH_KEY] != \
+        existing["jsonData"][agds.DATA_SOURCE_CONFIG_HASH_KEY]
+
+
+def test_apply_other_parameter_changes(mocker):
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='http')
+    mock_reconcile = mocker.patch('src.addGrafanaDataSources.reconcile_datasource',
+                                  return_value=agds.RECONCILE_UPDATED)
+    mock_secure = mocker.patch('src.addGrafanaDataSources.update_datasource_secure_fields')
+
+    assert agds.apply_influxdb_parameters_change(grafana_client(), "testPath", params, dict(params)) == \
+        agds.RECONCILE_UNCHANGED
+    assert agds.apply_influxdb_parameters_change(grafana_client(), "testPath", params,
+                                                 dict(params, InfluxDBBucket="other")) == agds.RECONCILE_UPDATED
+    assert mock_reconcile.call_count == 1
+    assert mock_secure.call_count == 0
+
+
+def test_apply_certs_change(mocker):
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='https')
+    mock_secure = mocker.patch('src.addGrafanaDataSources.update_datasource_secure_fields',
+                               side_effect=[agds.RECONCILE_UPDATED, agds.RECONCILE_UPDATED,
+                                            grafanaClient.GrafanaRequestError("PUT", "/api/datasources/9", 500)])
+
+    results = agds.apply_influxdb_certs_change(grafana_client(), params, "newCert", "newKey", ["tlsClientKey"],
+                                               [{"name": "raw", "bucket": "raw"}])
+    assert results == [{"name": "InfluxDB", "action": agds.RECONCILE_UPDATED},
+                       {"name": "raw", "action": agds.RECONCILE_UPDATED}]
+    config = mock_secure.call_args[0][1]
+    assert (config["name"], config["jsonData"]["defaultBucket"]) == ("raw", "raw")
+    assert config["secureJsonData"]["tlsClientKey"] == "newKey"
+    assert mock_secure.call_args[0][2] == ["tlsClientKey"]
+
+    with pytest.raises(ValueError, match="Failed to push"):
+        agds.apply_influxdb_certs_change(grafana_client(), params, "newCert", "newKey", ["tlsClientKey"])
+
+
+def test_secure_field_update_creates_missing_datasource(mocker):
+    mock_request = mocker.patch('requests.Session.request', side_effect=[grafana_response(404),
+                                                                         grafana_response(200)])
+    assert agds.update_datasource_secure_fields(grafana_client(), http_publish_json, ["token"]) == \
+        agds.RECONCILE_CREATED
+    assert mock_request.call_args[0][0] == "POST"
+
+
+def test_create_datasource_config_overrides():
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='http')
+    output = agds.create_influxdb_datasource_config(params, "", "", name="InfluxDB-raw", bucket="raw")
+    assert output["name"] == "InfluxDB-raw"
+    assert output["jsonData"]["organization"] == "greengrass"
+    assert output["jsonData"]["defaultBucket"] == "raw"
+
+    output = agds.create_influxdb_datasource_config(params, "", "", org="other")
+    assert output["name"] == "InfluxDB"
+    assert output["jsonData"]["organization"] == "other"
+    assert output["jsonData"]["defaultBucket"] == "greengrass-telemetry"
+
+    output = agds.create_influxdb_datasource_config(params, "", "", url="http://172.17.0.1:8087")
+    assert output["url"] == "http://172.17.0.1:8087"
+
+
+def test_create_datasource_config_profile_options():
+    options = {"timeInterval": "30s", "maxSeries": 100, "timeout": 30, "httpMode": "POST"}
+    for protocol in ("http", "https"):
+        params = dict(testInfluxDBParams, InfluxDBServerProtocol=protocol)
+        output = agds.create_influxdb_datasource_config(params, "", "", options=options)
+        assert {k: output["jsonData"][k] for k in options} == options
+        assert output["jsonData"]["version"] == "Flux"
+
+    # A different profile means a different config, so reconciling pushes it to existing datasources
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol="http")
+    assert (agds.compute_datasource_config_hash(agds.create_influxdb_datasource_config(params, "", "", options=options))
+            != agds.compute_datasource_config_hash(agds.create_influxdb_datasource_config(params, "", "")))
+    assert agds.datasource_spec_options({"name": "raw"}, options) == options
+    assert agds.datasource_spec_options({"name": "raw", "profile": "none"}, options) == {}
+
+
+def test_parse_datasource_specs():
+    assert agds.parse_datasource_specs("") == []
+    assert agds.parse_datasource_specs("[]") == []
+    specs = agds.parse_datasource_specs('[{"name": "raw", "bucket": "raw"}, {"name": "other", "org": "o"}]')
+    assert specs == [{"name": "raw", "bucket": "raw"}, {"name": "other", "org": "o"}]
+    assert agds.parse_datasource_specs('[{"name": "raw", "profile": "edge-large"}]')[0]["profile"] == "edge-large"
+
+    for invalid, message in [('{"name": "raw"}', "must be a JSON list"),
+                             ('[{"bucket": "raw"}]', "needs a name"),
+                             ('[{"name": "raw", "buckets": "raw"}]', "Unknown datasource spec fields"),
+                             ('[{"name": "raw"}, {"name": "raw"}]', "Duplicate datasource name"),
+                             ('[{"name": "raw", "profile": "tiny"}]', "Unknown datasource profile")]:
+        with pytest.raises(ValueError, match=message):
+            agds.parse_datasource_specs(invalid)
+
+
+def test_add_influxdb_datasources_in_parallel(mocker):
+    params = dict(testInfluxDBParams, InfluxDBServerProtocol='http')
+    specs = [{"name": "InfluxDB-{}".format(i), "bucket": "bucket{}".format(i)} for i in range(12)]
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+
+    def reconcile(grafana_client, config):
+        with lock:
+            in_flight.append(config["name"])
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.remove(config["name"])
+        if config["name"] == "InfluxDB-3":
+            raise grafanaClient.GrafanaRequestError("POST", "/api/datasources", 500)
+        return agds.RECONCILE_CREATED
+
+    mocker.patch('src.addGrafanaDataSources.reconcile_datasource', side_effect=reconcile)
+    start = time.monotonic()
+    results = agds.add_influxdb_datasources_to_grafana(grafana_client(), "testPath", params, specs, max_workers=4)
+    elapsed = time.monotonic() - start
+
+    assert [r["name"] for r in results] == [s["name"] for s in specs]
+    assert results[3]["action"] == agds.RECONCILE_FAILED
+    assert all(r["action"] == agds.RECONCILE_CREATED for i, r in enumerate(results) if i != 3)
+    assert all(r["latency"] >= 0.05 for r in results)
+    assert max(max_in_flight) <= 4
+    # 12 datasources on 4 workers take three rounds rather than twelve
+    assert elapsed < 0.4
+
+
+def test_add_no_additional_datasources(mocker):
+    mock_reconcile = mocker.patch('src.addGrafanaDataSources.reconcile_datasource')
+    assert agds.add_influxdb_datasources_to_grafana(grafana_client(), "testPath", testInfluxDBParams, []) == []
+    assert mock_reconcile.call_count == 0
@@ -0,0 +1,26 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+
+sys.path.append("benchmark/")
+import benchmarkProvisioning  # noqa: E402
+
+
+def test_benchmark_smoke(tmp_path):
+    output = tmp_path / "results.json"
+    report = benchmarkProvisioning.main(["--sizes", "1,3", "--repeat", "1", "--ipc_delay", "0",
+                                         "--output", str(output)])
+
+    assert json.loads(output.read_text()) == json.loads(json.dumps(report))
+    assert [(s["size"], s["run"]) for s in report["summary"]] == [(1, "cold"), (1, "warm"), (3, "cold"), (3, "warm")]
+    cold, warm = report["results"][2:4]
+    # One datasource lookup/creation and one dashboard push per item on a cold Grafana
+    assert cold["grafana_requests_by_endpoint"]["create_datasource"] == 3
+    assert cold["grafana_requests_by_endpoint"]["push_dashboard"] == 3
+    # Nothing changed in between, so the second run only reads
+    assert "create_datasource" not in warm["grafana_requests_by_endpoint"]
+    assert "push_dashboard" not in warm["grafana_requests_by_endpoint"]
+    assert cold["ipc_connections"] == warm["ipc_connections"] == 1
+    assert cold["grafana_connections"] <= 5
@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+
+import pytest
+
+sys.path.append("benchmark/")
+import benchmarkQueries  # noqa: E402
+import fluxEngine  # noqa: E402
+
+NS = fluxEngine.NS
+
+
+def test_benchmark_smoke(tmp_path):
+    output = tmp_path / "results.json"
+    report = benchmarkQueries.main(["--devices", "2", "--interval", "10s", "--history", "1h", "--time_range", "1h",
+                                    "--profiles", "none,edge-small", "--tiers", '[{"every": "5m", "retention": "0s"}]',
+                                    "--repeat", "1", "--output", str(output)])
+
+    assert json.loads(output.read_text()) == json.loads(json.dumps(report))
+    assert report["ingest"]["points"] == 2 * 360 * len(benchmarkQueries.TELEMETRY_METRICS)
+    assert [(s["profile"], s["datasource"], s["window_period"]) for s in report["summary"]] == [
+        ("none", "InfluxDB", 5), ("none", "InfluxDB-5m", 5), ("edge-small", "InfluxDB", 30),
+        ("edge-small", "InfluxDB-5m", 30)]
+    raw, rollup, raw_small, _ = report["summary"]
+    assert all(s["errors"] == 0 and s["series_max"] == 2 for s in report["summary"])
+    # The rollup and a longer minimum interval both return fewer points than the raw bucket
+    assert rollup["bytes_per_refresh"] < raw["bytes_per_refresh"]
+    assert raw_small["rows_per_refresh"] < raw["rows_per_refresh"]
+    # The panel without aggregateWindow returns every raw point whatever the profile
+    raw_panels = [r for r in report["results"] if r["panel"] == "Open file descriptors (raw)" and r["bucket"] ==
+                  raw["bucket"]]
+    assert [r["rows"] for r in raw_panels] == [720, 720]
+
+
+def test_flux_engine():
+    store = fluxEngine.PointStore(clock=lambda: 3600)
+    store.write("telemetry", "\n".join(["cpu,device=a V=1 0", "cpu,device=a V=3 30", "cpu,device=a V=5 60",
+                                        "cpu,device=b V=10 30", "mem,device=a V=100 30"]), precision="s")
+
+    tables = fluxEngine.evaluate(store, 'from(bucket: "telemetry")\n  |> range(start: -1h)\n'
+                                        '  |> filter(fn: (r) => r._measurement == "cpu" and r.device == "a")\n'
+                                        '  |> aggregateWindow(every: 1m, fn: mean, createEmpty: false)')
+    assert [(t.tags, t.times, t.values) for t in tables] == [((("device", "a"),), [60 * NS, 120 * NS], [2.0, 5.0])]
+    assert fluxEngine.render_csv(tables).split("\r\n")[:2] == [
+        ",result,table,_start,_stop,_time,_value,_field,_measurement,device",
+        ",_result,0,1970-01-01T00:00:00Z,1970-01-01T01:00:00Z,1970-01-01T00:01:00Z,2.0,V,cpu,a"]
+
+    tables = fluxEngine.evaluate(store, 'from(bucket: "telemetry") |> range(start: 0) |> filter(fn: (r) => r._value > 4)'
+                                        ' |> last()')
+    assert sorted((t.measurement, t.values[0]) for t in tables) == [("cpu", 5.0), ("cpu", 10.0), ("mem", 100.0)]
+
+    with pytest.raises(ValueError, match="unbounded"):
+        fluxEngine.evaluate(store, 'from(bucket: "telemetry") |> last()')
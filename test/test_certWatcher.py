@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+import src.certWatcher as certWatcher
+
+sys.path.append("src/")
+
+
+def pem(label, body):
+    return "-----BEGIN {0}-----\n{1}\n-----END {0}-----\n".format(label, body)
+
+
+def write(path, content):
+    # Replace the file the way cert generators usually do, through a rename
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+@pytest.fixture
+def cert_paths(tmp_path):
+    cert = str(tmp_path / "influxdb.crt")
+    key = str(tmp_path / "influxdb.key")
+    write(cert, pem("CERTIFICATE", "cert1"))
+    write(key, pem("PRIVATE KEY", "key1"))
+    return cert, key
+
+
+def test_cert_file_is_only_read_when_changed(cert_paths):
+    cert_file = certWatcher.CertFile(cert_paths[0])
+    assert cert_file.refresh()
+    assert cert_file.content == pem("CERTIFICATE", "cert1")
+    for _ in range(5):
+        assert not cert_file.refresh()
+    assert cert_file.read_count == 1
+
+    write(cert_paths[0], pem("CERTIFICATE", "cert2"))
+    assert cert_file.refresh()
+    assert cert_file.content == pem("CERTIFICATE", "cert2")
+
+    # Same content in a new file: read once more, but not reported as a change
+    write(cert_paths[0], pem("CERTIFICATE", "cert2"))
+    assert not cert_file.refresh()
+    assert cert_file.read_count == 3
+
+
+def test_cert_file_ignores_incomplete_and_missing_files(cert_paths):
+    cert_file = certWatcher.CertFile(cert_paths[0])
+    cert_file.refresh()
+    write(cert_paths[0], "-----BEGIN CERTIFICATE-----\nhalf")
+    assert not cert_file.refresh()
+    os.remove(cert_paths[0])
+    assert not cert_file.refresh()
+    assert cert_file.content == pem("CERTIFICATE", "cert1")
+
+
+def run_watcher(watcher):
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop_event,), daemon=True)
+    thread.start()
+    return stop_event, thread
+
+
+def wait_for(condition, timeout=5):
+    end_time = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end_time:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher_pushes_only_the_changed_field(cert_paths, use_inotify):
+    changes = []
+    watcher = certWatcher.CertWatcher(*cert_paths, lambda changed, material: changes.append((changed, material)),
+                                      poll_interval=0.05, debounce=0.05, use_inotify=use_inotify)
+    stop_event, thread = run_watcher(watcher)
+    try:
+        time.sleep(0.2)
+        assert changes == []
+        write(cert_paths[1], pem("PRIVATE KEY", "key2"))
+        assert wait_for(lambda: changes)
+    finally:
+        stop_event.set()
+        thread.join()
+
+    changed, material = changes[0]
+    assert changed == {certWatcher.KEY_FIELD: pem("PRIVATE KEY", "key2")}
+    assert material == {certWatcher.CERT_FIELD: pem("CERTIFICATE", "cert1"),
+                        certWatcher.KEY_FIELD: pem("PRIVATE KEY", "key2")}
+
+
+def test_watcher_falls_back_to_polling(cert_paths, mocker):
+    mocker.patch("src.certWatcher.Inotify", side_effect=OSError("not supported"))
+    watcher = certWatcher.CertWatcher(*cert_paths, None)
+    assert watcher._open_inotify() is None
+
+
+def test_watcher_retries_failed_push(cert_paths):
+    calls = []
+
+    def on_change(changed, material):
+        calls.append(changed)
+        if len(calls) == 1:
+            raise ValueError("Grafana is down")
+
+    watcher = certWatcher.CertWatcher(*cert_paths, on_change, poll_interval=0.05, debounce=0, use_inotify=False)
+    stop_event, thread = run_watcher(watcher)
+    try:
+        time.sleep(0.1)
+        write(cert_paths[0], pem("CERTIFICATE", "cert2"))
+        assert wait_for(lambda: watcher.change_count == 1)
+    finally:
+        stop_event.set()
+        thread.join()
+
+    assert calls[0] == calls[1] == {certWatcher.CERT_FIELD: pem("CERTIFICATE", "cert2")}
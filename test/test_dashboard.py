@@ -2,12 +2,49 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import argparse
+import json
+import runpy
+import subprocess
 import sys
+import threading
+import time
 import pytest
+from unittest.mock import ANY
 
 sys.path.append("src/")
 
 
+def test_optional_feature_defaults(mocker):
+    import src.dashboard as dashboard
+    import certWatcher
+    import downsamplingTiers
+    import grafanaProvisioning
+    import metricsServer
+    import paramsCache
+    import queryProxy
+    import selfTelemetry
+    import tokenRotationWatcher
+
+    mocker.patch.object(sys, "argv", ["dashboard.py", "--subscribe_topic", "s", "--publish_topic", "p", "--mount_path",
+                                      "m", "--grafana_secret_arn", "a", "--skip_tls_verify", "true", "--grafana_port",
+                                      "3000", "--grafana_server_protocol", "https"])
+    args = dashboard.parse_arguments()
+    # The defaults are spelled out in dashboard.py so that these modules aren't imported to parse the arguments
+    assert (args.token_rotation_debounce, args.cert_poll_interval) == (tokenRotationWatcher.DEBOUNCE,
+                                                                       certWatcher.POLL_INTERVAL)
+    assert args.provisioning_mode == grafanaProvisioning.API_MODE
+    assert args.grafana_provisioning_path == grafanaProvisioning.GRAFANA_PROVISIONING_PATH
+    assert args.downsampling_access_level == downsamplingTiers.ADMIN_ACCESS
+    assert args.params_cache_ttl == paramsCache.TTL
+    assert (args.telemetry_access_level, args.telemetry_flush_interval) == (selfTelemetry.WRITE_ACCESS,
+                                                                            selfTelemetry.FLUSH_INTERVAL)
+    assert (args.query_proxy_port, args.query_proxy_bind, args.query_proxy_url, args.query_proxy_ttl,
+            args.query_proxy_alignment, args.query_proxy_max_bytes) == (
+        queryProxy.PORT, queryProxy.BIND_ADDRESS, queryProxy.DATASOURCE_URL, queryProxy.TTL, queryProxy.ALIGNMENT,
+        queryProxy.MAX_BYTES)
+    assert (args.metrics_port, args.metrics_bind) == (metricsServer.PORT, metricsServer.BIND_ADDRESS)
+
+
 def test_parse_valid_args(mocker):
     mock_parse_args = mocker.patch(
         "argparse.ArgumentParser.parse_args", return_value=argparse.Namespace(
@@ -40,3 +77,548 @@ def test_parse_no_args(mocker):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
         dashboard.parse_arguments()
     assert pytest_wrapped_e.type == SystemExit
+
+
+def bootstrap_args(bootstrap_mode):
+    return argparse.Namespace(
+        subscribe_topic="test/subscribe",
+        publish_topic="test/publish",
+        mount_path="test_path",
+        grafana_secret_arn="testarn",
+        grafana_port="3000",
+        grafana_server_protocol="https",
+        skip_tls_verify="true",
+        token_request_initial_backoff=1,
+        token_request_max_backoff=15,
+        token_request_deadline=150,
+        bootstrap_mode=bootstrap_mode,
+        grafana_ready_deadline=120,
+        retry_policies="",
+        startup_deadline=0,
+        reconcile_datasource="false",
+        daemon="false",
+        token_rotation_debounce=2,
+        cert_poll_interval=5,
+        dashboards_dir="",
+        dashboard_workers=4,
+        plan="false",
+        apply="false",
+        flux_lint="off",
+        provisioning_mode="api",
+        provisioning_dir="",
+        grafana_provisioning_path="/etc/grafana/provisioning",
+        datasources="",
+        datasource_workers=4,
+        datasource_profile="none",
+        downsampling_tiers="",
+        downsampling_access_level="Admin",
+        params_cache="false",
+        params_cache_ttl=86400,
+        params_cache_encrypt="true",
+        telemetry_bucket="",
+        telemetry_access_level="RW",
+        query_proxy="false",
+        query_proxy_port=0,
+        query_proxy_bind="127.0.0.1",
+        query_proxy_url="http://172.17.0.1:8087",
+        query_proxy_ttl=30,
+        query_proxy_alignment=10,
+        query_proxy_max_bytes=1024 * 1024
+    )
+
+
+def slow_phase(result):
+    def phase(*args, **kwargs):
+        time.sleep(0.2)
+        return result
+    return phase
+
+
+@pytest.mark.parametrize("bootstrap_mode", ["concurrent", "sequential"])
+def test_bootstrap(mocker, bootstrap_mode):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", side_effect=slow_phase({"grafana_username": "user"}))
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", side_effect=slow_phase({"InfluxDBOrg": "org"}))
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", side_effect=slow_phase(0.2))
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    # requests is imported on first use; load it up front so that only the phases are timed
+    import requests  # noqa: F401
+
+    phase_timings = dashboard.bootstrap(bootstrap_args(bootstrap_mode))
+
+    mock_add.assert_called_once_with("test_path", {"grafana_username": "user"}, {"InfluxDBOrg": "org"}, "3000",
+                                     "https", False, grafana_client=ANY, reconcile=False, options={}, url=None)
+    assert set(phase_timings) == {"retrieve_secret", "retrieve_influxdb_params", "wait_for_grafana",
+                                  "add_influxdb_datasource", "total"}
+    if bootstrap_mode == "concurrent":
+        # The independent phases overlap, so the total is bounded by the slowest one
+        assert phase_timings["total"] < 0.35
+    else:
+        assert phase_timings["total"] >= 0.6
+
+
+def test_bootstrap_phase_failure(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", side_effect=ValueError("test"))
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", side_effect=slow_phase({}))
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", side_effect=slow_phase(0.2))
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+
+    with pytest.raises(ValueError, match="test"):
+        dashboard.bootstrap(bootstrap_args("concurrent"))
+    assert mock_add.call_count == 0
+
+
+EXIT_ON_PHASE_FAILURE = """
+import sys, time
+sys.path.insert(0, "src")
+import dashboard
+
+def fail():
+    raise ValueError("test")
+
+try:
+    dashboard.run_independent_phases([("fail", fail, (), {}), ("slow", time.sleep, (5,), {})], {}, "concurrent")
+except ValueError:
+    sys.exit(1)
+"""
+
+
+def test_phase_failure_exits_promptly():
+    start = time.monotonic()
+    process = subprocess.run([sys.executable, "-c", EXIT_ON_PHASE_FAILURE], stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    assert process.returncode == 1
+    # The process doesn't wait for the phase that is still running
+    assert time.monotonic() - start < 3
+
+
+def test_bootstrap_daemon(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mock_retrieve = mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBOrg": "org"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_run = mocker.patch("tokenRotationWatcher.TokenRotationWatcher.run")
+
+    args = bootstrap_args("concurrent")
+    args.daemon = "true"
+    stop_event = threading.Event()
+    dashboard.bootstrap(args, stop_event)
+
+    retrieve_kwargs = mock_retrieve.call_args[1]
+    assert retrieve_kwargs["keep_subscription"]
+    assert retrieve_kwargs["handler"] is not None
+    # Daemon mode always reconciles, since an existing datasource must not end the process
+    assert mock_add.call_args[1]["reconcile"]
+    mock_run.assert_called_once_with(stop_event)
+
+
+def test_watch_token_rotation_applies_changes(mocker):
+    import src.dashboard as dashboard
+
+    mock_apply = mocker.patch("addGrafanaDataSources.apply_influxdb_parameters_change", return_value="updated")
+
+    def run(watcher, stop_event):
+        watcher.on_rotation({"InfluxDBToken": "old"}, {"InfluxDBToken": "new"})
+
+    mocker.patch("tokenRotationWatcher.TokenRotationWatcher.run", autospec=True, side_effect=run)
+    mocker.patch("signal.signal")
+    grafana_client = object()
+    dashboard.watch_token_rotation(bootstrap_args("concurrent"), grafana_client, None, {})
+    mock_apply.assert_called_once_with(grafana_client, "test_path", {"InfluxDBToken": "old"}, {"InfluxDBToken": "new"},
+                                       options={}, url=None)
+
+
+def test_watch_token_rotation_watches_certs(mocker):
+    import src.dashboard as dashboard
+
+    mock_apply_certs = mocker.patch("addGrafanaDataSources.apply_influxdb_certs_change")
+
+    def run(watcher, stop_event):
+        watcher.on_change({"tlsClientKey": "newKey"}, {"tlsClientCert": "cert", "tlsClientKey": "newKey"})
+
+    mocker.patch("certWatcher.CertWatcher.run", autospec=True, side_effect=run)
+    mocker.patch("tokenRotationWatcher.TokenRotationWatcher.run")
+    grafana_client = object()
+    parameters = {"InfluxDBServerProtocol": "https"}
+    dashboard.watch_token_rotation(bootstrap_args("concurrent"), grafana_client, None, parameters,
+                                   stop_event=threading.Event())
+    mock_apply_certs.assert_called_once_with(grafana_client, parameters, "cert", "newKey", ["tlsClientKey"], None,
+                                             options={}, url=None)
+
+
+def test_provision_dashboards(mocker, tmp_path):
+    import src.dashboard as dashboard
+
+    args = bootstrap_args("concurrent")
+    args.mount_path = str(tmp_path)
+    args.dashboards_dir = "dashboards"
+    mock_provision = mocker.patch("provisionDashboards.provision_dashboards", return_value={"pushed": ["a"]})
+    mocker.patch("addGrafanaDataSources.get_influxdb_datasource", return_value={"uid": "influxUid"})
+
+    assert dashboard.provision_dashboards(args, None) == {"pushed": [], "skipped": [], "failed": []}
+    assert mock_provision.call_count == 0
+
+    (tmp_path / "dashboards").mkdir()
+    assert dashboard.provision_dashboards(args, None) == {"pushed": ["a"]}
+    mock_provision.assert_called_once_with(None, str(tmp_path / "dashboards"), "InfluxDB", "influxUid",
+                                           max_workers=4, flux_lint="off")
+
+
+def test_bootstrap_additional_datasources(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBOrg": "org"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_fan_out = mocker.patch("addGrafanaDataSources.add_influxdb_datasources_to_grafana", return_value=[])
+
+    args = bootstrap_args("concurrent")
+    args.datasources = '[{"name": "raw", "bucket": "raw"}]'
+    phase_timings = dashboard.bootstrap(args)
+
+    assert "add_additional_datasources" in phase_timings
+    mock_fan_out.assert_called_once_with(ANY, "test_path", {"InfluxDBOrg": "org"}, [{"name": "raw", "bucket": "raw"}],
+                                         max_workers=4, options={}, url=None)
+
+
+def test_bootstrap_invalid_datasources(mocker):
+    import src.dashboard as dashboard
+
+    mock_retrieve = mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params")
+    args = bootstrap_args("concurrent")
+    args.datasources = '[{"bucket": "raw"}]'
+    with pytest.raises(ValueError, match="needs a name"):
+        dashboard.bootstrap(args)
+    assert mock_retrieve.call_count == 0
+
+
+def test_bootstrap_retry_policies(mocker):
+    import src.dashboard as dashboard
+    import retryPolicy
+
+    mock_retrieve = mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params")
+    args = bootstrap_args("concurrent")
+    args.retry_policies = '{"grafana": {"attempts": 2}}'
+    with pytest.raises(ValueError, match="Unknown retry policy fields"):
+        dashboard.bootstrap(args)
+    assert mock_retrieve.call_count == 0
+
+    args.retry_policies = '{"ipc": {"max_attempts": 5}}'
+    args.startup_deadline = 60
+    policies = dashboard.configure_retries(args)
+    assert policies["ipc"].max_attempts == 5
+    assert 59 < retryPolicy.budget().remaining() <= 60
+
+
+def test_bootstrap_plan(mocker):
+    import src.dashboard as dashboard
+    import grafanaPlan
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret",
+                 return_value={"grafana_username": "user", "grafana_password": "password"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                 return_value={"InfluxDBServerProtocol": "http", "InfluxDBContainerName": "influxdb",
+                               "InfluxDBOrg": "org", "InfluxDBBucket": "telemetry", "InfluxDBToken": "token"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_fetch = mocker.patch("grafanaPlan.fetch_state", return_value=grafanaPlan.GrafanaState())
+    mock_apply = mocker.patch("grafanaPlan.apply_plan", return_value=[])
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_serve = mocker.patch("src.dashboard.serve")
+
+    args = bootstrap_args("concurrent")
+    args.datasources = '[{"name": "raw", "bucket": "raw"}]'
+    args.plan = "true"
+    phase_timings = dashboard.bootstrap(args)
+    assert "plan_grafana" in phase_timings and "apply_grafana_plan" not in phase_timings
+    assert mock_fetch.call_count == 1
+    # A dry run neither writes to Grafana nor keeps running
+    assert mock_apply.call_count == 0 and mock_add.call_count == 0 and mock_serve.call_count == 0
+
+    args.plan = "false"
+    args.apply = "true"
+    phase_timings = dashboard.bootstrap(args)
+    assert "apply_grafana_plan" in phase_timings and mock_add.call_count == 0
+    changes = mock_apply.call_args[0][1]
+    assert [(change.name, change.action) for change in changes] == [("InfluxDB", "create"), ("raw", "create")]
+    assert mock_apply.call_args[1] == {"max_workers": 4, "required": ["InfluxDB"]}
+
+    args.plan = "true"
+    with pytest.raises(ValueError, match="Plan mode"):
+        dashboard.bootstrap(args)
+
+
+def test_bootstrap_warm_start(mocker, tmp_path):
+    import src.dashboard as dashboard
+    import paramsCache
+
+    secrets = {"grafana_username": "user", "grafana_password": "pass"}
+    cache = paramsCache.ParamsCache(str(tmp_path / paramsCache.CACHE_RELATIVE_PATH))
+    cache.store({"InfluxDBToken": "cached"}, secrets)
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value=secrets)
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", side_effect=slow_phase({"InfluxDBToken": "fresh"}))
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_apply = mocker.patch("addGrafanaDataSources.apply_influxdb_parameters_change", return_value="updated")
+
+    args = bootstrap_args("concurrent")
+    args.mount_path = str(tmp_path)
+    args.params_cache = "true"
+    phase_timings = dashboard.bootstrap(args)
+
+    # Grafana is provisioned from the cache without waiting for the token exchange
+    assert mock_add.call_args[0][2] == {"InfluxDBToken": "cached"}
+    assert phase_timings["ready"] < 0.2
+    mock_apply.assert_called_once_with(ANY, str(tmp_path), {"InfluxDBToken": "cached"}, {"InfluxDBToken": "fresh"},
+                                       options={}, url=None)
+    assert cache.load(secrets) == {"InfluxDBToken": "fresh"}
+
+
+def test_bootstrap_cold_start_fills_cache(mocker, tmp_path):
+    import src.dashboard as dashboard
+    import paramsCache
+
+    secrets = {"grafana_username": "user", "grafana_password": "pass"}
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value=secrets)
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBToken": "fresh"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_apply = mocker.patch("addGrafanaDataSources.apply_influxdb_parameters_change")
+
+    args = bootstrap_args("sequential")
+    args.mount_path = str(tmp_path)
+    args.params_cache = "true"
+    dashboard.bootstrap(args)
+
+    assert mock_add.call_args[0][2] == {"InfluxDBToken": "fresh"}
+    assert mock_apply.call_count == 0
+    cache = paramsCache.ParamsCache(str(tmp_path / paramsCache.CACHE_RELATIVE_PATH))
+    assert cache.load(secrets) == {"InfluxDBToken": "fresh"}
+
+
+def test_bootstrap_cache_store_failure_is_not_fatal(mocker, tmp_path):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBToken": "fresh"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mocker.patch("paramsCache.ParamsCache.store", side_effect=OSError("read-only file system"))
+
+    args = bootstrap_args("sequential")
+    args.mount_path = str(tmp_path)
+    args.params_cache = "true"
+    assert "total" in dashboard.bootstrap(args)
+    assert mock_add.call_count == 1
+
+
+def test_refresh_failure_after_cache_hit_exits_cleanly(mocker, tmp_path):
+    import paramsCache
+    import retryPolicy
+
+    secrets = {"grafana_username": "user", "grafana_password": "pass"}
+    cache = paramsCache.ParamsCache(str(tmp_path / paramsCache.CACHE_RELATIVE_PATH), encrypt=False)
+    cache.store({"InfluxDBToken": "cached"}, secrets)
+    stored = cache.load(secrets)
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value=secrets)
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                 side_effect=retryPolicy.DeadlineExceededError("retrieve_influxdb_params", 3, 30))
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_store = mocker.patch("paramsCache.ParamsCache.store")
+    mocker.patch.object(sys, "argv", ["dashboard.py", "--subscribe_topic", "test/subscribe", "--publish_topic",
+                                      "test/publish", "--mount_path", str(tmp_path), "--grafana_secret_arn", "testarn",
+                                      "--skip_tls_verify", "true", "--grafana_port", "3000",
+                                      "--grafana_server_protocol", "https", "--params_cache", "true"])
+
+    exit_code = 0
+    try:
+        runpy.run_path("src/dashboard.py", run_name="__main__")
+    except SystemExit as e:
+        exit_code = e.code
+    assert exit_code == 0
+    # Grafana keeps the cached parameters, and the cache isn't stored again
+    assert mock_add.call_args[0][2] == stored
+    assert mock_store.call_count == 0
+
+
+def test_bootstrap_reports_startup_profile(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBOrg": "org"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    profiler = mocker.Mock()
+
+    dashboard.bootstrap(bootstrap_args("concurrent"), profiler=profiler)
+    profiler.stop.assert_called_once_with()
+    profiler.report.assert_called_once_with()
+
+
+def test_bootstrap_records_self_telemetry(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBOrg": "org"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_start = mocker.patch.object(dashboard, "start_self_telemetry")
+    telemetry = mocker.Mock()
+
+    args = bootstrap_args("concurrent")
+    phase_timings = dashboard.bootstrap(args, telemetry=telemetry)
+    telemetry.record.assert_called_once_with("greengrass_dashboard", phase_timings,
+                                             {"event": "bootstrap", "bootstrap_mode": "concurrent"})
+    mock_start.assert_called_once_with(args, telemetry)
+
+
+@pytest.mark.parametrize("telemetry_bucket,bucket", [("", "greengrass-telemetry"), ("metrics", "metrics")])
+def test_start_self_telemetry(mocker, telemetry_bucket, bucket):
+    import src.dashboard as dashboard
+
+    mock_retrieve = mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={
+        "InfluxDBServerProtocol": "https", "InfluxDBInterface": "127.0.0.1", "InfluxDBPort": "8086",
+        "InfluxDBToken": "rwtoken", "InfluxDBOrg": "greengrass", "InfluxDBBucket": "greengrass-telemetry",
+        "InfluxDBSkipTLSVerify": "true"})
+    telemetry = mocker.Mock()
+    args = bootstrap_args("concurrent")
+    args.telemetry_bucket = telemetry_bucket
+
+    dashboard.start_self_telemetry(args, telemetry).join(5)
+    mock_retrieve.assert_called_once_with("test/publish", "test/subscribe", initial_backoff=1, max_backoff=15,
+                                          deadline=30, access_level="RW")
+    telemetry.configure.assert_called_once_with("https://127.0.0.1:8086", "rwtoken", "greengrass", bucket,
+                                                tls_verify=False)
+
+
+def test_start_self_telemetry_failure(mocker):
+    import retryPolicy
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                 side_effect=retryPolicy.DeadlineExceededError("retrieve_influxdb_params", 3, 30))
+    telemetry = mocker.Mock()
+
+    dashboard.start_self_telemetry(bootstrap_args("concurrent"), telemetry).join(5)
+    telemetry.configure.assert_not_called()
+
+
+def test_bootstrap_datasource_profile(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBOrg": "org"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    args = bootstrap_args("concurrent")
+    args.datasource_profile = "edge-small"
+
+    dashboard.bootstrap(args)
+    assert mock_add.call_args[1]["options"] == {"timeInterval": "30s", "maxSeries": 100, "timeout": 30,
+                                                "httpMode": "POST"}
+
+
+def test_bootstrap_downsampling_tiers(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                 return_value={"InfluxDBOrg": "org", "InfluxDBBucket": "telemetry"})
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_fan_out = mocker.patch("addGrafanaDataSources.add_influxdb_datasources_to_grafana")
+    mock_downsampling = mocker.patch.object(dashboard, "provision_downsampling")
+    args = bootstrap_args("concurrent")
+    args.downsampling_tiers = '[{"every": "1m", "retention": "30d"}]'
+
+    phase_timings = dashboard.bootstrap(args)
+    mock_downsampling.assert_called_once_with(args, {"InfluxDBOrg": "org", "InfluxDBBucket": "telemetry"},
+                                              [{"every": "1m", "retention": "30d"}])
+    assert mock_fan_out.call_args[0][3] == [{"name": "InfluxDB-1m", "bucket": "telemetry-1m"}]
+    assert "provision_downsampling" in phase_timings
+
+
+def test_provision_downsampling(mocker):
+    import src.dashboard as dashboard
+    sys.path.append("benchmark/")
+    from fakeInfluxDB import FakeInfluxDBServer
+
+    with FakeInfluxDBServer(token="admintoken") as influxdb:
+        parameters = {"InfluxDBServerProtocol": "http", "InfluxDBInterface": "127.0.0.1", "InfluxDBPort": influxdb.port,
+                      "InfluxDBOrg": "greengrass", "InfluxDBBucket": "greengrass-telemetry",
+                      "InfluxDBSkipTLSVerify": "true"}
+        mock_retrieve = mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                                     return_value=dict(parameters, InfluxDBToken="admintoken"))
+        results = dashboard.provision_downsampling(bootstrap_args("concurrent"), parameters,
+                                                   [{"every": "1m", "retention": "30d"}])
+
+    assert mock_retrieve.call_args[1]["access_level"] == "Admin"
+    assert [(r["bucket_action"], r["task_action"]) for r in results] == [("created", "created")]
+
+
+def test_provision_downsampling_failure(mocker):
+    import retryPolicy
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                 side_effect=retryPolicy.DeadlineExceededError("retrieve_influxdb_params", 3, 30))
+    assert dashboard.provision_downsampling(bootstrap_args("concurrent"), {}, [{"every": "1m"}]) == []
+
+
+def test_bootstrap_query_proxy(mocker):
+    import src.dashboard as dashboard
+
+    parameters = {"InfluxDBServerProtocol": "http", "InfluxDBInterface": "127.0.0.1", "InfluxDBPort": "8086",
+                  "InfluxDBSkipTLSVerify": "false"}
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "user"})
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value=parameters)
+    mocker.patch("grafanaClient.GrafanaClient.wait_until_ready", return_value=0)
+    mock_add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+    mock_stop = mocker.patch("queryProxy.QueryProxy.stop", autospec=True)
+    args = bootstrap_args("concurrent")
+    args.query_proxy = "true"
+    stop_event = threading.Event()
+    stop_event.set()
+
+    dashboard.bootstrap(args, stop_event=stop_event)
+    assert mock_add.call_args[1]["url"] == "http://172.17.0.1:8087"
+    proxy = mock_stop.call_args[0][0]
+    assert proxy.upstream_url == "http://127.0.0.1:8086"
+    assert proxy.cache.max_bytes == 1024 * 1024
+    proxy.shutdown()
+    proxy.server_close()
+
+
+def test_bootstrap_files(mocker, tmp_path):
+    import src.dashboard as dashboard
+
+    mock_grafana = mocker.patch("grafanaClient.GrafanaClient")
+    mock_secret = mocker.patch("retrieveGrafanaSecrets.retrieve_secret")
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params",
+                 return_value={"InfluxDBServerProtocol": "http", "InfluxDBContainerName": "influxdb",
+                               "InfluxDBOrg": "org", "InfluxDBBucket": "telemetry", "InfluxDBToken": "token"})
+    args = bootstrap_args("concurrent")
+    args.mount_path = str(tmp_path)
+    args.provisioning_dir = "provisioning"
+    args.datasources = '[{"name": "raw", "bucket": "raw"}]'
+
+    phase_timings = dashboard.bootstrap_files(args)
+    assert set(phase_timings) == {"retrieve_influxdb_params", "write_provisioning_files", "total"}
+    with open(str(tmp_path / "provisioning" / "datasources" / "greengrass.yaml")) as f:
+        datasources = json.load(f)["datasources"]
+    assert [datasource["name"] for datasource in datasources] == ["InfluxDB", "raw"]
+    assert datasources[0]["secureJsonData"] == {"token": "token"}
+    # Grafana is never called
+    assert mock_grafana.call_count == 0 and mock_secret.call_count == 0
+
+    args.daemon = "true"
+    with pytest.raises(ValueError, match="Daemon mode"):
+        dashboard.bootstrap_files(args)
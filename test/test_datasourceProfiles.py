@@ -0,0 +1,53 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+
+import pytest
+
+import src.datasourceProfiles as datasourceProfiles
+
+sys.path.append("src/")
+
+
+def test_profile_options():
+    assert datasourceProfiles.profile_options("none") == {}
+    assert datasourceProfiles.profile_options("edge-small") == {
+        "timeInterval": "30s", "maxSeries": 100, "timeout": 30, "httpMode": "POST"}
+    assert datasourceProfiles.profile_options("edge-large")["maxSeries"] == 1000
+
+    # Callers may add to the options without changing the profile
+    datasourceProfiles.profile_options("edge-small")["maxSeries"] = 1
+    assert datasourceProfiles.PROFILES["edge-small"]["maxSeries"] == 100
+
+    with pytest.raises(ValueError, match="Unknown datasource profile"):
+        datasourceProfiles.profile_options("edge-tiny")
+
+
+@pytest.mark.parametrize("cpus,memory_mb,profile", [
+    (1, 512, "edge-small"),
+    (4, 1024, "edge-small"),
+    (2, 8192, "edge-small"),
+    (4, 4096, "edge-large"),
+    (None, 4096, "edge-small"),
+    (4, None, "edge-small")
+])
+def test_select_profile(cpus, memory_mb, profile):
+    assert datasourceProfiles.select_profile(cpus, memory_mb) == profile
+
+
+def test_auto_profile(mocker):
+    mocker.patch.object(datasourceProfiles, "device_capacity", return_value=(8, 16384))
+    assert datasourceProfiles.profile_options("auto") == datasourceProfiles.PROFILES["edge-large"]
+
+    mocker.patch.object(datasourceProfiles, "device_capacity", return_value=(1, 1024))
+    assert datasourceProfiles.profile_options("auto") == datasourceProfiles.PROFILES["edge-small"]
+
+
+def test_device_capacity(mocker):
+    cpus, memory_mb = datasourceProfiles.device_capacity()
+    assert cpus >= 1
+    assert memory_mb > 0
+
+    mocker.patch("os.sysconf", side_effect=ValueError("unsupported"))
+    assert datasourceProfiles.device_capacity()[1] is None
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+
+import pytest
+
+import src.downsamplingTiers as downsamplingTiers
+import src.influxdbClient as influxdbClient
+
+sys.path.append("src/")
+sys.path.append("benchmark/")
+from fakeInfluxDB import FakeInfluxDBServer, TOKEN  # noqa: E402
+
+TIERS = '[{"every": "1m", "retention": "30d"}, {"every": "1h", "retention": "0s", "fn": "max", "bucket": "hourly"}]'
+
+
+@pytest.fixture
+def influxdb():
+    with FakeInfluxDBServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(influxdb):
+    with influxdbClient.InfluxDBClient(influxdb.url, TOKEN, True) as influxdb_client:
+        yield influxdb_client
+
+
+def test_parse_tiers():
+    assert downsamplingTiers.parse_tiers("") == []
+    tiers = downsamplingTiers.parse_tiers(TIERS)
+    assert [tier["every"] for tier in tiers] == ["1m", "1h"]
+
+    for invalid, message in [('{"every": "1m"}', "must be a JSON list"),
+                             ('[{"every": "1m"}]', "needs every and retention"),
+                             ('[{"every": "1m", "retention": "30d", "window": "1m"}]', "Unknown downsampling tier"),
+                             ('[{"every": "1 minute", "retention": "30d"}]', "Invalid duration"),
+                             ('[{"every": "1m", "retention": "0d"}]', "Invalid duration"),
+                             ('[{"every": "1m", "retention": "30d", "fn": "stddev"}]', "Unsupported aggregate"),
+                             ('[{"every": "1m", "retention": "1d"}, {"every": "1m", "retention": "2d"}]', "Duplicate")]:
+        with pytest.raises(ValueError, match=message):
+            downsamplingTiers.parse_tiers(invalid)
+
+
+def test_duration_seconds():
+    assert downsamplingTiers.duration_seconds("90s") == 90
+    assert downsamplingTiers.duration_seconds("30d") == 30 * 86400
+    assert downsamplingTiers.duration_seconds("2w") == 14 * 86400
+
+
+def test_tier_datasource_specs():
+    tiers = downsamplingTiers.parse_tiers(TIERS)
+    assert downsamplingTiers.tier_datasource_specs(tiers, "telemetry") == [
+        {"name": "InfluxDB-1m", "bucket": "telemetry-1m"}, {"name": "InfluxDB-1h", "bucket": "hourly"}]
+
+
+def test_create_task_flux():
+    flux = downsamplingTiers.create_task_flux({"every": "1h", "retention": "30d", "fn": "max"}, "greengrass",
+                                              "telemetry")
+    assert 'option task = {name: "greengrass-downsample-telemetry-1h", every: 1h}' in flux
+    assert 'from(bucket: "telemetry")' in flux
+    assert "|> aggregateWindow(every: 1h, fn: max, createEmpty: false)" in flux
+    assert '|> to(bucket: "telemetry-1h", org: "greengrass")' in flux
+
+
+def test_provision_tiers_is_idempotent(influxdb, client):
+    tiers = downsamplingTiers.parse_tiers(TIERS)
+
+    results = downsamplingTiers.provision_tiers(client, "greengrass", "greengrass-telemetry", tiers)
+    assert [(r["bucket"], r["bucket_action"], r["task_action"]) for r in results] == [
+        ("greengrass-telemetry-1m", "created", "created"), ("hourly", "created", "created")]
+    buckets = {b["name"]: b["retentionRules"] for b in influxdb.buckets.values()}
+    assert buckets["greengrass-telemetry-1m"] == [{"type": "expire", "everySeconds": 30 * 86400}]
+    assert buckets["hourly"] == []
+    assert sorted(t["name"] for t in influxdb.tasks.values()) == ["greengrass-downsample-greengrass-telemetry-1m",
+                                                                  "greengrass-downsample-hourly"]
+
+    influxdb.requests.clear()
+    results = downsamplingTiers.provision_tiers(client, "greengrass", "greengrass-telemetry", tiers)
+    assert {(r["bucket_action"], r["task_action"]) for r in results} == {("unchanged", "unchanged")}
+    assert set(influxdb.requests) == {"list_orgs", "list_buckets", "list_tasks"}
+    assert len(influxdb.tasks) == 2
+
+
+def test_provision_tiers_updates_changed_tiers(influxdb, client):
+    downsamplingTiers.provision_tiers(client, "greengrass", "greengrass-telemetry",
+                                      downsamplingTiers.parse_tiers('[{"every": "1m", "retention": "30d"}]'))
+    task = next(iter(influxdb.tasks.values()))
+    task["status"] = "inactive"
+
+    results = downsamplingTiers.provision_tiers(client, "greengrass", "greengrass-telemetry", downsamplingTiers.parse_tiers(
+        '[{"every": "1m", "retention": "7d", "fn": "last"}]'))
+    assert (results[0]["bucket_action"], results[0]["task_action"]) == ("updated", "updated")
+    assert task["status"] == "active"
+    assert "fn: last" in task["flux"]
+    assert len(influxdb.tasks) == 1
+    bucket = [b for b in influxdb.buckets.values() if b["name"] == "greengrass-telemetry-1m"][0]
+    assert bucket["retentionRules"] == [{"type": "expire", "everySeconds": 7 * 86400}]
+
+
+def test_provision_tiers_failure(influxdb, client, mocker):
+    tiers = downsamplingTiers.parse_tiers(TIERS)
+    mocker.patch.object(downsamplingTiers, "reconcile_task", side_effect=[ValueError("test"), "created"])
+
+    results = downsamplingTiers.provision_tiers(client, "greengrass", "greengrass-telemetry", tiers)
+    # A failing tier doesn't prevent the next one from being provisioned
+    assert [(r["bucket_action"], r["task_action"]) for r in results] == [("created", "failed"), ("created", "created")]
+
+    with pytest.raises(ValueError, match="org other does not exist"):
+        downsamplingTiers.provision_tiers(client, "other", "greengrass-telemetry", tiers)
+
+
+def test_influxdb_client_errors(influxdb):
+    with influxdbClient.InfluxDBClient(influxdb.url, "rotoken", True) as client:
+        with pytest.raises(ValueError, match="status code 401"):
+            client.call("GET", "/api/v2/orgs")
+
+
+def test_influxdb_url():
+    assert influxdbClient.influxdb_url({"InfluxDBServerProtocol": "https", "InfluxDBInterface": "localhost",
+                                        "InfluxDBPort": "8086"}) == "https://localhost:8086"
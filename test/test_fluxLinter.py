@@ -0,0 +1,116 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+
+import src.fluxLinter as fluxLinter
+
+sys.path.append("src/")
+
+WINDOWED_QUERY = """from(bucket: "telemetry")
+  |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+  |> filter(fn: (r) => r._measurement == "cpu")
+  |> aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)"""
+RAW_QUERY = """from(bucket: "telemetry")
+  |> range(start: -30d)
+  |> filter(fn: (r) => r._measurement == "cpu")
+  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+  |> filter(fn: (r) => r._time > 2021-01-01T00:00:00Z)"""
+
+
+def rules(findings):
+    return [finding["rule"] for finding in findings]
+
+
+def test_split_statements():
+    flux = 'import "strings"\n// a comment |> with a pipe\ndata = from(bucket: "b")\n  |> range(start: -1h)\n' \
+           'data |> yield(name: "a\\"|>")\n'
+    statements = fluxLinter.split_statements(flux)
+    assert "".join(statements) == flux
+    assert [s.strip().split("\n")[-1].strip() for s in statements] == [
+        'import "strings"', '// a comment |> with a pipe', '|> range(start: -1h)', 'data |> yield(name: "a\\"|>")']
+    assert fluxLinter.split_pipeline(statements[2]) == ("data = ", ['from(bucket: "b")', "range(start: -1h)"])
+
+
+def test_window_aware_query_is_clean():
+    assert fluxLinter.lint_flux(WINDOWED_QUERY, fix=True) == (WINDOWED_QUERY, [])
+    # A reducer bounds the points returned just as well
+    assert fluxLinter.lint_flux(WINDOWED_QUERY.rsplit("\n", 1)[0] + "\n  |> last()")[1] == []
+
+
+def test_lint_report_only():
+    flux, findings = fluxLinter.lint_flux(RAW_QUERY)
+    assert flux == RAW_QUERY
+    assert rules(findings) == ["fixed-range", "missing-window-period", "pivot-before-filter"]
+    assert not any(finding["fixed"] for finding in findings)
+    assert fluxLinter.cost_class(findings) == "high"
+
+
+def test_lint_rewrites_window_aware_forms():
+    flux, findings = fluxLinter.lint_flux(RAW_QUERY, fix=True)
+    assert all(finding["fixed"] for finding in findings)
+    assert flux == """from(bucket: "telemetry")
+  |> range(start: v.timeRangeStart, stop: v.timeRangeStop)
+  |> filter(fn: (r) => r._measurement == "cpu")
+  |> aggregateWindow(every: v.windowPeriod, fn: mean, createEmpty: false)
+  |> filter(fn: (r) => r._time > 2021-01-01T00:00:00Z)
+  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")"""
+    assert fluxLinter.lint_flux(flux) == (flux, [])
+
+
+def test_lint_unbounded_and_fixed_window():
+    flux, findings = fluxLinter.lint_flux('from(bucket: "b") |> aggregateWindow(every: 1m, fn: max)', fix=True)
+    assert rules(findings) == ["unbounded-range", "missing-window-period"]
+    assert flux == 'from(bucket: "b")\n  |> range(start: v.timeRangeStart, stop: v.timeRangeStop)\n' \
+                   '  |> aggregateWindow(every: v.windowPeriod, fn: max)'
+    assert rules(fluxLinter.lint_flux('from(bucket: "b") |> range(start: 0) |> last()')[1]) == ["unbounded-range"]
+
+
+def test_pivot_filters_on_fields_are_not_moved():
+    flux = WINDOWED_QUERY + '\n  |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")' \
+                            '\n  |> filter(fn: (r) => r.usage > 5)'
+    fixed, findings = fluxLinter.lint_flux(flux, fix=True)
+    assert fixed == flux
+    assert rules(findings) == ["pivot-before-filter"] and not findings[0]["fixed"]
+
+
+def test_variable_pipelines():
+    flux = 'data = from(bucket: "b")\n  |> range(start: v.timeRangeStart)\n' \
+           'data |> aggregateWindow(every: v.windowPeriod, fn: mean)\n'
+    assert fluxLinter.lint_flux(flux) == (flux, [])
+
+
+def test_lint_dashboard():
+    dashboard = {"panels": [
+        {"id": 1, "title": "CPU", "targets": [{"refId": "A", "query": RAW_QUERY}]},
+        {"type": "row", "panels": [{"id": 2, "title": "Memory", "targets": [{"refId": "A", "query": WINDOWED_QUERY}]}]},
+        {"id": 3, "title": "Text"}
+    ]}
+
+    linted, report = fluxLinter.lint_dashboard(dashboard)
+    assert linted is dashboard
+    assert [(panel["id"], panel["cost"]) for panel in report] == [(1, "high"), (2, "low")]
+    assert report[0]["findings"][0]["refId"] == "A"
+    assert fluxLinter.dashboard_cost(report) == "high"
+
+    linted, report = fluxLinter.lint_dashboard(dashboard, fix=True)
+    assert dashboard["panels"][0]["targets"][0]["query"] == RAW_QUERY
+    assert linted["panels"][0]["targets"][0]["query"] != RAW_QUERY
+    assert [panel["cost"] for panel in report] == ["low", "low"]
+
+
+def test_cli(tmp_path, capsys):
+    panel = {"id": 1, "title": "CPU", "targets": [{"refId": "A", "query": RAW_QUERY}]}
+    (tmp_path / "raw.json").write_text(json.dumps({"uid": "raw", "panels": [panel]}))
+    (tmp_path / "wrapped.json").write_text(json.dumps({"dashboard": {"uid": "ok", "panels": []}, "overwrite": True}))
+
+    assert fluxLinter.main([str(tmp_path)]) == 1
+    report = json.loads(capsys.readouterr().out)
+    assert [(dashboard["uid"], dashboard["cost"]) for dashboard in report] == [("raw", "high"), ("ok", "low")]
+
+    output = tmp_path / "fixed"
+    assert fluxLinter.main([str(tmp_path), "--fix", "--output", str(output)]) == 0
+    assert [path.name for path in output.iterdir()] == ["raw.json"]
+    assert json.loads((tmp_path / "raw.json").read_text())["panels"][0]["targets"][0]["query"] == RAW_QUERY
+    assert fluxLinter.main([str(output), "--fail_on", "medium"]) == 0
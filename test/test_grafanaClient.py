@@ -0,0 +1,184 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import json
+import shutil
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+import requests
+import src.grafanaClient as grafanaClient
+
+sys.path.append("src/")
+
+
+class FakeGrafanaServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, statuses=None, delay=0, health=None):
+        super().__init__(("127.0.0.1", 0), FakeGrafanaHandler)
+        self.statuses = list(statuses or [])
+        self.health = list(health or [])
+        self.delay = delay
+        self.connections = 0
+        self.requests_seen = []
+        self.lock = threading.Lock()
+
+
+class FakeGrafanaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests_seen.append((self.command, self.path, self.headers.get("Authorization")))
+            status = self.server.statuses.pop(0) if self.server.statuses else 200
+            health = self.server.health.pop(0) if self.server.health else {"database": "ok"}
+        time.sleep(self.server.delay)
+        body = json.dumps(health).encode() if self.path == grafanaClient.HEALTH_PATH else b'{}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _respond
+
+
+@pytest.fixture
+def fake_grafana(request):
+    server = FakeGrafanaServer(**getattr(request, "param", {}))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(fake_grafana):
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("http", port, True, username="user", password="pass") as client:
+        for _ in range(5):
+            assert client.get("/api/datasources").status_code == 200
+        assert client.post("/api/datasources", {"name": "test"}).status_code == 200
+
+    assert fake_grafana.connections == 1
+    assert len(fake_grafana.requests_seen) == 6
+    expected_auth = "Basic " + base64.b64encode(b"user:pass").decode()
+    assert all(auth == expected_auth for _, _, auth in fake_grafana.requests_seen)
+
+
+@pytest.mark.parametrize("fake_grafana", [{"statuses": [503, 502, 200]}], indirect=True)
+def test_retries_server_errors(fake_grafana):
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("http", port, True, backoff_factor=0) as client:
+        assert client.get("/api/datasources/name/InfluxDB").status_code == 200
+    assert len(fake_grafana.requests_seen) == 3
+
+
+@pytest.mark.parametrize("fake_grafana", [{"statuses": [503, 200]}], indirect=True)
+def test_posts_are_not_retried(fake_grafana):
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("http", port, True, backoff_factor=0) as client:
+        assert client.post("/api/datasources", {"name": "test"}).status_code == 503
+    assert len(fake_grafana.requests_seen) == 1
+
+
+@pytest.mark.parametrize("fake_grafana", [{"statuses": [500, 500]}], indirect=True)
+def test_returns_last_response_when_retries_are_exhausted(fake_grafana):
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("http", port, True, max_retries=1, backoff_factor=0) as client:
+        assert client.get("/api/datasources/name/InfluxDB").status_code == 500
+    assert len(fake_grafana.requests_seen) == 2
+
+
+@pytest.mark.parametrize("fake_grafana", [{"delay": 2}], indirect=True)
+def test_hung_grafana_times_out(fake_grafana):
+    port = fake_grafana.server_address[1]
+    start = time.monotonic()
+    with grafanaClient.GrafanaClient("http", port, True, timeout=0.2, max_retries=0) as client:
+        with pytest.raises(requests.exceptions.RequestException):
+            client.get("/api/health")
+    assert time.monotonic() - start < 1.5
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl is required to create a test certificate")
+def test_https_connections_are_reused(fake_grafana, tmp_path):
+    cert = str(tmp_path / "grafana.crt")
+    key = str(tmp_path / "grafana.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-keyout", key, "-out", cert], check=True, capture_output=True)
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(cert, key)
+    fake_grafana.socket = server_context.wrap_socket(fake_grafana.socket, server_side=True)
+
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("https", port, False) as client:
+        for _ in range(3):
+            assert client.get("/api/datasources").status_code == 200
+    assert fake_grafana.connections == 1
+
+
+def test_ssl_context():
+    assert grafanaClient.create_ssl_context(True).verify_mode == ssl.CERT_REQUIRED
+    context = grafanaClient.create_ssl_context(False)
+    assert context.verify_mode == ssl.CERT_NONE
+    assert not context.check_hostname
+
+
+def unused_port():
+    server = HTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    port = server.server_address[1]
+    server.server_close()
+    return port
+
+
+def test_wait_until_ready(fake_grafana):
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("http", port, True) as client:
+        assert client.wait_until_ready(deadline=5) < 1
+    assert len(fake_grafana.requests_seen) == 1
+
+
+@pytest.mark.parametrize("fake_grafana", [{"statuses": [503, 200, 200], "health": [{}, {"database": "migrating"}]}],
+                         indirect=True)
+def test_wait_until_ready_while_grafana_starts(fake_grafana):
+    port = fake_grafana.server_address[1]
+    with grafanaClient.GrafanaClient("http", port, True) as client:
+        assert client.wait_until_ready(deadline=5, initial_backoff=0.01) < 1
+    # Health checks are not retried by the adapter, every poll is a single request
+    assert len(fake_grafana.requests_seen) == 3
+
+
+def test_wait_until_ready_deadline():
+    start = time.monotonic()
+    with grafanaClient.GrafanaClient("http", unused_port(), True) as client:
+        with pytest.raises(TimeoutError):
+            client.wait_until_ready(deadline=0.3, initial_backoff=0.05)
+    assert time.monotonic() - start < 1
+
+
+def test_is_ready_with_invalid_health_body(mocker):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"not json"
+    mocker.patch("requests.Session.request", return_value=response)
+    with grafanaClient.GrafanaClient("http", 3000, True) as client:
+        assert not client.is_ready()
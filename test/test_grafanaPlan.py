@@ -0,0 +1,102 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+
+import pytest
+
+import src.grafanaClient as grafanaClient
+import src.grafanaPlan as grafanaPlan
+
+sys.path.append("src/")
+sys.path.append("benchmark/")
+from fakeGrafana import FakeGrafanaServer  # noqa: E402
+
+dashboard = {
+    "title": "System Telemetry",
+    "panels": [{"title": "CPU", "datasource": {"type": "influxdb", "uid": "${DS_INFLUXDB}"}}]
+}
+
+
+def datasource_config(name, bucket="telemetry"):
+    return {"name": name, "type": "influxdb", "access": "proxy", "url": "http://influxdb:8086",
+            "jsonData": {"version": "Flux", "organization": "org", "defaultBucket": bucket},
+            "secureJsonData": {"token": "token"}}
+
+
+@pytest.fixture
+def grafana():
+    with FakeGrafanaServer() as server:
+        with grafanaClient.GrafanaClient("http", server.port, True, host="127.0.0.1") as client:
+            yield server, client
+
+
+def write_dashboards(path, count):
+    for i in range(count):
+        (path / "dashboard{}.json".format(i)).write_text(json.dumps(dict(dashboard, title="Dashboard {}".format(i))))
+
+
+def plan(client, configs, dashboards_path):
+    return grafanaPlan.plan_provisioning(grafanaPlan.fetch_state(client), configs, dashboards_path)
+
+
+def test_plan_and_apply(grafana, tmp_path):
+    server, client = grafana
+    write_dashboards(tmp_path, 5)
+    configs = [datasource_config("InfluxDB"), datasource_config("raw", "raw")]
+
+    changes = plan(client, configs, str(tmp_path))
+    # Grafana's state is read with two requests, whatever the number of datasources and dashboards
+    assert server.requests == {"list_datasources": 1, "search_dashboards": 1}
+    assert grafanaPlan.summarize(changes) == {"create": 7, "update": 0, "unchanged": 0}
+    # Dashboards are bound to the uid the InfluxDB datasource will be created with
+    influxdb_uid = grafanaPlan.datasource_uid("InfluxDB")
+    assert changes[2].payload["panels"][0]["datasource"] == {"type": "influxdb", "uid": influxdb_uid}
+
+    report = grafanaPlan.apply_plan(client, changes)
+    assert {result["action"] for result in report} == {"create"}
+    assert server.requests["create_datasource"] == 2 and server.requests["push_dashboard"] == 5
+    assert server.datasources["InfluxDB"]["uid"] == influxdb_uid
+
+    # Nothing changed, so the plan is applied without a single write
+    server.reset_counters()
+    changes = plan(client, configs, str(tmp_path))
+    assert grafanaPlan.summarize(changes) == {"create": 0, "update": 0, "unchanged": 7}
+    grafanaPlan.apply_plan(client, changes)
+    assert server.requests == {"list_datasources": 1, "search_dashboards": 1}
+
+    # Only the changed datasource and dashboard are written
+    server.reset_counters()
+    configs[1] = datasource_config("raw", "other")
+    (tmp_path / "dashboard0.json").write_text(json.dumps(dict(dashboard, title="Renamed")))
+    changes = plan(client, configs, str(tmp_path))
+    assert [(change.name, change.action) for change in changes if change.action != grafanaPlan.UNCHANGED] == \
+        [("raw", "update"), (changes[2].name, "update")]
+    grafanaPlan.apply_plan(client, changes)
+    assert server.requests == {"list_datasources": 1, "search_dashboards": 1, "update_datasource": 1,
+                               "push_dashboard": 1}
+    assert server.datasources["raw"]["jsonData"]["defaultBucket"] == "other"
+    assert "2 to update, 5 unchanged" in grafanaPlan.format_plan(changes)
+
+
+def test_apply_plan_failures(mocker):
+    changes = [grafanaPlan.Change(grafanaPlan.DATASOURCE, "InfluxDB", grafanaPlan.CREATE, {"name": "InfluxDB"}),
+               grafanaPlan.Change(grafanaPlan.DASHBOARD, "gg-1", grafanaPlan.CREATE, {"uid": "gg-1"})]
+    mocker.patch("addGrafanaDataSources.create_and_add_datasource_to_grafana",
+                 side_effect=grafanaClient.GrafanaRequestError("POST", "/api/datasources", 500))
+    mock_push = mocker.patch("provisionDashboards.push_dashboard")
+
+    # A failing datasource is reported, unless the dashboards depend on it
+    report = grafanaPlan.apply_plan(None, changes)
+    assert [result["action"] for result in report] == ["failed", "create"]
+    with pytest.raises(ValueError, match="InfluxDB"):
+        grafanaPlan.apply_plan(None, changes, required=["InfluxDB"])
+    assert mock_push.call_count == 1
+
+
+def test_fetch_state_failure(mocker):
+    client = mocker.Mock()
+    client.get.return_value.status_code = 401
+    with pytest.raises(ValueError, match="datasources"):
+        grafanaPlan.fetch_state(client)
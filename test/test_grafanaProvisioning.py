@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+import src.addGrafanaDataSources as agds
+import src.grafanaProvisioning as gp
+
+sys.path.append("src/")
+
+influxdb_parameters = {
+    "InfluxDBContainerName": "greengrass_InfluxDB",
+    "InfluxDBOrg": "greengrass",
+    "InfluxDBBucket": "greengrass-telemetry",
+    "InfluxDBPort": "8086",
+    "InfluxDBInterface": "127.0.0.1",
+    "InfluxDBToken": "testToken",
+    "InfluxDBServerProtocol": "http",
+    "InfluxDBSkipTLSVerify": "true"
+}
+dashboard = {
+    "title": "System Telemetry",
+    "panels": [{"title": "CPU", "datasource": "${DS_INFLUXDB}", "targets": [{"refId": "A", "query": "from(bucket: \"b\")"}]}]
+}
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def configs():
+    return agds.create_influxdb_datasource_configs(influxdb_parameters, "", "", [{"name": "InfluxDB-1m",
+                                                                                  "bucket": "telemetry-1m"}])
+
+
+def test_render_datasources(configs):
+    rendered = gp.render_datasources(configs)
+    assert json.loads(rendered) == {"apiVersion": 1, "datasources": [
+        {"name": "InfluxDB", "type": "influxdb", "access": "direct", "editable": False,
+         "url": "http://greengrass_InfluxDB:8086",
+         "jsonData": {"version": "Flux", "organization": "greengrass", "defaultBucket": "greengrass-telemetry"},
+         "secureJsonData": {"token": "testToken"}},
+        {"name": "InfluxDB-1m", "type": "influxdb", "access": "direct", "editable": False,
+         "url": "http://greengrass_InfluxDB:8086",
+         "jsonData": {"version": "Flux", "organization": "greengrass", "defaultBucket": "telemetry-1m"},
+         "secureJsonData": {"token": "testToken"}}
+    ]}
+    # Rendering is stable, so unchanged configs never rewrite the file
+    assert gp.render_datasources([dict(config) for config in configs]) == rendered
+
+
+def test_write_if_changed(tmp_path):
+    path = str(tmp_path / "datasources" / "greengrass.yaml")
+    assert gp.write_if_changed(path, "a") == "created"
+    modified = os.stat(path).st_mtime_ns
+    assert gp.write_if_changed(path, "a") == "unchanged"
+    assert os.stat(path).st_mtime_ns == modified
+    assert gp.write_if_changed(path, "b") == "updated"
+    with open(path) as f:
+        assert f.read() == "b"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(str(tmp_path / "datasources")) == ["greengrass.yaml"]
+
+
+def test_write_if_changed_cleans_up_on_failure(tmp_path, mocker):
+    mocker.patch("os.replace", side_effect=OSError("disk full"))
+    with pytest.raises(OSError):
+        gp.write_if_changed(str(tmp_path / "greengrass.yaml"), "a")
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_write_provisioning_files(tmp_path, configs):
+    dashboards_dir = tmp_path / "dashboards"
+    dashboards_dir.mkdir()
+    (dashboards_dir / "system.json").write_text(json.dumps(dashboard))
+    (dashboards_dir / "other.json").write_text(json.dumps(dict(dashboard, title="Other")))
+    provisioning = tmp_path / "provisioning"
+
+    dashboards = gp.render_dashboards(str(dashboards_dir), "InfluxDB", flux_lint="fix")
+    report = gp.write_provisioning_files(str(provisioning), configs, dashboards, "/grafana/provisioning")
+    assert report == {"datasources/greengrass.yaml": "created", "dashboards/greengrass.yaml": "created",
+                      "dashboards/greengrass/other.json": "created", "dashboards/greengrass/system.json": "created"}
+
+    assert read(str(provisioning / "datasources" / "greengrass.yaml"))["datasources"] == configs
+    provider = read(str(provisioning / "dashboards" / "greengrass.yaml"))["providers"][0]
+    assert provider["options"] == {"path": "/grafana/provisioning/dashboards/greengrass"}
+    rendered = read(str(provisioning / "dashboards" / "greengrass" / "system.json"))
+    assert rendered["panels"][0]["datasource"] == "InfluxDB"
+    assert rendered["uid"].startswith("gg-") and rendered["id"] is None
+    assert "v.timeRangeStart" in rendered["panels"][0]["targets"][0]["query"]
+
+    # Nothing changed, so nothing is rewritten, and a dashboard that is gone is removed
+    (dashboards_dir / "other.json").unlink()
+    dashboards = gp.render_dashboards(str(dashboards_dir), "InfluxDB", flux_lint="fix")
+    report = gp.write_provisioning_files(str(provisioning), configs, dashboards, "/grafana/provisioning")
+    assert report == {"datasources/greengrass.yaml": "unchanged", "dashboards/greengrass.yaml": "unchanged",
+                      "dashboards/greengrass/system.json": "unchanged", "dashboards/greengrass/other.json": "removed"}
+
+
+def test_write_provisioning_files_without_dashboards(tmp_path, configs):
+    assert gp.render_dashboards(str(tmp_path / "missing"), "InfluxDB") == {}
+    report = gp.write_provisioning_files(str(tmp_path), configs[:1])
+    assert report == {"datasources/greengrass.yaml": "created"}
@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+import threading
+import time
+
+import pytest
+import src.instrumentation as instrumentation
+
+sys.path.append("src/")
+
+
+@pytest.fixture(autouse=True)
+def disable_instrumentation():
+    yield
+    instrumentation.disable()
+    # The instrumented modules use the bare module, which may be a different module object
+    import instrumentation as bare_instrumentation
+    bare_instrumentation.disable()
+
+
+@instrumentation.traced("traced_function")
+def traced_function(value):
+    instrumentation.annotate(retries=value)
+    return value
+
+
+def test_disabled_instrumentation_records_nothing():
+    assert instrumentation.span("test") is instrumentation.NOOP_SPAN
+    with instrumentation.span("test") as span:
+        span.set(retries=1)
+    assert traced_function(3) == 3
+    assert instrumentation.summary() is None
+    assert instrumentation.report() is None
+
+
+def test_disabled_instrumentation_overhead():
+    calls = 100000
+    start = time.perf_counter()
+    for _ in range(calls):
+        traced_function(0)
+    # A disabled span costs a global lookup and an extra call
+    assert (time.perf_counter() - start) / calls < 1e-5
+
+
+def test_spans_nest_and_record_outcomes():
+    instrumentation.enable()
+    with instrumentation.span("parent", datasource="InfluxDB"):
+        assert traced_function(2) == 2
+        traced_function(1)
+        with pytest.raises(ValueError):
+            with instrumentation.span("failing"):
+                raise ValueError("test")
+        with pytest.raises(SystemExit):
+            with instrumentation.span("exiting"):
+                exit(1)
+
+    summary = instrumentation.summary()
+    spans = {span["name"]: span for span in summary["spans"]}
+    assert spans["parent"]["parent"] is None
+    assert spans["parent"]["attributes"] == {"datasource": "InfluxDB"}
+    assert spans["traced_function"]["parent"] == "parent"
+    assert spans["failing"]["outcome"] == instrumentation.OUTCOME_ERROR
+    assert spans["failing"]["error"] == "ValueError"
+    assert spans["exiting"]["outcome"] == instrumentation.OUTCOME_EXIT
+    assert summary["totals"]["traced_function"]["count"] == 2
+    assert summary["totals"]["traced_function"]["retries"] == 3
+    assert summary["totals"]["parent"]["errors"] == 0
+
+
+def test_spans_from_threads():
+    instrumentation.enable()
+    with instrumentation.span("main"):
+        threads = [threading.Thread(target=traced_function, args=(1,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    summary = instrumentation.summary()
+    assert summary["totals"]["traced_function"]["count"] == 4
+    # Spans only nest within a thread
+    assert all(span["parent"] is None for span in summary["spans"])
+
+
+def test_report(tmp_path):
+    instrumentation.enable()
+    traced_function(1)
+    path = tmp_path / "report.json"
+    report = instrumentation.report(str(path))
+    assert json.loads(path.read_text()) == report
+    assert report["version"] == instrumentation.REPORT_FORMAT_VERSION
+    assert report["spans"][0]["outcome"] == instrumentation.OUTCOME_OK
+
+
+def test_retrieve_influxdb_params_spans(mocker):
+    import instrumentation as bare_instrumentation
+    import src.retrieveInfluxDBParams as retrieveInfluxDBParams
+    from test.test_retrieveInfluxDBParams import FakeTokenResponder, testparams
+
+    bare_instrumentation.enable()
+    responder = FakeTokenResponder(0.05, [dict(testparams, InfluxDBTokenAccessType="RO")])
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+    retrieveInfluxDBParams.retrieve_influxdb_params("test/publish", "test/subscribe", initial_backoff=0.01)
+
+    totals = bare_instrumentation.summary()["totals"]
+    assert totals["ipc_connect"]["count"] == 1
+    assert totals["retrieve_influxdb_params"]["retries"] == totals["publish_token_request"]["count"] - 1 > 0
+    assert totals["wait_for_token_response"]["count"] == totals["publish_token_request"]["count"]
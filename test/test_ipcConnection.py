@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import pytest
+import src.ipcConnection as ipcc
+
+sys.path.append("src/")
+
+
+def test_client_is_created_lazily_and_shared(mocker):
+    mock_connect = mocker.patch("awsiot.greengrasscoreipc.connect")
+    manager = ipcc.IPCConnectionManager()
+    assert mock_connect.call_count == 0
+
+    first = manager.get_client()
+    second = manager.get_client()
+    assert first is second
+    assert mock_connect.call_count == 1
+
+    stats = manager.stats()
+    assert stats["connect_count"] == 1
+    assert stats["connect_latency_total"] >= 0
+
+
+def test_close_and_reconnect(mocker):
+    mock_connect = mocker.patch("awsiot.greengrasscoreipc.connect")
+    manager = ipcc.IPCConnectionManager()
+    client = manager.get_client()
+    manager.close()
+    assert client.close.call_count == 1
+
+    # Closing twice is a no-op
+    manager.close()
+    assert client.close.call_count == 1
+
+    manager.get_client()
+    assert mock_connect.call_count == 2
+    assert manager.stats()["connect_count"] == 2
+
+
+def test_context_manager_closes_client(mocker):
+    mocker.patch("awsiot.greengrasscoreipc.connect")
+    manager = ipcc.IPCConnectionManager()
+    with manager as client:
+        assert client is not None
+    assert client.close.call_count == 1
+
+
+def test_failed_connect_is_not_cached(mocker):
+    mocker.patch("awsiot.greengrasscoreipc.connect", side_effect=TimeoutError("test"))
+    manager = ipcc.IPCConnectionManager()
+    with pytest.raises(TimeoutError, match='test'):
+        manager.get_client()
+    assert manager.stats()["connect_count"] == 0
+
+
+def test_module_level_client(mocker):
+    mock_connect = mocker.patch("awsiot.greengrasscoreipc.connect")
+    assert ipcc.get_ipc_client() is ipcc.get_ipc_client()
+    assert mock_connect.call_count == 1
+    ipcc.close_ipc_client()
+    assert ipcc.get_ipc_connection_stats()["connect_count"] >= 1
@@ -0,0 +1,139 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import time
+
+import pytest
+import requests
+
+import src.instrumentation as instrumentation
+import src.metricsServer as metricsServer
+
+sys.path.append("src/")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSpan:
+    def __init__(self, name, duration=0.02, outcome="ok", **attributes):
+        self.name = name
+        self.duration = duration
+        self.outcome = outcome
+        self.attributes = attributes
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def registry(clock):
+    return metricsServer.MetricsRegistry(clock=clock)
+
+
+@pytest.fixture
+def server(registry):
+    with metricsServer.MetricsServer(registry, port=0, bind_address="127.0.0.1") as metrics_server:
+        yield metrics_server
+
+
+def get(server, path):
+    return requests.get("http://127.0.0.1:{}{}".format(server.port, path), timeout=5)
+
+
+def test_histogram_rendering():
+    metric = metricsServer.Metric("latency_seconds", "histogram", "Latency.", ["method"], buckets=(0.1, 1.0))
+    metric.observe(0.05, method="GET")
+    metric.observe(0.5, method="GET")
+
+    assert metric.render() == [
+        "# HELP greengrass_dashboard_latency_seconds Latency.",
+        "# TYPE greengrass_dashboard_latency_seconds histogram",
+        'greengrass_dashboard_latency_seconds_bucket{method="GET",le="0.1"} 1',
+        'greengrass_dashboard_latency_seconds_bucket{method="GET",le="1.0"} 2',
+        'greengrass_dashboard_latency_seconds_bucket{method="GET",le="+Inf"} 2',
+        'greengrass_dashboard_latency_seconds_sum{method="GET"} 0.55',
+        'greengrass_dashboard_latency_seconds_count{method="GET"} 2'
+    ]
+
+
+def test_registry_records_instrumentation_spans(registry):
+    instrumentation.add_listener(registry.record_span)
+    try:
+        with instrumentation.span("get_secret_over_ipc"):
+            pass
+        with instrumentation.span("retrieve_influxdb_params") as span:
+            span.set(retries=2)
+        with instrumentation.span("grafana_request", method="POST", endpoint="/api/datasources") as span:
+            span.set(status_code=409)
+        with instrumentation.span("reconcile_datasource", datasource='Influx"DB') as span:
+            span.set(action="updated")
+    finally:
+        instrumentation.disable()
+
+    text = registry.render()
+    assert 'greengrass_dashboard_ipc_request_duration_seconds_count{operation="get_secret_over_ipc"} 1' in text
+    assert 'greengrass_dashboard_retries_total{operation="retrieve_influxdb_params"} 2' in text
+    assert 'greengrass_dashboard_grafana_request_duration_seconds_count{method="POST"} 1' in text
+    assert 'greengrass_dashboard_grafana_requests_total{method="POST",code="409"} 1' in text
+    assert 'greengrass_dashboard_grafana_request_failures_total{method="POST"} 1' in text
+    assert 'greengrass_dashboard_datasource_reconciles_total{datasource="Influx\\"DB",action="updated"} 1' in text
+    assert "greengrass_dashboard_last_successful_sync_timestamp_seconds 1000.0" in text
+
+
+def test_sync_age_and_failures(registry, clock):
+    assert registry.health() == {"status": "starting", "last_sync_age_seconds": None}
+    assert "greengrass_dashboard_last_successful_sync_age_seconds NaN" in registry.render()
+
+    registry.record_span(FakeSpan("update_datasource_in_grafana", status_code=200))
+    clock.now += 90
+    assert registry.health() == {"status": "ok", "last_sync_age_seconds": 90}
+    assert "greengrass_dashboard_last_successful_sync_age_seconds 90.0" in registry.render()
+
+    registry.record_span(FakeSpan("update_datasource_in_grafana", outcome="error"))
+    registry.record_span(FakeSpan("grafana_request", outcome="error", method="PUT"))
+    text = registry.render()
+    assert registry.health()["status"] == "failing"
+    assert 'greengrass_dashboard_operation_errors_total{operation="update_datasource_in_grafana"} 1' in text
+    assert 'greengrass_dashboard_grafana_requests_total{method="PUT",code="error"} 1' in text
+    # The last successful sync is kept, and its age keeps growing
+    assert "greengrass_dashboard_last_successful_sync_timestamp_seconds 1000.0" in text
+
+
+def test_metrics_endpoint(server, registry):
+    registry.record_span(FakeSpan("ipc_connect", duration=0.003))
+    response = get(server, "/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == metricsServer.CONTENT_TYPE
+    assert 'greengrass_dashboard_ipc_request_duration_seconds_bucket{operation="ipc_connect",le="0.005"} 1' \
+        in response.text
+    assert "# TYPE greengrass_dashboard_retries_total counter" in response.text
+    assert get(server, "/other").status_code == 404
+
+
+def test_healthz_endpoint(server, registry):
+    response = get(server, "/healthz")
+    assert response.status_code == 503 and response.json()["status"] == "starting"
+
+    registry.record_span(FakeSpan("write_provisioning_files"))
+    response = get(server, "/healthz")
+    assert response.status_code == 200 and response.json() == {"status": "ok", "last_sync_age_seconds": 0}
+
+
+def test_recording_overhead(registry):
+    spans = [FakeSpan("grafana_request", method="GET", status_code=200), FakeSpan("get_secret_over_ipc"),
+             FakeSpan("reconcile_datasource", datasource="InfluxDB", action="unchanged")] * 10000
+    started = time.perf_counter()
+    for span in spans:
+        registry.record_span(span)
+    # Well under 100 microseconds a span, even on a slow device
+    assert (time.perf_counter() - started) / len(spans) < 0.0001
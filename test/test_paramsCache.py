@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import stat
+import sys
+import time
+
+import pytest
+import src.paramsCache as paramsCache
+
+sys.path.append("src/")
+
+secrets = {"grafana_username": "user", "grafana_password": "pass"}
+influxdb_parameters = {"InfluxDBToken": "token", "InfluxDBOrg": "org", "InfluxDBTokenAccessType": "RO"}
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / paramsCache.CACHE_RELATIVE_PATH)
+
+
+@pytest.mark.parametrize("encrypt", [True, False])
+def test_round_trip(cache_path, encrypt):
+    cache = paramsCache.ParamsCache(cache_path, encrypt=encrypt)
+    assert cache.load(secrets) is None
+    cache.store(influxdb_parameters, secrets)
+    assert cache.load(secrets) == influxdb_parameters
+    assert stat.S_IMODE(os.stat(cache_path).st_mode) == 0o600
+    assert os.listdir(os.path.dirname(cache_path)) == [os.path.basename(cache_path)]
+
+
+def test_encrypted_cache_hides_token(cache_path):
+    paramsCache.ParamsCache(cache_path).store(influxdb_parameters, secrets)
+    with open(cache_path) as f:
+        assert "token" not in f.read()
+
+
+def test_wrong_key_is_rejected(cache_path):
+    paramsCache.ParamsCache(cache_path).store(influxdb_parameters, secrets)
+    other_secrets = {"grafana_username": "user", "grafana_password": "other"}
+    assert paramsCache.ParamsCache(cache_path).load(other_secrets) is None
+
+
+def test_expired_entry_is_ignored(cache_path, mocker):
+    cache = paramsCache.ParamsCache(cache_path, ttl=60)
+    cache.store(influxdb_parameters, secrets)
+    mocker.patch("time.time", return_value=time.time() + 61)
+    assert cache.load(secrets) is None
+
+
+def test_encryption_requires_cryptography(cache_path, mocker):
+    mocker.patch.dict(sys.modules, {"cryptography.fernet": None})
+    with pytest.raises(ValueError, match="cryptography"):
+        paramsCache.ParamsCache(cache_path, encrypt=True)
+    paramsCache.ParamsCache(cache_path, encrypt=False).store(influxdb_parameters)
+
+
+def test_encryption_setting_mismatch(cache_path):
+    paramsCache.ParamsCache(cache_path, encrypt=False).store(influxdb_parameters)
+    assert paramsCache.ParamsCache(cache_path).load(secrets) is None
+
+
+@pytest.mark.parametrize("content", ["not json", json.dumps({"version": 0}), json.dumps({"version": 1})])
+def test_corrupt_cache_is_ignored(cache_path, content):
+    os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, "w") as f:
+        f.write(content)
+    assert paramsCache.ParamsCache(cache_path).load(secrets) is None
+
+
+def test_invalidate(cache_path):
+    cache = paramsCache.ParamsCache(cache_path)
+    cache.invalidate()
+    cache.store(influxdb_parameters, secrets)
+    cache.invalidate()
+    assert cache.load(secrets) is None
@@ -0,0 +1,169 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+import threading
+import time
+
+import pytest
+import requests
+import src.grafanaClient as grafanaClient
+import src.provisionDashboards as pd
+
+sys.path.append("src/")
+
+test_dashboard = {
+    "__inputs": [{"name": "DS_INFLUXDB", "type": "datasource", "pluginId": "influxdb"}],
+    "title": "System Telemetry",
+    "tags": ["greengrass"],
+    "panels": [
+        {"title": "CPU", "datasource": "${DS_INFLUXDB}", "targets": [{"query": "from(bucket: v.defaultBucket)"}]},
+        {"title": "Memory", "datasource": {"type": "influxdb", "uid": "${DS_INFLUXDB}"}},
+        {"title": "Text", "datasource": {"type": "prometheus", "uid": "other"}}
+    ]
+}
+
+
+def grafana_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode() if body is not None else b''
+    return response
+
+
+class FakeGrafanaRouter:
+    """Answers dashboard search and push calls, tracking how many pushes run at the same time."""
+
+    def __init__(self, search_results=None, push_status=200, push_delay=0):
+        self.search_results = search_results or []
+        self.push_status = push_status
+        self.push_delay = push_delay
+        self.calls = []
+        self.pushed = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, **kwargs):
+        with self.lock:
+            self.calls.append((method, url))
+        if method == "GET" and url.endswith("/api/search"):
+            return grafana_response(200, self.search_results)
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.push_delay)
+        with self.lock:
+            self.in_flight -= 1
+            self.pushed.append(json.loads(kwargs["data"])["dashboard"])
+        return grafana_response(self.push_status, {})
+
+
+def write_dashboards(path, count):
+    for i in range(count):
+        dashboard = dict(test_dashboard, title="Dashboard {}".format(i))
+        (path / "dashboard{}.json".format(i)).write_text(json.dumps(dashboard))
+
+
+def grafana_client():
+    return grafanaClient.GrafanaClient("https", 3000, False)
+
+
+def test_bind_dashboard():
+    bound = pd.bind_dashboard("system.json", test_dashboard, "InfluxDB", "influxUid")
+    assert "__inputs" not in bound
+    assert bound["uid"].startswith(pd.DASHBOARD_UID_PREFIX)
+    assert bound["uid"] == pd.bind_dashboard("system.json", test_dashboard, "InfluxDB")["uid"]
+    assert bound["panels"][0]["datasource"] == "InfluxDB"
+    assert bound["panels"][1]["datasource"] == {"type": "influxdb", "uid": "influxUid"}
+    assert bound["panels"][2]["datasource"] == {"type": "prometheus", "uid": "other"}
+    # The source dashboard is left untouched
+    assert test_dashboard["panels"][0]["datasource"] == "${DS_INFLUXDB}"
+
+    assert pd.bind_dashboard("system.json", test_dashboard, "InfluxDB")["panels"][1]["datasource"] == "InfluxDB"
+    assert pd.bind_dashboard("system.json", dict(test_dashboard, uid="fixed"), "InfluxDB")["uid"] == "fixed"
+
+
+def test_dashboard_hash():
+    stamped = pd.stamp_dashboard_hash(test_dashboard)
+    hash_tags = [t for t in stamped["tags"] if t.startswith(pd.DASHBOARD_HASH_TAG_PREFIX)]
+    assert len(hash_tags) == 1
+    assert pd.compute_dashboard_hash(stamped) == pd.compute_dashboard_hash(test_dashboard)
+    assert pd.stamp_dashboard_hash(stamped) == stamped
+    assert pd.compute_dashboard_hash(dict(test_dashboard, id=3, version=9)) == pd.compute_dashboard_hash(test_dashboard)
+    assert pd.compute_dashboard_hash(dict(test_dashboard, title="Other")) != pd.compute_dashboard_hash(test_dashboard)
+
+
+def test_load_dashboards(tmp_path):
+    (tmp_path / "b.json").write_text(json.dumps({"dashboard": test_dashboard, "overwrite": True}))
+    (tmp_path / "a.json").write_text(json.dumps(test_dashboard))
+    (tmp_path / "broken.json").write_text("{")
+    (tmp_path / "notes.txt").write_text("not a dashboard")
+    assert pd.load_dashboards(str(tmp_path)) == [("a.json", test_dashboard), ("b.json", test_dashboard)]
+
+
+def test_provision_dashboards_concurrently(tmp_path, mocker):
+    write_dashboards(tmp_path, 8)
+    router = FakeGrafanaRouter(push_delay=0.05)
+    mocker.patch("requests.Session.request", side_effect=router)
+
+    report = pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB", max_workers=3)
+
+    assert len(report["pushed"]) == 8
+    assert report["skipped"] == [] and report["failed"] == []
+    assert router.max_in_flight <= 3
+    assert all(d["panels"][0]["datasource"] == "InfluxDB" for d in router.pushed)
+
+
+def test_unchanged_dashboards_are_skipped(tmp_path, mocker):
+    write_dashboards(tmp_path, 3)
+    first_run = FakeGrafanaRouter()
+    mocker.patch("requests.Session.request", side_effect=first_run)
+    pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB")
+
+    # Grafana now holds two of the three dashboards as pushed, and an outdated copy of the third
+    search_results = [{"uid": d["uid"], "tags": d["tags"]} for d in first_run.pushed]
+    search_results[2]["tags"] = ["greengrass", pd.DASHBOARD_HASH_TAG_PREFIX + "outdated"]
+    second_run = FakeGrafanaRouter(search_results)
+    mocker.patch("requests.Session.request", side_effect=second_run)
+    report = pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB")
+
+    assert len(report["skipped"]) == 2
+    assert report["pushed"] == [search_results[2]["uid"]]
+    assert len(second_run.calls) == 2
+
+
+def test_failed_pushes_are_reported(tmp_path, mocker):
+    write_dashboards(tmp_path, 2)
+    mocker.patch("requests.Session.request", side_effect=FakeGrafanaRouter(push_status=400))
+    report = pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB")
+    assert len(report["failed"]) == 2
+
+
+def test_failed_search(tmp_path, mocker):
+    write_dashboards(tmp_path, 1)
+    mocker.patch("requests.Session.request", return_value=grafana_response(500))
+    with pytest.raises(ValueError, match="Failed to list Grafana dashboards"):
+        pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB")
+
+
+def test_missing_dashboard_directory(tmp_path, mocker):
+    mock_request = mocker.patch("requests.Session.request")
+    report = pd.provision_dashboards(grafana_client(), str(tmp_path / "missing"), "InfluxDB")
+    assert report == {"pushed": [], "skipped": [], "failed": []}
+    assert mock_request.call_count == 0
+
+
+def test_dashboards_are_linted_before_pushing(tmp_path, mocker):
+    write_dashboards(tmp_path, 1)
+    router = FakeGrafanaRouter()
+    mocker.patch("requests.Session.request", side_effect=router)
+
+    report = pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB", flux_lint="report")
+    assert list(report["cost"].values()) == ["high"]
+    assert router.pushed[0]["panels"][0]["targets"][0]["query"] == "from(bucket: v.defaultBucket)"
+
+    report = pd.provision_dashboards(grafana_client(), str(tmp_path), "InfluxDB", flux_lint="fix")
+    assert list(report["cost"].values()) == ["low"]
+    assert "aggregateWindow(every: v.windowPeriod" in router.pushed[1]["panels"][0]["targets"][0]["query"]
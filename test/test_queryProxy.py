@@ -0,0 +1,163 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import concurrent.futures
+import json
+import sys
+
+import pytest
+import requests
+
+import src.queryProxy as queryProxy
+
+sys.path.append("src/")
+sys.path.append("benchmark/")
+from fakeInfluxDB import FakeInfluxDBServer, TOKEN  # noqa: E402
+
+HEADERS = {"Authorization": "Token {}".format(TOKEN), "Content-Type": "application/json"}
+QUERY = 'from(bucket: "telemetry") |> range(start: 2021-06-01T10:00:03.250Z, stop: 2021-06-01T11:00:04Z)'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def influxdb():
+    with FakeInfluxDBServer() as server:
+        yield server
+
+
+@pytest.fixture
+def proxy(influxdb):
+    with queryProxy.QueryProxy(influxdb.url, True, port=0, bind_address="127.0.0.1") as query_proxy:
+        yield query_proxy
+
+
+def query(proxy, flux=QUERY, token=TOKEN):
+    return requests.post("http://127.0.0.1:{}/api/v2/query?org=greengrass".format(proxy.port),
+                         data=json.dumps({"query": flux, "type": "flux"}),
+                         headers=dict(HEADERS, Authorization="Token {}".format(token)), timeout=5)
+
+
+def test_normalize_flux():
+    assert queryProxy.normalize_flux(QUERY) == \
+        'from(bucket: "telemetry") |> range(start: 2021-06-01T10:00:00Z, stop: 2021-06-01T11:00:10Z)'
+    # Aligned bounds and relative ranges are left as they are
+    assert queryProxy.normalize_flux("range(start: 2021-06-01T10:00:00Z)", 60) == "range(start: 2021-06-01T10:00:00Z)"
+    assert queryProxy.normalize_flux("range(start: -1h)") == "range(start: -1h)"
+
+
+def test_normalize_query_body():
+    first = queryProxy.normalize_query_body(json.dumps({"type": "flux", "query": QUERY}).encode("utf-8"))
+    second = queryProxy.normalize_query_body(json.dumps({"query": QUERY.replace("03.250", "09"),
+                                                         "type": "flux"}).encode("utf-8"))
+    assert first == second
+    assert queryProxy.normalize_query_body(QUERY.encode("utf-8")) == queryProxy.normalize_flux(QUERY).encode("utf-8")
+
+
+def test_cache_lru_and_memory_bound():
+    response = queryProxy.CachedResponse(200, "text/csv", b"x" * 100)
+    size = queryProxy.QueryCache.entry_size("a", response)
+    cache = queryProxy.QueryCache(max_bytes=size * 4)
+
+    for key in "abcd":
+        assert cache.put(key, response)
+    assert cache.get("a") == response
+    cache.put("e", response)
+    # b was the least recently used
+    assert cache.get("b") is None
+    assert len(cache) == 4 and cache.bytes == size * 4 and cache.evictions == 1
+
+    assert not cache.put("f", queryProxy.CachedResponse(200, "text/csv", b"x" * size * 2))
+    assert cache.get("f") is None
+
+
+def test_cache_ttl():
+    clock = FakeClock()
+    cache = queryProxy.QueryCache(ttl=30, clock=clock)
+    response = queryProxy.CachedResponse(200, "text/csv", b"data")
+    cache.put("key", response)
+
+    clock.now = 29
+    assert cache.get("key") == response
+    clock.now = 30
+    assert cache.get("key") is None
+    assert cache.expirations == 1 and cache.bytes == 0
+
+
+def test_proxy_serves_repeated_queries_from_cache(influxdb, proxy):
+    first = query(proxy)
+    # A refresh a few seconds later falls into the same aligned range
+    second = query(proxy, QUERY.replace("03.250", "07"))
+
+    assert first.status_code == second.status_code == 200
+    assert first.text == second.text
+    assert first.headers["Content-Type"].startswith("text/csv")
+    assert influxdb.queries == [queryProxy.normalize_flux(QUERY)]
+    metrics = requests.get("http://127.0.0.1:{}/proxy/metrics".format(proxy.port), timeout=5).json()
+    assert metrics["hits"] == 1 and metrics["misses"] == 1 and metrics["hit_rate"] == 0.5
+    assert metrics["entries"] == 1 and metrics["bytes"] > 0
+
+
+def test_proxy_keys_by_token(influxdb, proxy):
+    assert query(proxy).status_code == 200
+    assert query(proxy, token="othertoken").status_code == 401
+    # Errors are not cached
+    assert query(proxy, token="othertoken").status_code == 401
+    assert influxdb.requests["query"] == 3
+    assert proxy.metrics()["entries"] == 1
+
+
+def test_proxy_collapses_identical_in_flight_queries(influxdb, proxy):
+    influxdb.query_delay = 0.3
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        responses = list(executor.map(lambda _: query(proxy), range(5)))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses}) == 1
+    assert influxdb.requests["query"] == 1
+    metrics = proxy.metrics()
+    assert metrics["misses"] == 1 and metrics["collapsed"] + metrics["hits"] == 4 and metrics["hit_rate"] == 0.8
+
+
+def test_proxy_passes_through_health_checks_only(influxdb, proxy):
+    url = "http://127.0.0.1:{}".format(proxy.port)
+    response = requests.get(url + "/health", timeout=5)
+    assert response.status_code == 200 and response.json()["status"] == "pass"
+    assert proxy.metrics()["passthrough"] == 1
+
+    # Writes and management calls never reach InfluxDB through the proxy
+    assert requests.post(url + "/api/v2/write?org=greengrass&bucket=greengrass-telemetry", data="m v=1",
+                         headers=HEADERS, timeout=5).status_code == 405
+    assert requests.get(url + "/api/v2/buckets", headers=HEADERS, timeout=5).status_code == 405
+    assert requests.delete(url + "/api/v2/buckets/1", headers=HEADERS, timeout=5).status_code == 405
+    assert influxdb.requests == {"health": 1}
+
+
+def test_proxy_times_out_waiting_for_in_flight_query(influxdb):
+    with queryProxy.QueryProxy(influxdb.url, True, port=0, bind_address="127.0.0.1", timeout=0.1) as proxy:
+        # An identical query that never completes
+        body = queryProxy.normalize_query_body(json.dumps({"query": QUERY, "type": "flux"}).encode("utf-8"))
+        key = queryProxy.cache_key("/api/v2/query?org=greengrass", body, HEADERS["Authorization"])
+        proxy._in_flight[key] = concurrent.futures.Future()
+        response = query(proxy)
+
+    assert response.status_code == 504
+    assert influxdb.requests["query"] == 0
+
+
+def test_proxy_upstream_unreachable():
+    # Nothing listens on the port of a closed server
+    server = FakeInfluxDBServer()
+    url = server.url
+    server.server_close()
+    with queryProxy.QueryProxy(url, True, port=0, bind_address="127.0.0.1", timeout=1) as proxy:
+        response = query(proxy)
+
+    assert response.status_code == 502
+    assert proxy.metrics()["upstream_errors"] == 1 and proxy.metrics()["entries"] == 0
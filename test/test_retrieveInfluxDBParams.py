@@ -5,11 +5,15 @@ import sys
 import pytest
 import json
 import logging
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import patch, MagicMock
 import concurrent.futures
 
-from awsiot.greengrasscoreipc.model import UnauthorizedError
+from awsiot.greengrasscoreipc.model import UnauthorizedError, SubscriptionResponseMessage, JsonMessage
 import src.retrieveInfluxDBParams as ridp
+import retryPolicy
+import streamHandlers
 
 TIMEOUT = 10
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +34,47 @@ testparams = {
 }
 
 
+class FakeTokenResponder:
+    """
+    Stands in for the Greengrass IPC client and the InfluxDB component answering token requests.
+    Each published request is answered with the next queued response, or list of responses, after the given
+    delay. Responses echo the request's correlation ID if echo_request_id is set.
+    """
+
+    def __init__(self, delay, responses, echo_request_id=False):
+        self.delay = delay
+        self.responses = list(responses)
+        self.echo_request_id = echo_request_id
+        self.handler = None
+        self.publish_count = 0
+        self.requests = []
+
+    def new_subscribe_to_topic(self, handler):
+        self.handler = handler
+        self.subscriber_operation = MagicMock()
+        return self.subscriber_operation
+
+    def new_publish_to_topic(self):
+        self.publish_count += 1
+        operation = MagicMock()
+        operation.activate.side_effect = self._respond
+        return operation
+
+    def close(self):
+        pass
+
+    def _respond(self, request):
+        message = request.publish_message.json_message.message
+        self.requests.append(message)
+        if self.responses:
+            responses = self.responses.pop(0)
+            for response in responses if isinstance(responses, list) else [responses]:
+                if self.echo_request_id and "requestId" not in response:
+                    response = dict(response, requestId=message["requestId"])
+                event = SubscriptionResponseMessage(json_message=JsonMessage(message=response))
+                threading.Timer(self.delay, self.handler.on_stream_event, [event]).start()
+
+
 def timeout_helper():
     raise concurrent.futures.TimeoutError("test")
 
@@ -47,7 +92,7 @@ def test_retrieve_influxdb_params(InfluxDBDataStreamHandler, mocker):
 
     mocker.patch("awsiot.greengrasscoreipc.connect")
     handler = InfluxDBDataStreamHandler()
-    handler.influxdb_parameters = str.encode(json.dumps(testparams))
+    handler.multiplexer.open.return_value.wait.return_value = str.encode(json.dumps(testparams))
     params = ridp.retrieve_influxdb_params("test/topic", "test/topic")
     assert json.loads(params) == testparams
 
@@ -57,42 +102,160 @@ def test_fail_to_retrieve_influxdb_params(InfluxDBDataStreamHandler, mocker):
 
     mocker.patch("awsiot.greengrasscoreipc.connect")
     handler = InfluxDBDataStreamHandler()
-    handler.influxdb_parameters = None
+    handler.multiplexer.open.return_value.wait.return_value = None
     mocker.patch("src.retrieveInfluxDBParams.publish_token_request", side_effect=ValueError("test"))
-    with pytest.raises(SystemExit) as e:
+    # Errors that retrying won't fix are raised right away
+    with pytest.raises(ValueError, match="test"):
         ridp.retrieve_influxdb_params("test/topic", "test/topic")
-        assert e.type == SystemExit
-        assert e.value.code == 1
 
 
 @patch('streamHandlers.InfluxDBDataStreamHandler')
 def test_errors_retrieving_influxdb_params(InfluxDBDataStreamHandler, mocker):
 
-    # Speed up testing by changing the timeout
-    ridp.TIMEOUT = .1
     mocker.patch("awsiot.greengrasscoreipc.connect")
     handler = InfluxDBDataStreamHandler()
-    handler.influxdb_parameters = None
-    mocker.patch("src.retrieveInfluxDBParams.publish_token_request")
-    with pytest.raises(SystemExit) as e:
+    handler.multiplexer.open.return_value.wait.return_value = None
+    mock_publish = mocker.patch("src.retrieveInfluxDBParams.publish_token_request")
+    with pytest.raises(retryPolicy.RetriesExhaustedError) as e:
+        ridp.retrieve_influxdb_params("test/topic", "test/topic")
+    assert e.value.attempts == mock_publish.call_count == 10
+
+    # Publish timeouts use up attempts as well
+    retryPolicy.configure({"token_request": {"max_attempts": 3}})
+    mock_publish.reset_mock(side_effect=True)
+    mock_publish.side_effect = concurrent.futures.TimeoutError("test")
+    with pytest.raises(retryPolicy.RetriesExhaustedError):
         ridp.retrieve_influxdb_params("test/topic", "test/topic")
-        assert e.type == SystemExit
-        assert e.value.code == 1
+    assert mock_publish.call_count == 3
 
-    mocker.patch("time.sleep", side_effect=Exception("test"))
-    with pytest.raises(SystemExit) as e:
+    handler.multiplexer.open.return_value.wait.side_effect = Exception("test")
+    with pytest.raises(Exception, match="test"):
         ridp.retrieve_influxdb_params("test/topic", "test/topic")
-        assert e.type == SystemExit
-        assert e.value.code == 1
+
+
+def test_retrieve_influxdb_params_tracks_response_time(mocker):
+
+    read_only_params = dict(testparams, InfluxDBTokenAccessType='RO')
+    responder = FakeTokenResponder(0.05, [read_only_params])
+    mock_connect = mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+
+    start = time.monotonic()
+    params = ridp.retrieve_influxdb_params("test/topic", "test/topic", initial_backoff=5)
+    elapsed = time.monotonic() - start
+
+    assert params == read_only_params
+    assert responder.publish_count == 1
+    assert elapsed < 1
+    # The subscription and the token request share a single IPC connection
+    assert mock_connect.call_count == 1
+
+
+def test_retrieve_influxdb_params_ignores_incorrect_access_level(mocker):
+
+    read_only_params = dict(testparams, InfluxDBTokenAccessType='RO')
+    # A token meant for another component arrives first, without ending the wait for ours
+    responder = FakeTokenResponder(0.01, [[testparams, read_only_params]])
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+
+    start = time.monotonic()
+    params = ridp.retrieve_influxdb_params("test/topic", "test/topic", initial_backoff=5)
+    elapsed = time.monotonic() - start
+
+    assert params == read_only_params
+    assert responder.publish_count == 1
+    assert elapsed < 1
+
+
+def test_retrieve_influxdb_params_routes_by_request_id(mocker):
+
+    read_only_params = dict(testparams, InfluxDBTokenAccessType='RO')
+    foreign_params = dict(read_only_params, InfluxDBToken='other', requestId='other-component')
+    responder = FakeTokenResponder(0.01, [[foreign_params, read_only_params]], echo_request_id=True)
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+
+    params = ridp.retrieve_influxdb_params("test/topic", "test/topic", initial_backoff=5)
+
+    # The correlation ID is stripped, so that parameters compare equal across token exchanges
+    assert params == read_only_params
+    assert responder.publish_count == 1
+    assert responder.requests[0]["accessLevel"] == "RO"
+    assert len(responder.requests[0]["requestId"]) == 32
+
+
+def test_retrieve_influxdb_params_keeps_request_id_across_retries(mocker):
+
+    read_only_params = dict(testparams, InfluxDBTokenAccessType='RO')
+    responder = FakeTokenResponder(0.01, [[], [], read_only_params], echo_request_id=True)
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+
+    params = ridp.retrieve_influxdb_params("test/topic", "test/topic", initial_backoff=0.05)
+
+    assert params == read_only_params
+    assert responder.publish_count == 3
+    assert len({request["requestId"] for request in responder.requests}) == 1
+
+
+def test_concurrent_token_requests_share_subscription(mocker):
+
+    read_only_params = dict(testparams, InfluxDBTokenAccessType='RO')
+    # Without correlation IDs, each response goes to the outstanding request for its access level
+    responder = FakeTokenResponder(0.05, [read_only_params, testparams])
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+    handler = streamHandlers.InfluxDBDataStreamHandler()
+    results = {}
+
+    def retrieve(access_level):
+        results[access_level] = ridp.retrieve_influxdb_params("test/topic", "test/topic", initial_backoff=5,
+                                                              handler=handler, keep_subscription=True,
+                                                              access_level=access_level)
+
+    threads = [threading.Thread(target=retrieve, args=(access_level,)) for access_level in ("RO", "RW")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == {"RO": read_only_params, "RW": testparams}
+    assert handler.multiplexer.outstanding_count() == 0
+
+
+def test_retrieve_influxdb_params_keeps_subscription(mocker):
+
+    read_only_params = dict(testparams, InfluxDBTokenAccessType='RO')
+    responder = FakeTokenResponder(0.01, [read_only_params])
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+    handler = streamHandlers.InfluxDBDataStreamHandler()
+
+    params = ridp.retrieve_influxdb_params("test/topic", "test/topic", handler=handler, keep_subscription=True)
+
+    assert params == read_only_params
+    assert responder.handler is handler
+    assert responder.subscriber_operation.close.call_count == 0
+
+
+def test_retrieve_influxdb_params_deadline(mocker):
+
+    responder = FakeTokenResponder(0, [])
+    mocker.patch("awsiot.greengrasscoreipc.connect", return_value=responder)
+
+    start = time.monotonic()
+    with pytest.raises(retryPolicy.DeadlineExceededError):
+        ridp.retrieve_influxdb_params("test/topic", "test/topic", initial_backoff=0.05, max_backoff=0.1, deadline=0.3)
+    elapsed = time.monotonic() - start
+
+    assert 0.3 <= elapsed < 1
+    assert responder.publish_count >= 3
 
 
 def test_no_ipc_connection(mocker):
 
     mock_ipc_call = mocker.patch("awsiot.greengrasscoreipc.connect", side_effect=concurrent.futures.TimeoutError("test"))
 
-    with pytest.raises(concurrent.futures.TimeoutError, match='test'):
+    # The IPC connection is retried, and the last timeout is chained to the typed error
+    with pytest.raises(retryPolicy.RetriesExhaustedError, match="subscribe_to_token_responses") as e:
         ridp.retrieve_influxdb_params("test/topic", "test/topic")
-        assert mock_ipc_call.call_count == 1
+    assert isinstance(e.value.__cause__, concurrent.futures.TimeoutError)
+    assert mock_ipc_call.call_count == retryPolicy.get(retryPolicy.IPC).max_attempts
 
     mock_ipc_call = mocker.patch("awsiot.greengrasscoreipc.connect", side_effect=UnauthorizedError())
     with pytest.raises(UnauthorizedError):
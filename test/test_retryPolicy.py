@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import concurrent.futures
+import sys
+import time
+
+import pytest
+import requests
+
+sys.path.append("src/")
+import grafanaClient  # noqa: E402
+import retryPolicy  # noqa: E402
+
+
+class Failing:
+    def __init__(self, errors, result="done"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.result
+
+
+def test_backoff_with_jitter():
+    policy = retryPolicy.RetryPolicy(initial_backoff=1, max_backoff=5, jitter=0.5)
+    assert [policy.backoff(attempt, rand=lambda: 0) for attempt in range(1, 5)] == [1, 2, 4, 5]
+    assert policy.backoff(3, rand=lambda: 1) == 2
+    assert all(2 <= policy.backoff(3) <= 4 for _ in range(100))
+
+    with pytest.raises(ValueError):
+        retryPolicy.RetryPolicy(max_attempts=0)
+    with pytest.raises(ValueError):
+        retryPolicy.RetryPolicy(jitter=2)
+
+
+def test_is_retryable():
+    assert retryPolicy.is_retryable(TimeoutError())
+    assert retryPolicy.is_retryable(concurrent.futures.TimeoutError())
+    assert retryPolicy.is_retryable(ConnectionResetError())
+    assert retryPolicy.is_retryable(requests.exceptions.ConnectTimeout())
+    assert retryPolicy.is_retryable(grafanaClient.GrafanaRequestError("PUT", "/api/datasources/1", 503))
+    assert not retryPolicy.is_retryable(grafanaClient.GrafanaRequestError("PUT", "/api/datasources/1", 401))
+    assert not retryPolicy.is_retryable(ValueError())
+    assert not retryPolicy.is_retryable(FileNotFoundError())
+    assert not retryPolicy.is_retryable(retryPolicy.DeadlineExceededError("operation", 3, 10))
+
+
+def test_run_retries_transient_errors():
+    policy = retryPolicy.RetryPolicy(max_attempts=3, initial_backoff=0.01)
+    function = Failing([TimeoutError(), ConnectionError()])
+    assert policy.run("operation", function) == "done"
+    assert function.calls == 3
+
+    # Once the attempts are used up, the typed error is raised from the last error
+    function = Failing([TimeoutError("first"), TimeoutError("second"), TimeoutError("third")])
+    with pytest.raises(retryPolicy.RetriesExhaustedError, match="operation did not succeed after 3 attempts") as e:
+        policy.run("operation", function)
+    assert (e.value.operation, e.value.attempts) == ("operation", 3)
+    assert str(e.value.__cause__) == "third"
+    assert not retryPolicy.is_retryable(e.value)
+
+    function = Failing([ValueError("invalid")])
+    with pytest.raises(ValueError):
+        policy.run("operation", function)
+    assert function.calls == 1
+
+
+def test_run_respects_deadlines():
+    policy = retryPolicy.RetryPolicy(max_attempts=None, initial_backoff=0.05, max_backoff=0.05, jitter=0,
+                                     deadline=0.2)
+    function = Failing([TimeoutError()] * 100)
+    start = time.monotonic()
+    with pytest.raises(retryPolicy.DeadlineExceededError) as e:
+        policy.run("operation", function)
+    assert time.monotonic() - start < 0.3
+    assert e.value.attempts == function.calls >= 3
+    assert isinstance(e.value.__cause__, TimeoutError)
+
+    # The startup deadline bounds policies without a deadline of their own
+    retryPolicy.configure(startup_deadline=0.2)
+    function = Failing([TimeoutError()] * 100)
+    with pytest.raises(retryPolicy.DeadlineExceededError):
+        policy.replace(deadline=0).run("operation", function)
+    assert retryPolicy.get(retryPolicy.GRAFANA).attempt_timeout() <= 0.2
+    retryPolicy.end_startup()
+    assert retryPolicy.get(retryPolicy.GRAFANA).attempt_timeout() == 10
+
+
+def test_configure_policies():
+    overrides = retryPolicy.parse_policies('{"token_request": {"max_attempts": 3, "deadline": 60}, '
+                                           '"grafana": {"timeout": 5}}')
+    policies = retryPolicy.configure(overrides)
+    assert retryPolicy.get(retryPolicy.TOKEN_REQUEST) is policies["token_request"]
+    assert policies["token_request"].to_dict() == {"max_attempts": 3, "initial_backoff": 1, "max_backoff": 15,
+                                                   "multiplier": 2, "jitter": 0.2, "timeout": 15, "deadline": 60}
+    assert policies["grafana"].timeout == 5
+    with grafanaClient.GrafanaClient("http", 3000, True) as client:
+        assert client.timeout == 5
+
+    assert retryPolicy.parse_policies("") == {}
+    with pytest.raises(ValueError, match="Unknown retry policy phase"):
+        retryPolicy.parse_policies('{"other": {}}')
+    with pytest.raises(ValueError, match="Unknown retry policy fields"):
+        retryPolicy.parse_policies('{"grafana": {"retries": 3}}')
+    with pytest.raises(ValueError):
+        retryPolicy.parse_policies('[]')
@@ -0,0 +1,148 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import threading
+import time
+
+import pytest
+
+import src.instrumentation as instrumentation
+import src.selfTelemetry as selfTelemetry
+
+sys.path.append("src/")
+sys.path.append("benchmark/")
+from fakeInfluxDB import FakeInfluxDBServer  # noqa: E402
+import retryPolicy  # noqa: E402
+
+TOKEN = "rwtoken"
+
+
+@pytest.fixture
+def influxdb():
+    with FakeInfluxDBServer(token=TOKEN) as server:
+        yield server
+
+
+def test_line_protocol():
+    line = selfTelemetry.to_line_protocol("greengrass dashboard", {"span": "grafana_request", "endpoint": "/api a,b=c",
+                                                                   "parent": None, "empty": ""},
+                                          {"duration": 0.5, "status_code": 200, "ok": True, "error": 'say "hi"'}, 1)
+    assert line == ('greengrass\\ dashboard,endpoint=/api\\ a\\,b\\=c,span=grafana_request '
+                    'duration=0.5,error="say \\"hi\\"",ok=true,status_code=200i 1')
+
+
+def test_writer_batches_points(influxdb):
+    writer = selfTelemetry.TelemetryWriter(batch_size=3, flush_interval=60, default_tags={"host": "gateway"})
+    # Recorded before the destination is known, so they are buffered until configure()
+    for i in range(7):
+        writer.record("bootstrap", {"total": i}, {"event": "test"}, timestamp_ns=i)
+    writer.configure(influxdb.url, TOKEN, "greengrass", "telemetry")
+    writer.close()
+
+    assert [len(write["body"].split("\n")) for write in influxdb.writes] == [3, 3, 1]
+    assert all(write["params"] == {"org": "greengrass", "bucket": "telemetry", "precision": "ns"}
+               for write in influxdb.writes)
+    assert influxdb.lines() == ["bootstrap,event=test,host=gateway total={}i {}".format(i, i) for i in range(7)]
+    assert (writer.written_count, writer.dropped_count, writer.failed_writes) == (7, 0, 0)
+
+
+def test_writer_timeout_follows_influxdb_policy(influxdb):
+    writer = selfTelemetry.TelemetryWriter(flush_interval=60)
+    # The writer is created before the recipe's retry policies are configured
+    retryPolicy.configure({"influxdb": {"timeout": 3}})
+    writer.configure(influxdb.url, TOKEN, "greengrass", "telemetry")
+    writer.close()
+    assert writer.timeout == 3
+
+
+def test_writer_flushes_full_batch_without_waiting(influxdb):
+    writer = selfTelemetry.TelemetryWriter(batch_size=2, flush_interval=60)
+    writer.configure(influxdb.url, TOKEN, "greengrass", "telemetry")
+    writer.record("bootstrap", {"total": 1})
+    writer.record("bootstrap", {"total": 2})
+    end_time = time.monotonic() + 5
+    while writer.written_count < 2 and time.monotonic() < end_time:
+        time.sleep(0.01)
+    assert writer.written_count == 2
+    writer.close()
+
+
+def test_writer_retries_failed_write(influxdb):
+    influxdb.fail_writes = 1
+    writer = selfTelemetry.TelemetryWriter(batch_size=10, flush_interval=60)
+    writer.configure(influxdb.url, TOKEN, "greengrass", "telemetry")
+    writer.record("bootstrap", {"total": 1}, timestamp_ns=1)
+
+    assert writer.flush() is False
+    writer.record("bootstrap", {"total": 2}, timestamp_ns=2)
+    assert writer.flush() is True
+    writer.close()
+    assert influxdb.lines() == ["bootstrap total=1i 1", "bootstrap total=2i 2"]
+    assert writer.failed_writes == 1
+
+
+def test_writer_rejected_token(influxdb):
+    writer = selfTelemetry.TelemetryWriter(flush_interval=60)
+    writer.configure(influxdb.url, "rotoken", "greengrass", "telemetry")
+    writer.record("bootstrap", {"total": 1})
+    writer.close()
+    assert influxdb.writes == []
+    assert (writer.written_count, writer.failed_writes) == (0, 1)
+
+
+def test_writer_drops_oldest_points_when_full():
+    writer = selfTelemetry.TelemetryWriter(max_buffer=3)
+    for i in range(5):
+        writer.record("bootstrap", {"total": i})
+    assert writer.dropped_count == 2
+    assert [fields["total"] for _, _, fields, _ in writer._buffer] == [2, 3, 4]
+    # Never configured: closing must not wait for InfluxDB that will never come
+    start = time.monotonic()
+    writer.close()
+    assert time.monotonic() - start < 0.1
+    # A token that arrives after the component started exiting doesn't start a writer
+    writer.configure("http://127.0.0.1:8086", TOKEN, "greengrass", "telemetry")
+    assert writer._thread is None
+
+
+def test_writer_keeps_session_while_writing(influxdb, mocker):
+    writer = selfTelemetry.TelemetryWriter(flush_interval=60)
+    writer.configure(influxdb.url, TOKEN, "greengrass", "telemetry")
+    release = threading.Event()
+    post = writer._session.post
+
+    def slow_post(*args, **kwargs):
+        release.wait(5)
+        return post(*args, **kwargs)
+
+    mocker.patch.object(writer._session, "post", side_effect=slow_post)
+    mock_close = mocker.patch.object(writer._session, "close")
+    writer.record("bootstrap", {"total": 1}, timestamp_ns=1)
+
+    writer.close(timeout=0.1)
+    # The write is still in progress, so the thread keeps its session
+    assert writer._thread.is_alive()
+    assert mock_close.call_count == 0
+    release.set()
+    writer._thread.join(5)
+    assert mock_close.call_count == 1
+    assert influxdb.lines() == ["bootstrap total=1i 1"]
+
+
+def test_writer_records_spans(influxdb):
+    writer = selfTelemetry.TelemetryWriter(flush_interval=60)
+    instrumentation.add_listener(writer.record_span)
+    try:
+        with instrumentation.span("grafana_request", method="GET", endpoint="/api/health") as span:
+            span.set(status_code=200)
+    finally:
+        instrumentation.disable()
+    writer.configure(influxdb.url, TOKEN, "greengrass", "telemetry")
+    writer.close()
+
+    lines = influxdb.lines()
+    assert len(lines) == 1
+    assert lines[0].startswith("greengrass_dashboard,endpoint=/api/health,method=GET,outcome=ok,span=grafana_request "
+                               "duration=")
+    assert ",status_code=200i " in lines[0]
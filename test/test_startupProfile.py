@@ -0,0 +1,60 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import builtins
+import json
+import subprocess
+import sys
+
+import src.startupProfile as startupProfile
+
+sys.path.append("src/")
+
+# dashboard.py must stay cheap to import on constrained gateways: the IPC client library (awscrt), requests
+# and the modules of optional features are only loaded by the code paths that use them
+IMPORT_TIME_BUDGET = 0.5
+RSS_BUDGET_KB = 16 * 1024
+HEAVY_MODULES = ("awsiot", "awscrt", "requests", "urllib3", "cryptography", "http.server", "queryProxy",
+                 "metricsServer", "grafanaProvisioning", "paramsCache", "downsamplingTiers", "selfTelemetry")
+
+MEASURE_IMPORT = """
+import json, sys, time
+sys.path.insert(0, "src")
+import startupProfile
+rss = startupProfile.peak_rss_kb()
+start = time.perf_counter()
+import dashboard
+print(json.dumps({"import_time": time.perf_counter() - start, "rss_kb": startupProfile.peak_rss_kb() - rss,
+                  "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def test_dashboard_import_budget():
+    output = subprocess.run([sys.executable, "-c", MEASURE_IMPORT], check=True, stdout=subprocess.PIPE).stdout
+    measurement = json.loads(output.decode())
+    assert measurement["loaded"] == []
+    assert measurement["import_time"] < IMPORT_TIME_BUDGET
+    assert measurement["rss_kb"] < RSS_BUDGET_KB
+
+
+def test_profiler_records_imports():
+    sys.modules.pop("colorsys", None)
+    profiler = startupProfile.StartupProfiler()
+    original_import = builtins.__import__
+    profiler.start()
+    try:
+        import colorsys  # noqa: F401
+        import json  # noqa: F401,F811
+    finally:
+        profiler.stop()
+    assert builtins.__import__ is original_import
+
+    self_time, cumulative = profiler.timings["colorsys"]
+    assert 0 <= self_time <= cumulative
+    # Modules that were already loaded are not recorded
+    assert "json" not in profiler.timings
+
+    summary = profiler.report()
+    assert summary["imports"] == len(profiler.timings)
+    assert summary["slowest"][0][0] in profiler.timings
+    assert summary["peak_rss_kb"] >= summary["start_peak_rss_kb"] > 0
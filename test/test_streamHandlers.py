@@ -2,8 +2,8 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import sys
-import pytest
 import logging
+import threading
 import src.streamHandlers as streamHandler
 
 
@@ -45,9 +45,37 @@ def test_invalidInfluxDBParams(mocker):
     handler = streamHandler.InfluxDBDataStreamHandler()
     message = JsonMessage(message=emptyparams)
     response_message = SubscriptionResponseMessage(json_message=message)
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        handler.on_stream_event(response_message)
-        assert pytest_wrapped_e.type == SystemExit
+    handler.on_stream_event(response_message)
+    # The invalid message is dropped, without exiting from the IPC callback thread
+    assert handler.influxdb_parameters == {}
+    assert handler.parameters_version == 0
+
+
+def test_routes_responses_to_requests(mocker):
+
+    handler = streamHandler.InfluxDBDataStreamHandler()
+    token_request = handler.multiplexer.open("RW")
+    message = JsonMessage(message=dict(testparams, requestId=token_request.request_id))
+    threading.Timer(0.05, handler.on_stream_event, [SubscriptionResponseMessage(json_message=message)]).start()
+
+    assert token_request.wait(5) == testparams
+    assert handler.influxdb_parameters == testparams
+    assert handler.parameters_version == 1
+
+
+def test_ignores_responses_to_other_requests(mocker):
+
+    handler = streamHandler.InfluxDBDataStreamHandler()
+    handler.on_stream_event(SubscriptionResponseMessage(json_message=JsonMessage(message=testparams)))
+    token_request = handler.multiplexer.open("RW")
+
+    message = JsonMessage(message=dict(testparams, InfluxDBToken="other", requestId="other-component"))
+    handler.on_stream_event(SubscriptionResponseMessage(json_message=message))
+
+    # The foreign response neither resolves the request nor replaces the last received parameters
+    assert token_request.wait(0.01) == {}
+    assert handler.influxdb_parameters == testparams
+    assert handler.parameters_version == 1
 
 
 def test_stream_operations(mocker):
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import threading
+
+import src.tokenMultiplexer as tokenMultiplexer
+
+sys.path.append("src/")
+
+READ_ONLY_PARAMS = {"InfluxDBToken": "rotoken", "InfluxDBTokenAccessType": "RO"}
+READ_WRITE_PARAMS = {"InfluxDBToken": "rwtoken", "InfluxDBTokenAccessType": "RW"}
+
+
+def test_split_response():
+    assert tokenMultiplexer.split_response(dict(READ_ONLY_PARAMS, requestId="1")) == ("1", READ_ONLY_PARAMS)
+    assert tokenMultiplexer.split_response(READ_ONLY_PARAMS) == (None, READ_ONLY_PARAMS)
+
+
+def test_routes_by_request_id():
+    multiplexer = tokenMultiplexer.TokenRequestMultiplexer()
+    first = multiplexer.open("RO")
+    second = multiplexer.open("RO")
+
+    assert multiplexer.dispatch(dict(READ_ONLY_PARAMS, requestId=second.request_id))
+    assert second.wait(0) == READ_ONLY_PARAMS
+    assert not first.future.done()
+    assert multiplexer.outstanding_count() == 1
+
+
+def test_routes_responses_without_id_to_oldest_matching_request():
+    multiplexer = tokenMultiplexer.TokenRequestMultiplexer()
+    read_only = [multiplexer.open("RO"), multiplexer.open("RO")]
+    read_write = multiplexer.open("RW")
+
+    assert multiplexer.dispatch(READ_WRITE_PARAMS)
+    assert multiplexer.dispatch(READ_ONLY_PARAMS)
+    assert read_write.wait(0) == READ_WRITE_PARAMS
+    assert read_only[0].wait(0) == READ_ONLY_PARAMS
+    assert read_only[1].wait(0) == {}
+
+
+def test_ignores_foreign_responses():
+    multiplexer = tokenMultiplexer.TokenRequestMultiplexer()
+    request = multiplexer.open("RO")
+
+    # Another component's request ID, a token with the wrong access level, and an admin token
+    assert not multiplexer.dispatch(dict(READ_ONLY_PARAMS, requestId="other-component"))
+    assert not multiplexer.dispatch(dict(READ_WRITE_PARAMS, requestId=request.request_id))
+    assert not multiplexer.dispatch({"InfluxDBToken": "admintoken", "InfluxDBTokenAccessType": "Admin"})
+
+    assert (multiplexer.routed_count, multiplexer.ignored_count) == (0, 3)
+    assert multiplexer.outstanding_count() == 1
+    assert multiplexer.dispatch(READ_ONLY_PARAMS)
+    assert request.wait(0) == READ_ONLY_PARAMS
+
+
+def test_close_request():
+    multiplexer = tokenMultiplexer.TokenRequestMultiplexer()
+    request = multiplexer.open("RO")
+    multiplexer.close(request)
+
+    assert request.future.cancelled()
+    # A late response to a request nobody waits for anymore is ignored
+    assert not multiplexer.dispatch(dict(READ_ONLY_PARAMS, requestId=request.request_id))
+
+    answered = multiplexer.open("RO")
+    multiplexer.dispatch(READ_ONLY_PARAMS)
+    multiplexer.close(answered)
+    assert answered.wait(0) == READ_ONLY_PARAMS
+
+
+def test_many_outstanding_requests():
+    multiplexer = tokenMultiplexer.TokenRequestMultiplexer()
+    requests = [multiplexer.open("RO") for _ in range(50)]
+
+    threads = [threading.Thread(target=multiplexer.dispatch, args=(dict(READ_ONLY_PARAMS, requestId=r.request_id,
+                                                                        InfluxDBToken=str(i)),))
+               for i, r in enumerate(requests)]
+    for thread in reversed(threads):
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert [r.wait(1)["InfluxDBToken"] for r in requests] == [str(i) for i in range(50)]
+    assert multiplexer.outstanding_count() == 0
@@ -0,0 +1,126 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import threading
+import time
+
+import src.streamHandlers as streamHandler
+import src.tokenRotationWatcher as trw
+from awsiot.greengrasscoreipc.model import (
+    SubscriptionResponseMessage, JsonMessage
+)
+
+sys.path.append("src/")
+
+testparams = {
+    'InfluxDBContainerName': 'greengrass_InfluxDB',
+    'InfluxDBOrg': 'greengrass',
+    'InfluxDBBucket': 'greengrass-telemetry',
+    'InfluxDBPort': '8086',
+    'InfluxDBInterface': '127.0.0.1',
+    'InfluxDBToken': 'testToken',
+    'InfluxDBServerProtocol': 'https',
+    'InfluxDBSkipTLSVerify': 'true',
+    'InfluxDBTokenAccessType': 'RO'
+}
+
+
+def send(handler, **overrides):
+    message = JsonMessage(message=dict(testparams, **overrides))
+    handler.on_stream_event(SubscriptionResponseMessage(json_message=message))
+
+
+def start_watcher(handler, rotations, debounce=0.1):
+    stop_event = threading.Event()
+    watcher = trw.TokenRotationWatcher(handler, lambda previous, current: rotations.append((previous, current)),
+                                       dict(testparams), debounce=debounce, poll_interval=0.05)
+    thread = threading.Thread(target=watcher.run, args=(stop_event,), daemon=True)
+    thread.start()
+    return watcher, stop_event, thread
+
+
+def stop_watcher(stop_event, thread):
+    stop_event.set()
+    thread.join(2)
+    assert not thread.is_alive()
+
+
+def test_burst_of_rotations_is_applied_once():
+    handler = streamHandler.InfluxDBDataStreamHandler()
+    rotations = []
+    watcher, stop_event, thread = start_watcher(handler, rotations)
+
+    for i in range(5):
+        send(handler, InfluxDBToken="rotated{}".format(i))
+        time.sleep(0.01)
+    time.sleep(0.4)
+    stop_watcher(stop_event, thread)
+
+    assert len(rotations) == 1
+    previous, current = rotations[0]
+    assert previous == testparams
+    assert current["InfluxDBToken"] == "rotated4"
+    assert watcher.rotation_count == 1
+
+
+def test_foreign_and_unchanged_responses_are_ignored():
+    handler = streamHandler.InfluxDBDataStreamHandler()
+    rotations = []
+    watcher, stop_event, thread = start_watcher(handler, rotations)
+
+    send(handler, InfluxDBToken="adminToken", InfluxDBTokenAccessType="Admin")
+    time.sleep(0.3)
+    send(handler)
+    time.sleep(0.3)
+    stop_watcher(stop_event, thread)
+
+    assert rotations == []
+
+
+def test_failed_rotation_is_retried_on_next_response():
+    handler = streamHandler.InfluxDBDataStreamHandler()
+    calls = []
+
+    def on_rotation(previous, current):
+        calls.append(current["InfluxDBToken"])
+        if len(calls) == 1:
+            raise ValueError("test")
+
+    stop_event = threading.Event()
+    watcher = trw.TokenRotationWatcher(handler, on_rotation, dict(testparams), debounce=0.05, poll_interval=0.05)
+    thread = threading.Thread(target=watcher.run, args=(stop_event,), daemon=True)
+    thread.start()
+
+    send(handler, InfluxDBToken="rotated")
+    time.sleep(0.3)
+    assert watcher.influxdb_parameters == testparams
+    send(handler, InfluxDBToken="rotated")
+    time.sleep(0.3)
+    stop_watcher(stop_event, thread)
+
+    assert calls == ["rotated", "rotated"]
+    assert watcher.influxdb_parameters["InfluxDBToken"] == "rotated"
+
+
+def test_broadcasts_with_foreign_request_ids_are_watched():
+    handler = streamHandler.InfluxDBDataStreamHandler()
+    rotations = []
+    watcher, stop_event, thread = start_watcher(handler, rotations, debounce=0.05)
+    time.sleep(0.05)
+
+    # A response to this component's own request still resolves it, e.g. the self-telemetry write token
+    token_request = handler.multiplexer.open("RW")
+    send(handler, InfluxDBToken="writeToken", InfluxDBTokenAccessType="RW", requestId=token_request.request_id)
+    assert token_request.wait(1)["InfluxDBToken"] == "writeToken"
+    # Rotated read-only tokens carry the ID of whichever request triggered them, admin tokens are still ignored
+    send(handler, InfluxDBToken="adminToken", InfluxDBTokenAccessType="Admin", requestId="other-component")
+    send(handler, InfluxDBToken="rotated", requestId="other-component")
+    time.sleep(0.3)
+    stop_watcher(stop_event, thread)
+
+    assert [current["InfluxDBToken"] for _, current in rotations] == ["rotated"]
+    # Once the watcher is gone, responses to other requests are left alone again
+    assert handler.broadcast_access_level is None
+    send(handler, InfluxDBToken="late", requestId="other-component")
+    assert handler.influxdb_parameters["InfluxDBToken"] == "rotated"